@@ -1,56 +1,111 @@
 import os
+import sys
 import threading
 import logging
 import requests
 import re
-import markdown
 import asyncio
-from typing import Optional, Union
+import concurrent.futures
+import contextvars
+import functools
+import importlib.util
+import json
+import math
+from typing import Dict, List, Optional, Tuple, Union
 from slack_bolt import App
-from anthropic import Anthropic, AnthropicError
-from github import Github, GithubException
-from atlassian import Confluence
-from bs4 import BeautifulSoup
-from google.cloud import secretmanager
+from lazy_imports import lazy_import, LazyObject, preload as lazy_imports_preload
+import anthropic_gateway
+import confluence_format
+import design_chunker
+import async_runtime
+import job_store
+import lifecycle
+import metrics
+import model_router
+import pipeline
+import repo_index
+import scheduler
+import task_queue
+import token_budget
+import tracing
+from logging_config import configure_logging
+
+# --- ロギング設定 ---
+# 形式・ロガー別レベル・サンプリングは環境変数で指定（logging_config.py 参照）
+configure_logging()
+
+# 重量級の依存は最初に使われた時点で読み込む（コールドスタート短縮のため）
+anthropic = lazy_import("anthropic")
+github = lazy_import("github")
+atlassian = lazy_import("atlassian")
+secretmanager = lazy_import("google.cloud.secretmanager")
 
 # 共通の非同期実行関数
-def run_async_safely(coro):
-    """非同期コルーチンを安全に実行する関数"""
-    def run_in_thread():
-        try:
-            # 新しいイベントループを作成
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+def run_async_safely(coro, kind: str = "async") -> concurrent.futures.Future:
+    """非同期コルーチンを共有イベントループで実行する（戻り値の Future で完了待ち・キャンセルができる）"""
+    metrics.QUEUE_DEPTH.inc(kind=kind)
+    # 呼び出し元のトレースをタスクへ引き継ぐ
+    task_span = tracing.start_span(f"task.{kind}")
+    started = threading.Event()
+    
+    async def run():
+        started.set()
+        with tracing.use_span(task_span):
             try:
-                loop.run_until_complete(coro)
-            finally:
-                loop.close()
-        except Exception as e:
-            logging.error(f"非同期タスク実行エラー: {e}")
+                await coro
+            except asyncio.CancelledError:
+                logging.info(f"非同期タスクがキャンセルされました: {kind}")
+                raise
+            except Exception as e:
+                logging.error(f"非同期タスク実行エラー: {e}")
+    
+    def done(_):
+        # 開始前にキャンセルされた場合も実行中のタスク数を戻す
+        metrics.QUEUE_DEPTH.dec(kind=kind)
+        if not started.is_set():
+            # コルーチンが span を終了しないため、ここで終了してトレースを出力させる
+            coro.close()
+            if task_span:
+                task_span.set_attribute("cancelled_before_start", True)
+                task_span.end()
     
-    thread = threading.Thread(target=run_in_thread, daemon=True)
+    future = async_runtime.submit(run())
+    future.add_done_callback(done)
+    return future
+
+def start_background_task(kind: str, target, *args):
+    """バックグラウンドスレッドでタスクを実行する（実行中のタスク数とトレースを記録）"""
+    metrics.QUEUE_DEPTH.inc(kind=kind)
+    # 呼び出し元のトレースをスレッドへ引き継ぐ
+    task_span = tracing.start_span(f"task.{kind}")
+    context = contextvars.copy_context()
+    
+    def run():
+        try:
+            with lifecycle.track(kind), tracing.use_span(task_span):
+                target(*args)
+        finally:
+            metrics.QUEUE_DEPTH.dec(kind=kind)
+    
+    thread = threading.Thread(target=context.run, args=(run,))
     thread.start()
+    return thread
 
-# Atlassian MCP Client のインポート
-try:
-    from atlassian_mcp_integration import (
-        create_confluence_page_mcp,
-        get_confluence_page_mcp,
-        search_confluence_pages_mcp,
-        generate_design_document_mcp
-    )
-    MCP_AVAILABLE = True
-    logging.info("Atlassian MCP Client が利用可能です")
-except ImportError as e:
-    MCP_AVAILABLE = False
-    logging.warning(f"Atlassian MCP Client のインポートに失敗しました: {e}")
+# ユーザーごとの公平な実行順とレート制限（scheduler.py 参照）
+SCHEDULER = scheduler.scheduler_from_env(start_background_task)
 
-# --- ロギング設定 ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+@tracing.traced("slack.response_url")
+def post_slack_message(response_url: str, text: str):
+    """response_url 経由でSlackにメッセージを送信する"""
+    requests.post(response_url, json={"text": text})
 
-# Anthropic APIのログも詳細に出力
-logging.getLogger("anthropic").setLevel(logging.DEBUG)
-logging.getLogger("httpx").setLevel(logging.DEBUG)
+# Atlassian MCP Client（MCP系コマンドの実行時に遅延インポート）
+mcp = lazy_import("atlassian_mcp_integration")
+MCP_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ("atlassian_mcp_integration", "httpx"))
+if MCP_AVAILABLE:
+    logging.info("Atlassian MCP Client が利用可能です")
+else:
+    logging.warning("Atlassian MCP Client が見つかりません。MCP機能は無効になります。")
 
 # --- 定数 ---
 # Slackに表示するアイコンのURL
@@ -59,6 +114,10 @@ CLAUDE_ICON_URL = "https://claude.ai/favicon.ico"
 # --- Secret Manager クライアント ---
 def get_secret_value(secret_name: str, project_id: Optional[str] = None) -> str:
     """Google Cloud Secret Managerからシークレット値を取得する"""
+    # ローカル実行・ベンチマーク時はSecret Managerを使わず環境変数のみを参照
+    if os.environ.get("DISABLE_SECRET_MANAGER", "").lower() in ("1", "true", "yes"):
+        return os.environ.get(secret_name, "").strip()
+    
     try:
         if project_id is None:
             project_id = os.environ.get("GOOGLE_CLOUD_PROJECT")
@@ -88,7 +147,6 @@ def get_secret_value(secret_name: str, project_id: Optional[str] = None) -> str:
 
 # --- 環境変数・シークレットから認証情報を読み込み ---
 # Google Cloud環境ではSecret Managerから、ローカル環境では環境変数から取得
-import concurrent.futures
 import time
 
 def load_secrets_parallel():
@@ -101,7 +159,7 @@ def load_secrets_parallel():
     # 環境別シークレット名の生成
     def get_env_secret_name(base_name):
         # Slack系のみ環境別に分離
-        if base_name in ["SLACK_BOT_TOKEN", "SLACK_APP_TOKEN"]:
+        if base_name in ["SLACK_BOT_TOKEN", "SLACK_APP_TOKEN", "SLACK_SIGNING_SECRET"]:
             if environment == "PRODUCTION":
                 return f"{base_name}_PROD"
             elif environment == "STAGING":
@@ -113,6 +171,7 @@ def load_secrets_parallel():
     base_secret_names = [
         "SLACK_BOT_TOKEN",
         "SLACK_APP_TOKEN",
+        "SLACK_SIGNING_SECRET",
         "ANTHROPIC_API_KEY", 
         "GITHUB_ACCESS_TOKEN",
         "CONFLUENCE_URL",
@@ -125,7 +184,6 @@ def load_secrets_parallel():
     secret_mapping = {name: get_env_secret_name(name) for name in base_secret_names}
     
     logging.info(f"Environment: {environment}")
-    logging.info(f"Secret mapping: {secret_mapping}")
     
     with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
         future_to_secret = {}
@@ -137,7 +195,7 @@ def load_secrets_parallel():
             secret_name = future_to_secret[future]
             try:
                 secrets[secret_name] = future.result()
-                logging.info(f"Successfully retrieved secret: {secret_name}")
+                logging.debug(f"Successfully retrieved secret: {secret_name}")
             except Exception as e:
                 logging.error(f"Failed to retrieve secret {secret_name}: {e}")
                 secrets[secret_name] = ""
@@ -152,6 +210,10 @@ logging.info(f"Secrets loaded in {end_time - start_time:.2f} seconds")
 
 SLACK_BOT_TOKEN = secrets["SLACK_BOT_TOKEN"]
 SLACK_APP_TOKEN = secrets["SLACK_APP_TOKEN"]  # Socket Mode用
+SLACK_SIGNING_SECRET = secrets["SLACK_SIGNING_SECRET"]  # HTTPモード（Events API）の署名検証用
+
+# Slackからの受信方式: socket（Socket Mode、デフォルト）/ http（Request URL。Cloud Runの複数インスタンスに分散できる）
+SLACK_MODE = os.environ.get("SLACK_MODE", "socket").strip().lower()
 ANTHROPIC_API_KEY = secrets["ANTHROPIC_API_KEY"]
 GITHUB_ACCESS_TOKEN = secrets["GITHUB_ACCESS_TOKEN"]
 
@@ -166,7 +228,10 @@ if not os.environ.get("GITHUB_ACTIONS"):
     missing_vars = []
     if not SLACK_BOT_TOKEN:
         missing_vars.append("SLACK_BOT_TOKEN")
-    if not SLACK_APP_TOKEN:
+    if SLACK_MODE == "http":
+        if not SLACK_SIGNING_SECRET:
+            missing_vars.append("SLACK_SIGNING_SECRET")
+    elif not SLACK_APP_TOKEN:
         missing_vars.append("SLACK_APP_TOKEN")
     if not ANTHROPIC_API_KEY:
         missing_vars.append("ANTHROPIC_API_KEY")
@@ -176,7 +241,9 @@ if not os.environ.get("GITHUB_ACTIONS"):
     if missing_vars:
         logging.error(f"環境変数の詳細状況:")
         logging.error(f"  SLACK_BOT_TOKEN: {'設定済み' if SLACK_BOT_TOKEN else '未設定'}")
+        logging.error(f"  SLACK_MODE: {SLACK_MODE}")
         logging.error(f"  SLACK_APP_TOKEN: {'設定済み' if SLACK_APP_TOKEN else '未設定'}")
+        logging.error(f"  SLACK_SIGNING_SECRET: {'設定済み' if SLACK_SIGNING_SECRET else '未設定'}")
         logging.error(f"  ANTHROPIC_API_KEY: {'設定済み' if ANTHROPIC_API_KEY else '未設定'}")
         logging.error(f"  GITHUB_ACCESS_TOKEN: {'設定済み' if GITHUB_ACCESS_TOKEN else '未設定'}")
         logging.error(f"  GOOGLE_CLOUD_PROJECT: {os.environ.get('GOOGLE_CLOUD_PROJECT', '未設定')}")
@@ -206,27 +273,175 @@ if os.environ.get("GITHUB_ACTIONS"):
     app = App(token=dummy_token, process_before_response=True, 
               token_verification_enabled=False)
     anthropic_client = None
+    async_anthropic_client = None
     github_client = None
 else:
-    app = App(token=SLACK_BOT_TOKEN, process_before_response=True)
-    anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
-    github_client = Github(GITHUB_ACCESS_TOKEN)
+    # オフライン環境（ベンチマーク等）ではSLACK_TOKEN_VERIFICATION=falseでauth.testを省略
+    slack_token_verification = os.environ.get("SLACK_TOKEN_VERIFICATION", "true").lower() not in ("0", "false", "no")
+    # HTTPモードのリクエストは SLACK_SIGNING_SECRET で署名を検証する（Socket Modeでは検証は行われない）
+    app = App(token=SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET, process_before_response=True,
+              token_verification_enabled=slack_token_verification)
+    # APIクライアントは最初の利用時に生成する（リトライは anthropic_gateway が行うため SDK のリトライは無効化）
+    anthropic_client = LazyObject(lambda: anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=0), "anthropic_client")
+    async_anthropic_client = LazyObject(
+        lambda: anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, max_retries=0), "async_anthropic_client"
+    )
+    # GITHUB_API_URL で GitHub Enterprise や負荷試験用の偽サーバーを指定できる
+    github_client = LazyObject(
+        lambda: github.Github(GITHUB_ACCESS_TOKEN, base_url=os.environ.get("GITHUB_API_URL", "https://api.github.com")),
+        "github_client"
+    )
+
+def _create_confluence_client():
+    client = atlassian.Confluence(
+        url=CONFLUENCE_URL,
+        username=CONFLUENCE_USERNAME,
+        password=CONFLUENCE_API_TOKEN,
+        cloud=True
+    )
+    logging.info("Confluenceクライアントの初期化が完了しました")
+    return client
 
-# Confluenceクライアントの初期化（有効な場合のみ）
+# Confluenceクライアントの初期化（有効な場合のみ、最初の利用時に生成）
 confluence_client = None
 if CONFLUENCE_ENABLED and not os.environ.get("GITHUB_ACTIONS"):
+    confluence_client = LazyObject(_create_confluence_client, "confluence_client")
+
+# --- ウォームアップ ---
+# 外部APIへの接続が確立済みかどうか（main.py の /ready で参照）
+CLIENTS_WARM = False
+ASYNC_CLIENT_WARM = False
+WARMUP_RESULTS: dict = {}
+_warmup_lock = threading.Lock()
+
+def _timed_warmup_step(step) -> dict:
+    """ウォームアップ処理を1つ実行し、結果と所要時間を返す"""
+    start_time = time.time()
     try:
-        confluence_client = Confluence(
-            url=CONFLUENCE_URL,
-            username=CONFLUENCE_USERNAME,
-            password=CONFLUENCE_API_TOKEN,
-            cloud=True
-        )
-        logging.info("Confluenceクライアントの初期化が完了しました")
+        detail = step()
+        return {"ok": True, "elapsed_ms": round((time.time() - start_time) * 1000, 1), "detail": detail}
+    except Exception as e:
+        logging.warning(f"ウォームアップ失敗: {e}")
+        return {"ok": False, "elapsed_ms": round((time.time() - start_time) * 1000, 1), "error": str(e)}
+
+def _warm_up_anthropic():
+    # 認証とTLS接続を確立（トークンは消費しない）
+    if hasattr(anthropic_client, "models"):
+        anthropic_client.models.list(limit=1)
+    return "connected"
+
+async def _awarm_up_anthropic():
+    """AsyncAnthropic の接続を確立する（MCP系コマンドの処理と並行して実行する）"""
+    global ASYNC_CLIENT_WARM
+    result = {"ok": True, "detail": "connected"}
+    try:
+        if hasattr(async_anthropic_client, "models"):
+            await async_anthropic_client.models.list(limit=1)
+        ASYNC_CLIENT_WARM = True
     except Exception as e:
-        logging.error(f"Confluenceクライアントの初期化に失敗しました: {e}")
-        CONFLUENCE_ENABLED = False
+        logging.warning(f"ウォームアップ失敗: {e}")
+        result = {"ok": False, "error": str(e)}
+    return result
 
+def _warm_up_github():
+    # レート制限の取得はAPIクォータを消費しない
+    rate_limit = github_client.get_rate_limit()
+    core = getattr(rate_limit, "core", None) or getattr(getattr(rate_limit, "resources", None), "core", None)
+    return {"remaining": getattr(core, "remaining", None)}
+
+def _warm_up_confluence():
+    space = confluence_client.get_space(CONFLUENCE_SPACE_KEY)
+    return {"space": space.get("key") if isinstance(space, dict) else CONFLUENCE_SPACE_KEY}
+
+def _warm_up_mcp():
+    # MCPクライアントのモジュールとインスタンスを読み込んでおく
+    return {"server": mcp.atlassian_mcp_client.mcp_server_url}
+
+def warm_up_clients() -> dict:
+    """Anthropic・GitHub・Confluenceへの接続を事前に確立し、遅延インポートを読み込む
+
+    Returns:
+        dict: コンポーネントごとの結果（ok, elapsed_ms, detail/error）
+    """
+    global CLIENTS_WARM, WARMUP_RESULTS
+
+    with _warmup_lock:
+        if os.environ.get("GITHUB_ACTIONS"):
+            return {"skipped": {"ok": True, "detail": "GitHub Actions環境"}}
+
+        logging.info("🔥 クライアントのウォームアップを開始します...")
+        results = {}
+        module_timings = lazy_imports_preload()
+        results["modules"] = {"ok": True, "detail": {name: round(t * 1000, 1) for name, t in module_timings.items()}}
+
+        steps = {"anthropic": _warm_up_anthropic, "github": _warm_up_github}
+        if CONFLUENCE_ENABLED and confluence_client:
+            steps["confluence"] = _warm_up_confluence
+        if MCP_AVAILABLE:
+            steps["mcp"] = _warm_up_mcp
+
+        # 各接続は独立しているため並行して確立する
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(steps)) as executor:
+            futures = {name: executor.submit(_timed_warmup_step, step) for name, step in steps.items()}
+            for name, future in futures.items():
+                results[name] = future.result()
+
+        # Anthropic と GitHub は全コマンドの前提となるため必須
+        CLIENTS_WARM = results["anthropic"]["ok"] and results["github"]["ok"]
+        WARMUP_RESULTS = results
+        logging.info(f"ウォームアップ完了: {'成功' if CLIENTS_WARM else '一部失敗'}")
+        return results
+
+WARMUP_RETRY_BASE = float(os.environ.get("WARMUP_RETRY_BASE", "2"))
+WARMUP_RETRY_MAX = float(os.environ.get("WARMUP_RETRY_MAX", "60"))
+
+def start_warm_up() -> Optional[threading.Thread]:
+    """ウォームアップを行い、必須の接続に失敗した場合はバックグラウンドで再試行する
+
+    起動時の一時的なエラーで CLIENTS_WARM が False のままになり、/ready が503を返し続けないよう、
+    成功するか終了処理が始まるまで指数バックオフ（WARMUP_RETRY_BASE 秒から WARMUP_RETRY_MAX 秒まで）で繰り返す。
+
+    Returns:
+        再試行のスレッド（初回で成功した場合は None）
+    """
+    warm_up_clients()
+    if CLIENTS_WARM or os.environ.get("GITHUB_ACTIONS"):
+        return None
+
+    def retry():
+        delay = WARMUP_RETRY_BASE
+        while not CLIENTS_WARM and not lifecycle.wait_stopping(delay):
+            logging.info(f"ウォームアップを再試行します（{delay:.0f}秒待機後）")
+            warm_up_clients()
+            delay = min(delay * 2, WARMUP_RETRY_MAX)
+
+    thread = threading.Thread(target=retry, name="warmup-retry", daemon=True)
+    thread.start()
+    return thread
+
+def close_clients():
+    """生成済みのクライアントの接続を閉じる（終了処理から呼び出す。未生成のクライアントは生成しない）"""
+    global CLIENTS_WARM
+    CLIENTS_WARM = False
+    closers = {
+        name: client.close
+        for name, client in (("anthropic", anthropic_client), ("github", github_client))
+        if isinstance(client, LazyObject) and client.is_loaded
+    }
+    if isinstance(async_anthropic_client, LazyObject) and async_anthropic_client.is_loaded:
+        closers["async_anthropic"] = lambda: async_runtime.run(async_anthropic_client.close(), timeout=2)
+    if "atlassian_mcp_integration" in sys.modules:
+        closers["mcp"] = lambda: async_runtime.run(mcp.atlassian_mcp_client.aclose(), timeout=2)
+    for name, close in closers.items():
+        try:
+            close()
+        except Exception as e:
+            logging.warning(f"クライアントを閉じられませんでした ({name}): {e}")
+
+lifecycle.on_close(close_clients)
+
+@metrics.timed("github_fetch")
+@tracing.traced("github.get_repo_content")
 def get_repo_content(repo_name: str, file_path: str, branch: str = "main") -> Optional[str]:
     """GitHubリポジトリからファイルの内容を取得する"""
     try:
@@ -237,18 +452,39 @@ def get_repo_content(repo_name: str, file_path: str, branch: str = "main") -> Op
         if isinstance(content_file, list):
             content_file = content_file[0]
         return content_file.decoded_content.decode("utf-8")
-    except GithubException as e:
+    except github.GithubException as e:
         logging.error(f"GitHubからのファイル取得エラー (repo: {repo_name}, file: {file_path}): {e}")
         return None
 
-def create_github_pr(repo_name: str, new_branch_name: str, file_path: str, new_content: str, commit_message: str, pr_title: str) -> Optional[str]:
-    """GitHubに新しいブランチを作成し、ファイルを更新してPRを作成する"""
+@tracing.traced("github.get_branch_sha")
+def get_branch_sha(repo_name: str, branch: str = "main") -> Optional[str]:
+    """ブランチの先頭コミットSHAを取得する（PR作成のベースとして先行取得する。失敗時は None）"""
+    try:
+        return github_client.get_repo(repo_name).get_branch(branch).commit.sha
+    except Exception as e:
+        logging.warning(f"ブランチの取得に失敗しました (repo: {repo_name}, branch: {branch}): {e}")
+        return None
+
+@metrics.timed("pr_create")
+@tracing.traced("github.create_pr")
+def create_github_pr(repo_name: str, new_branch_name: str, file_path: str, new_content: str, commit_message: str, pr_title: str,
+                     base_sha: Optional[str] = None) -> Optional[str]:
+    """GitHubに新しいブランチを作成し、ファイルを更新してPRを作成する（base_sha 省略時は main の先頭から分岐）"""
+    repo = None
+    created_branch = False
     try:
         repo = github_client.get_repo(repo_name)
-        source_branch = repo.get_branch("main")
+        if base_sha is None:
+            base_sha = repo.get_branch("main").commit.sha
         
-        # 新しいブランチを作成
-        repo.create_git_ref(ref=f"refs/heads/{new_branch_name}", sha=source_branch.commit.sha)
+        # 新しいブランチを作成（中断したジョブの再開で作成済みの場合はそのまま使う）
+        try:
+            repo.create_git_ref(ref=f"refs/heads/{new_branch_name}", sha=base_sha)
+            created_branch = True
+        except github.GithubException as e:
+            if e.status != 422:
+                raise
+            logging.info(f"ブランチは作成済みのため再利用します: {new_branch_name}")
 
         # ファイルを更新 (または新規作成)
         try:
@@ -257,7 +493,7 @@ def create_github_pr(repo_name: str, new_branch_name: str, file_path: str, new_c
             if isinstance(contents, list):
                 contents = contents[0]
             repo.update_file(contents.path, commit_message, new_content, contents.sha, branch=new_branch_name)
-        except GithubException as e:
+        except github.GithubException as e:
             if e.status == 404: # ファイルが存在しない場合
                 repo.create_file(file_path, commit_message, new_content, branch=new_branch_name)
             else:
@@ -271,12 +507,20 @@ def create_github_pr(repo_name: str, new_branch_name: str, file_path: str, new_c
             base="main"
         )
         return pr.html_url
-    except GithubException as e:
+    except github.GithubException as e:
         logging.error(f"GitHubでのPR作成エラー: {e}")
+        if created_branch:
+            # PRのないブランチを残さない
+            try:
+                repo.get_git_ref(f"heads/{new_branch_name}").delete()
+            except github.GithubException as cleanup_error:
+                logging.warning(f"作成したブランチを削除できませんでした ({new_branch_name}): {cleanup_error}")
         return None
 
+@metrics.timed("confluence_create")
+@tracing.traced("confluence.create_page")
 def create_confluence_page(space_key: str, title: str, content: str, parent_id: Optional[str] = None) -> Optional[str]:
-    """Confluenceページを作成する"""
+    """Confluenceページを作成する（同じタイトルのページがあれば変更されたセクションがある場合だけ更新する）"""
     if not CONFLUENCE_ENABLED or not confluence_client:
         logging.error("Confluenceが有効になっていません")
         return None
@@ -284,42 +528,24 @@ def create_confluence_page(space_key: str, title: str, content: str, parent_id:
     try:
         logging.info(f"Confluenceページを作成中: {title} (スペース: {space_key})")
         
-        # マークダウンをConfluence形式のHTMLに変換
-        html_content = markdown.markdown(content, extensions=['tables', 'fenced_code', 'toc'])
-        
-        # ページ作成
-        page_data = {
-            'type': 'page',
-            'title': title,
-            'space': {'key': space_key},
-            'body': {
-                'storage': {
-                    'value': html_content,
-                    'representation': 'storage'
-                }
-            }
-        }
-        
-        if parent_id:
-            page_data['ancestors'] = [{'id': parent_id}]
-        
-        result = confluence_client.create_page(
-            space=space_key,
-            title=title,
-            body=html_content,
-            parent_id=parent_id
-        )
-        
-        page_id = result['id']
-        page_url = f"{CONFLUENCE_URL}/pages/viewpage.action?pageId={page_id}"
+        # マークダウンをConfluenceのストレージ形式に変換して作成・更新
+        written = confluence_format.write_page(confluence_client, space_key, title, content, parent_id)
+        page_url = f"{CONFLUENCE_URL}/pages/viewpage.action?pageId={written.page_id}"
         
-        logging.info(f"Confluenceページが作成されました: {page_url}")
+        if written.action == "updated":
+            logging.info(f"既存のConfluenceページを更新しました (version {written.version}, 変更: {written.changed_sections}): {page_url}")
+        elif written.action == "unchanged":
+            logging.info(f"既存のConfluenceページに変更がないため更新しませんでした: {page_url}")
+        else:
+            logging.info(f"Confluenceページが作成されました: {page_url}")
         return page_url
         
     except Exception as e:
         logging.error(f"Confluenceページ作成エラー: {e}")
         return None
 
+@metrics.timed("confluence_get")
+@tracing.traced("confluence.get_page")
 def get_confluence_page_content(page_url: str) -> str | None:
     """ConfluenceページのURLから内容を取得する"""
     if not CONFLUENCE_ENABLED or not confluence_client:
@@ -348,10 +574,9 @@ def get_confluence_page_content(page_url: str) -> str | None:
             logging.error(f"ページが見つかりませんでした: {page_id}")
             return None
         
-        # HTML内容をテキストに変換
+        # HTML内容をテキストに変換（見出しはセクション分割のためMarkdown形式で残す）
         html_content = page['body']['storage']['value']
-        soup = BeautifulSoup(html_content, 'html.parser')
-        text_content = soup.get_text(separator='\n', strip=True)
+        text_content = design_chunker.storage_to_text(html_content)
         
         logging.info(f"Confluenceページ内容を取得しました: {len(text_content)}文字")
         return text_content
@@ -361,7 +586,7 @@ def get_confluence_page_content(page_url: str) -> str | None:
         return None
 
 def generate_design_document(project_name: str, feature_name: str, requirements: str) -> str:
-    """Claude APIを使用して設計ドキュメントを生成する"""
+    """Claude APIを使用して設計ドキュメントを生成する（失敗した場合は anthropic.AnthropicError を送出する）"""
     prompt = f"""
 あなたはシニアシステムアーキテクトです。以下の要件に基づいて詳細な設計ドキュメントを作成してください。
 
@@ -425,22 +650,43 @@ def generate_design_document(project_name: str, feature_name: str, requirements:
     
     try:
         logging.info("設計ドキュメントを生成中...")
-        response = anthropic_client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=4096,
-            messages=[{"role": "user", "content": prompt}]
+        response = model_router.create_message(
+            anthropic_client, "design_doc", [{"role": "user", "content": prompt}], cancel=job_store.cancel_event()
         )
         
         design_content = response.content[0].text
         logging.info(f"設計ドキュメントが生成されました: {len(design_content)}文字")
         return design_content
         
-    except AnthropicError as e:
+    except anthropic.AnthropicError as e:
+        # エラーの文言を設計書として保存・公開しないよう、呼び出し元に失敗として返す
         logging.error(f"設計ドキュメント生成エラー: {e}")
-        return f"設計ドキュメントの生成中にエラーが発生しました: {e}"
+        raise
 
-def generate_code_from_design(design_content: str, file_path: str, additional_requirements: str = "") -> str:
-    """設計ドキュメントからコードを生成する"""
+def summarize_design_section(section) -> str:
+    """設計書の1セクションを短く要約する（design_chunker から並列に呼ばれる）"""
+    prompt = f"""以下は設計書の「{section.title}」セクションです。実装時に必要な決定事項・名前・数値を残して、5行以内の箇条書きで要約してください。
+
+{section.text}
+"""
+    with tracing.span("design_summary", section=section.title):
+        response = model_router.create_message(
+            anthropic_client, "design_summary", [{"role": "user", "content": prompt}], stage="llm_summary"
+        )
+    return response.content[0].text
+
+def build_design_code_prompt(design_content: str, file_path: str, additional_requirements: str = "") -> str:
+    """設計ドキュメントからのコード生成プロンプトを組み立てる"""
+    # 長い設計書は実装対象に関係するセクションを優先して圧縮する
+    with tracing.span("design_context") as context_span:
+        context = design_chunker.build_design_context(
+            design_content, file_path, additional_requirements, summarize=summarize_design_section
+        )
+        if context_span:
+            context_span.set_attribute("original_tokens", context.original_tokens)
+            context_span.set_attribute("context_tokens", context.context_tokens)
+    design_content = context.text
+    
     prompt = f"""
 あなたはシニアソフトウェアエンジニアです。以下の設計ドキュメントに基づいてコードを実装してください。
 
@@ -460,122 +706,365 @@ def generate_code_from_design(design_content: str, file_path: str, additional_re
 
 実装後のコード全体のみを、コードブロックなしで返してください。
 """
-    
+    return prompt
+
+def generate_code_from_design(design_content: str, file_path: str, additional_requirements: str = "") -> str:
+    """設計ドキュメントからコードを生成する（失敗した場合は anthropic.AnthropicError を送出する）"""
+    prompt = build_design_code_prompt(design_content, file_path, additional_requirements)
     try:
         logging.info("設計ベースコード生成中...")
-        response = anthropic_client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=4096,
-            messages=[{"role": "user", "content": prompt}]
+        response = model_router.create_message(
+            anthropic_client, "code_generation", [{"role": "user", "content": prompt}], cancel=job_store.cancel_event()
         )
         
         code_content = response.content[0].text
         logging.info(f"設計ベースコードが生成されました: {len(code_content)}文字")
         return code_content
         
-    except AnthropicError as e:
+    except anthropic.AnthropicError as e:
+        # エラーの文言をコードとして保存・表示しないよう、呼び出し元に失敗として返す
         logging.error(f"設計ベースコード生成エラー: {e}")
-        return f"# コード生成エラー\n# {e}"
+        raise
 
-def process_development_task(body, response_url):
-    """バックグラウンドで実行されるメインのタスク処理関数"""
+async def agenerate_code_from_design(design_content: str, file_path: str, additional_requirements: str = "") -> str:
+    """generate_code_from_design の非同期版（共有イベントループ上で AsyncAnthropic を使う）"""
+    # セクション要約はスレッドプールで並列に行うため、ループを止めないよう別スレッドで組み立てる
+    prompt = await asyncio.to_thread(build_design_code_prompt, design_content, file_path, additional_requirements)
     try:
-        # Slackからの指示テキストをパース
-        # 例: "my-user/my-repo の main.py に「Hello」と出力する機能を追加"
-        text = body.get("text", "")
-        logging.info(f"受信したコマンド: {text}")
-        parts = text.split(" の ", 1)
-        repo_name = parts[0]
-        parts = parts[1].split(" に ", 1)
-        file_path = parts[0]
-        instruction = parts[1]
-        logging.info(f"解析結果 - リポジトリ: {repo_name}, ファイル: {file_path}, 指示: {instruction}")
+        logging.info("設計ベースコード生成中...")
+        response = await model_router.acreate_message(
+            async_anthropic_client, "code_generation", [{"role": "user", "content": prompt}]
+        )
         
-        def send_message(text):
-            requests.post(response_url, json={"text": text})
-
-        # 1. GitHubから現在のコードを取得
-        send_message(f"承知しました。`{repo_name}`の`{file_path}`に対する作業を開始します。\nまずは現在のコードを取得します...")
-        current_code = get_repo_content(repo_name, file_path)
-        if current_code is None:
-            send_message(f"警告: `{repo_name}`の`{file_path}`が見つかりませんでした。新規ファイルとして処理を続行します。")
-            current_code = "" # 新規ファイルの場合は空の文字列
-            
-        # 2. Claudeにコード生成を依頼
-        send_message("コードのコンテキストをAIに渡し、改修案を生成させます...")
-        prompt = f"""
-        あなたはシニアソフトウェアエンジニアです。以下のファイルに対して、指示通りにコードを改修してください。
+        code_content = response.content[0].text
+        logging.info(f"設計ベースコードが生成されました: {len(code_content)}文字")
+        return code_content
         
+    except anthropic.AnthropicError as e:
+        # エラーの文言をコードとして保存・表示しないよう、呼び出し元に失敗として返す
+        logging.error(f"設計ベースコード生成エラー: {e}")
+        raise
+
+DEVELOP_MODEL = model_router.route("code_generation").model
+
+TRIM_NOTE = "`<<<AIBOT_OMITTED_番号>>>` の行は省略した既存コードです。この行は変更・削除せず、同じ位置にそのまま残してください。"
+CHUNK_NOTE = "これはファイルの一部（{index}/{total}）です。この部分の改修後のコードのみを返してください。指示に関係しない部分は変更せずに返してください。"
+
+def build_develop_prompt(file_path: str, code: str, instruction: str, note: str = "", related: str = "") -> str:
+    """/develop のコード改修プロンプトを組み立てる（related はリポジトリ内の関連コード）"""
+    related_section = f"""
+        参考: リポジトリ内の関連コード（import先・呼び出し元など。改修対象ではありません）
+        ```
+        {related}
+        ```
+        """ if related else ""
+    return f"""
+        あなたはシニアソフトウェアエンジニアです。以下のファイルに対して、指示通りにコードを改修してください。
+        {related_section}
         ファイルパス: `{file_path}`
         現在のコード:
         ```
-        {current_code}
+        {code}
         ```
         
         指示: 「{instruction}」
-        
+        {note}
         改修後のコード全体のみを、コードブロックなしで返してください。
         """
-        
-        logging.info(f"Anthropic APIリクエスト開始 - モデル: claude-3-5-sonnet-20240620, プロンプト長: {len(prompt)}")
-        logging.debug(f"送信プロンプト: {prompt[:500]}...")
-        
-        try:
-            response = anthropic_client.messages.create(
-                model="claude-3-5-sonnet-20240620", # 最新モデルを推奨
-                max_tokens=4096,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            logging.info(f"Anthropic APIレスポンス受信 - レスポンス長: {len(response.content[0].text)}")
-            logging.debug(f"受信レスポンス: {response.content[0].text[:500]}...")
-            new_code = response.content[0].text
-        except AnthropicError as e:
-            logging.error(f"Anthropic APIエラー詳細: {e}")
-            send_message(f"AIとの通信中にエラーが発生しました: {e}")
-            return
 
-        # 3. GitHubにPRを作成
-        send_message("新しいコードを元に、GitHubにプルリクエストを作成します...")
-        branch_name = f"ai-feature/{instruction[:20].replace(' ', '-')}-{os.urandom(2).hex()}"
-        commit_message = f"feat: {instruction}"
-        pr_title = f"AI提案: {instruction}"
-        
-        logging.info(f"GitHub PR作成開始 - ブランチ: {branch_name}, コミット: {commit_message}")
-        pr_url = create_github_pr(repo_name, branch_name, file_path, new_code, commit_message, pr_title)
+def count_code_tokens(text: str) -> int:
+    """Anthropic の count_tokens API でトークン数を数える（上限付近の場合のみ呼ばれる）"""
+    result = anthropic_client.messages.count_tokens(
+        model=DEVELOP_MODEL,
+        messages=[{"role": "user", "content": text}]
+    )
+    return result.input_tokens
+
+# 形式どおりでないコマンドを軽量モデルで解析するフォールバック
+# 推測した repo_name・file_path のまま確認なしでPRまで進むため、明示的に有効にした場合のみ使う
+COMMAND_PARSING_FALLBACK = os.environ.get("COMMAND_PARSING_FALLBACK", "false").strip().lower() in ("1", "true", "yes")
+
+DEVELOP_COMMAND_FIELDS = {
+    "repo_name": "GitHubリポジトリ名（owner/repo 形式）",
+    "file_path": "改修するファイルのパス",
+    "instruction": "やってほしいこと",
+}
+DESIGN_COMMAND_FIELDS = {
+    "project_name": "プロジェクト名",
+    "feature_name": "機能名",
+    "requirements": "要件・制約",
+}
+
+def parse_command_with_llm(text: str, fields: Dict[str, str]) -> Optional[Dict[str, str]]:
+    """コマンド引数から fields の各項目を抽出する（抽出できない項目がある場合は None）"""
+    if not COMMAND_PARSING_FALLBACK or not text.strip():
+        return None
+    field_lines = "\n".join(f"- {name}: {description}" for name, description in fields.items())
+    prompt = f"""次のSlackコマンドの引数から以下の項目を抽出し、JSONオブジェクトのみを返してください。
+抽出できない項目は null にしてください。
+
+項目:
+{field_lines}
+
+引数: {text}
+"""
+    try:
+        response = model_router.create_message(
+            anthropic_client, "command_parsing", [{"role": "user", "content": prompt}], stage=None
+        )
+        match = re.search(r"\{.*\}", response.content[0].text, re.DOTALL)
+        parsed = json.loads(match.group(0)) if match else {}
+    except Exception as e:
+        logging.warning(f"コマンドの解析（フォールバック）に失敗しました: {e}")
+        return None
+    if not isinstance(parsed, dict) or not all(isinstance(parsed.get(name), str) and parsed[name].strip() for name in fields):
+        return None
+    logging.info(f"コマンドを軽量モデルで解析しました: {parsed}")
+    return {name: parsed[name].strip() for name in fields}
+
+def job_payload(body: dict, response_url: str) -> dict:
+    """ジョブの再開に必要なコマンドの情報（トークン類は保存しない）"""
+    return {
+        "text": body.get("text", ""),
+        "user_id": body.get("user_id"),
+        "channel_id": body.get("channel_id"),
+        "response_url": response_url,
+    }
+
+def hand_over_if_stopping(job: job_store.Job, send_message) -> bool:
+    """終了処理中なら重いステージに進まず、ジョブを他のワーカーに引き継ぐ（永続化していないジョブはそのまま続行する）"""
+    if not lifecycle.stopping() or job.store is None:
+        return False
+    job.release()
+    send_message("⏸️ サーバーの再起動のため処理を一時停止しました。完了済みのステップから自動的に再開します")
+    return True
+
+def report_cancelled(job: job_store.Job, response_url: str):
+    """/cancel で取り消されたジョブを終了し、取り消したことを通知する"""
+    metrics.JOBS_CANCELLED.inc(kind=job.kind)
+    job.finish(job_store.CANCELLED)
+    done = f"（完了済み: {', '.join(job.checkpoints)}）" if job.checkpoints else ""
+    post_slack_message(response_url, f"🛑 ジョブ `{job.id[:8]}` を取り消しました{done}")
+
+def process_development_task(body, response_url, job: Optional[job_store.Job] = None):
+    """バックグラウンドで実行されるメインのタスク処理関数（job を渡すと完了済みのステージから再開する）"""
+    stages = pipeline.Pipeline("develop")
+    job = job_store.activate(job or job_store.start("develop", job_payload(body, response_url)))
+    try:
+        def send_message(text):
+            post_slack_message(response_url, text)
+
+        # Slackからの指示テキストをパース
+        # 例: "my-user/my-repo の main.py に「Hello」と出力する機能を追加"
+        text = body.get("text", "")
+        logging.info(f"受信したコマンド: {text}")
+        if job.get("parsed") is None:
+            with metrics.stage_timer("parse"), tracing.span("parse"):
+                try:
+                    parts = text.split(" の ", 1)
+                    repo_name = parts[0]
+                    parts = parts[1].split(" に ", 1)
+                    file_path = parts[0]
+                    instruction = parts[1]
+                except IndexError:
+                    parsed = parse_command_with_llm(text, DEVELOP_COMMAND_FIELDS)
+                    if parsed is None or "/" not in parsed["repo_name"]:
+                        raise
+                    repo_name, file_path, instruction = parsed["repo_name"], parsed["file_path"], parsed["instruction"]
+            job.checkpoint("parsed", {"repo_name": repo_name, "file_path": file_path, "instruction": instruction})
+        repo_name, file_path, instruction = (job.get("parsed")[key] for key in ("repo_name", "file_path", "instruction"))
+        logging.info(f"解析結果 - リポジトリ: {repo_name}, ファイル: {file_path}, 指示: {instruction}")
+        if job.resumed:
+            send_message(f"🔄 中断していた `{repo_name}` の `{file_path}` の作業を再開します（完了済み: {', '.join(job.checkpoints)}）")
+
+        # 1. GitHubから現在のコードを取得（PRのベースブランチ・インデックス更新・接続確立と並行）
+        job.raise_if_cancelled()
+        if job.get("fetched") is None:
+            stages.start("repo_file", get_repo_content, repo_name, file_path)
+            stages.start("base_sha", get_branch_sha, repo_name)
+            if not CLIENTS_WARM:
+                stages.start("anthropic_warmup", _timed_warmup_step, _warm_up_anthropic)
+            index_future = repo_index.prepare(github_client, repo_name) if repo_index.retrieval_enabled() else None
+            send_message(f"承知しました。`{repo_name}`の`{file_path}`に対する作業を開始します。\nまずは現在のコードを取得します...")
+            current_code = stages.result("repo_file")
+            if current_code is None:
+                send_message(f"警告: `{repo_name}`の`{file_path}`が見つかりませんでした。新規ファイルとして処理を続行します。")
+                current_code = "" # 新規ファイルの場合は空の文字列
+            related = ""
+            if index_future is not None:
+                with metrics.stage_timer("retrieval"), tracing.span("retrieval") as retrieval_span:
+                    index = repo_index.wait_for_index(index_future)
+                    snippets = index.related_snippets(file_path, current_code, instruction) if index else []
+                    related = repo_index.format_snippets(snippets)
+                    if retrieval_span:
+                        retrieval_span.set_attribute("snippets", len(snippets))
+                logging.info(f"関連コード: {len(snippets)}件 {[f'{s.path}:{s.start_line}' for s in snippets]}")
+            job.checkpoint("fetched", {"current_code": current_code, "related": related, "base_sha": stages.result("base_sha")})
+            
+        # 2. Claudeにコード生成を依頼（トークン予算に応じて送信方針を決める）
+        job.raise_if_cancelled()
+        if job.get("generated") is None:
+            if hand_over_if_stopping(job, send_message):
+                return
+            current_code, related = job.get("fetched")["current_code"], job.get("fetched")["related"]
+            send_message("コードのコンテキストをAIに渡し、改修案を生成させます...")
+            overhead_tokens = token_budget.estimate_tokens(build_develop_prompt(file_path, "", instruction, related=related))
+            with tracing.span("token_budget") as budget_span:
+                plan = token_budget.plan_code_edit(current_code, instruction, DEVELOP_MODEL, overhead_tokens, counter=count_code_tokens)
+                if budget_span:
+                    budget_span.set_attribute("strategy", plan.strategy)
+                    budget_span.set_attribute("estimated_tokens", plan.input_tokens)
+            logging.info(f"トークン予算: {plan.strategy} (推定 {plan.input_tokens} トークン) {plan.reason}")
+            
+            if plan.strategy == "reject":
+                send_message(f"⚠️ `{file_path}` が大きすぎるため処理を中止しました: {plan.reason}\n対象の関数・クラス名を指示に含めるか、ファイルを分割してから再実行してください。")
+                job.fail(plan.reason)
+                return
+            if plan.strategy == "trim":
+                send_message(f"ℹ️ ファイルが大きいため、指示に関係する部分のみをAIに渡します（{plan.reason}）")
+            elif plan.strategy == "chunk":
+                send_message(f"ℹ️ ファイルが大きいため、{len(plan.parts)}回に分けて改修します")
+            
+            if "anthropic_warmup" in stages:
+                stages.result("anthropic_warmup")
+            try:
+                # 分割時は完了した部分ごとに記録し、再開時は残りの部分だけを生成する
+                outputs = list(job.get("outputs") or [])
+                for index, (part, max_tokens) in enumerate(zip(plan.parts, plan.max_tokens), start=1):
+                    if index <= len(outputs):
+                        continue
+                    if plan.strategy == "trim":
+                        note = TRIM_NOTE
+                    elif plan.strategy == "chunk":
+                        note = CHUNK_NOTE.format(index=index, total=len(plan.parts))
+                    else:
+                        note = ""
+                    prompt = build_develop_prompt(file_path, part, instruction, note, related)
+                    logging.info(f"Anthropic APIリクエスト開始 - モデル: {DEVELOP_MODEL}, プロンプト長: {len(prompt)}, max_tokens: {max_tokens}")
+                    response = model_router.create_message(
+                        anthropic_client, "code_generation", [{"role": "user", "content": prompt}], max_tokens=max_tokens,
+                        cancel=job_store.cancel_event()
+                    )
+                    logging.info(f"Anthropic APIレスポンス受信 - レスポンス長: {len(response.content[0].text)}")
+                    if getattr(response, "stop_reason", None) == "max_tokens":
+                        send_message("❌ AIの出力が上限で打ち切られたため、プルリクエストの作成を中止しました。対象を絞って再実行してください。")
+                        job.fail("出力が max_tokens で打ち切られました")
+                        return
+                    outputs.append(response.content[0].text)
+                    if len(plan.parts) > 1:
+                        job.checkpoint("outputs", outputs)
+            except anthropic.AnthropicError as e:
+                logging.error(f"Anthropic APIエラー詳細: {e}")
+                send_message(f"AIとの通信中にエラーが発生しました: {e}")
+                job.fail(e)
+                return
+            
+            if plan.strategy == "chunk":
+                new_code = "\n".join(output.rstrip("\n") for output in outputs) + "\n"
+            else:
+                new_code = plan.restore(outputs[0])
+            if new_code is None:
+                send_message("❌ AIの出力から省略したコードを復元できなかったため、プルリクエストの作成を中止しました。")
+                job.fail("省略したコードを復元できませんでした")
+                return
+            branch_name = f"ai-feature/{instruction[:20].replace(' ', '-')}-{os.urandom(2).hex()}"
+            job.checkpoint("generated", {"new_code": new_code, "branch_name": branch_name})
+
+        # 3. GitHubにPRを作成（取り消しを確認するのはここまで。作成を始めたら完了させる）
+        job.raise_if_cancelled()
+        if job.get("pr_created") is None:
+            new_code, branch_name = job.get("generated")["new_code"], job.get("generated")["branch_name"]
+            send_message("新しいコードを元に、GitHubにプルリクエストを作成します...")
+            commit_message = f"feat: {instruction}"
+            pr_title = f"AI提案: {instruction}"
+            
+            logging.info(f"GitHub PR作成開始 - ブランチ: {branch_name}, コミット: {commit_message}")
+            pr_url = create_github_pr(repo_name, branch_name, file_path, new_code, commit_message, pr_title,
+                                      base_sha=(job.get("fetched") or {}).get("base_sha"))
+            if not pr_url:
+                logging.error("GitHub PR作成失敗")
+                send_message("❌ プルリクエストの作成中にエラーが発生しました。詳細はログを確認してください。")
+                job.fail("プルリクエストの作成に失敗しました")
+                return
+            job.checkpoint("pr_created", {"pr_url": pr_url})
+            job.add_link("PR", pr_url)
         
-        if pr_url:
-            logging.info(f"GitHub PR作成成功: {pr_url}")
-            send_message(f"✅ プルリクエストの作成が完了しました！\nレビューをお願いします: {pr_url}")
-        else:
-            logging.error("GitHub PR作成失敗")
-            send_message("❌ プルリクエストの作成中にエラーが発生しました。詳細はログを確認してください。")
+        pr_url = job.get("pr_created")["pr_url"]
+        logging.info(f"GitHub PR作成成功: {pr_url}")
+        send_message(f"✅ プルリクエストの作成が完了しました！\nレビューをお願いします: {pr_url}")
 
-    except IndexError:
-        requests.post(response_url, json={"text": "コマンドの形式が正しくありません。\n例: `/develop [リポジトリ名] の [ファイルパス] に [やってほしいこと]`"})
-    except AnthropicError as e:
-        requests.post(response_url, json={"text": f"AIとの通信中にエラーが発生しました: {e}"})
+    except job_store.JobCancelled:
+        report_cancelled(job, response_url)
+    except IndexError as e:
+        job.fail(e)
+        post_slack_message(response_url, "コマンドの形式が正しくありません。\n例: `/develop [リポジトリ名] の [ファイルパス] に [やってほしいこと]`")
+    except anthropic.AnthropicError as e:
+        job.fail(e)
+        post_slack_message(response_url, f"AIとの通信中にエラーが発生しました: {e}")
     except Exception as e:
+        job.fail(e)
         logging.error(f"予期せぬエラー: {e}")
-        requests.post(response_url, json={"text": f"予期せぬエラーが発生しました。詳細はログを確認してください。"})
+        post_slack_message(response_url, f"予期せぬエラーが発生しました。詳細はログを確認してください。")
+    finally:
+        stages.close()
+        job.finish()
+
+# 受信したコマンドの記録（replay.py で再生するため。COMMAND_RECORD_FILE 指定時のみ）
+COMMAND_RECORD_FILE = os.environ.get("COMMAND_RECORD_FILE", "").strip()
+_command_record_lock = threading.Lock()
+
+def record_command(command: str, body: dict):
+    """コマンドの受信時刻とペイロード（トークン・response_urlを除く）をJSON Linesで追記する"""
+    if not COMMAND_RECORD_FILE:
+        return
+    entry = {
+        "timestamp": time.time(),
+        "command": command,
+        "text": body.get("text", ""),
+        "user_id": body.get("user_id"),
+        "channel_id": body.get("channel_id"),
+    }
+    try:
+        with _command_record_lock, open(COMMAND_RECORD_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logging.warning(f"コマンドの記録に失敗しました: {e}")
+
+# 登録済みコマンドハンドラー（プレフィックスなしのコマンド名 -> ハンドラー）
+COMMAND_HANDLERS: dict = {}
 
 # 環境別コマンド登録のヘルパー関数
 def register_command(command_name):
-    """環境に応じたコマンド名でデコレータを返す"""
+    """環境に応じたコマンド名でデコレータを返す（コマンドごとにトレースを開始）"""
     full_command_name = f"/{COMMAND_PREFIX}{command_name}"
-    return app.command(full_command_name)
+    
+    def decorator(handler):
+        @functools.wraps(handler)
+        def traced_handler(ack, body, say):
+            record_command(full_command_name, body)
+            with tracing.start_trace(
+                full_command_name,
+                user_id=body.get("user_id"),
+                channel_id=body.get("channel_id"),
+                trigger_id=body.get("trigger_id"),
+                text=body.get("text", "")[:200]
+            ):
+                return handler(ack, body, say)
+        
+        COMMAND_HANDLERS[command_name] = traced_handler
+        return app.command(full_command_name)(traced_handler)
+    
+    return decorator
 
 @register_command("develop")
 def handle_develop_command(ack, body, say):
     """Slackからのスラッシュコマンドを受け取るハンドラ"""
-    # Slackの3秒タイムアウトに応答
-    ack(f"指示を受け付けました: `{body['text']}`\nバックグラウンドで開発タスクを開始します...")
-    
-    # バックグラウンドでタスクを実行
-    thread = threading.Thread(target=process_development_task, args=(body, body['response_url']))
-    thread.start()
+    # Slackの3秒タイムアウトに応答し、キュー（TASK_QUEUE）に入れるかバックグラウンドでタスクを実行
+    accept_task(ack, "develop", body, f"指示を受け付けました: `{body['text']}`\nバックグラウンドで開発タスクを開始します...")
 
-def process_design_task(body, response_url):
-    """設計ドキュメント作成タスクの処理"""
+def process_design_task(body, response_url, job: Optional[job_store.Job] = None):
+    """設計ドキュメント作成タスクの処理（job を渡すと完了済みのステージから再開する）"""
+    job = job_store.activate(job or job_store.start("design", job_payload(body, response_url)))
     try:
         # Slackからの指示テキストをパース
         # 例: "my-app の ユーザー認証機能 について JWT認証を使用し、ログイン・ログアウト機能を含む"
@@ -583,49 +1072,71 @@ def process_design_task(body, response_url):
         logging.info(f"受信した設計コマンド: {text}")
         
         def send_message(text):
-            requests.post(response_url, json={"text": text})
-        
-        # コマンド形式の解析
-        parts = text.split(" の ", 1)
-        if len(parts) < 2:
-            send_message("コマンドの形式が正しくありません。\n例: `/design プロジェクト名 の 機能名 について 要件内容`")
-            return
-            
-        project_name = parts[0]
-        parts = parts[1].split(" について ", 1)
-        if len(parts) < 2:
-            send_message("コマンドの形式が正しくありません。\n例: `/design プロジェクト名 の 機能名 について 要件内容`")
-            return
-            
-        feature_name = parts[0]
-        requirements = parts[1]
+            post_slack_message(response_url, text)
+        
+        # コマンド形式の解析（形式どおりでない場合は軽量モデルで解析）
+        if job.get("parsed") is None:
+            parts = text.split(" の ", 1)
+            if len(parts) == 2 and " について " in parts[1]:
+                project_name = parts[0]
+                feature_name, requirements = parts[1].split(" について ", 1)
+            else:
+                parsed = parse_command_with_llm(text, DESIGN_COMMAND_FIELDS)
+                if parsed is None:
+                    send_message("コマンドの形式が正しくありません。\n例: `/design プロジェクト名 の 機能名 について 要件内容`")
+                    job.fail("コマンドの形式が正しくありません")
+                    return
+                project_name, feature_name, requirements = parsed["project_name"], parsed["feature_name"], parsed["requirements"]
+            job.checkpoint("parsed", {"project_name": project_name, "feature_name": feature_name, "requirements": requirements})
+        project_name, feature_name, requirements = (job.get("parsed")[key] for key in ("project_name", "feature_name", "requirements"))
         
         logging.info(f"設計解析結果 - プロジェクト: {project_name}, 機能: {feature_name}, 要件: {requirements}")
         
         if not CONFLUENCE_ENABLED:
             send_message("⚠️ Confluence機能が有効になっていません。環境変数を確認してください。")
+            job.fail("Confluenceが無効です")
             return
+        if job.resumed:
+            send_message(f"🔄 中断していた `{feature_name}` の設計ドキュメント作成を再開します（完了済み: {', '.join(job.checkpoints)}）")
         
         # 1. 設計ドキュメント生成
-        send_message(f"📋 `{project_name}`の`{feature_name}`機能の設計ドキュメントを生成中...")
-        design_content = generate_design_document(project_name, feature_name, requirements)
+        job.raise_if_cancelled()
+        if job.get("design_doc") is None:
+            if hand_over_if_stopping(job, send_message):
+                return
+            send_message(f"📋 `{project_name}`の`{feature_name}`機能の設計ドキュメントを生成中...")
+            job.checkpoint("design_doc", {"content": generate_design_document(project_name, feature_name, requirements)})
+        design_content = job.get("design_doc")["content"]
         
         # 2. Confluenceページ作成
-        send_message("📝 Confluenceに設計ドキュメントを作成中...")
-        page_title = f"{project_name} - {feature_name} 設計書"
-        page_url = create_confluence_page(CONFLUENCE_SPACE_KEY, page_title, design_content)
+        job.raise_if_cancelled()
+        if job.get("page_created") is None:
+            send_message("📝 Confluenceに設計ドキュメントを作成中...")
+            page_title = f"{project_name} - {feature_name} 設計書"
+            page_url = create_confluence_page(CONFLUENCE_SPACE_KEY, page_title, design_content)
+            if not page_url:
+                send_message("❌ Confluenceページの作成中にエラーが発生しました。詳細はログを確認してください。")
+                job.fail("Confluenceページの作成に失敗しました")
+                return
+            job.checkpoint("page_created", {"page_url": page_url})
+            job.add_link("設計書", page_url)
         
-        if page_url:
-            send_message(f"✅ 設計ドキュメントの作成が完了しました！\n📄 設計書: {page_url}\n\n💡 開発を開始するには `/develop-from-design {page_url} の [ファイルパス] に実装` を使用してください。")
-        else:
-            send_message("❌ Confluenceページの作成中にエラーが発生しました。詳細はログを確認してください。")
+        page_url = job.get("page_created")["page_url"]
+        send_message(f"✅ 設計ドキュメントの作成が完了しました！\n📄 設計書: {page_url}\n\n💡 開発を開始するには `/develop-from-design {page_url} の [ファイルパス] に実装` を使用してください。")
             
+    except job_store.JobCancelled:
+        report_cancelled(job, response_url)
     except Exception as e:
+        job.fail(e)
         logging.error(f"設計タスク処理エラー: {e}")
-        requests.post(response_url, json={"text": f"設計ドキュメント作成中にエラーが発生しました: {e}"})
+        post_slack_message(response_url, f"設計ドキュメント作成中にエラーが発生しました: {e}")
+    finally:
+        job.finish()
 
-def process_design_based_development_task(body, response_url):
-    """設計ベース開発タスクの処理"""
+def process_design_based_development_task(body, response_url, job: Optional[job_store.Job] = None):
+    """設計ベース開発タスクの処理（job を渡すと完了済みのステージから再開する）"""
+    stages = pipeline.Pipeline("develop_from_design")
+    job = job_store.activate(job or job_store.start("develop_from_design", job_payload(body, response_url)))
     try:
         # Slackからの指示テキストをパース
         # 例: "https://company.atlassian.net/wiki/spaces/DEV/pages/123456/User-Auth の auth.py に実装"
@@ -633,18 +1144,20 @@ def process_design_based_development_task(body, response_url):
         logging.info(f"受信した設計ベース開発コマンド: {text}")
         
         def send_message(text):
-            requests.post(response_url, json={"text": text})
+            post_slack_message(response_url, text)
         
         # コマンド形式の解析
         parts = text.split(" の ", 1)
         if len(parts) < 2:
             send_message("コマンドの形式が正しくありません。\n例: `/develop-from-design [confluence-url] の [ファイルパス] に実装`")
+            job.fail("コマンドの形式が正しくありません")
             return
             
         confluence_url = parts[0]
         parts = parts[1].split(" に実装", 1)
         if len(parts) < 1:
             send_message("コマンドの形式が正しくありません。\n例: `/develop-from-design [confluence-url] の [ファイルパス] に実装`")
+            job.fail("コマンドの形式が正しくありません")
             return
             
         file_path = parts[0]
@@ -654,19 +1167,38 @@ def process_design_based_development_task(body, response_url):
         
         if not CONFLUENCE_ENABLED:
             send_message("⚠️ Confluence機能が有効になっていません。環境変数を確認してください。")
+            job.fail("Confluenceが無効です")
             return
+        if job.resumed:
+            send_message(f"🔄 中断していた `{file_path}` のコード生成を再開します（完了済み: {', '.join(job.checkpoints)}）")
+        
+        # 1. Confluenceから設計ドキュメント取得（Anthropic への接続確立と並行）
+        job.raise_if_cancelled()
+        if job.get("design") is None:
+            stages.start("design", get_confluence_page_content, confluence_url)
+            if not CLIENTS_WARM:
+                stages.start("anthropic_warmup", _timed_warmup_step, _warm_up_anthropic)
+            send_message(f"📖 Confluenceから設計ドキュメントを取得中...")
+            design_content = stages.result("design")
+            
+            if not design_content:
+                send_message("❌ Confluenceページから設計ドキュメントを取得できませんでした。URLを確認してください。")
+                job.fail("設計ドキュメントを取得できませんでした")
+                return
+            job.checkpoint("design", {"content": design_content})
+        design_content = job.get("design")["content"]
         
-        # 1. Confluenceから設計ドキュメント取得
-        send_message(f"📖 Confluenceから設計ドキュメントを取得中...")
-        design_content = get_confluence_page_content(confluence_url)
-        
-        if not design_content:
-            send_message("❌ Confluenceページから設計ドキュメントを取得できませんでした。URLを確認してください。")
-            return
-        
-        # 2. 設計ベースコード生成
-        send_message(f"🤖 設計ドキュメントに基づいて`{file_path}`のコードを生成中...")
-        generated_code = generate_code_from_design(design_content, file_path, additional_requirements)
+        # 2. 設計ベースコード生成（進捗の通知と並行）
+        job.raise_if_cancelled()
+        if job.get("generated") is None:
+            if hand_over_if_stopping(job, send_message):
+                return
+            if "anthropic_warmup" in stages:
+                stages.result("anthropic_warmup")
+            stages.start("code", generate_code_from_design, design_content, file_path, additional_requirements)
+            send_message(f"🤖 設計ドキュメントに基づいて`{file_path}`のコードを生成中...")
+            job.checkpoint("generated", {"code": stages.result("code")})
+        generated_code = job.get("generated")["code"]
         
         # 3. GitHubからリポジトリ情報を推測またはユーザーに確認
         # 今回は簡単のため、事前設定されたリポジトリを使用
@@ -681,61 +1213,360 @@ def process_design_based_development_task(body, response_url):
         # 将来の改善提案
         send_message("💡 改善提案: `/develop-with-design [confluence-url] [owner/repo] の [ファイルパス] に実装` のような形式で、リポジトリを指定できるようにすることを検討中です。")
         
+    except job_store.JobCancelled:
+        report_cancelled(job, response_url)
     except Exception as e:
+        job.fail(e)
         logging.error(f"設計ベース開発タスク処理エラー: {e}")
-        requests.post(response_url, json={"text": f"設計ベース開発中にエラーが発生しました: {e}"})
+        post_slack_message(response_url, f"設計ベース開発中にエラーが発生しました: {e}")
+    finally:
+        stages.close()
+        job.finish()
+
+# /design-batch: 1つのプロジェクトの複数の機能の設計書を並行して作成する
+DESIGN_BATCH_MAX_FEATURES = int(os.environ.get("DESIGN_BATCH_MAX_FEATURES", "10"))
+DESIGN_BATCH_USAGE = "例: `/design-batch プロジェクト名 の 機能A、機能B: 個別の要件、機能C について 共通の要件`"
+
+def parse_design_batch(text: str) -> Optional[Tuple[str, List[Dict[str, str]], str]]:
+    """「プロジェクト名 の 機能A、機能B: 個別の要件 について 共通の要件」を解析する（機能は 、 , ; 改行 で区切る）"""
+    parts = text.split(" の ", 1)
+    if len(parts) != 2:
+        return None
+    features_text, _, requirements = parts[1].partition(" について ")
+    features: Dict[str, str] = {}
+    for item in re.split(r"[、,;；\n]", features_text):
+        name, _, extra = item.replace("：", ":").partition(":")
+        if name.strip():
+            features.setdefault(name.strip(), extra.strip())
+    if not parts[0].strip() or not features:
+        return None
+    return parts[0].strip(), [{"feature_name": name, "requirements": extra} for name, extra in features.items()], requirements.strip()
+
+def design_batch_concurrency(count: int) -> int:
+    """同時に生成する件数（ゲートウェイの同時実行数を超えるとスレッドが順番待ちでタイムアウトするため、それ以下にする）"""
+    gateway = anthropic_gateway.GATEWAY
+    limit = int(os.environ.get("DESIGN_BATCH_CONCURRENCY", "0")) or gateway.model_concurrency
+    return max(1, min(limit, gateway.model_concurrency, gateway.max_concurrency, count))
+
+def design_batch_index(project_name: str, features: List[Dict[str, str]], requirements: str) -> str:
+    """親ページ（設計書一覧）の本文"""
+    rows = "\n".join(f"| {feature['feature_name']} | {feature['requirements'] or '-'} |" for feature in features)
+    return f"# {project_name} 設計書一覧\n\n共通の要件: {requirements or '-'}\n\n| 機能 | 個別の要件 |\n|---|---|\n{rows}\n"
+
+def create_batch_design_page(job: job_store.Job, project_name: str, feature: Dict[str, str], requirements: str,
+                             parent_id: str) -> str:
+    """1機能の設計書を生成して親ページの下に作成し、ページのURLを返す（スレッドプールから呼ばれる）"""
+    job.raise_if_cancelled()
+    feature_requirements = "\n".join(filter(None, [requirements, feature["requirements"]]))
+    content = generate_design_document(project_name, feature["feature_name"], feature_requirements)
+    job.raise_if_cancelled()
+    page_url = create_confluence_page(
+        CONFLUENCE_SPACE_KEY, f"{project_name} - {feature['feature_name']} 設計書", content, parent_id=parent_id
+    )
+    if not page_url:
+        raise RuntimeError("Confluenceページの作成に失敗しました")
+    return page_url
+
+def process_design_batch_task(body, response_url, job: Optional[job_store.Job] = None):
+    """複数機能の設計ドキュメント作成タスクの処理（作成済みのページは再開時に作り直さない）"""
+    job = job_store.activate(job or job_store.start("design_batch", job_payload(body, response_url)))
+    try:
+        text = body.get("text", "")
+        logging.info(f"受信した一括設計コマンド: {text}")
+
+        def send_message(text):
+            post_slack_message(response_url, text)
+
+        if job.get("parsed") is None:
+            parsed = parse_design_batch(text)
+            if parsed is None:
+                send_message(f"コマンドの形式が正しくありません。\n{DESIGN_BATCH_USAGE}")
+                job.fail("コマンドの形式が正しくありません")
+                return
+            project_name, features, requirements = parsed
+            if len(features) > DESIGN_BATCH_MAX_FEATURES:
+                send_message(f"一度に作成できる設計書は{DESIGN_BATCH_MAX_FEATURES}件までです（指定: {len(features)}件）")
+                job.fail("機能の数が上限を超えています")
+                return
+            job.checkpoint("parsed", {"project_name": project_name, "features": features, "requirements": requirements})
+        project_name, features, requirements = (job.get("parsed")[key] for key in ("project_name", "features", "requirements"))
+
+        if not CONFLUENCE_ENABLED:
+            send_message("⚠️ Confluence機能が有効になっていません。環境変数を確認してください。")
+            job.fail("Confluenceが無効です")
+            return
+
+        # 1. 親ページ（設計書一覧）を作成し、各機能のページをその下に作成する
+        job.raise_if_cancelled()
+        if job.get("parent") is None:
+            parent = confluence_format.write_page(
+                confluence_client, CONFLUENCE_SPACE_KEY, f"{project_name} 設計書一覧",
+                design_batch_index(project_name, features, requirements),
+            )
+            job.checkpoint("parent", {"page_id": parent.page_id, "page_url": f"{CONFLUENCE_URL}/pages/viewpage.action?pageId={parent.page_id}"})
+            job.add_link("設計書一覧", job.get("parent")["page_url"])
+        parent = job.get("parent")
+
+        # 2. 各機能の設計書を並行して生成・作成（完了したものから記録する）
+        pending = [index for index in range(len(features)) if job.get(f"page:{index}") is None]
+        errors: Dict[int, str] = {}
+        if pending:
+            if hand_over_if_stopping(job, send_message):
+                return
+            workers = design_batch_concurrency(len(pending))
+            send_message(f"📋 `{project_name}` の{len(pending)}件の設計ドキュメントを並行して生成中...（同時に{workers}件）")
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="design-batch") as executor:
+                # 取り消しの確認とトークン使用量の記録のため、ジョブのコンテキストを引き継ぐ
+                futures = {
+                    executor.submit(contextvars.copy_context().run, create_batch_design_page,
+                                    job, project_name, features[index], requirements, parent["page_id"]): index
+                    for index in pending
+                }
+                try:
+                    for future in concurrent.futures.as_completed(futures):
+                        index = futures[future]
+                        try:
+                            job.checkpoint(f"page:{index}", {"page_url": future.result()})
+                            metrics.DESIGN_BATCH_ITEMS.inc(status="created")
+                        except job_store.JobCancelled:
+                            raise
+                        except Exception as e:
+                            logging.error(f"設計書の作成に失敗しました ({features[index]['feature_name']}): {e}")
+                            metrics.DESIGN_BATCH_ITEMS.inc(status="failed")
+                            errors[index] = str(e)
+                except job_store.JobCancelled:
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    raise
+
+        # 3. 結果をまとめて1回だけ通知する
+        lines = []
+        for index, feature in enumerate(features):
+            page = job.get(f"page:{index}")
+            lines.append(f"• {feature['feature_name']}: {page['page_url'] if page else '❌ ' + errors.get(index, '未作成')}")
+        created = len(features) - len(errors)
+        if not created:
+            job.fail("すべての設計書の作成に失敗しました")
+            send_message(
+                f"❌ `{project_name}` の設計ドキュメントを作成できませんでした（0/{len(features)}件、{format_duration(job.elapsed())}）\n"
+                + "\n".join(lines)
+            )
+            return
+        status = "✅" if not errors else "⚠️"
+        send_message(
+            f"{status} `{project_name}` の設計ドキュメントを作成しました（{created}/{len(features)}件、{format_duration(job.elapsed())}）\n"
+            f"📁 設計書一覧: {parent['page_url']}\n" + "\n".join(lines)
+        )
+
+    except job_store.JobCancelled:
+        report_cancelled(job, response_url)
+    except Exception as e:
+        job.fail(e)
+        logging.error(f"一括設計タスク処理エラー: {e}")
+        post_slack_message(response_url, f"設計ドキュメントの一括作成中にエラーが発生しました: {e}")
+    finally:
+        job.finish()
 
 @register_command("design")
 def handle_design_command(ack, body, say):
     """設計ドキュメント作成コマンドのハンドラー"""
-    # Slackの3秒タイムアウトに応答
-    ack(f"設計依頼を受け付けました: `{body['text']}`\n設計ドキュメントの生成を開始します...")
-    
-    # バックグラウンドでタスクを実行
-    thread = threading.Thread(target=process_design_task, args=(body, body['response_url']))
-    thread.start()
+    # Slackの3秒タイムアウトに応答し、キュー（TASK_QUEUE）に入れるかバックグラウンドでタスクを実行
+    accept_task(ack, "design", body, f"設計依頼を受け付けました: `{body['text']}`\n設計ドキュメントの生成を開始します...")
+
+@register_command("design-batch")
+def handle_design_batch_command(ack, body, say):
+    """複数機能の設計ドキュメント作成コマンドのハンドラー"""
+    accept_task(ack, "design_batch", body, f"一括設計依頼を受け付けました: `{body['text']}`\n設計ドキュメントの並行生成を開始します...")
 
 @register_command("develop-from-design")
 def handle_develop_from_design_command(ack, body, say):
     """設計ベース開発コマンドのハンドラー"""
-    # Slackの3秒タイムアウトに応答
-    ack(f"設計ベース開発依頼を受け付けました: `{body['text']}`\n設計ドキュメントの解析を開始します...")
-    
-    # バックグラウンドでタスクを実行
-    thread = threading.Thread(target=process_design_based_development_task, args=(body, body['response_url']))
-    thread.start()
+    # Slackの3秒タイムアウトに応答し、キュー（TASK_QUEUE）に入れるかバックグラウンドでタスクを実行
+    accept_task(ack, "develop_from_design", body, f"設計ベース開発依頼を受け付けました: `{body['text']}`\n設計ドキュメントの解析を開始します...")
+
+# /status の表示
+STATUS_JOB_LIMIT = 5
+JOB_STATUS_LABELS = {
+    job_store.QUEUED: "⏳ キュー待ち",
+    job_store.RUNNING: "🔄 実行中",
+    job_store.DONE: "✅ 完了",
+    job_store.FAILED: "❌ 失敗",
+    job_store.CANCELLED: "🛑 取り消し",
+    job_store.RELEASED: "⏸️ 引き継ぎ中",
+}
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}分{seconds}秒" if minutes else f"{seconds}秒"
+
+def format_job_status(job: job_store.Job, now: Optional[float] = None) -> str:
+    """/status の1行（状態・経過時間・最後に完了したステージ・トークン数・成果物のリンク）"""
+    label = JOB_STATUS_LABELS.get(job.status, job.status)
+    if job.status == job_store.RUNNING and not job.started:
+        label = "⏳ 実行待ち"
+    text = job.payload.get("text", "")
+    line = f"• `{job.id[:8]}` {label} /{COMMAND_PREFIX}{job.kind.replace('_', '-')} `{text[:40]}{'…' if len(text) > 40 else ''}`"
+    details = [format_duration(job.elapsed(now))]
+    if job.stage and job.status == job_store.RUNNING:
+        details.append(f"`{job.stage}` まで完了")
+    usage = job.progress.get("usage")
+    if usage:
+        details.append(f"{usage['input_tokens'] + usage['output_tokens']:,} トークン")
+    line += f"（{'、'.join(details)}）"
+    links = job.progress.get("links") or {}
+    if links:
+        line += " " + " ".join(f"<{url}|{name}>" for name, url in links.items())
+    return line
+
+@register_command("status")
+def handle_status_command(ack, body, say):
+    """自分のジョブの進捗を返すコマンドのハンドラー（同じコマンドの再送を減らすため）"""
+    jobs = job_store.jobs_for(_scheduler_key(body), limit=STATUS_JOB_LIMIT)
+    if not jobs:
+        ack("最近のジョブはありません")
+        return
+    ack(f"📋 最近のジョブ（{len(jobs)}件）\n" + "\n".join(format_job_status(job) for job in jobs))
+
+@register_command("cancel")
+def handle_cancel_command(ack, body, say):
+    """実行中・実行待ちのジョブを取り消すコマンドのハンドラー（ID省略時は最後に受け付けたジョブ）"""
+    job_id = body.get("text", "").strip()
+    cancelled = job_store.cancel(_scheduler_key(body), job_id or None)
+    if cancelled is None:
+        ack(f"取り消せるジョブが見つかりませんでした: `{job_id}`" if job_id else "取り消せるジョブが見つかりませんでした")
+        return
+    # 実行中のジョブは次の確認箇所（ステージの区切り・LLMの応答の受信中）で中断し、完了時に通知する
+    ack(f"🛑 ジョブ `{cancelled[:8]}` の取り消しを受け付けました")
+
+# 再開できるジョブの種類と処理関数（job_store.py 参照。MCP版は非同期のため対象外）
+JOB_PROCESSORS = {
+    "develop": process_development_task,
+    "design": process_design_task,
+    "design_batch": process_design_batch_task,
+    "develop_from_design": process_design_based_development_task,
+}
+
+def resume_job(job: job_store.Job):
+    """中断したジョブを保存済みのコマンド情報からバックグラウンドで再開する"""
+    body = dict(job.payload)
+    SCHEDULER.submit(_scheduler_key(body), job.kind, JOB_PROCESSORS[job.kind], body, body["response_url"], job)
+
+def _scheduler_key(body: dict) -> str:
+    return body.get("user_id") or "unknown"
+
+def accept_task(ack, kind: str, body: dict, message: str):
+    """レート制限を確認して ack し、タスクを実行に回す（実行待ちになった場合は順番を ack に含める）"""
+    wait = SCHEDULER.check_rate(_scheduler_key(body), body.get("channel_id") or "unknown")
+    if wait > 0:
+        ack(f"⏳ 短時間にコマンドが集中しているため受け付けられませんでした。{math.ceil(wait)}秒後に再度お試しください。")
+        return
+    if task_queue.QUEUE is not None:
+        # process_before_response=True のため ack はリスナーが戻ってからSlackに送られる。
+        # 送信の再送で3秒を超えないよう、キューへの送信は別スレッドで行ってすぐに戻る
+        ack(message)
+        threading.Thread(target=contextvars.copy_context().run, args=(dispatch_task, kind, body),
+                         name=f"dispatch-{kind}").start()
+        return
+    job_id, position = dispatch_task(kind, body)
+    if position:
+        message += f"\n⏳ 他のコマンドを実行中のため、{position}番目に開始します"
+    if job_id:
+        message += f"\n🆔 `{job_id[:8]}`（取り消すには `/{COMMAND_PREFIX}cancel {job_id[:8]}`）"
+    ack(message)
+
+def accept_async_task(ack, kind: str, body: dict, message: str, process) -> Optional[concurrent.futures.Future]:
+    """MCP版のコマンドをレート制限を確認して ack し、共有イベントループで実行する
 
-async def process_design_task_mcp(body, response_url):
-    """MCP版設計ドキュメント作成タスクの処理"""
+    非同期のため公平な実行順（SCHEDULER.submit）と再開の対象外だが、ジョブとして登録して /status・/cancel で扱えるようにする。
+    """
+    wait = SCHEDULER.check_rate(_scheduler_key(body), body.get("channel_id") or "unknown")
+    if wait > 0:
+        ack(f"⏳ 短時間にコマンドが集中しているため受け付けられませんでした。{math.ceil(wait)}秒後に再度お試しください。")
+        return None
+    job = job_store.start(kind, job_payload(body, body["response_url"]), persist=False)
+    ack(f"{message}\n🆔 `{job.id[:8]}`（取り消すには `/{COMMAND_PREFIX}cancel {job.id[:8]}`）")
+    future = run_async_safely(process(body, body["response_url"], job), kind=kind)
+    # 開始前に終了処理でキャンセルされた場合もジョブを終了する（終了済みなら何もしない）
+    future.add_done_callback(lambda _: job.finish(job_store.CANCELLED))
+    return future
+
+def dispatch_task(kind: str, body: dict) -> Tuple[Optional[str], int]:
+    """コマンドをタスクキューに入れる（TASK_QUEUE=inline または投入に失敗した場合はこのプロセスで実行する）
+
+    Returns:
+        (ジョブID, 順番): ジョブIDは /cancel で指定できるID（HTTPで送った場合は None）、
+        順番はこのプロセスで実行待ちになった場合の順番（すぐに開始した場合とキューに入れた場合は 0）
+    """
+    queue = task_queue.QUEUE
+    payload = job_payload(body, body["response_url"])
+    if queue is not None:
+        try:
+            job_id = queue.put(kind, payload)
+            logging.info(f"タスクをキューに追加しました: {kind} ({queue.backend}: {job_id})")
+            return (job_id if queue.backend == "sqlite" else None), 0
+        except task_queue.EnqueueError as e:
+            metrics.TASKS_ENQUEUE_ERRORS.inc(kind=kind, backend=queue.backend)
+            logging.warning(f"タスクをキューに追加できないため、このプロセスで実行します: {e}")
+    # 実行待ちの間も /cancel で取り消せるよう、受け付けた時点でジョブを登録する
+    job = job_store.start(kind, payload)
+    return job.id, SCHEDULER.submit(_scheduler_key(body), kind, JOB_PROCESSORS[kind], body, body["response_url"], job)
+
+def _hand_over_pending_tasks():
+    """終了処理の開始時に、まだ開始していないタスクを他のワーカーに引き継ぐ"""
+    for kind, (body, response_url, *resumed) in SCHEDULER.take_pending():
+        # 再開待ちのジョブはそのまま引き継ぎ、新しいコマンドはジョブとして記録してから引き継ぐ
+        job = resumed[0] if resumed else job_store.start(kind, job_payload(body, response_url))
+        if job.store is None:
+            post_slack_message(response_url, "⚠️ サーバーの再起動のためコマンドを実行できませんでした。もう一度お試しください。")
+            continue
+        job.release()
+        post_slack_message(response_url, "⏸️ サーバーの再起動のため、実行待ちのコマンドは再起動後に自動的に開始します")
+
+lifecycle.on_stop(_hand_over_pending_tasks)
+
+def run_job(kind: str, payload: dict, job: Optional[job_store.Job] = None):
+    """キューから受け取ったジョブを呼び出し元のスレッドで実行する（worker.py から呼び出す）"""
+    body = dict(payload)
+    metrics.QUEUE_DEPTH.inc(kind=kind)
+    try:
+        with lifecycle.track(kind), tracing.span(f"task.{kind}", worker=job_store.WORKER_ID):
+            JOB_PROCESSORS[kind](body, body["response_url"], job)
+    finally:
+        metrics.QUEUE_DEPTH.dec(kind=kind)
+
+def start_job_resume():
+    """中断したジョブの定期的な再開を開始する（main.py の起動処理から呼び出す）"""
+    return job_store.start_resume_loop({kind: resume_job for kind in JOB_PROCESSORS})
+
+async def process_design_task_mcp(body, response_url, job: Optional[job_store.Job] = None):
+    """MCP版設計ドキュメント作成タスクの処理（再開はできないため、ジョブは永続化しない）"""
+    job = job_store.activate(job or job_store.start("design_mcp", job_payload(body, response_url), persist=False))
     try:
         # Slackからの指示テキストをパース
         text = body.get("text", "")
         logging.info(f"受信したMCP設計コマンド: {text}")
         
-        def send_message(text):
-            requests.post(response_url, json={"text": text})
+        async def send_message(text):
+            # 共有イベントループを止めないよう、Slackへの送信は別スレッドで行う
+            await asyncio.to_thread(post_slack_message, response_url, text)
         
         if not MCP_AVAILABLE:
-            send_message("⚠️ Atlassian MCP機能が利用できません。従来の方式で処理します...")
-            # フォールバックとして従来の処理を実行（非同期から同期処理へ）
-            def run_fallback():
-                process_design_task(body, response_url)
-            
-            import threading
-            thread = threading.Thread(target=run_fallback)
-            thread.start()
+            await send_message("⚠️ Atlassian MCP機能が利用できません。従来の方式で処理します...")
+            # フォールバックとして従来の処理を実行（共有ループを止めないよう別スレッドで）
+            await asyncio.to_thread(process_design_task, body, response_url, job)
             return
         
         # コマンド形式の解析
         parts = text.split(" の ", 1)
         if len(parts) < 2:
-            send_message("コマンドの形式が正しくありません。\n例: `/design-mcp プロジェクト名 の 機能名 について 要件内容`")
+            await send_message("コマンドの形式が正しくありません。\n例: `/design-mcp プロジェクト名 の 機能名 について 要件内容`")
+            job.fail("コマンドの形式が正しくありません")
             return
             
         project_name = parts[0]
         parts = parts[1].split(" について ", 1)
         if len(parts) < 2:
-            send_message("コマンドの形式が正しくありません。\n例: `/design-mcp プロジェクト名 の 機能名 について 要件内容`")
+            await send_message("コマンドの形式が正しくありません。\n例: `/design-mcp プロジェクト名 の 機能名 について 要件内容`")
+            job.fail("コマンドの形式が正しくありません")
             return
             
         feature_name = parts[0]
@@ -744,90 +1575,96 @@ async def process_design_task_mcp(body, response_url):
         logging.info(f"MCP設計解析結果 - プロジェクト: {project_name}, 機能: {feature_name}, 要件: {requirements}")
         
         # 1. MCP版設計ドキュメント生成
-        send_message(f"🤖 `{project_name}`の`{feature_name}`機能の設計ドキュメントをMCP経由で生成中...")
-        design_content = await generate_design_document_mcp(project_name, feature_name, requirements)
+        job.raise_if_cancelled()
+        await send_message(f"🤖 `{project_name}`の`{feature_name}`機能の設計ドキュメントをMCP経由で生成中...")
+        design_content = await mcp.generate_design_document_mcp(project_name, feature_name, requirements)
         
         # 2. MCP経由でConfluenceページ作成
-        send_message("📝 Atlassian MCP経由でConfluenceに設計ドキュメントを作成中...")
+        job.raise_if_cancelled()
+        await send_message("📝 Atlassian MCP経由でConfluenceに設計ドキュメントを作成中...")
         page_title = f"{project_name} - {feature_name} 設計書"
         
         # デフォルトスペースキーを使用（環境変数から取得、なければDEV）
         default_space = os.environ.get("CONFLUENCE_SPACE_KEY", "SCRUM").strip()
         
-        result = await create_confluence_page_mcp(default_space, page_title, design_content)
+        result = await mcp.create_confluence_page_mcp(default_space, page_title, design_content)
         
         if result["success"]:
             page_url = result.get("page_url", "URLの抽出に失敗")
-            send_message(f"✅ MCP経由での設計ドキュメント作成が完了しました！\n📄 設計書: {page_url}\n\n💡 開発を開始するには `/develop-from-design-mcp {page_url} の [ファイルパス] に実装` を使用してください。")
+            await send_message(f"✅ MCP経由での設計ドキュメント作成が完了しました！\n📄 設計書: {page_url}\n\n💡 開発を開始するには `/develop-from-design-mcp {page_url} の [ファイルパス] に実装` を使用してください。")
             
             # 詳細な作成結果も送信
             if result.get("response"):
                 # レスポンスが長い場合は一部のみ表示
                 response_preview = result["response"][:500] + "..." if len(result["response"]) > 500 else result["response"]
-                send_message(f"📋 作成詳細:\n```{response_preview}```")
+                await send_message(f"📋 作成詳細:\n```{response_preview}```")
         else:
             error_msg = result.get("error", "不明なエラー")
-            send_message(f"❌ MCP経由でのConfluenceページ作成中にエラーが発生しました:\n{error_msg}")
-            send_message("🔄 従来方式でのページ作成にフォールバックします...")
+            await send_message(f"❌ MCP経由でのConfluenceページ作成中にエラーが発生しました:\n{error_msg}")
+            await send_message("🔄 従来方式でのページ作成にフォールバックします...")
             
             # 従来方式でのページ作成を試行
-            try:
-                from atlassian import Confluence
-                confluence = Confluence(
+            def write_fallback_page():
+                confluence = atlassian.Confluence(
                     url=os.environ.get("CONFLUENCE_URL"),
                     username=os.environ.get("CONFLUENCE_USERNAME"),
                     password=os.environ.get("CONFLUENCE_API_TOKEN"),
                     cloud=True
                 )
+                # ページ作成（同じタイトルのページがあれば更新）
+                return confluence_format.write_page(confluence, default_space, page_title, design_content)
+            
+            try:
+                # Confluence API は同期のため、共有イベントループを止めないよう別スレッドで呼ぶ
+                page = await asyncio.to_thread(write_fallback_page)
                 
-                import markdown
-                html_content = markdown.markdown(design_content)
-                
-                # ページ作成
-                page = confluence.create_page(
-                    space=default_space,
-                    title=page_title,
-                    body=html_content,
-                    type='page',
-                    representation='storage'
-                )
-                
-                page_url = f"{os.environ.get('CONFLUENCE_URL')}/spaces/{default_space}/pages/{page['id']}"
-                send_message(f"✅ 従来方式での設計ドキュメント作成が完了しました！\n📄 設計書: {page_url}")
+                page_url = f"{os.environ.get('CONFLUENCE_URL')}/spaces/{default_space}/pages/{page.page_id}"
+                await send_message(f"✅ 従来方式での設計ドキュメント作成が完了しました！\n📄 設計書: {page_url}")
                 
             except Exception as fallback_error:
                 logging.error(f"従来方式でのページ作成も失敗: {fallback_error}")
-                send_message(f"❌ 従来方式でのページ作成も失敗しました: {fallback_error}")
+                await send_message(f"❌ 従来方式でのページ作成も失敗しました: {fallback_error}")
+                job.fail(fallback_error)
             
+    except job_store.JobCancelled:
+        await asyncio.to_thread(report_cancelled, job, response_url)
     except Exception as e:
+        job.fail(e)
         logging.error(f"MCP設計タスク処理エラー: {e}")
-        requests.post(response_url, json={"text": f"MCP設計ドキュメント作成中にエラーが発生しました: {e}"})
+        await asyncio.to_thread(post_slack_message, response_url, f"MCP設計ドキュメント作成中にエラーが発生しました: {e}")
+    finally:
+        job.finish()
 
-async def process_design_based_development_task_mcp(body, response_url):
-    """MCP版設計ベース開発タスクの処理"""
+async def process_design_based_development_task_mcp(body, response_url, job: Optional[job_store.Job] = None):
+    """MCP版設計ベース開発タスクの処理（再開はできないため、ジョブは永続化しない）"""
+    stages = pipeline.Pipeline("develop_from_design_mcp")
+    job = job_store.activate(job or job_store.start("develop_from_design_mcp", job_payload(body, response_url), persist=False))
     try:
         # Slackからの指示テキストをパース
         text = body.get("text", "")
         logging.info(f"受信したMCP設計ベース開発コマンド: {text}")
         
-        def send_message(text):
-            requests.post(response_url, json={"text": text})
+        async def send_message(text):
+            # 共有イベントループを止めないよう、Slackへの送信は別スレッドで行う
+            await asyncio.to_thread(post_slack_message, response_url, text)
         
         if not MCP_AVAILABLE:
-            send_message("⚠️ Atlassian MCP機能が利用できません。従来の方式で処理します...")
+            await send_message("⚠️ Atlassian MCP機能が利用できません。従来の方式で処理します...")
             # フォールバックとして従来の処理を実行
-            return process_design_based_development_task(body, response_url)
+            return await asyncio.to_thread(process_design_based_development_task, body, response_url, job)
         
         # コマンド形式の解析
         parts = text.split(" の ", 1)
         if len(parts) < 2:
-            send_message("コマンドの形式が正しくありません。\n例: `/develop-from-design-mcp [confluence-url] の [ファイルパス] に実装`")
+            await send_message("コマンドの形式が正しくありません。\n例: `/develop-from-design-mcp [confluence-url] の [ファイルパス] に実装`")
+            job.fail("コマンドの形式が正しくありません")
             return
             
         confluence_url = parts[0]
         parts = parts[1].split(" に実装", 1)
         if len(parts) < 1:
-            send_message("コマンドの形式が正しくありません。\n例: `/develop-from-design-mcp [confluence-url] の [ファイルパス] に実装`")
+            await send_message("コマンドの形式が正しくありません。\n例: `/develop-from-design-mcp [confluence-url] の [ファイルパス] に実装`")
+            job.fail("コマンドの形式が正しくありません")
             return
             
         file_path = parts[0]
@@ -835,56 +1672,85 @@ async def process_design_based_development_task_mcp(body, response_url):
         
         logging.info(f"MCP設計ベース開発解析結果 - URL: {confluence_url}, ファイル: {file_path}")
         
-        # 1. MCP経由でConfluenceから設計ドキュメント取得
-        send_message(f"📖 Atlassian MCP経由でConfluenceから設計ドキュメントを取得中...")
-        page_result = await get_confluence_page_mcp(confluence_url)
+        # 1. MCP経由でConfluenceから設計ドキュメント取得（AsyncAnthropic への接続確立と並行）
+        job.raise_if_cancelled()
+        stages.start("design", mcp.get_confluence_page_mcp, confluence_url)
+        if not ASYNC_CLIENT_WARM:
+            stages.start("anthropic_warmup", _awarm_up_anthropic)
+        await send_message(f"📖 Atlassian MCP経由でConfluenceから設計ドキュメントを取得中...")
+        page_result = await stages.aresult("design")
         
         if not page_result["success"]:
             error_msg = page_result.get("error", "不明なエラー")
-            send_message(f"❌ MCP経由でのConfluenceページ取得に失敗しました:\n{error_msg}")
+            await send_message(f"❌ MCP経由でのConfluenceページ取得に失敗しました:\n{error_msg}")
+            job.fail(error_msg)
             return
         
         design_content = page_result["content"]
         
-        # 2. 設計ベースコード生成
-        send_message(f"🤖 MCP取得の設計ドキュメントに基づいて`{file_path}`のコードを生成中...")
-        generated_code = generate_code_from_design(design_content, file_path, additional_requirements)
+        # 2. 設計ベースコード生成（進捗の通知と並行）
+        job.raise_if_cancelled()
+        if "anthropic_warmup" in stages:
+            await stages.aresult("anthropic_warmup")
+        stages.start("code", agenerate_code_from_design, design_content, file_path, additional_requirements)
+        await send_message(f"🤖 MCP取得の設計ドキュメントに基づいて`{file_path}`のコードを生成中...")
+        generated_code = await stages.aresult("code")
         
         # 3. 生成されたコードを提供
-        send_message("✅ MCP経由での設計ベースコード生成が完了しました！")
+        await send_message("✅ MCP経由での設計ベースコード生成が完了しました！")
         
         # コードをSlackに送信（長い場合は一部のみ）
         code_preview = generated_code[:1000] + "..." if len(generated_code) > 1000 else generated_code
-        send_message(f"```{file_path}\n{code_preview}\n```")
+        await send_message(f"```{file_path}\n{code_preview}\n```")
         
         # 取得した設計ドキュメント情報も送信
         design_preview = design_content[:300] + "..." if len(design_content) > 300 else design_content
-        send_message(f"📋 参考にした設計書の内容:\n```{design_preview}```")
+        await send_message(f"📋 参考にした設計書の内容:\n```{design_preview}```")
         
         # 将来の改善提案
-        send_message("💡 改善提案: 今後、MCP経由でGitHubへの自動PR作成機能も追加予定です。")
+        await send_message("💡 改善提案: 今後、MCP経由でGitHubへの自動PR作成機能も追加予定です。")
         
+    except job_store.JobCancelled:
+        await asyncio.to_thread(report_cancelled, job, response_url)
     except Exception as e:
+        job.fail(e)
         logging.error(f"MCP設計ベース開発タスク処理エラー: {e}")
-        requests.post(response_url, json={"text": f"MCP設計ベース開発中にエラーが発生しました: {e}"})
+        await asyncio.to_thread(post_slack_message, response_url, f"MCP設計ベース開発中にエラーが発生しました: {e}")
+    finally:
+        stages.close()
+        job.finish()
 
 @register_command("design-mcp")
 def handle_design_command_mcp(ack, body, say):
     """MCP版設計ドキュメント作成コマンドのハンドラー"""
-    # Slackの3秒タイムアウトに応答
-    ack(f"🤖 MCP設計依頼を受け付けました: `{body['text']}`\nAtlassian MCP経由で設計ドキュメントの生成を開始します...")
-    
-    # バックグラウンドでタスクを実行
-    run_async_safely(process_design_task_mcp(body, body['response_url']))
+    accept_async_task(ack, "design_mcp", body,
+                      f"🤖 MCP設計依頼を受け付けました: `{body['text']}`\nAtlassian MCP経由で設計ドキュメントの生成を開始します...",
+                      process_design_task_mcp)
 
 @register_command("develop-from-design-mcp")
 def handle_develop_from_design_command_mcp(ack, body, say):
     """MCP版設計ベース開発コマンドのハンドラー"""
-    # Slackの3秒タイムアウトに応答
-    ack(f"🤖 MCP設計ベース開発依頼を受け付けました: `{body['text']}`\nAtlassian MCP経由で設計ドキュメントの解析を開始します...")
-    
-    # バックグラウンドでタスクを実行
-    run_async_safely(process_design_based_development_task_mcp(body, body['response_url']))
+    accept_async_task(ack, "develop_from_design_mcp", body,
+                      f"🤖 MCP設計ベース開発依頼を受け付けました: `{body['text']}`\nAtlassian MCP経由で設計ドキュメントの解析を開始します...",
+                      process_design_based_development_task_mcp)
+
+# 検索結果を軽量モデルで要約して追加で返す
+CONFLUENCE_SEARCH_SUMMARY = os.environ.get("CONFLUENCE_SEARCH_SUMMARY", "false").strip().lower() in ("1", "true", "yes")
+
+def summarize_search_results(query: str, results: str) -> Optional[str]:
+    """Confluence検索結果を、クエリに答える形で短く要約する（失敗時は None）"""
+    prompt = f"""以下はConfluenceで「{query}」を検索した結果です。どのページを読めばよいかが分かるように、3〜5行の箇条書きで要約してください。
+
+{results}
+"""
+    try:
+        response = model_router.create_message(
+            anthropic_client, "search_summary", [{"role": "user", "content": prompt}], stage="llm_summary"
+        )
+        return response.content[0].text
+    except anthropic.AnthropicError as e:
+        logging.warning(f"検索結果の要約に失敗しました: {e}")
+        return None
 
 @register_command("confluence-search")
 def handle_confluence_search_command(ack, body, say):
@@ -896,15 +1762,16 @@ def handle_confluence_search_command(ack, body, say):
         try:
             text = body.get("text", "")
             
-            def send_message(text):
-                requests.post(body['response_url'], json={"text": text})
+            async def send_message(text):
+                # 共有イベントループを止めないよう、Slackへの送信は別スレッドで行う
+                await asyncio.to_thread(post_slack_message, body['response_url'], text)
             
             if not MCP_AVAILABLE:
-                send_message("⚠️ Atlassian MCP機能が利用できません。")
+                await send_message("⚠️ Atlassian MCP機能が利用できません。")
                 return
             
             if not text.strip():
-                send_message("検索クエリを指定してください。\n例: `/confluence-search ユーザー認証`")
+                await send_message("検索クエリを指定してください。\n例: `/confluence-search ユーザー認証`")
                 return
             
             # スペース指定の解析（オプション）
@@ -913,20 +1780,24 @@ def handle_confluence_search_command(ack, body, say):
             space_key = parts[1].strip() if len(parts) > 1 else None
             
             # MCP経由で検索実行
-            send_message(f"🔍 「{query}」を検索中...")
-            result = await search_confluence_pages_mcp(query, space_key)
+            await send_message(f"🔍 「{query}」を検索中...")
+            result = await mcp.search_confluence_pages_mcp(query, space_key)
             
             if result["success"]:
-                send_message(f"✅ 検索完了しました！\n\n{result['results']}")
+                await send_message(f"✅ 検索完了しました！\n\n{result['results']}")
+                if CONFLUENCE_SEARCH_SUMMARY:
+                    summary = await asyncio.to_thread(summarize_search_results, query, result["results"])
+                    if summary:
+                        await send_message(f"📝 検索結果の要約:\n{summary}")
             else:
                 error_msg = result.get("error", "不明なエラー")
-                send_message(f"❌ 検索中にエラーが発生しました:\n{error_msg}")
+                await send_message(f"❌ 検索中にエラーが発生しました:\n{error_msg}")
                 
         except Exception as e:
             logging.error(f"Confluence検索エラー: {e}")
-            requests.post(body['response_url'], json={"text": f"検索中にエラーが発生しました: {e}"})
+            await asyncio.to_thread(post_slack_message, body['response_url'], f"検索中にエラーが発生しました: {e}")
     
     # バックグラウンドでタスクを実行
-    run_async_safely(process_search())
+    run_async_safely(process_search(), kind="confluence_search")
 
 # Socket Mode の初期化は main.py で行います（Cloud Run用）
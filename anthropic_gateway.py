@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Anthropic API ゲートウェイ（同時実行数の制限・レート制御・リトライ）
+
+並行する /develop や /design がそれぞれ messages.create を呼ぶと、同時実行数に上限がなく、
+429（レート制限）や 529（過負荷）がそのままSlackへのエラーになっていた。
+すべての呼び出しをゲートウェイ経由にして、以下を共通で行う。
+
+- 同時実行数: 全体とモデルごとのセマフォ
+- ペース配分: モデルごとのトークンバケット（リクエスト数/分・入力トークン数/分）
+- リトライ: 429・5xx・接続エラーを指数バックオフ（フルジッター）で再試行し、retry-after を優先する。
+  429 の場合は同じモデルの後続リクエストも retry-after まで待たせ、エラーの連鎖を防ぐ
+- タイムアウト: 順番待ちが ANTHROPIC_QUEUE_TIMEOUT を超えたら APITimeoutError（予約したレートは返却する）。
+  リトライは最初の失敗から ANTHROPIC_RETRY_TIMEOUT の範囲で行い、順番待ちの時間とは別に数える
+
+同期クライアント（スレッド）からは call()、AsyncAnthropic（共有イベントループ）からは acall() を使う。
+制限は両者で共有する。
+
+SDK 自体のリトライと二重にならないよう、クライアントは max_retries=0 で作成する。
+
+環境変数:
+    ANTHROPIC_MAX_CONCURRENCY: 全体の同時実行数（デフォルト: 8）
+    ANTHROPIC_MODEL_CONCURRENCY: モデルごとの同時実行数（デフォルト: 4）
+    ANTHROPIC_REQUESTS_PER_MINUTE: モデルごとのリクエスト数/分（デフォルト: 50）
+    ANTHROPIC_INPUT_TOKENS_PER_MINUTE: モデルごとの入力トークン数/分（デフォルト: 40000）
+    ANTHROPIC_MAX_RETRIES: 最大リトライ回数（デフォルト: 4）
+    ANTHROPIC_RETRY_BASE: バックオフの初期値（秒、デフォルト: 1.0）
+    ANTHROPIC_RETRY_MAX: バックオフの上限（秒、デフォルト: 60）
+    ANTHROPIC_QUEUE_TIMEOUT: 1回の呼び出しの順番待ちの上限（秒、デフォルト: 120）
+    ANTHROPIC_RETRY_TIMEOUT: 最初の失敗からリトライを続ける時間の上限（秒、デフォルト: 120）
+"""
+
+import asyncio
+import contextlib
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from lazy_imports import lazy_import
+import metrics
+
+anthropic = lazy_import("anthropic")
+httpx = lazy_import("httpx")
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, str(default)))
+
+
+class TokenBucket:
+    """1分あたりの量で補充されるトークンバケット（先に予約して待ち時間を返す方式）"""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """amount を予約し、使えるようになるまでの待ち時間（秒）を返す"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def refund(self, amount: float = 1.0) -> None:
+        """使わなかった予約を返す"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def pause(self, seconds: float) -> None:
+        """429 の retry-after の間、新しい予約を待たせる"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+class Gateway:
+    """Anthropic API 呼び出しの同時実行数・レート・リトライを管理する"""
+
+    def __init__(self, max_concurrency: int = 8, model_concurrency: int = 4, requests_per_minute: float = 50,
+                 input_tokens_per_minute: float = 40000, max_retries: int = 4, retry_base: float = 1.0,
+                 retry_max: float = 60.0, queue_timeout: float = 120.0, retry_timeout: float = 120.0,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = model_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.input_tokens_per_minute = input_tokens_per_minute
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.queue_timeout = queue_timeout
+        self.retry_timeout = retry_timeout
+        self._sleep = sleep
+        self._global = threading.BoundedSemaphore(max_concurrency)
+        self._models: Dict[str, dict] = {}
+        self._models_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Gateway":
+        return cls(
+            max_concurrency=int(os.environ.get("ANTHROPIC_MAX_CONCURRENCY", "8")),
+            model_concurrency=int(os.environ.get("ANTHROPIC_MODEL_CONCURRENCY", "4")),
+            requests_per_minute=_env_float("ANTHROPIC_REQUESTS_PER_MINUTE", 50),
+            input_tokens_per_minute=_env_float("ANTHROPIC_INPUT_TOKENS_PER_MINUTE", 40000),
+            max_retries=int(os.environ.get("ANTHROPIC_MAX_RETRIES", "4")),
+            retry_base=_env_float("ANTHROPIC_RETRY_BASE", 1.0),
+            retry_max=_env_float("ANTHROPIC_RETRY_MAX", 60.0),
+            queue_timeout=_env_float("ANTHROPIC_QUEUE_TIMEOUT", 120.0),
+            retry_timeout=_env_float("ANTHROPIC_RETRY_TIMEOUT", 120.0),
+        )
+
+    def _model(self, model: str) -> dict:
+        with self._models_lock:
+            if model not in self._models:
+                self._models[model] = {
+                    "semaphore": threading.BoundedSemaphore(self.model_concurrency),
+                    "requests": TokenBucket(self.requests_per_minute),
+                    "input_tokens": TokenBucket(self.input_tokens_per_minute),
+                }
+            return self._models[model]
+
+    # --- リトライ判定 ---
+    @staticmethod
+    def retry_after(error: BaseException) -> Optional[float]:
+        """レスポンスの retry-after-ms / retry-after（秒またはHTTP日付）"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        value = headers.get("retry-after-ms")
+        if value:
+            try:
+                return float(value) / 1000
+            except ValueError:
+                pass
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+
+    @staticmethod
+    def is_retryable(error: BaseException) -> bool:
+        if isinstance(error, anthropic.APIStatusError):
+            return error.status_code in RETRYABLE_STATUS
+        return isinstance(error, anthropic.APIConnectionError)
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """retry-after があればそれを、なければ指数バックオフ（フルジッター）の待ち時間"""
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.retry_max)
+        return random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+
+    @staticmethod
+    def _reason(error: BaseException) -> str:
+        status = getattr(error, "status_code", None)
+        return str(status) if status else type(error).__name__
+
+    def _timeout_error(self, model: str):
+        metrics.ANTHROPIC_GATEWAY_TIMEOUTS.inc(model=model)
+        return anthropic.APITimeoutError(request=httpx.Request("POST", "https://api.anthropic.com/v1/messages"))
+
+    # --- 呼び出し ---
+    def _rate_wait(self, model: str, input_tokens: int, deadline: float) -> float:
+        """レートの予約をして待ち時間を返す（期限を超える場合は予約を返して APITimeoutError）"""
+        limits = self._model(model)
+        wait = max(limits["requests"].reserve(1), limits["input_tokens"].reserve(input_tokens))
+        if wait > 0:
+            if time.monotonic() + wait > deadline:
+                # 返さないと断った呼び出しの分までバケットが借り越しになり、後続がすべてタイムアウトする
+                limits["requests"].refund(1)
+                limits["input_tokens"].refund(input_tokens)
+                raise self._timeout_error(model)
+            metrics.ANTHROPIC_GATEWAY_WAIT.observe(wait, model=model, reason="rate")
+        return wait
+
+    def _wait_for_rate(self, model: str, input_tokens: int, deadline: float) -> None:
+        wait = self._rate_wait(model, input_tokens, deadline)
+        if wait > 0:
+            self._sleep(wait)
+
+    def _acquire(self, semaphore: threading.BoundedSemaphore, model: str, deadline: float) -> None:
+        start = time.monotonic()
+        if not semaphore.acquire(timeout=max(0.0, deadline - start)):
+            raise self._timeout_error(model)
+        metrics.ANTHROPIC_GATEWAY_WAIT.observe(time.monotonic() - start, model=model, reason="concurrency")
+
+    @contextlib.contextmanager
+    def _slot(self, model: str, deadline: float):
+        """全体とモデルごとのセマフォを取得する"""
+        semaphore = self._model(model)["semaphore"]
+        self._acquire(self._global, model, deadline)
+        try:
+            self._acquire(semaphore, model, deadline)
+            try:
+                metrics.ANTHROPIC_INFLIGHT.inc(model=model)
+                yield
+            finally:
+                metrics.ANTHROPIC_INFLIGHT.dec(model=model)
+                semaphore.release()
+        finally:
+            self._global.release()
+
+    async def _acquire_async(self, semaphore: threading.BoundedSemaphore, model: str, deadline: float) -> None:
+        # スレッドと共有するセマフォのため、ループを止めないようにポーリングで取得する
+        start = time.monotonic()
+        interval = 0.005
+        while not semaphore.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise self._timeout_error(model)
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, 0.1)
+        metrics.ANTHROPIC_GATEWAY_WAIT.observe(time.monotonic() - start, model=model, reason="concurrency")
+
+    @contextlib.asynccontextmanager
+    async def _aslot(self, model: str, deadline: float):
+        semaphore = self._model(model)["semaphore"]
+        await self._acquire_async(self._global, model, deadline)
+        try:
+            await self._acquire_async(semaphore, model, deadline)
+            try:
+                metrics.ANTHROPIC_INFLIGHT.inc(model=model)
+                yield
+            finally:
+                metrics.ANTHROPIC_INFLIGHT.dec(model=model)
+                semaphore.release()
+        finally:
+            self._global.release()
+
+    def _retry_delay(self, model: str, attempt: int, error: Exception, deadline: float) -> Optional[float]:
+        """リトライまでの待ち時間（リトライしない場合は None）"""
+        if not self.is_retryable(error) or attempt >= self.max_retries:
+            return None
+        delay = self.backoff(attempt, error)
+        if time.monotonic() + delay > deadline:
+            return None
+        if getattr(error, "status_code", None) == 429:
+            self._model(model)["requests"].pause(delay)
+        metrics.ANTHROPIC_RETRIES.inc(model=model, reason=self._reason(error))
+        logging.warning(f"Anthropic API の一時的なエラーのため {delay:.1f}秒後に再試行します ({attempt + 1}/{self.max_retries}): {error}")
+        return delay
+
+    def call(self, model: str, request: Callable[[], T], input_tokens: int = 0) -> T:
+        """同時実行数とレートの範囲で request を実行し、一時的なエラーはリトライする
+
+        Args:
+            model: モデル名（モデルごとの制限に使う）
+            request: API呼び出し（引数なし）
+            input_tokens: 入力トークン数の見積もり（入力トークンのバケットから予約する）
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        retry_deadline = None
+        attempt = 0
+        while True:
+            self._wait_for_rate(model, input_tokens, deadline)
+            with self._slot(model, deadline):
+                try:
+                    return request()
+                except Exception as e:
+                    if retry_deadline is None:
+                        retry_deadline = time.monotonic() + self.retry_timeout
+                    delay = self._retry_delay(model, attempt, e, retry_deadline)
+                    if delay is None:
+                        raise
+            # バックオフ中はスロットを手放す
+            self._sleep(delay)
+            attempt += 1
+            deadline = time.monotonic() + self.queue_timeout
+
+    async def acall(self, model: str, request: Callable[[], Awaitable[T]], input_tokens: int = 0) -> T:
+        """call() の非同期版（request はコルーチンを返す関数。キャンセルは待機中・実行中どちらでも伝わる）"""
+        deadline = time.monotonic() + self.queue_timeout
+        retry_deadline = None
+        attempt = 0
+        while True:
+            wait = self._rate_wait(model, input_tokens, deadline)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with self._aslot(model, deadline):
+                try:
+                    return await request()
+                except Exception as e:
+                    if retry_deadline is None:
+                        retry_deadline = time.monotonic() + self.retry_timeout
+                    delay = self._retry_delay(model, attempt, e, retry_deadline)
+                    if delay is None:
+                        raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            deadline = time.monotonic() + self.queue_timeout
+
+
+GATEWAY = Gateway.from_env()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+共有イベントループ
+
+MCP系コマンドは run_async_safely がタスクごとに新しいイベントループを作っていたため、
+共有の httpx.AsyncClient（MCPクライアント）や AsyncAnthropic が閉じたループに紐付いたまま再利用され、
+"Task was destroyed but it is pending" や "Event loop is closed" の原因になっていた。
+プロセスで1つのイベントループを専用スレッドで動かし、すべての非同期タスクをそこで実行する。
+
+submit() は concurrent.futures.Future を返し、cancel() でタスクをキャンセルできる。
+呼び出し元スレッドの contextvars（トレース等）はタスクに引き継がれる。
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Coroutine, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """共有イベントループ（最初の呼び出しでスレッドを起動する）"""
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            _thread = threading.Thread(target=run, name="aibot-event-loop", daemon=True)
+            _thread.start()
+            started.wait()
+            _loop = loop
+        return _loop
+
+
+def in_loop_thread() -> bool:
+    return _thread is not None and threading.current_thread() is _thread
+
+
+def submit(coro: Coroutine) -> concurrent.futures.Future:
+    """コルーチンを共有ループで実行する（呼び出し元の contextvars を引き継ぐ）"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """コルーチンを共有ループで実行して結果を待つ（ループのスレッドからは呼べない）"""
+    if in_loop_thread():
+        coro.close()
+        raise RuntimeError("共有イベントループのスレッドから run() は呼べません。await してください")
+    future = submit(coro)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+def pending_tasks() -> int:
+    """共有ループで実行中のタスク数"""
+    loop = _loop
+    if loop is None or loop.is_closed():
+        return 0
+    return sum(1 for task in asyncio.all_tasks(loop) if not task.done())
+
+
+def shutdown(timeout: float = 10.0) -> None:
+    """実行中のタスクを timeout 秒待ち、残りをキャンセルしてループを停止する"""
+    global _loop, _thread
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop, _thread = None, None
+    if loop is None or loop.is_closed():
+        return
+
+    async def drain():
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            _, still_running = await asyncio.wait(tasks, timeout=timeout)
+            for task in still_running:
+                task.cancel()
+            if still_running:
+                logging.warning(f"終了時に {len(still_running)} 件の非同期タスクをキャンセルしました")
+                await asyncio.gather(*still_running, return_exceptions=True)
+        await loop.shutdown_asyncgens()
+
+    try:
+        asyncio.run_coroutine_threadsafe(drain(), loop).result(timeout + 5)
+    except Exception as e:
+        logging.warning(f"イベントループの終了処理に失敗しました: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    if thread is not None:
+        thread.join(timeout=5)
+    if not loop.is_running():
+        loop.close()
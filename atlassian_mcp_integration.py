@@ -10,14 +10,21 @@ import logging
 import json
 import uuid
 from typing import Dict, List, Optional, Any
-from anthropic import Anthropic, AnthropicError
-import sseclient
-import httpx
-import aiohttp
 from urllib.parse import urljoin
+from lazy_imports import lazy_import, LazyObject
+import confluence_format
+import metrics
+import model_router
+import tracing
+from logging_config import configure_logging
+
+# 重量級の依存は最初に使われた時点で読み込む
+anthropic = lazy_import("anthropic")
+httpx = lazy_import("httpx")
+atlassian = lazy_import("atlassian")
 
 # --- ロギング設定 ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 
 # --- 環境変数から認証情報を読み込み ---
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "").strip()
@@ -26,11 +33,15 @@ CONFLUENCE_USERNAME = os.environ.get("CONFLUENCE_USERNAME", "").strip()
 CONFLUENCE_API_TOKEN = os.environ.get("CONFLUENCE_API_TOKEN", "").strip()
 CONFLUENCE_SPACE_KEY = os.environ.get("CONFLUENCE_SPACE_KEY", "SCRUM").strip()
 
-# Anthropicクライアントの初期化
-anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
+# Anthropicクライアントの初期化（最初の利用時に生成。リトライは anthropic_gateway が行う）
+anthropic_client = LazyObject(lambda: anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=0), "anthropic_client")
+# 非同期版は共有イベントループ（async_runtime）上で使う
+async_anthropic_client = LazyObject(
+    lambda: anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, max_retries=0), "async_anthropic_client"
+)
 
 # Remote MCP Server設定
-REMOTE_MCP_SERVER_URL = "https://mcp.atlassian.com/v1/sse"
+REMOTE_MCP_SERVER_URL = os.environ.get("ATLASSIAN_MCP_SERVER_URL", "https://mcp.atlassian.com/v1/sse").strip()
 REMOTE_MCP_API_KEY = os.environ.get("ATLASSIAN_MCP_API_KEY", "").strip()  # 必要に応じて設定
 
 class AtlassianMCPClient:
@@ -40,6 +51,7 @@ class AtlassianMCPClient:
         self.mcp_server_url = REMOTE_MCP_SERVER_URL
         self.mcp_api_key = REMOTE_MCP_API_KEY
         self.anthropic_client = anthropic_client
+        self.async_anthropic_client = async_anthropic_client
         self.confluence_url = CONFLUENCE_URL
         self.confluence_username = CONFLUENCE_USERNAME
         self.confluence_api_token = CONFLUENCE_API_TOKEN
@@ -49,12 +61,34 @@ class AtlassianMCPClient:
         self.session_id = None
         self.session_timeout = 300  # 5分
         
-        # HTTP clients
-        self.http_client = httpx.AsyncClient(timeout=30.0)
-        self.sync_client = httpx.Client(timeout=30.0)
+        # HTTP clients（最初の利用時に生成）
+        self._http_client = None
+        self._sync_client = None
+    
+    @property
+    def http_client(self):
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(timeout=30.0)
+        return self._http_client
+    
+    @property
+    def sync_client(self):
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(timeout=30.0)
+        return self._sync_client
+    
+    async def aclose(self):
+        """生成済みのHTTPクライアントを閉じる（終了処理から呼び出す）"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
     
     async def _ensure_session(self):
         """リモートMCPサーバーとのセッションを確立"""
+        metrics.record_cache("mcp_session", hit=self.session_id is not None)
         if self.session_id is None:
             try:
                 session_data = {
@@ -90,14 +124,18 @@ class AtlassianMCPClient:
                 logging.error(f"MCP セッション確立エラー: {e}")
                 self.session_id = "fallback"
     
+    @metrics.timed("mcp_tool_call")
+    @tracing.traced("mcp.tool_call")
     async def _run_mcp_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """リモートMCP ツールを実行（フォールバック付き）"""
+        tracing.set_attribute("tool", tool_name)
         try:
             # セッションを確立
             await self._ensure_session()
             
             # フォールバックの場合は直接API呼び出し
             if self.session_id == "fallback":
+                metrics.MCP_FALLBACKS.inc(tool=tool_name, reason="no_session")
                 return await self._fallback_to_direct_api(tool_name, arguments)
             
             # リモートMCPサーバーへのSSEリクエストを実行
@@ -106,8 +144,10 @@ class AtlassianMCPClient:
         except Exception as e:
             logging.error(f"MCP ツール実行エラー: {e}")
             # エラー時は直接API呼び出しにフォールバック
+            metrics.MCP_FALLBACKS.inc(tool=tool_name, reason="error")
             return await self._fallback_to_direct_api(tool_name, arguments)
     
+    @tracing.traced("mcp.sse_request")
     async def _execute_sse_request(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """リモートMCPサーバーへのSSEリクエストを実行"""
         try:
@@ -172,14 +212,14 @@ class AtlassianMCPClient:
             logging.error(f"SSE リクエストエラー: {e}")
             raise
     
+    @tracing.traced("confluence.direct_api")
     async def _fallback_to_direct_api(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """直接APIへのフォールバック実装"""
         try:
             logging.info(f"直接API呼び出しにフォールバック: {tool_name}")
-            from atlassian import Confluence
             
             # Confluence APIクライアントの初期化
-            confluence = Confluence(
+            confluence = atlassian.Confluence(
                 url=self.confluence_url,
                 username=self.confluence_username,
                 password=self.confluence_api_token,
@@ -236,24 +276,17 @@ class AtlassianMCPClient:
                 content = arguments.get("content", "")
                 parent_id = arguments.get("parent_id", None)
                 
-                # HTMLに変換
-                import markdown
-                html_content = markdown.markdown(content)
-                
-                # ページ作成
-                page = confluence.create_page(
-                    space=space_key,
-                    title=title,
-                    body=html_content,
-                    parent_id=parent_id
-                )
+                # ページ作成（同じタイトルのページがあれば変更されたセクションだけを確認して更新）
+                page = confluence_format.write_page(confluence, space_key, title, content, parent_id)
                 
-                page_url = f"{self.confluence_url}/spaces/{space_key}/pages/{page['id']}"
+                page_url = f"{self.confluence_url}/spaces/{space_key}/pages/{page.page_id}"
                 
                 return {
                     "success": True,
                     "page_url": page_url,
-                    "page_id": page["id"]
+                    "page_id": page.page_id,
+                    "action": page.action,
+                    "changed_sections": page.changed_sections
                 }
                 
             else:
@@ -266,6 +299,8 @@ class AtlassianMCPClient:
                 "error": str(e)
             }
         
+    @metrics.timed("confluence_create")
+    @tracing.traced("confluence.create_page")
     async def create_confluence_page_with_mcp(self, space_key: str, title: str, content: str, parent_id: Optional[str] = None) -> dict:
         """
         sooperset/mcp-atlassian を使用してConfluenceページを作成
@@ -330,6 +365,8 @@ class AtlassianMCPClient:
                 "space_key": space_key
             }
     
+    @metrics.timed("confluence_get")
+    @tracing.traced("confluence.get_page")
     async def get_confluence_page_with_mcp(self, page_url: str) -> dict:
         """
         sooperset/mcp-atlassian を使用してConfluenceページ内容を取得
@@ -402,6 +439,7 @@ class AtlassianMCPClient:
         
         return ""
     
+    @tracing.traced("confluence.search")
     async def search_confluence_pages_with_mcp(self, query: str, space_key: Optional[str] = None) -> dict:
         """
         sooperset/mcp-atlassian を使用してConfluenceページを検索
@@ -587,17 +625,15 @@ class AtlassianMCPClient:
         
         try:
             logging.info("MCP対応版設計ドキュメントを生成中...")
-            response = self.anthropic_client.messages.create(
-                model="claude-3-5-sonnet-20240620",
-                max_tokens=4096,
-                messages=[{"role": "user", "content": prompt}]
+            response = await model_router.acreate_message(
+                self.async_anthropic_client, "design_doc", [{"role": "user", "content": prompt}]
             )
             
             design_content = response.content[0].text
             logging.info(f"MCP対応版設計ドキュメントが生成されました: {len(design_content)}文字")
             return design_content
             
-        except AnthropicError as e:
+        except anthropic.AnthropicError as e:
             logging.error(f"MCP対応版設計ドキュメント生成エラー: {e}")
             return f"設計ドキュメントの生成中にエラーが発生しました: {e}"
     
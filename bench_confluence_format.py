@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Confluence 変換のマイクロベンチマーク
+
+設計書サイズ（数KB）のMarkdownについて、1文書あたりの変換時間を比較する:
+- per_call: 従来どおり呼び出しごとに markdown.markdown(..., extensions=[...]) を呼ぶ
+- shared:   confluence_format.to_storage()（設定済みの Markdown を reset() して使い回す）
+
+使用例:
+    python bench_confluence_format.py
+    python bench_confluence_format.py --iterations 500 --sections 20 --output bench_results/confluence_format_latest.json
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import markdown
+
+import confluence_format
+
+
+def sample_document(sections: int = 12) -> str:
+    """見出し・表・コードブロック・箇条書きを含む設計書風のMarkdown"""
+    parts = ["# サンプル機能 設計書", "", "[TOC]", ""]
+    for index in range(1, sections + 1):
+        parts += [
+            f"## {index}. セクション{index}",
+            "",
+            f"セクション{index}の説明です。**重要な決定事項**と `識別子` を含みます。" * 3,
+            "",
+            "- 要件A: 入力を検証する",
+            "- 要件B: エラーを記録する",
+            "- 要件C: 結果をキャッシュする",
+            "",
+            "| 項目 | 型 | 説明 |",
+            "|------|----|------|",
+            *(f"| field_{row} | string | フィールド{row}の説明 |" for row in range(5)),
+            "",
+            "```python",
+            f"def handler_{index}(request):",
+            "    if request.value < 0 and request.limit > 10:",
+            "        raise ValueError(\"invalid\")",
+            "    return {\"status\": \"ok\"}",
+            "```",
+            "",
+        ]
+    return "\n".join(parts)
+
+
+def per_call(text: str) -> str:
+    return markdown.markdown(text, extensions=["tables", "fenced_code", "toc"])
+
+
+def shared(text: str) -> str:
+    return confluence_format.to_storage(text)
+
+
+def measure(convert: Callable[[str], str], text: str, iterations: int) -> Dict[str, float]:
+    """1文書あたりの変換時間（ミリ秒）"""
+    convert(text)  # 初回の拡張機能の読み込みは除く
+    samples: List[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        convert(text)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "mean_ms": round(statistics.mean(samples), 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "min_ms": round(min(samples), 4),
+    }
+
+
+def run_benchmark(iterations: int = 200, sections: int = 12) -> Dict[str, object]:
+    text = sample_document(sections)
+    results = {name: measure(convert, text, iterations) for name, convert in (("per_call", per_call), ("shared", shared))}
+    return {
+        "document_bytes": len(text.encode("utf-8")),
+        "iterations": iterations,
+        "results": results,
+        "speedup": round(results["per_call"]["median_ms"] / results["shared"]["median_ms"], 2),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Confluence 変換のマイクロベンチマーク")
+    parser.add_argument("--iterations", type=int, default=200, help="計測回数")
+    parser.add_argument("--sections", type=int, default=12, help="サンプル文書のセクション数")
+    parser.add_argument("--output", type=Path, default=None, help="結果JSONの保存先")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.iterations, args.sections)
+    print(f"文書サイズ: {report['document_bytes']} bytes / {report['iterations']}回")
+    for name, result in report["results"].items():
+        print(f"  {name:9s} median {result['median_ms']:.3f}ms  mean {result['mean_ms']:.3f}ms  min {result['min_ms']:.3f}ms")
+    print(f"  速度比: {report['speedup']}x")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,609 @@
+#!/usr/bin/env python3
+"""
+負荷試験用のローカル偽サーバー
+
+実サービスに接続せずに aibot.py のタスク処理を動かすため、以下をローカルで起動する:
+- Anthropic Messages API（応答遅延とトークン生成速度を設定可能）
+- GitHub REST API（リポジトリ・コンテンツ・ブランチ・ツリー・tarball・PR作成）
+- Confluence REST API（ページ作成・タイトル検索・更新・取得・CQL検索・スペース）
+- Atlassian MCP SSE サーバー（セッション確立と tools/call）
+- Slack response_url の受け口（送信されたメッセージを記録）
+
+各サーバーは受信したリクエスト数を記録し、`FakeServers.stats()` で参照できる。
+
+使用例:
+    with FakeServers(FakeConfig(llm_latency=0.5)) as fakes:
+        os.environ.update(fakes.environment())
+        ...
+"""
+
+import base64
+import hashlib
+import io
+import itertools
+import json
+import tarfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+@dataclass
+class FakeConfig:
+    """偽サーバーの応答特性"""
+    llm_latency: float = 0.2             # 最初のトークンまでの時間（秒）
+    llm_tokens_per_second: float = 200.0  # 出力トークンの生成速度
+    llm_output_tokens: int = 400         # 1レスポンスあたりの出力トークン数
+    github_latency: float = 0.02
+    confluence_latency: float = 0.03
+    mcp_latency: float = 0.03
+    slack_latency: float = 0.005
+
+
+def _estimate_tokens(text: str) -> int:
+    # 日本語混在のプロンプトを想定したおおよその見積もり
+    return max(1, len(text) // 3)
+
+
+class FakeService:
+    """ルーティングとリクエスト計数を持つ偽サーバーの基底クラス"""
+
+    name = "fake"
+
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.requests: Counter = Counter()
+        self._lock = threading.Lock()
+        self._routes: List[Tuple[str, str, Callable]] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # --- ルーティング ---
+    def route(self, method: str, prefix: str, handler: Callable) -> None:
+        self._routes.append((method, prefix, handler))
+
+    def dispatch(self, method: str, path: str, query: Dict[str, List[str]], body: Any):
+        for route_method, prefix, handler in self._routes:
+            if route_method == method and path.startswith(prefix):
+                with self._lock:
+                    self.requests[f"{method} {prefix}"] += 1
+                return handler(path[len(prefix):], query, body)
+        return 404, {"message": f"Not Found: {method} {path}"}
+
+    # --- ライフサイクル ---
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeService":
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self, method: str):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else None
+                except ValueError:
+                    body = raw.decode("utf-8", "replace")
+                status, payload = service.dispatch(method, unquote(parsed.path), parse_qs(parsed.query), body)
+                if isinstance(payload, RawResponse):
+                    self.send_response(status)
+                    for name, value in payload.headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", str(len(payload.body)))
+                    self.end_headers()
+                    self.wfile.write(payload.body)
+                    return
+                if isinstance(payload, SSEStream):
+                    self.send_response(status)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Cache-Control", "no-cache")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    try:
+                        for event in payload.events:
+                            name = f"event: {event.get('type')}\n" if payload.named else ""
+                            self.wfile.write(f"{name}data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                            self.wfile.flush()
+                    except (BrokenPipeError, ConnectionResetError):
+                        # クライアントが受信を打ち切った（ストリーミングの取り消し）
+                        pass
+                    self.close_connection = True
+                    return
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PUT(self):
+                self._handle("PUT")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        # 同時接続数の多い負荷試験でも取りこぼさないよう listen キューを広げる
+        self._server.request_queue_size = 256
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"fake-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class SSEStream:
+    """Server-Sent Events として送信するイベント列（ジェネレーターを渡すと生成しながら送信する）
+
+    named=True の場合は各イベントの type を event: 行として送る（Anthropic のストリーミング形式）。
+    """
+
+    def __init__(self, events: Iterable[Dict[str, Any]], named: bool = False):
+        self.events = events
+        self.named = named
+
+
+class RawResponse:
+    """JSON以外の本文（tarballなど）やリダイレクトを返す応答"""
+
+    def __init__(self, body: bytes = b"", headers: Optional[Dict[str, str]] = None):
+        self.body = body
+        self.headers = headers or {}
+
+
+class FakeAnthropic(FakeService):
+    """Anthropic Messages API: 遅延 = llm_latency + 出力トークン数 / llm_tokens_per_second
+
+    "stream": true の場合は出力トークンを少しずつ送り、途中で切断されたら送信済みの分だけを数える。
+    """
+
+    name = "anthropic"
+
+    def __init__(self, config: FakeConfig):
+        super().__init__(config)
+        self.tokens: Counter = Counter()
+        self.route("POST", "/v1/messages/count_tokens", self.count_tokens)
+        self.route("POST", "/v1/messages", self.create_message)
+        self.route("GET", "/v1/models", self.list_models)
+
+    def _completion_text(self, prompt: str, output_tokens: int) -> str:
+        if "設計" in prompt and "ドキュメント" in prompt:
+            sections = ["概要", "要件", "アーキテクチャ", "API設計", "データベース設計", "テスト戦略"]
+            body = "\n\n".join(f"## {title}\n{title}の内容です。" for title in sections)
+            text = f"# 設計書\n\n{body}\n"
+        else:
+            text = "def generated():\n    return 'generated by fake anthropic'\n"
+        # 出力トークン数に見合う長さに揃える
+        filler = "# " + "x" * 60 + "\n"
+        while _estimate_tokens(text) < output_tokens:
+            text += filler
+        return text
+
+    @staticmethod
+    def _prompt(body) -> str:
+        return "".join(
+            message["content"] if isinstance(message.get("content"), str) else json.dumps(message.get("content"))
+            for message in body.get("messages", [])
+        )
+
+    def count_tokens(self, _path, _query, body):
+        return 200, {"input_tokens": _estimate_tokens(self._prompt(body or {}))}
+
+    def create_message(self, _path, _query, body):
+        body = body or {}
+        prompt = self._prompt(body)
+        input_tokens = _estimate_tokens(prompt)
+        max_tokens = int(body.get("max_tokens", self.config.llm_output_tokens))
+        output_tokens = min(max_tokens, self.config.llm_output_tokens)
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "fake-model"),
+            "content": [{"type": "text", "text": self._completion_text(prompt, output_tokens)}],
+            "stop_reason": "max_tokens" if max_tokens < self.config.llm_output_tokens else "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+        }
+        if body.get("stream"):
+            return 200, SSEStream(self._stream_events(message), named=True)
+        time.sleep(self.config.llm_latency + output_tokens / self.config.llm_tokens_per_second)
+        with self._lock:
+            self.tokens["input"] += input_tokens
+            self.tokens["output"] += output_tokens
+        return 200, message
+
+    def _stream_events(self, message: Dict[str, Any], chunks: int = 10):
+        """message を Anthropic のストリーミングイベントに分けて、生成速度に合わせて送る"""
+        text = message["content"][0]["text"]
+        usage = message["usage"]
+        with self._lock:
+            self.tokens["input"] += usage["input_tokens"]
+        time.sleep(self.config.llm_latency)
+        yield {
+            "type": "message_start",
+            "message": dict(message, content=[], stop_reason=None, usage=dict(usage, output_tokens=0)),
+        }
+        yield {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+        size = -(-len(text) // chunks)
+        for start in range(0, len(text), size):
+            time.sleep(usage["output_tokens"] / chunks / self.config.llm_tokens_per_second)
+            with self._lock:
+                self.tokens["output"] += usage["output_tokens"] // chunks
+            yield {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text[start:start + size]}}
+        yield {"type": "content_block_stop", "index": 0}
+        yield {
+            "type": "message_delta",
+            "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+            "usage": {"output_tokens": usage["output_tokens"]},
+        }
+        yield {"type": "message_stop"}
+
+    def list_models(self, _path, _query, _body):
+        model = {"type": "model", "id": "fake-model", "display_name": "Fake", "created_at": "2024-01-01T00:00:00Z"}
+        return 200, {"data": [model], "has_more": False, "first_id": model["id"], "last_id": model["id"]}
+
+
+def _git_blob_sha(content: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+class FakeGitHub(FakeService):
+    """GitHub REST API: get_repo / get_contents / get_branch / get_git_tree / get_git_blob / tarball /
+    create_git_ref / update_file / create_pull
+
+    各リポジトリは REPOSITORY_FILES のファイルを持ち、それ以外のパスには固定の内容を返す。
+    """
+
+    name = "github"
+
+    def __init__(self, config: FakeConfig):
+        super().__init__(config)
+        self._pr_numbers = itertools.count(1)
+        self.pull_requests: List[Dict[str, Any]] = []
+        self.route("GET", "/rate_limit", self.rate_limit)
+        self.route("GET", "/repos/", self.get_repo_resource)
+        self.route("GET", "/archive/", self.get_archive)
+        self.route("POST", "/repos/", self.post_repo_resource)
+        self.route("PUT", "/repos/", self.put_repo_resource)
+
+    @staticmethod
+    def _split(path: str) -> Tuple[str, List[str]]:
+        parts = path.split("/")
+        return "/".join(parts[:2]), parts[2:]
+
+    def _repo(self, full_name: str) -> Dict[str, Any]:
+        owner, name = full_name.split("/", 1)
+        return {
+            "id": int(hashlib.md5(full_name.encode()).hexdigest()[:6], 16),
+            "name": name,
+            "full_name": full_name,
+            "owner": {"login": owner, "type": "User"},
+            "private": False,
+            "default_branch": "main",
+            "url": f"{self.url}/repos/{full_name}",
+            "html_url": f"https://github.example/{full_name}",
+        }
+
+    # 関連コード検索（repo_index）が索引を作るためのリポジトリ内容
+    REPOSITORY_FILES = {
+        "main.py": "from utils import greet\n\n\ndef main():\n    print(greet('world'))\n",
+        "utils.py": "def greet(name):\n    return f'Hello, {name}'\n\n\ndef shout(name):\n    return greet(name).upper()\n",
+        "models/user.py": "class User:\n    def __init__(self, name):\n        self.name = name\n",
+    }
+
+    @classmethod
+    def _content(cls, file_path: str) -> str:
+        return cls.REPOSITORY_FILES.get(file_path, f"# {file_path}\n\ndef main():\n    print('hello')\n")
+
+    def _tarball(self, full_name: str, sha: str) -> bytes:
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            for file_path, content in self.REPOSITORY_FILES.items():
+                data = content.encode()
+                member = tarfile.TarInfo(f"{full_name.replace('/', '-')}-{sha[:7]}/{file_path}")
+                member.size = len(data)
+                archive.addfile(member, io.BytesIO(data))
+        return buffer.getvalue()
+
+    def _file(self, full_name: str, file_path: str) -> Dict[str, Any]:
+        content = self._content(file_path)
+        return {
+            "type": "file",
+            "encoding": "base64",
+            "name": file_path.rsplit("/", 1)[-1],
+            "path": file_path,
+            "sha": hashlib.sha1(content.encode()).hexdigest(),
+            "size": len(content),
+            "content": base64.b64encode(content.encode()).decode(),
+            "url": f"{self.url}/repos/{full_name}/contents/{file_path}",
+        }
+
+    def rate_limit(self, _path, _query, _body):
+        core = {"limit": 5000, "remaining": 5000, "reset": int(time.time()) + 3600, "used": 0}
+        return 200, {"resources": {"core": core}, "rate": core}
+
+    def get_repo_resource(self, path, _query, _body):
+        time.sleep(self.config.github_latency)
+        full_name, rest = self._split(path)
+        if not rest:
+            return 200, self._repo(full_name)
+        if rest[0] == "contents":
+            file_path = "/".join(rest[1:])
+            if "missing" in file_path:
+                return 404, {"message": "Not Found"}
+            return 200, self._file(full_name, file_path)
+        if rest[0] == "branches":
+            sha = hashlib.sha1(full_name.encode()).hexdigest()
+            return 200, {"name": rest[1], "commit": {"sha": sha, "url": f"{self.url}/repos/{full_name}/commits/{sha}"}}
+        if rest[:2] == ["git", "trees"]:
+            tree = [
+                {"path": file_path, "mode": "100644", "type": "blob", "sha": _git_blob_sha(content.encode()), "size": len(content.encode())}
+                for file_path, content in self.REPOSITORY_FILES.items()
+            ]
+            return 200, {"sha": rest[2], "tree": tree, "truncated": False}
+        if rest[:2] == ["git", "blobs"]:
+            for content in self.REPOSITORY_FILES.values():
+                if _git_blob_sha(content.encode()) == rest[2]:
+                    return 200, {"sha": rest[2], "encoding": "base64", "size": len(content.encode()),
+                                 "content": base64.b64encode(content.encode()).decode()}
+            return 404, {"message": "Not Found"}
+        if rest[0] == "tarball":
+            # 実際のGitHubと同様にダウンロードURLへリダイレクトする
+            return 302, RawResponse(headers={"Location": f"{self.url}/archive/{full_name}/{rest[1]}"})
+        return 404, {"message": "Not Found"}
+
+    def get_archive(self, path, _query, _body):
+        time.sleep(self.config.github_latency)
+        owner, name, sha = path.split("/", 2)
+        return 200, RawResponse(self._tarball(f"{owner}/{name}", sha), {"Content-Type": "application/x-gzip"})
+
+    def post_repo_resource(self, path, _query, body):
+        time.sleep(self.config.github_latency)
+        full_name, rest = self._split(path)
+        if rest[:2] == ["git", "refs"]:
+            return 201, {"ref": body["ref"], "object": {"sha": body["sha"], "type": "commit"}}
+        if rest == ["pulls"]:
+            number = next(self._pr_numbers)
+            pull = {
+                "number": number,
+                "title": body.get("title"),
+                "head": {"ref": body.get("head")},
+                "base": {"ref": body.get("base")},
+                "html_url": f"https://github.example/{full_name}/pull/{number}",
+                "url": f"{self.url}/repos/{full_name}/pulls/{number}",
+            }
+            with self._lock:
+                self.pull_requests.append(pull)
+            return 201, pull
+        return 404, {"message": "Not Found"}
+
+    def put_repo_resource(self, path, _query, body):
+        time.sleep(self.config.github_latency)
+        full_name, rest = self._split(path)
+        if rest and rest[0] == "contents":
+            file_path = "/".join(rest[1:])
+            content = self._file(full_name, file_path)
+            return 200, {"content": content, "commit": {"sha": uuid.uuid4().hex, "message": (body or {}).get("message")}}
+        return 404, {"message": "Not Found"}
+
+
+class FakeConfluence(FakeService):
+    """Confluence REST API（/wiki/rest/api 配下）"""
+
+    name = "confluence"
+
+    def __init__(self, config: FakeConfig):
+        super().__init__(config)
+        self._page_ids = itertools.count(100000)
+        self.pages: Dict[str, Dict[str, Any]] = {}
+        self.route("POST", "/wiki/rest/api/content", self.create_content)
+        self.route("PUT", "/wiki/rest/api/content/", self.update_content)
+        self.route("GET", "/wiki/rest/api/content/", self.get_content)
+        self.route("GET", "/wiki/rest/api/content", self.find_content)
+        self.route("GET", "/wiki/rest/api/search", self.search)
+        self.route("GET", "/wiki/rest/api/space/", self.get_space)
+
+    def _page(self, page_id: str, title: str, value: str, space_key: str) -> Dict[str, Any]:
+        return {
+            "id": page_id,
+            "type": "page",
+            "status": "current",
+            "title": title,
+            "space": {"key": space_key, "name": space_key},
+            "version": {"number": 1},
+            "body": {"storage": {"value": value, "representation": "storage"}},
+            "_links": {"webui": f"/spaces/{space_key}/pages/{page_id}"},
+        }
+
+    def create_content(self, _path, _query, body):
+        time.sleep(self.config.confluence_latency)
+        body = body or {}
+        page_id = str(next(self._page_ids))
+        page = self._page(
+            page_id,
+            body.get("title", ""),
+            body.get("body", {}).get("storage", {}).get("value", ""),
+            body.get("space", {}).get("key", ""),
+        )
+        with self._lock:
+            self.pages[page_id] = page
+        return 200, page
+
+    def get_content(self, path, _query, _body):
+        time.sleep(self.config.confluence_latency)
+        page_id = path.strip("/")
+        with self._lock:
+            page = self.pages.get(page_id)
+        if page is None:
+            page = self._page(page_id, f"設計書 {page_id}", "<h1>設計書</h1><h2>概要</h2><p>偽の設計書です。</p>", "BENCH")
+        return 200, page
+
+    def find_content(self, _path, query, _body):
+        """スペースとタイトルでの検索（get_page_by_title）"""
+        time.sleep(self.config.confluence_latency)
+        space_key, title = query.get("spaceKey", [""])[0], query.get("title", [""])[0]
+        with self._lock:
+            results = [page for page in self.pages.values() if page["space"]["key"] == space_key and page["title"] == title]
+        return 200, {"results": results, "size": len(results)}
+
+    def update_content(self, path, _query, body):
+        """ページの更新（バージョン番号が現在の次でなければ 409）"""
+        time.sleep(self.config.confluence_latency)
+        page_id, body = path.strip("/"), body or {}
+        with self._lock:
+            page = self.pages.get(page_id)
+            if page is None:
+                return 404, {"message": f"Not Found: {page_id}"}
+            version = body.get("version", {}).get("number")
+            if version != page["version"]["number"] + 1:
+                return 409, {"message": "Version must be incremented on update"}
+            page["version"] = {"number": version}
+            page["title"] = body.get("title", page["title"])
+            page["body"] = {"storage": {"value": body.get("body", {}).get("storage", {}).get("value", ""), "representation": "storage"}}
+            return 200, page
+
+    def search(self, _path, query, _body):
+        time.sleep(self.config.confluence_latency)
+        results = [
+            {"title": f"検索結果 {index}", "url": f"/spaces/BENCH/pages/{index}", "excerpt": query.get("cql", [""])[0]}
+            for index in range(3)
+        ]
+        return 200, {"results": results, "size": len(results)}
+
+    def get_space(self, path, _query, _body):
+        key = path.strip("/").split("/")[0]
+        return 200, {"key": key, "name": key, "type": "global"}
+
+
+class FakeMCPServer(FakeService):
+    """Atlassian MCP SSE サーバー（/v1/sessions と /v1/sse）"""
+
+    name = "mcp"
+
+    def __init__(self, config: FakeConfig):
+        super().__init__(config)
+        self._page_ids = itertools.count(200000)
+        self.route("POST", "/v1/sessions", self.create_session)
+        self.route("POST", "/v1/sse", self.call_tool)
+
+    @property
+    def sse_url(self) -> str:
+        return f"{self.url}/v1/sse"
+
+    def create_session(self, _path, _query, _body):
+        return 200, {"session_id": uuid.uuid4().hex}
+
+    def call_tool(self, _path, _query, body):
+        time.sleep(self.config.mcp_latency)
+        body = body or {}
+        params = body.get("params", {})
+        tool_name = params.get("name")
+        arguments = params.get("arguments", {})
+        if tool_name == "confluence_create_page":
+            page_id = str(next(self._page_ids))
+            result = {"page_id": page_id, "page_url": f"{self.url}/wiki/spaces/{arguments.get('space_key')}/pages/{page_id}"}
+        elif tool_name == "confluence_get_page":
+            result = {"title": "設計書", "content": "# 設計書\n\n## 概要\n偽の設計書です。"}
+        elif tool_name == "confluence_search":
+            result = {"results": [{"title": "検索結果", "url": "/spaces/BENCH/pages/1"}]}
+        else:
+            return 200, SSEStream([{"id": body.get("id"), "error": f"unknown tool: {tool_name}"}])
+        # 無関係なイベントを挟み、クライアントがIDで応答を選別することを確認する
+        return 200, SSEStream([{"id": "heartbeat"}, {"id": body.get("id"), "result": result}])
+
+
+class FakeSlackSink(FakeService):
+    """Slack response_url の受け口（response_url ごとにメッセージを記録）"""
+
+    name = "slack"
+
+    def __init__(self, config: FakeConfig):
+        super().__init__(config)
+        self.messages: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.route("POST", "/response/", self.receive)
+
+    def response_url(self, request_id: str) -> str:
+        return f"{self.url}/response/{request_id}"
+
+    def receive(self, path, _query, body):
+        time.sleep(self.config.slack_latency)
+        text = body.get("text", "") if isinstance(body, dict) else str(body)
+        with self._lock:
+            self.messages[path].append({"text": text, "received_at": time.time()})
+        return 200, None
+
+    def messages_for(self, request_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.messages.get(request_id, []))
+
+
+class FakeServers:
+    """全ての偽サーバーをまとめて起動・停止する"""
+
+    def __init__(self, config: Optional[FakeConfig] = None):
+        self.config = config or FakeConfig()
+        self.anthropic = FakeAnthropic(self.config)
+        self.github = FakeGitHub(self.config)
+        self.confluence = FakeConfluence(self.config)
+        self.mcp = FakeMCPServer(self.config)
+        self.slack = FakeSlackSink(self.config)
+        self.services: List[FakeService] = [self.anthropic, self.github, self.confluence, self.mcp, self.slack]
+
+    def __enter__(self) -> "FakeServers":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> "FakeServers":
+        for service in self.services:
+            service.start()
+        return self
+
+    def stop(self) -> None:
+        for service in self.services:
+            service.stop()
+
+    def environment(self) -> Dict[str, str]:
+        """aibot.py / atlassian_mcp_integration.py を偽サーバーに向ける環境変数"""
+        return {
+            "ANTHROPIC_BASE_URL": self.anthropic.url,
+            "GITHUB_API_URL": self.github.url,
+            "CONFLUENCE_URL": f"{self.confluence.url}/wiki",
+            "ATLASSIAN_MCP_SERVER_URL": self.mcp.sse_url,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """サービスごとの受信リクエスト数"""
+        stats: Dict[str, Any] = {service.name: dict(service.requests) for service in self.services}
+        stats["anthropic_tokens"] = dict(self.anthropic.tokens)
+        return stats
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+オフライン負荷試験
+
+bench_fakes.py の偽サーバー（Anthropic / GitHub / Confluence / MCP SSE / Slack response_url）
+を起動し、aibot.py の実際のタスク処理関数を指定した並行数で実行する。
+シナリオごとにスループット、レイテンシ（p50/p95/p99）、ステージ別の平均時間、
+成功率とメモリ使用量を計測し、bench_results/ にJSONで保存する。
+
+使用例:
+    python bench_load.py --requests 50 --concurrency 10
+    python bench_load.py --scenarios develop design_mcp --llm-latency 1.0 --llm-tps 80
+    python bench_load.py --tracemalloc
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import importlib
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from bench_fakes import FakeConfig, FakeServers
+from bench_startup import RESULTS_DIR, _git_commit, stub_environment
+
+LATEST_PATH = RESULTS_DIR / "load_latest.json"
+
+# metrics.STAGE_DURATION に記録されるステージ
+STAGES = ("parse", "github_fetch", "retrieval", "llm_call", "llm_summary", "pr_create", "confluence_create", "confluence_get", "mcp_tool_call")
+
+
+@dataclass
+class Scenario:
+    """負荷試験の対象タスク"""
+    name: str
+    function: str           # aibot のタスク関数名
+    is_async: bool
+    make_text: Callable[[int], str]
+    success: str            # 成功した場合にタスクが送る最後の報告の書き出し
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in [
+        Scenario("develop", "process_development_task", False,
+                 lambda i: f"bench/repo{i % 5} の src/module_{i}.py に ログ出力を追加",
+                 "✅ プルリクエストの作成が完了しました"),
+        Scenario("design", "process_design_task", False,
+                 lambda i: f"bench-app の 機能{i} について JWT認証を使用したログイン機能",
+                 "✅ 設計ドキュメントの作成が完了しました"),
+        Scenario("design_batch", "process_design_batch_task", False,
+                 lambda i: f"bench-app{i} の 機能A、機能B、機能C、機能D について JWT認証を使用したログイン機能",
+                 "✅ `"),
+        Scenario("develop_from_design", "process_design_based_development_task", False,
+                 lambda i: f"https://example.atlassian.net/wiki/pages/viewpage.action?pageId={1000 + i} の src/feature_{i}.py に実装",
+                 "💡 改善提案"),
+        Scenario("design_mcp", "process_design_task_mcp", True,
+                 lambda i: f"bench-app の 機能{i} について JWT認証を使用したログイン機能",
+                 "✅ MCP経由での設計ドキュメント作成が完了しました"),
+        Scenario("develop_from_design_mcp", "process_design_based_development_task_mcp", True,
+                 lambda i: f"https://example.atlassian.net/wiki/spaces/BENCH/pages/{1000 + i}/Design の src/feature_{i}.py に実装",
+                 "✅ MCP経由での設計ベースコード生成が完了しました"),
+    ]
+}
+DEFAULT_SCENARIOS = ["develop", "design", "design_mcp"]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """線形補間によるパーセンタイル（q は 0〜100）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+def is_successful(messages: List[Dict[str, Any]], success: str) -> bool:
+    """Slackに送信されたメッセージからタスクの成否を判定する
+
+    生成したコードや設計書の本文に含まれる文字で誤判定しないよう、メッセージの書き出しだけを見る。
+    """
+    texts = [message["text"] for message in messages]
+    return any(text.startswith(success) for text in texts) and not any(text.startswith("❌") for text in texts)
+
+
+def _stage_snapshot(metrics) -> Dict[str, tuple]:
+    return {
+        stage: (metrics.STAGE_DURATION.get_count(stage=stage), metrics.STAGE_DURATION.get_sum(stage=stage))
+        for stage in STAGES
+    }
+
+
+def _stage_breakdown(before: Dict[str, tuple], after: Dict[str, tuple]) -> Dict[str, Dict[str, float]]:
+    breakdown = {}
+    for stage in STAGES:
+        count = after[stage][0] - before[stage][0]
+        if count:
+            total = after[stage][1] - before[stage][1]
+            breakdown[stage] = {"count": count, "mean_ms": round(total / count * 1000, 1)}
+    return breakdown
+
+
+def _max_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_scenario(aibot, fakes: FakeServers, scenario: Scenario, requests: int, concurrency: int) -> Dict[str, Any]:
+    """1シナリオを指定の並行数で実行して計測する"""
+    task = getattr(aibot, scenario.function)
+    request_ids = [f"{scenario.name}-{index}-{os.urandom(3).hex()}" for index in range(requests)]
+    bodies = [
+        {
+            "text": scenario.make_text(index),
+            "user_id": f"U{index % 7:04d}",
+            "channel_id": "CBENCH",
+            "response_url": fakes.slack.response_url(request_id),
+        }
+        for index, request_id in enumerate(request_ids)
+    ]
+    latencies: List[float] = []
+    stages_before = _stage_snapshot(aibot.metrics)
+
+    def timed_call(body):
+        start = time.perf_counter()
+        task(body, body["response_url"])
+        return time.perf_counter() - start
+
+    async def timed_async_call(body, semaphore):
+        async with semaphore:
+            start = time.perf_counter()
+            await task(body, body["response_url"])
+            return time.perf_counter() - start
+
+    async def run_async_batch():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(timed_async_call(body, semaphore) for body in bodies))
+
+    wall_start = time.perf_counter()
+    if scenario.is_async:
+        # 本番と同じく aibot の共有イベントループで実行する
+        latencies = list(aibot.async_runtime.run(run_async_batch()))
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(timed_call, bodies))
+    wall_s = time.perf_counter() - wall_start
+
+    succeeded = sum(1 for request_id in request_ids if is_successful(fakes.slack.messages_for(request_id), scenario.success))
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(requests / wall_s, 3) if wall_s else 0.0,
+        "success_rate": round(succeeded / requests, 3) if requests else 0.0,
+        "latency": latency_summary(latencies),
+        "stages": _stage_breakdown(stages_before, _stage_snapshot(aibot.metrics)),
+        "max_rss_kb": _max_rss_kb(),
+    }
+
+
+def add_fake_arguments(parser: argparse.ArgumentParser) -> None:
+    """偽サーバーの応答特性を指定する引数を追加する（bench_replay.py と共通）"""
+    parser.add_argument("--llm-latency", type=float, default=FakeConfig.llm_latency, help="Anthropicの最初のトークンまでの秒数")
+    parser.add_argument("--llm-tps", type=float, default=FakeConfig.llm_tokens_per_second, help="Anthropicの出力トークン/秒")
+    parser.add_argument("--llm-output-tokens", type=int, default=FakeConfig.llm_output_tokens, help="1レスポンスの出力トークン数")
+    parser.add_argument("--github-latency", type=float, default=FakeConfig.github_latency, help="GitHub APIの応答秒数")
+    parser.add_argument("--confluence-latency", type=float, default=FakeConfig.confluence_latency, help="Confluence APIの応答秒数")
+    parser.add_argument("--mcp-latency", type=float, default=FakeConfig.mcp_latency, help="MCPツール呼び出しの応答秒数")
+
+
+def fake_config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        llm_latency=args.llm_latency,
+        llm_tokens_per_second=args.llm_tps,
+        llm_output_tokens=args.llm_output_tokens,
+        github_latency=args.github_latency,
+        confluence_latency=args.confluence_latency,
+        mcp_latency=args.mcp_latency,
+    )
+
+
+def load_aibot(fakes: FakeServers):
+    """偽サーバーに向けた環境変数で aibot をインポートする"""
+    env = stub_environment()
+    env.update(fakes.environment())
+    env.setdefault("TRACE_EXPORTER", "none")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    # 偽サーバーにはレート制限がないため、ゲートウェイのペース配分は明示した場合のみ効かせる
+    for name in ("ANTHROPIC_REQUESTS_PER_MINUTE", "ANTHROPIC_INPUT_TOKENS_PER_MINUTE"):
+        env.setdefault(name, os.environ.get(name, "1000000"))
+    os.environ.update(env)
+    return importlib.import_module("aibot")
+
+
+def run_benchmark(scenarios: List[str], requests: int, concurrency: int, config: FakeConfig, trace_memory: bool) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"scenarios": {}}
+    if trace_memory:
+        tracemalloc.start()
+
+    with FakeServers(config) as fakes:
+        rss_before = _max_rss_kb()
+        aibot = load_aibot(fakes)
+        results["import_rss_kb"] = _max_rss_kb() - rss_before
+        for name in scenarios:
+            if trace_memory:
+                tracemalloc.reset_peak()
+            summary = run_scenario(aibot, fakes, SCENARIOS[name], requests, concurrency)
+            if trace_memory:
+                summary["python_heap_peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+            results["scenarios"][name] = summary
+        results["fake_requests"] = fakes.stats()
+
+    if trace_memory:
+        tracemalloc.stop()
+    return results
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{'scenario':<26}{'rps':>8}{'ok%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'RSS MiB':>9}")
+    for name, summary in report["results"]["scenarios"].items():
+        latency = summary["latency"]
+        print(
+            f"{name:<26}{summary['throughput_rps']:>8.2f}{summary['success_rate'] * 100:>6.0f}%"
+            f"{latency['p50_ms']:>8.0f}ms{latency['p95_ms']:>7.0f}ms{latency['p99_ms']:>7.0f}ms"
+            f"{summary['max_rss_kb'] / 1024:>9.1f}"
+        )
+        for stage, data in summary["stages"].items():
+            print(f"    {stage:<20} x{data['count']:<5} {data['mean_ms']:>9.1f} ms (mean)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="オフライン負荷試験")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=DEFAULT_SCENARIOS, help="実行するシナリオ")
+    parser.add_argument("--requests", type=int, default=20, help="シナリオごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=5, help="同時実行数")
+    add_fake_arguments(parser)
+    parser.add_argument("--tracemalloc", action="store_true", help="シナリオごとのPythonヒープのピークを計測（低速）")
+    parser.add_argument("--output", type=Path, default=None, help="結果JSONの保存先")
+    args = parser.parse_args(argv)
+
+    config = fake_config_from_args(args)
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(config),
+        "results": run_benchmark(args.scenarios, args.requests, args.concurrency, config, args.tracemalloc),
+    }
+    print_report(report)
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    output = args.output or RESULTS_DIR / f"load-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    for path in (output, LATEST_PATH):
+        path.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"\n結果を保存しました: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+記録したコマンドトラフィックの再生
+
+aibot.py が COMMAND_RECORD_FILE に記録したスラッシュコマンド（JSON Lines）を読み込み、
+元の到着間隔（または --speed で圧縮した間隔）で実際のコマンドハンドラーに投入する。
+外部サービスは bench_fakes.py の偽サーバーを使うため、本番の負荷の形をオフラインで再現できる。
+
+リクエストごとのステージ別時間は、コマンドごとのトレース（tracing.py）から集計する。
+ハンドラーとバックグラウンド処理の全スパンが終了した時点を完了とみなす。
+
+記録の形式（1行1件）:
+    {"timestamp": 1718000000.0, "command": "/develop", "text": "...", "user_id": "U1", "channel_id": "C1"}
+timestamp はエポック秒またはISO 8601文字列。command を持たない行は読み飛ばす。
+
+使用例:
+    COMMAND_RECORD_FILE=/tmp/commands.jsonl python main.py   # 記録
+    python bench_replay.py /tmp/commands.jsonl                # 元の間隔で再生
+    python bench_replay.py /tmp/commands.jsonl --speed 10 --max-gap 5
+    python bench_replay.py /tmp/commands.jsonl --speed 0      # 全件を一斉に投入
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import tracing
+from bench_fakes import FakeServers
+from bench_load import add_fake_arguments, fake_config_from_args, latency_summary, load_aibot
+from bench_startup import RESULTS_DIR, _git_commit
+
+LATEST_PATH = RESULTS_DIR / "replay_latest.json"
+
+# 環境別のコマンドプレフィックス（aibot.COMMAND_PREFIX）
+COMMAND_PREFIXES = ("stg-",)
+
+
+def _parse_timestamp(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def load_records(path: Path) -> List[Dict[str, Any]]:
+    """記録ファイルを読み込み、時刻順に並べたコマンドのリストを返す"""
+    records = []
+    skipped = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if not isinstance(entry, dict) or not entry.get("command"):
+                skipped += 1
+                continue
+            timestamp = _parse_timestamp(entry.get("timestamp"))
+            entry["timestamp"] = timestamp if timestamp is not None else 0.0
+            records.append(entry)
+    if skipped:
+        logging.warning(f"コマンドではない行を {skipped} 件読み飛ばしました: {path}")
+    return sorted(records, key=lambda entry: entry["timestamp"])
+
+
+def schedule(records: List[Dict[str, Any]], speed: float = 1.0, max_gap: Optional[float] = None) -> List[float]:
+    """各コマンドを投入する時刻（開始からの秒数）を計算する
+
+    Args:
+        speed: 再生速度（2なら到着間隔を1/2に圧縮、0なら全件を同時に投入）
+        max_gap: 到着間隔の上限（秒）。長い空白を詰めるために使う
+    """
+    offsets = []
+    current = 0.0
+    for index, record in enumerate(records):
+        if index and speed > 0:
+            gap = max(0.0, record["timestamp"] - records[index - 1]["timestamp"]) / speed
+            if max_gap is not None:
+                gap = min(gap, max_gap)
+            current += gap
+        offsets.append(current)
+    return offsets
+
+
+def command_name(command: str) -> str:
+    """"/stg-develop" などの記録上のコマンド名をプレフィックスなしの名前にする"""
+    name = command.lstrip("/")
+    for prefix in COMMAND_PREFIXES:
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+
+class ReplayCollector(tracing.SpanExporter):
+    """再生したコマンドのトレースを trigger_id ごとに集める"""
+
+    def __init__(self):
+        self._traces: Dict[str, Dict[str, Any]] = {}
+        self._condition = threading.Condition()
+
+    def export(self, trace: Dict[str, Any]) -> None:
+        trigger_id = trace["attributes"].get("trigger_id")
+        if not trigger_id:
+            return
+        with self._condition:
+            self._traces[trigger_id] = trace
+            self._condition.notify_all()
+
+    def wait_for(self, trigger_ids: List[str], timeout: float) -> Dict[str, Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while not all(trigger_id in self._traces for trigger_id in trigger_ids):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return {trigger_id: self._traces[trigger_id] for trigger_id in trigger_ids if trigger_id in self._traces}
+
+
+def replay(aibot, fakes: FakeServers, records: List[Dict[str, Any]], offsets: List[float], timeout: float) -> List[Dict[str, Any]]:
+    """コマンドを予定時刻にハンドラーへ投入し、完了したトレースから結果をまとめる"""
+    collector = ReplayCollector()
+    tracing.add_exporter(collector)
+    requests = []
+    start = time.perf_counter()
+
+    for record, offset in zip(records, offsets):
+        delay = offset - (time.perf_counter() - start)
+        if delay > 0:
+            time.sleep(delay)
+
+        name = command_name(record["command"])
+        trigger_id = uuid.uuid4().hex
+        entry = {"command": record["command"], "name": name, "trigger_id": trigger_id, "offset_s": round(offset, 3)}
+        requests.append(entry)
+        handler = aibot.COMMAND_HANDLERS.get(name)
+        if handler is None:
+            entry["status"] = "unknown_command"
+            continue
+
+        body = {
+            "command": f"/{aibot.COMMAND_PREFIX}{name}",
+            "text": record.get("text", ""),
+            "user_id": record.get("user_id") or "UREPLAY",
+            "channel_id": record.get("channel_id") or "CREPLAY",
+            "trigger_id": trigger_id,
+            "response_url": fakes.slack.response_url(trigger_id),
+        }
+        submitted = time.perf_counter()
+        acked = {}
+
+        def ack(*args, **kwargs):
+            acked.setdefault("at", time.perf_counter())
+
+        handler(ack, body, lambda *args, **kwargs: None)
+        entry["actual_offset_s"] = round(submitted - start, 3)
+        entry["ack_ms"] = round((acked.get("at", time.perf_counter()) - submitted) * 1000, 1)
+
+    pending = [entry["trigger_id"] for entry in requests if "status" not in entry]
+    traces = collector.wait_for(pending, timeout)
+    for entry in requests:
+        if "status" in entry:
+            continue
+        trace = traces.get(entry["trigger_id"])
+        if trace is None:
+            entry["status"] = "timeout"
+            continue
+        summary = tracing.summarize(trace)
+        entry["status"] = summary["status"]
+        entry["duration_ms"] = summary["duration_ms"]
+        entry["stages"] = {name: data["total_ms"] for name, data in summary["breakdown"].items()}
+        entry["messages"] = len(fakes.slack.messages_for(entry["trigger_id"]))
+    return requests
+
+
+def summarize_requests(requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """コマンドごとにレイテンシとステージ別の平均時間を集計する"""
+    summary: Dict[str, Any] = {}
+    for name in sorted({entry["name"] for entry in requests}):
+        entries = [entry for entry in requests if entry["name"] == name]
+        completed = [entry for entry in entries if "duration_ms" in entry]
+        stage_totals: Dict[str, float] = {}
+        for entry in completed:
+            for stage, total_ms in entry["stages"].items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + total_ms
+        summary[name] = {
+            "count": len(entries),
+            "completed": len(completed),
+            "errors": sum(1 for entry in entries if entry.get("status") not in ("ok", None)),
+            "latency": latency_summary([entry["duration_ms"] / 1000 for entry in completed]),
+            "ack": latency_summary([entry["ack_ms"] / 1000 for entry in entries if "ack_ms" in entry]),
+            "stage_mean_ms": {
+                stage: round(total / len(completed), 1)
+                for stage, total in sorted(stage_totals.items(), key=lambda item: item[1], reverse=True)
+            },
+        }
+    return summary
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    results = report["results"]
+    print(f"\n再生: {results['requests']}件 / {results['wall_s']:.1f}秒 (speed={report['speed']})")
+    print(f"{'command':<26}{'n':>5}{'done':>6}{'err':>5}{'ack p95':>10}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, data in results["commands"].items():
+        latency = data["latency"]
+        print(
+            f"{name:<26}{data['count']:>5}{data['completed']:>6}{data['errors']:>5}"
+            f"{data['ack']['p95_ms']:>8.0f}ms{latency['p50_ms']:>7.0f}ms{latency['p95_ms']:>7.0f}ms{latency['p99_ms']:>7.0f}ms"
+        )
+        for stage, mean_ms in list(data["stage_mean_ms"].items())[:8]:
+            print(f"    {stage:<34} {mean_ms:>9.1f} ms (mean)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="記録したコマンドトラフィックの再生")
+    parser.add_argument("records", type=Path, help="記録ファイル（JSON Lines）")
+    parser.add_argument("--speed", type=float, default=1.0, help="再生速度（到着間隔を1/speedに圧縮、0で一斉投入）")
+    parser.add_argument("--max-gap", type=float, default=None, help="到着間隔の上限（秒）")
+    parser.add_argument("--limit", type=int, default=None, help="再生する最大件数")
+    parser.add_argument("--timeout", type=float, default=300.0, help="最後の投入後に完了を待つ秒数")
+    parser.add_argument("--output", type=Path, default=None, help="結果JSONの保存先")
+    add_fake_arguments(parser)
+    args = parser.parse_args(argv)
+
+    records = load_records(args.records)[:args.limit]
+    if not records:
+        print(f"再生できるコマンドがありません: {args.records}")
+        return 1
+    offsets = schedule(records, args.speed, args.max_gap)
+
+    with FakeServers(fake_config_from_args(args)) as fakes:
+        aibot = load_aibot(fakes)
+        wall_start = time.perf_counter()
+        requests = replay(aibot, fakes, records, offsets, args.timeout)
+        wall_s = time.perf_counter() - wall_start
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "source": str(args.records),
+        "speed": args.speed,
+        "max_gap": args.max_gap,
+        "results": {
+            "requests": len(requests),
+            "wall_s": round(wall_s, 3),
+            "commands": summarize_requests(requests),
+            "per_request": requests,
+        },
+    }
+    print_report(report)
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    output = args.output or RESULTS_DIR / f"replay-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    for path in (output, LATEST_PATH):
+        path.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"\n結果を保存しました: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+起動時間ベンチマーク（Cloud Runのコールドスタート計測用）
+
+スタブのシークレットを使い、ネットワークに接続せずに以下を計測する:
+- `import aibot` / `import main` の所要時間と `-X importtime` の内訳
+- シークレット読み込み時間
+- `python main.py` 起動から /health が最初に200を返すまでの時間
+
+結果は bench_results/（gitの管理外）にJSONで保存し、ベースラインと比較して劣化を検出する。
+ベースラインは比較の基準としてコミットするため bench_baselines/startup.json に置く。
+
+使用例:
+    python bench_startup.py --runs 5
+    python bench_startup.py --save-baseline
+    python bench_startup.py --fail-on-regression --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent
+RESULTS_DIR = REPO_ROOT / "bench_results"
+BASELINE_PATH = REPO_ROOT / "bench_baselines" / "startup.json"
+LATEST_PATH = RESULTS_DIR / "startup_latest.json"
+
+# 内訳を追跡する重量級パッケージ
+TRACKED_PACKAGES = [
+    "slack_bolt",
+    "anthropic",
+    "github",
+    "atlassian",
+    "bs4",
+    "markdown",
+    "google.cloud.secretmanager",
+    "atlassian_mcp_integration",
+    "httpx",
+    "aiohttp",
+    "sseclient",
+    "flask",
+]
+
+RESULT_MARKER = "__BENCH_RESULT__"
+
+# 子プロセスで実行する計測スクリプト
+IMPORT_CHILD_SCRIPT = """
+import json, os, resource, sys, time
+t0 = time.perf_counter()
+import {module} as target
+import_s = time.perf_counter() - t0
+result = {{"import_s": import_s}}
+if hasattr(target, "load_secrets_parallel"):
+    t1 = time.perf_counter()
+    target.load_secrets_parallel()
+    result["secret_loading_s"] = time.perf_counter() - t1
+result["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+sys.stdout.write("{marker}" + json.dumps(result) + "\\n")
+sys.stdout.flush()
+os._exit(0)
+"""
+
+
+def stub_environment() -> Dict[str, str]:
+    """ネットワーク不要で起動できるスタブ環境変数を作成"""
+    env = dict(os.environ)
+    # Secret Manager / メタデータサーバーへの問い合わせを避ける
+    env.pop("GOOGLE_CLOUD_PROJECT", None)
+    env.pop("GITHUB_ACTIONS", None)
+    stubs = {
+        "DISABLE_SECRET_MANAGER": "true",
+        "SLACK_TOKEN_VERIFICATION": "false",
+        "ENVIRONMENT": "development",
+        "SLACK_BOT_TOKEN": "stub-bot-token",
+        "SLACK_BOT_TOKEN_STAGING": "stub-bot-token",
+        "SLACK_APP_TOKEN": "stub-app-token",
+        "SLACK_APP_TOKEN_STAGING": "stub-app-token",
+        "SLACK_SIGNING_SECRET": "stub-signing-secret",
+        "ANTHROPIC_API_KEY": "stub-anthropic-key",
+        "GITHUB_ACCESS_TOKEN": "stub-github-token",
+        "CONFLUENCE_URL": "http://127.0.0.1:9/wiki",
+        "CONFLUENCE_USERNAME": "stub@example.com",
+        "CONFLUENCE_API_TOKEN": "stub-confluence-token",
+        "CONFLUENCE_SPACE_KEY": "BENCH",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    env.update(stubs)
+    return env
+
+
+def parse_importtime(stderr: str) -> Dict[str, Dict[str, int]]:
+    """`-X importtime` の出力をモジュール名ごとの self/cumulative(μs) に変換"""
+    modules: Dict[str, Dict[str, int]] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        try:
+            self_us = int(fields[0].strip())
+            cumulative_us = int(fields[1].strip())
+        except ValueError:
+            # ヘッダー行
+            continue
+        name = fields[2].strip()
+        # 同名モジュールが複数回出る場合は最初のインポートを採用
+        modules.setdefault(name, {"self_us": self_us, "cumulative_us": cumulative_us})
+    return modules
+
+
+def summarize_importtime(modules: Dict[str, Dict[str, int]], top_n: int = 15) -> Dict[str, object]:
+    """追跡対象パッケージとトップレベルパッケージ上位の内訳をまとめる"""
+    tracked = {
+        name: modules[name]["cumulative_us"]
+        for name in TRACKED_PACKAGES
+        if name in modules
+    }
+    top_level = sorted(
+        ((name, data["cumulative_us"]) for name, data in modules.items() if "." not in name),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:top_n]
+    return {
+        "tracked_cumulative_us": tracked,
+        "top_level_cumulative_us": dict(top_level),
+    }
+
+
+def measure_import(module: str, env: Dict[str, str]) -> Dict[str, object]:
+    """子プロセスでモジュールをインポートして計測"""
+    script = IMPORT_CHILD_SCRIPT.format(module=module, marker=RESULT_MARKER)
+    wall_start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    wall_s = time.perf_counter() - wall_start
+
+    result_line = next(
+        (line for line in proc.stdout.splitlines() if line.startswith(RESULT_MARKER)),
+        None,
+    )
+    if result_line is None:
+        raise RuntimeError(
+            f"`import {module}` の計測に失敗しました (exit={proc.returncode}):\n{proc.stderr[-2000:]}"
+        )
+
+    result = json.loads(result_line[len(RESULT_MARKER):])
+    result["process_wall_s"] = wall_s
+    result["importtime"] = summarize_importtime(parse_importtime(proc.stderr))
+    return result
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_time_to_healthy(env: Dict[str, str], timeout: float = 120.0) -> Dict[str, float]:
+    """`python main.py` の起動から /health が200を返すまでの時間を計測"""
+    port = _free_port()
+    run_env = dict(env, PORT=str(port))
+    url = f"http://127.0.0.1:{port}/health"
+
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=REPO_ROOT,
+        env=run_env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"main.py が終了しました (exit={proc.returncode})")
+            request_start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        now = time.perf_counter()
+                        return {
+                            "time_to_healthy_s": now - start,
+                            "first_response_ms": (now - request_start) * 1000,
+                        }
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                pass
+            time.sleep(0.02)
+        raise RuntimeError(f"{timeout}秒以内に /health が応答しませんでした")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def _stats(values: List[float]) -> Dict[str, float]:
+    return {
+        "median": statistics.median(values),
+        "min": min(values),
+        "max": max(values),
+    }
+
+
+def _median_breakdown(runs: List[Dict[str, object]], key: str) -> Dict[str, float]:
+    """各実行の importtime 内訳をパッケージごとの中央値(ms)にまとめる"""
+    names = set()
+    for run in runs:
+        names.update(run["importtime"][key].keys())
+    breakdown = {}
+    for name in names:
+        values = [run["importtime"][key][name] for run in runs if name in run["importtime"][key]]
+        breakdown[name] = round(statistics.median(values) / 1000, 2)
+    return dict(sorted(breakdown.items(), key=lambda item: item[1], reverse=True))
+
+
+def run_benchmark(runs: int, modules: List[str], skip_health: bool) -> Dict[str, object]:
+    """全ての計測を実行して結果をまとめる"""
+    env = stub_environment()
+    results: Dict[str, object] = {"imports": {}}
+
+    for module in modules:
+        module_runs = [measure_import(module, env) for _ in range(runs)]
+        summary = {
+            "import_s": _stats([r["import_s"] for r in module_runs]),
+            "process_wall_s": _stats([r["process_wall_s"] for r in module_runs]),
+            "max_rss_kb": _stats([r["max_rss_kb"] for r in module_runs]),
+            "tracked_ms": _median_breakdown(module_runs, "tracked_cumulative_us"),
+            "top_level_ms": _median_breakdown(module_runs, "top_level_cumulative_us"),
+        }
+        if all("secret_loading_s" in r for r in module_runs):
+            summary["secret_loading_s"] = _stats([r["secret_loading_s"] for r in module_runs])
+        results["imports"][module] = summary
+
+    if not skip_health:
+        health_runs = [measure_time_to_healthy(env) for _ in range(runs)]
+        results["health"] = {
+            "time_to_healthy_s": _stats([r["time_to_healthy_s"] for r in health_runs]),
+            "first_response_ms": _stats([r["first_response_ms"] for r in health_runs]),
+        }
+
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _comparable_metrics(report: Dict[str, object]) -> Dict[str, float]:
+    """ベースライン比較に使う指標（中央値）を平坦化"""
+    metrics = {}
+    for module, summary in report["results"]["imports"].items():
+        metrics[f"import {module}"] = summary["import_s"]["median"]
+        metrics[f"max_rss_kb {module}"] = summary["max_rss_kb"]["median"]
+    if "health" in report["results"]:
+        metrics["time_to_healthy"] = report["results"]["health"]["time_to_healthy_s"]["median"]
+    return metrics
+
+
+def compare_with_baseline(report: Dict[str, object], baseline: Dict[str, object], threshold: float) -> List[str]:
+    """ベースラインより threshold 以上悪化した指標を返す"""
+    current = _comparable_metrics(report)
+    previous = _comparable_metrics(baseline)
+    regressions = []
+    for name, value in current.items():
+        base = previous.get(name)
+        if not base:
+            continue
+        change = (value - base) / base
+        marker = "⚠️" if change > threshold else "  "
+        print(f"{marker} {name}: {base:.3f} -> {value:.3f} ({change:+.1%})")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def print_report(report: Dict[str, object]) -> None:
+    for module, summary in report["results"]["imports"].items():
+        print(f"\n=== import {module} ===")
+        print(f"  import: {summary['import_s']['median'] * 1000:.0f} ms (median)")
+        print(f"  max RSS: {summary['max_rss_kb']['median'] / 1024:.1f} MiB")
+        if "secret_loading_s" in summary:
+            print(f"  secret loading: {summary['secret_loading_s']['median'] * 1000:.1f} ms")
+        print("  tracked packages (cumulative ms):")
+        for name, ms in summary["tracked_ms"].items():
+            print(f"    {name:<32} {ms:>9.1f}")
+    if "health" in report["results"]:
+        health = report["results"]["health"]
+        print("\n=== main.py ===")
+        print(f"  time to first healthy response: {health['time_to_healthy_s']['median']:.2f} s (median)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="起動時間ベンチマーク")
+    parser.add_argument("--runs", type=int, default=3, help="計測回数（中央値を採用）")
+    parser.add_argument("--modules", nargs="+", default=["aibot", "main"], help="計測対象モジュール")
+    parser.add_argument("--skip-health", action="store_true", help="/health までの時間計測を省略")
+    parser.add_argument("--output", type=Path, default=None, help="結果JSONの保存先")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="比較対象のベースライン")
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果をベースラインとして保存")
+    parser.add_argument("--threshold", type=float, default=0.2, help="劣化とみなす変化率")
+    parser.add_argument("--fail-on-regression", action="store_true", help="劣化時に終了コード1を返す")
+    args = parser.parse_args(argv)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": args.runs,
+        "results": run_benchmark(args.runs, args.modules, args.skip_health),
+    }
+    print_report(report)
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    output = args.output or RESULTS_DIR / f"startup-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    for path in (output, LATEST_PATH):
+        path.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"\n結果を保存しました: {output}")
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(exist_ok=True)
+        args.baseline.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+        print(f"ベースラインを保存しました: {args.baseline}")
+        return 0
+
+    if args.baseline.exists():
+        print(f"\n=== ベースライン比較 ({args.baseline}) ===")
+        regressions = compare_with_baseline(report, json.loads(args.baseline.read_text()), args.threshold)
+        if regressions and args.fail_on_regression:
+            print(f"❌ 起動性能が劣化しました: {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Markdown から Confluence ストレージ形式への変換
+
+設計ドキュメントをConfluenceに書き込む3箇所（create_confluence_page、MCPの confluence_create_page、
+/design-mcp のフォールバック）がそれぞれ拡張機能の異なる markdown.markdown() を呼んでおり、
+呼び出しのたびに Markdown インスタンスと拡張機能を作り直していた。また、コードブロックは <pre><code> のまま
+書き込まれるため、Confluence上ではシンタックスハイライトされなかった。
+
+ここでは拡張機能を設定済みの markdown.Markdown を1つだけ作り、文書ごとに reset() して使い回す。
+変換はストレージ形式を直接出力する:
+- コードブロック（``` と字下げ）: code マクロ（言語を指定した場合は language パラメータ付き）
+- 表: <table><tbody> のみの表（見出し行は <th> のまま tbody に入れる）
+- 目次: 行単独の [TOC] か to_storage(..., toc=True) で toc マクロ
+
+Markdown インスタンスはスレッドセーフではないため、変換はロックで直列化する（数KBの文書で1ms程度）。
+
+upsert_page() は同じスペース・タイトルのページがあれば作成せずに更新する。現在の本文と見出し単位で比較し、
+変更されたセクションがない場合は書き込まない。更新は比較したバージョンの次の番号で行い、
+その間に他の人が編集していた場合（409）は読み直して比較からやり直す。
+
+環境変数:
+    CONFLUENCE_UPSERT: false で常に新しいページを作成する（デフォルト: true）
+"""
+
+import html
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+import design_chunker
+import metrics
+from lazy_imports import lazy_import
+
+markdown = lazy_import("markdown")
+
+EXTENSIONS = ["tables", "fenced_code", "sane_lists"]
+
+TOC_MARKER = "[TOC]"
+TOC_MACRO = '<ac:structured-macro ac:name="toc" ac:schema-version="1" />'
+
+_CODE_BLOCK = re.compile(r'<pre><code(?: class="language-([\w#+.-]+)")?>(.*?)</code></pre>', re.DOTALL)
+_THEAD = re.compile(r"<thead>\s*(.*?)\s*</thead>\s*<tbody>", re.DOTALL)
+
+_converter = None
+_lock = threading.Lock()
+
+
+def code_macro(code: str, language: Optional[str] = None) -> str:
+    """code マクロ（本文は CDATA に入れるため、終端の ]]> だけを分割する）"""
+    body = code.replace("]]>", "]]]]><![CDATA[>")
+    parameter = f'<ac:parameter ac:name="language">{html.escape(language)}</ac:parameter>' if language else ""
+    return (
+        f'<ac:structured-macro ac:name="code" ac:schema-version="1">{parameter}'
+        f"<ac:plain-text-body><![CDATA[{body}]]></ac:plain-text-body></ac:structured-macro>"
+    )
+
+
+def _storage_postprocess(text: str) -> str:
+    """HTMLをストレージ形式のマクロと表に置き換える"""
+    text = _CODE_BLOCK.sub(lambda match: code_macro(html.unescape(match.group(2)).rstrip("\n"), match.group(1)), text)
+    # マクロはブロック要素として扱われないため、段落で囲まれた目次を外す
+    text = text.replace(f"<p>{TOC_MACRO}</p>", TOC_MACRO)
+    return _THEAD.sub(r"<tbody>\n\1", text)
+
+
+def _build():
+    """ストレージ形式用の拡張機能を設定した Markdown インスタンスを作る"""
+    from markdown.extensions import Extension
+    from markdown.postprocessors import Postprocessor
+    from markdown.preprocessors import Preprocessor
+
+    class TocPreprocessor(Preprocessor):
+        def run(self, lines):
+            return [self.md.htmlStash.store(TOC_MACRO) if line.strip() == TOC_MARKER else line for line in lines]
+
+    class StoragePostprocessor(Postprocessor):
+        def run(self, text):
+            return _storage_postprocess(text)
+
+    class StorageExtension(Extension):
+        def extendMarkdown(self, md):
+            # [TOC] はコードブロックを退避した（fenced_code: 優先度25）後に、
+            # マクロへの置き換えは退避したHTMLを戻した（優先度30）後に行う
+            md.preprocessors.register(TocPreprocessor(md), "confluence_toc", 20)
+            md.postprocessors.register(StoragePostprocessor(md), "confluence_storage", 5)
+
+    return markdown.Markdown(extensions=[*EXTENSIONS, StorageExtension()], output_format="xhtml")
+
+
+def to_storage(text: str, toc: bool = False) -> str:
+    """Markdown をConfluenceのストレージ形式に変換する（toc=True の場合は先頭に目次を入れる）"""
+    global _converter
+    with _lock:
+        if _converter is None:
+            _converter = _build()
+        try:
+            body = _converter.convert(text)
+        finally:
+            _converter.reset()
+    return f"{TOC_MACRO}\n{body}" if toc else body
+
+
+def upsert_enabled() -> bool:
+    return os.environ.get("CONFLUENCE_UPSERT", "true").strip().lower() not in ("0", "false", "no")
+
+
+@dataclass
+class PageWrite:
+    """upsert_page() の結果"""
+    page_id: str
+    action: str          # created / updated / unchanged
+    version: int
+    changed_sections: List[str] = field(default_factory=list)
+
+
+def changed_sections(current: str, new: str) -> List[str]:
+    """ストレージ形式の本文を見出し単位で比較し、追加・変更・削除されたセクションの見出しを返す
+
+    Confluenceは保存時に本文を正規化する（属性の順序や空白が変わる）ため、HTMLではなくテキストで比較する。
+    """
+    def keyed(storage: str):
+        sections, seen = {}, {}
+        for section in design_chunker.split_sections(design_chunker.storage_to_text(storage)):
+            # 同じ見出しが複数ある場合は出現順で区別する
+            index = seen[section.title] = seen.get(section.title, -1) + 1
+            sections[(section.title, index)] = section.text
+        return sections
+
+    before, after = keyed(current), keyed(new)
+    return [
+        title or "(先頭)"
+        for title, index in dict.fromkeys([*after, *before])
+        if before.get((title, index)) != after.get((title, index))
+    ]
+
+
+def _find_page(confluence: Any, space_key: str, title: str) -> Optional[dict]:
+    """スペースとタイトルでページを探す（本文とバージョン付き）
+
+    atlassian-python-api 3.x は最初のページか None を、4.x 以降のクラウド版は検索結果（{"results": [...]}）を返す。
+    """
+    page = confluence.get_page_by_title(space_key, title, expand="body.storage,version")
+    if isinstance(page, dict) and "results" in page:
+        return (page["results"] or [None])[0]
+    return page or None
+
+
+def _is_conflict(error: Exception) -> bool:
+    return getattr(getattr(error, "response", None), "status_code", None) == 409
+
+
+def upsert_page(confluence: Any, space_key: str, title: str, storage: str,
+                parent_id: Optional[str] = None, retries: int = 1) -> PageWrite:
+    """同じスペース・タイトルのページを更新し、なければ作成する（本文はストレージ形式）
+
+    Args:
+        confluence: atlassian.Confluence
+        storage: to_storage() で変換した本文
+    """
+    page = _find_page(confluence, space_key, title)
+    if not page:
+        result = confluence.create_page(
+            space=space_key, title=title, body=storage, parent_id=parent_id, representation="storage"
+        )
+        metrics.CONFLUENCE_PAGE_WRITES.inc(action="created")
+        return PageWrite(result["id"], "created", (result.get("version") or {}).get("number", 1))
+
+    version = page["version"]["number"]
+    changed = changed_sections(page["body"]["storage"]["value"], storage)
+    if not changed:
+        metrics.CONFLUENCE_PAGE_WRITES.inc(action="unchanged")
+        return PageWrite(page["id"], "unchanged", version)
+
+    data = {
+        "id": page["id"],
+        "type": "page",
+        "title": title,
+        "space": {"key": space_key},
+        "body": {"storage": {"value": storage, "representation": "storage"}},
+        "version": {"number": version + 1, "message": f"{len(changed)}セクションを更新: {', '.join(changed)[:200]}"},
+    }
+    if parent_id:
+        data["ancestors"] = [{"type": "page", "id": parent_id}]
+    try:
+        confluence.put(f"rest/api/content/{page['id']}", data=data)
+    except Exception as e:
+        if not _is_conflict(e) or retries <= 0:
+            raise
+        logging.info(f"Confluenceページが同時に更新されたため読み直します: {title} (version {version})")
+        return upsert_page(confluence, space_key, title, storage, parent_id, retries - 1)
+    metrics.CONFLUENCE_PAGE_WRITES.inc(action="updated")
+    return PageWrite(page["id"], "updated", version + 1, changed)
+
+
+def write_page(confluence: Any, space_key: str, title: str, content: str, parent_id: Optional[str] = None) -> PageWrite:
+    """Markdown を変換してページを書き込む（CONFLUENCE_UPSERT=false の場合は常に作成する）"""
+    storage = to_storage(content)
+    if upsert_enabled():
+        return upsert_page(confluence, space_key, title, storage, parent_id)
+    result = confluence.create_page(space=space_key, title=title, body=storage, parent_id=parent_id, representation="storage")
+    metrics.CONFLUENCE_PAGE_WRITES.inc(action="created")
+    return PageWrite(result["id"], "created", 1)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+設計ドキュメントのセクション分割とコンテキスト圧縮
+
+/develop-from-design はConfluenceの設計書全体をプロンプトに貼り付けていたため、
+セクション数の多い設計書では入力トークンと応答時間が大きくなる。
+見出し単位でセクションに分割し、実装対象の file_path と追加要件に関係するセクションは全文、
+それ以外は並列に要約（または抜粋）して、コード生成用のコンパクトなコンテキストを組み立てる。
+
+入力はConfluenceのストレージ形式（HTML）とMarkdownのどちらでもよい。
+
+環境変数:
+    DESIGN_CONTEXT_BUDGET: 設計書コンテキストのトークン上限（デフォルト: 12000）
+    DESIGN_SUMMARY_MAX_WORKERS: 要約の並列数（デフォルト: 4）
+"""
+
+import concurrent.futures
+import contextvars
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from lazy_imports import lazy_import
+import token_budget
+
+bs4 = lazy_import("bs4")
+
+_HTML_HEADING = re.compile(r"<h[1-6][\s>]", re.IGNORECASE)
+_MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+# 英数字の識別子と、カタカナ・漢字の連続（ひらがなは区切りとして扱う）
+_KEYWORD = re.compile(r"[A-Za-z][A-Za-z0-9]{2,}|[ァ-ヿ一-鿿]{2,}")
+
+# 実装対象に関わらず常に必要なセクション
+ALWAYS_RELEVANT = ("概要", "実装方針", "技術選定", "コーディング規約")
+
+# 拡張子ごとに関係の深いセクションの見出しキーワード
+EXTENSION_KEYWORDS = {
+    ".py": ["api", "python", "バックエンド", "データベース", "テーブル"],
+    ".js": ["api", "フロントエンド", "画面", "ui"],
+    ".ts": ["api", "フロントエンド", "画面", "ui"],
+    ".tsx": ["フロントエンド", "画面", "ui", "コンポーネント"],
+    ".jsx": ["フロントエンド", "画面", "ui", "コンポーネント"],
+    ".sql": ["データベース", "テーブル", "インデックス", "データ移行"],
+    ".go": ["api", "バックエンド", "データベース"],
+    ".java": ["api", "バックエンド", "データベース"],
+}
+TEST_KEYWORDS = ["テスト", "test"]
+
+# 要約せずに抜粋で済ませるセクションの大きさ（トークン）
+EXCERPT_THRESHOLD = 300
+EXCERPT_CHARS = 400
+
+
+def context_budget() -> int:
+    return int(os.environ.get("DESIGN_CONTEXT_BUDGET", "12000"))
+
+
+@dataclass
+class Section:
+    """見出し1つ分のセクション"""
+    title: str
+    level: int
+    text: str
+
+    @property
+    def tokens(self) -> int:
+        return token_budget.estimate_tokens(self.text)
+
+    def render(self, body: Optional[str] = None) -> str:
+        heading = f"{'#' * self.level} {self.title}\n" if self.title else ""
+        return heading + (self.text if body is None else body).strip() + "\n"
+
+
+@dataclass
+class DesignContext:
+    """コード生成に渡す設計書コンテキスト"""
+    text: str
+    original_tokens: int
+    context_tokens: int
+    full_sections: List[str] = field(default_factory=list)
+    summarized_sections: List[str] = field(default_factory=list)
+
+
+def storage_to_text(html: str) -> str:
+    """ストレージ形式のHTMLを、見出しをMarkdown形式で残したテキストに変換する"""
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    # マクロのパラメータ（code マクロの言語など）は本文ではない
+    for parameter in soup.find_all("ac:parameter"):
+        parameter.decompose()
+    for level in range(1, 7):
+        for heading in soup.find_all(f"h{level}"):
+            heading.string = "#" * level + " " + heading.get_text(" ", strip=True)
+    return soup.get_text(separator="\n", strip=True)
+
+
+def split_sections(content: str) -> List[Section]:
+    """見出しでセクションに分割する（最初の見出しより前は title が空のセクション）"""
+    if _HTML_HEADING.search(content):
+        content = storage_to_text(content)
+
+    sections = [Section("", 0, "")]
+    lines: List[str] = []
+    for line in content.splitlines():
+        match = _MARKDOWN_HEADING.match(line)
+        if match:
+            sections[-1].text = "\n".join(lines).strip()
+            sections.append(Section(match.group(2), len(match.group(1)), ""))
+            lines = []
+        else:
+            lines.append(line)
+    sections[-1].text = "\n".join(lines).strip()
+    return [section for section in sections if section.title or section.text]
+
+
+def target_keywords(file_path: str, requirements: str = "") -> List[str]:
+    """実装対象のファイルパスと追加要件から関連セクションを探すキーワードを作る"""
+    keywords = []
+    stem, extension = os.path.splitext(file_path.lower())
+    for part in re.split(r"[/\\_\-.]+", stem):
+        if len(part) >= 3 and part not in ("src", "lib", "app", "main", "index"):
+            keywords.append(part)
+    keywords.extend(EXTENSION_KEYWORDS.get(extension, []))
+    if "test" in stem:
+        keywords.extend(TEST_KEYWORDS)
+    keywords.extend(word.lower() for word in _KEYWORD.findall(requirements))
+    return list(dict.fromkeys(keywords))
+
+
+def relevance(section: Section, keywords: List[str]) -> int:
+    """見出しへの一致を本文の3倍に重み付けした関連度"""
+    title = section.title.lower()
+    text = section.text.lower()
+    score = sum(3 for keyword in keywords if keyword in title)
+    score += sum(1 for keyword in keywords if keyword in text)
+    if any(name in section.title for name in ALWAYS_RELEVANT):
+        score += 3
+    return score
+
+
+def _excerpt(section: Section) -> str:
+    text = section.text.strip()
+    return text if len(text) <= EXCERPT_CHARS else text[:EXCERPT_CHARS] + "…"
+
+
+def build_design_context(content: str, file_path: str, requirements: str = "",
+                         summarize: Optional[Callable[[Section], str]] = None,
+                         budget: Optional[int] = None) -> DesignContext:
+    """実装対象に関係するセクションを優先して、予算内の設計書コンテキストを組み立てる
+
+    Args:
+        content: 設計書（ストレージ形式HTMLまたはMarkdown/テキスト）
+        file_path: 実装対象ファイル
+        requirements: 追加要件
+        summarize: セクションの要約を返す関数（省略時は抜粋）。並列に呼ばれる
+        budget: コンテキストのトークン上限（省略時は DESIGN_CONTEXT_BUDGET）
+    """
+    budget = budget or context_budget()
+    original_tokens = token_budget.estimate_tokens(content)
+    if original_tokens <= budget:
+        return DesignContext(content, original_tokens, original_tokens)
+
+    sections = split_sections(content)
+    keywords = target_keywords(file_path, requirements)
+    scores = [relevance(section, keywords) for section in sections]
+
+    # 関連度の高い順に、予算の範囲で全文を採用する（要約の分として予算の2割を残す）
+    full = set()
+    used = 0
+    full_budget = int(budget * 0.8)
+    for index in sorted(range(len(sections)), key=lambda index: scores[index], reverse=True):
+        if scores[index] == 0:
+            break
+        if used + sections[index].tokens <= full_budget:
+            full.add(index)
+            used += sections[index].tokens
+
+    rest = [index for index in range(len(sections)) if index not in full and sections[index].text]
+    to_summarize = [index for index in rest if summarize and sections[index].tokens > EXCERPT_THRESHOLD]
+    summaries = {index: _excerpt(sections[index]) for index in rest}
+    if to_summarize:
+        summaries.update(_summarize_parallel(sections, to_summarize, summarize))
+
+    parts = []
+    for index, section in enumerate(sections):
+        if index in full or not section.text:
+            parts.append(section.render())
+        else:
+            parts.append(section.render(f"（要約）{summaries[index]}"))
+    text = "\n".join(parts)
+    context = DesignContext(
+        text,
+        original_tokens,
+        token_budget.estimate_tokens(text),
+        full_sections=[sections[index].title for index in sorted(full)],
+        summarized_sections=[sections[index].title for index in rest],
+    )
+    logging.info(
+        f"設計書コンテキスト: {original_tokens} -> {context.context_tokens} トークン "
+        f"(全文 {len(full)} / 要約・抜粋 {len(rest)} セクション)"
+    )
+    return context
+
+
+def _summarize_parallel(sections: List[Section], indexes: List[int], summarize: Callable[[Section], str]) -> dict:
+    """セクションを並列に要約する（失敗したセクションは抜粋を使う）"""
+    max_workers = int(os.environ.get("DESIGN_SUMMARY_MAX_WORKERS", "4"))
+    summaries = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(indexes)))) as executor:
+        # トレースを要約スレッドへ引き継ぐ
+        futures = {
+            executor.submit(contextvars.copy_context().run, summarize, sections[index]): index
+            for index in indexes
+        }
+        for future, index in futures.items():
+            try:
+                summaries[index] = future.result().strip()
+            except Exception as e:
+                logging.warning(f"セクション「{sections[index].title}」の要約に失敗しました: {e}")
+                summaries[index] = _excerpt(sections[index])
+    return summaries
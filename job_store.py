@@ -0,0 +1,632 @@
+#!/usr/bin/env python3
+"""
+ジョブの永続化とステージごとのチェックポイント
+
+/develop などのタスクはスレッドの中にしか存在せず、インスタンスの入れ替えや再デプロイで処理中の作業と
+消費済みのLLMトークンが失われていた。ジョブとステージの結果（解析済みコマンド・取得したコード・生成結果・PR）を
+ストアに記録し、再起動後のワーカーは最後に完了したステージから再開する（生成済みの結果は再生成しない）。
+
+ストアは JobStore を実装すれば差し替えられる。標準は SQLite（ローカルファイル）。
+SQLiteのストアはワーカープロセス間のキュー（task_queue.py）も兼ね、投入されたジョブは所有者なしの queued として待つ。
+再起動をまたいで残すには JOB_STORE_PATH を永続ボリューム上に置くこと。
+
+実行中のジョブは所有者（ワーカーID）と更新時刻を持ち、チェックポイントのたびに更新する。
+所有者のプロセスが終了している（同じホストの場合）か、JOB_LEASE_SECONDS 以上更新されていないジョブは
+中断したものとみなして引き取る。
+
+このプロセスで実行中・実行待ちのジョブはメモリ上のレジストリにも登録し、/cancel から取り消せるようにする。
+ジョブは進捗（最後に完了したステージ・ステージごとの所要時間・トークン使用量・PRなどのリンク）も記録し、
+/status はレジストリと（SQLiteの場合は）ストアからユーザーのジョブを一覧する。
+取り消しは協調的で、処理関数はステージの区切りで Job.raise_if_cancelled() を呼び、
+生成中のLLM呼び出しは cancel_event() を model_router に渡してストリーミングを中断する。
+
+環境変数:
+    JOB_STORE: sqlite / none（デフォルト: sqlite）
+    JOB_STORE_PATH: SQLiteファイルのパス（デフォルト: /tmp/aibot-jobs.sqlite3）
+    JOB_LEASE_SECONDS: 中断したとみなすまでの秒数（デフォルト: 600）
+    JOB_RESUME_INTERVAL: 中断したジョブを探す間隔（秒、0で起動時のみ。デフォルト: 60）
+    JOB_RETENTION_SECONDS: 完了したジョブを保持する秒数（デフォルト: 604800）
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import metrics
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+# 終了処理で他のワーカーに引き継いだジョブ（ストア上は running のまま）
+RELEASED = "released"
+
+# 同じホストでもプロセスごとに異なるID（再起動後は別のワーカーとして扱う）
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class JobCancelled(Exception):
+    """ジョブが /cancel で取り消された"""
+
+
+def owner_alive(owner: Optional[str]) -> Optional[bool]:
+    """所有者のプロセスが生きているか（同じホストのプロセスのみ判定でき、それ以外は None）"""
+    host, _, rest = (owner or "").partition(":")
+    pid = rest.partition(":")[0]
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+@dataclass
+class Job:
+    """実行中のジョブ（完了済みステージの結果を checkpoints に持つ）"""
+    id: str
+    kind: str
+    payload: Dict[str, Any]
+    status: str = RUNNING
+    attempts: int = 1
+    checkpoints: Dict[str, Any] = field(default_factory=dict)
+    store: Optional["JobStore"] = field(default=None, repr=False, compare=False)
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+    created_at: float = field(default_factory=time.time)
+    # 進捗: started_at, finished_at, stage（最後に完了したステージ）, stage_at, stages（ステージ別の秒数）, usage, links
+    progress: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def resumed(self) -> bool:
+        return self.attempts > 1
+
+    @property
+    def user_id(self) -> Optional[str]:
+        return self.payload.get("user_id")
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self) -> None:
+        """取り消しを要求する（処理関数が次の確認箇所で JobCancelled を送出する）"""
+        self.cancel_event.set()
+
+    def raise_if_cancelled(self) -> None:
+        """取り消しが要求されていれば JobCancelled を送出する（ステージの区切りで呼ぶ）"""
+        if self.cancelled:
+            raise JobCancelled(self.id)
+
+    @property
+    def started(self) -> bool:
+        return "started_at" in self.progress
+
+    @property
+    def stage(self) -> Optional[str]:
+        """最後に完了したステージ"""
+        return self.progress.get("stage")
+
+    def elapsed(self, now: Optional[float] = None) -> float:
+        """受け付けてから終了まで（実行中なら現在まで）の秒数"""
+        end = self.progress.get("finished_at") or now or time.time()
+        return max(0.0, end - self.created_at)
+
+    def get(self, stage: str) -> Optional[Any]:
+        """完了済みステージの結果（未完了なら None）"""
+        return self.checkpoints.get(stage)
+
+    def mark_started(self) -> None:
+        """処理関数での実行を開始した時刻を記録する（初回は実行待ちの時間をメトリクスに記録する）"""
+        now = time.time()
+        if not self.resumed and not self.started:
+            metrics.JOB_QUEUE_WAIT.observe(max(0.0, now - self.created_at), kind=self.kind)
+        self.progress["started_at"] = now
+        self.progress["stage_at"] = now
+        self._save_progress()
+
+    def checkpoint(self, stage: str, data: Any) -> Any:
+        """ステージの結果を記録して返す（直前のステージからの所要時間も記録する）"""
+        self.checkpoints[stage] = data
+        now = time.time()
+        elapsed = max(0.0, now - self.progress.get("stage_at", self.created_at))
+        metrics.JOB_STAGE_DURATION.observe(elapsed, kind=self.kind, stage=stage)
+        self.progress.setdefault("stages", {})[stage] = round(elapsed, 3)
+        self.progress.update(stage=stage, stage_at=now)
+        if self.store is not None:
+            try:
+                self.store.checkpoint(self.id, stage, data)
+                self.store.save_progress(self.id, self.progress)
+            except sqlite3.Error as e:
+                logging.warning(f"チェックポイントを記録できませんでした ({self.id} {stage}): {e}")
+        return data
+
+    def add_usage(self, input_tokens: int = 0, output_tokens: int = 0, cost: float = 0.0) -> None:
+        """LLM呼び出しのトークン使用量と料金を加算する"""
+        usage = self.progress.setdefault("usage", {"input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+        usage["input_tokens"] += input_tokens
+        usage["output_tokens"] += output_tokens
+        usage["cost_usd"] = round(usage["cost_usd"] + cost, 6)
+        self._save_progress()
+
+    def add_link(self, name: str, url: str) -> None:
+        """成果物（PR・Confluenceページ）のリンクを記録する"""
+        self.progress.setdefault("links", {})[name] = url
+        self._save_progress()
+
+    def summary(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """運用向けの進捗（コマンドの本文やユーザーは含めない）"""
+        started_at = self.progress.get("started_at")
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status if started_at or self.status != RUNNING else "waiting",
+            "attempts": self.attempts,
+            "stage": self.stage,
+            "elapsed_seconds": round(self.elapsed(now), 3),
+            "queue_wait_seconds": round(started_at - self.created_at, 3) if started_at and not self.resumed else None,
+            "stages": self.progress.get("stages", {}),
+            "usage": self.progress.get("usage", {}),
+        }
+
+    def _save_progress(self) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.save_progress(self.id, self.progress)
+        except sqlite3.Error as e:
+            logging.warning(f"ジョブの進捗を記録できませんでした ({self.id}): {e}")
+
+    def finish(self, status: str = DONE, error: Optional[str] = None) -> None:
+        """ジョブを終了する（終了済みなら何もしない）"""
+        if self.status != RUNNING:
+            return
+        self.status = status
+        self.progress["finished_at"] = time.time()
+        unregister(self)
+        if self.store is not None:
+            try:
+                self.store.save_progress(self.id, self.progress)
+                self.store.finish(self.id, status, error)
+            except sqlite3.Error as e:
+                logging.warning(f"ジョブの終了を記録できませんでした ({self.id}): {e}")
+
+    def fail(self, error: Any) -> None:
+        self.finish(FAILED, str(error))
+
+    def release(self) -> None:
+        """このワーカーでの実行をやめ、他のワーカーが最後のチェックポイントから再開できるようにする"""
+        if self.status != RUNNING:
+            return
+        self.status = RELEASED
+        unregister(self)
+        if self.store is not None:
+            try:
+                self.store.release(job_id=self.id)
+            except sqlite3.Error as e:
+                logging.warning(f"ジョブを引き継げませんでした ({self.id}): {e}")
+
+
+class JobStore:
+    """ジョブストアのインターフェース"""
+
+    def create(self, kind: str, payload: Dict[str, Any], owner: Optional[str] = WORKER_ID, status: str = RUNNING) -> Job:
+        raise NotImplementedError
+
+    def checkpoint(self, job_id: str, stage: str, data: Any) -> None:
+        raise NotImplementedError
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+    def save_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    def list_jobs(self, user_id: str, limit: int = 10) -> List[Job]:
+        """ユーザーのジョブを新しい順に返す（チェックポイントの結果は読み込まない）"""
+        raise NotImplementedError
+
+    def claim_stale(self, owner: str = WORKER_ID, lease_seconds: float = 600.0) -> List[Job]:
+        """所有者が終了しているか lease_seconds 以上更新されていない、他のワーカーの実行中のジョブを引き取る"""
+        raise NotImplementedError
+
+    def release(self, job_id: Optional[str] = None, owner: str = WORKER_ID) -> int:
+        """実行中のジョブの期限を切れた扱いにし、他のワーカーがすぐに引き取れるようにする（job_id 省略時は owner のすべて）"""
+        raise NotImplementedError
+
+
+class NullJobStore(JobStore):
+    """永続化しないストア（JOB_STORE=none）"""
+
+    def create(self, kind: str, payload: Dict[str, Any], owner: Optional[str] = WORKER_ID, status: str = RUNNING) -> Job:
+        return Job(uuid.uuid4().hex, kind, payload, status)
+
+    def checkpoint(self, job_id: str, stage: str, data: Any) -> None:
+        pass
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        pass
+
+    def save_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        pass
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return None
+
+    def list_jobs(self, user_id: str, limit: int = 10) -> List[Job]:
+        return []
+
+    def claim_stale(self, owner: str = WORKER_ID, lease_seconds: float = 600.0) -> List[Job]:
+        return []
+
+    def release(self, job_id: Optional[str] = None, owner: str = WORKER_ID) -> int:
+        return 0
+
+
+class SQLiteJobStore(JobStore):
+    """SQLiteのジョブストア（接続はスレッド間で共有し、書き込みはロックで直列化する）"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        owner TEXT,
+        attempts INTEGER NOT NULL DEFAULT 1,
+        error TEXT,
+        progress TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at);
+    CREATE TABLE IF NOT EXISTS checkpoints (
+        job_id TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (job_id, stage)
+    );
+    """
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+
+    # ジョブを読み込むときの列（_load の引数の順）
+    COLUMNS = "id, kind, status, payload, attempts, created_at, progress"
+
+    def _migrate(self) -> None:
+        """以前のバージョンで作ったファイルに足りない列を追加する"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "progress" not in columns:
+            with self._conn:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")
+
+    def create(self, kind: str, payload: Dict[str, Any], owner: Optional[str] = WORKER_ID, status: str = RUNNING) -> Job:
+        now = self._clock()
+        job = Job(uuid.uuid4().hex, kind, payload, status, store=self, created_at=now)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, owner, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.id, kind, status, json.dumps(payload, ensure_ascii=False), owner, now, now),
+            )
+        return job
+
+    def checkpoint(self, job_id: str, stage: str, data: Any) -> None:
+        now = self._clock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (job_id, stage, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, stage, json.dumps(data, ensure_ascii=False), now),
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, self._clock(), job_id),
+            )
+
+    def save_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        # 更新時刻（リース）はチェックポイントだけで進める
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress, ensure_ascii=False), job_id)
+            )
+
+    def _load(self, row, checkpoints: bool = True) -> Job:
+        job_id, kind, status, payload, attempts, created_at, progress = row
+        results = {
+            stage: json.loads(data)
+            for stage, data in self._conn.execute(
+                "SELECT stage, data FROM checkpoints WHERE job_id = ? ORDER BY created_at, rowid", (job_id,)
+            )
+        } if checkpoints else {}
+        return Job(job_id, kind, json.loads(payload), status, attempts, results, store=self,
+                   created_at=created_at, progress=json.loads(progress) if progress else {})
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._load(row) if row else None
+
+    def list_jobs(self, user_id: str, limit: int = 10) -> List[Job]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self.COLUMNS} FROM jobs WHERE json_extract(payload, '$.user_id') = ? "
+                "ORDER BY created_at DESC, rowid DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+            return [self._load(row, checkpoints=False) for row in rows]
+
+    def claim_stale(self, owner: str = WORKER_ID, lease_seconds: float = 600.0) -> List[Job]:
+        now = self._clock()
+        with self._lock, self._conn:
+            candidates = self._conn.execute(
+                "SELECT id, owner, updated_at FROM jobs WHERE status = ? AND owner != ?", (RUNNING, owner)
+            ).fetchall()
+            claimed = []
+            for job_id, previous_owner, updated_at in candidates:
+                if updated_at > now - lease_seconds and owner_alive(previous_owner) is not False:
+                    continue
+                # 他のワーカーと同時に引き取らないよう、所有者と更新時刻が変わっていない場合だけ書き換える
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET owner = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ? AND status = ? AND owner = ? AND updated_at = ?",
+                    (owner, now, job_id, RUNNING, previous_owner, updated_at),
+                )
+                if cursor.rowcount:
+                    claimed.append(job_id)
+            return [
+                self._load(self._conn.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone())
+                for job_id in claimed
+            ]
+
+    def release(self, job_id: Optional[str] = None, owner: str = WORKER_ID) -> int:
+        with self._lock, self._conn:
+            if job_id is not None:
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET updated_at = 0 WHERE id = ? AND status = ?", (job_id, RUNNING)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET updated_at = 0 WHERE owner = ? AND status = ?", (owner, RUNNING)
+                )
+            return cursor.rowcount
+
+    def claim_queued(self, owner: str = WORKER_ID) -> Optional[Job]:
+        """投入順に最も古い queued のジョブを引き取り、実行中にする（なければ None）"""
+        with self._lock, self._conn:
+            while True:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created_at, rowid LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    return None
+                # 他のプロセスが先に引き取った場合は次のジョブを探す
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, updated_at = ? WHERE id = ? AND status = ?",
+                    (RUNNING, owner, self._clock(), row[0], QUEUED),
+                )
+                if cursor.rowcount:
+                    return self._load(self._conn.execute(
+                        f"SELECT {self.COLUMNS} FROM jobs WHERE id = ?", (row[0],)
+                    ).fetchone())
+
+    def cancel_queued(self, job_id: str, user_id: Optional[str] = None) -> Optional[str]:
+        """まだ取り出されていない queued のジョブを取り消す（job_id は先頭一致で、空なら最新のジョブ。取り消したジョブのIDを返す）"""
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = ? AND id LIKE ? ORDER BY created_at DESC, rowid DESC",
+                (QUEUED, f"{job_id}%"),
+            ).fetchall()
+            for found_id, payload in rows:
+                if user_id is not None and json.loads(payload).get("user_id") != user_id:
+                    continue
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                    (CANCELLED, self._clock(), found_id, QUEUED),
+                )
+                if cursor.rowcount:
+                    return found_id
+        return None
+
+    def purge(self, older_than: float) -> int:
+        """終了してから older_than 秒以上経ったジョブを削除する"""
+        cutoff = self._clock() - older_than
+        with self._lock, self._conn:
+            ids = [row[0] for row in self._conn.execute(
+                "SELECT id FROM jobs WHERE status NOT IN (?, ?) AND updated_at < ?", (QUEUED, RUNNING, cutoff)
+            )]
+            self._conn.executemany("DELETE FROM checkpoints WHERE job_id = ?", [(job_id,) for job_id in ids])
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in ids])
+        return len(ids)
+
+
+def store_from_env() -> JobStore:
+    backend = os.environ.get("JOB_STORE", "sqlite").strip().lower()
+    if backend in ("none", "off", "false", ""):
+        return NullJobStore()
+    if backend != "sqlite":
+        logging.warning(f"未対応の JOB_STORE です: {backend}（sqlite を使用します）")
+    path = os.environ.get("JOB_STORE_PATH", "/tmp/aibot-jobs.sqlite3")
+    try:
+        return SQLiteJobStore(path)
+    except (OSError, sqlite3.Error) as e:
+        logging.error(f"ジョブストアを開けないため、ジョブを永続化せずに実行します ({path}): {e}")
+        return NullJobStore()
+
+
+STORE: JobStore = store_from_env()
+
+# このプロセスで実行中・実行待ちのジョブ（登録順）と、最近終了したジョブ（/status 用）
+_active: Dict[str, Job] = {}
+_recent: Deque[Job] = deque(maxlen=200)
+_active_lock = threading.Lock()
+# 処理中のジョブ（パイプラインのステージのスレッドにもコンテキストごと引き継がれる）
+_current_job: ContextVar[Optional[Job]] = ContextVar("current_job", default=None)
+
+
+def register(job: Job) -> Job:
+    """ジョブをレジストリに登録する（終了・引き継ぎで自動的に外れる）"""
+    if job.status == RUNNING:
+        with _active_lock:
+            _active[job.id] = job
+    return job
+
+
+def unregister(job: Job) -> None:
+    with _active_lock:
+        if _active.pop(job.id, None) is not None:
+            _recent.append(job)
+
+
+def active_jobs(user_id: Optional[str] = None) -> List[Job]:
+    """このプロセスで実行中・実行待ちのジョブ（user_id を指定するとそのユーザーのジョブのみ）"""
+    with _active_lock:
+        jobs = list(_active.values())
+    return [job for job in jobs if user_id is None or job.user_id == user_id]
+
+
+def activate(job: Job) -> Job:
+    """処理関数の開始時に呼び、ジョブを登録して処理中のジョブに設定する"""
+    _current_job.set(job)
+    job.mark_started()
+    return register(job)
+
+
+def current() -> Optional[Job]:
+    """処理中のジョブ（ジョブの処理関数の外では None）"""
+    return _current_job.get()
+
+
+def jobs_for(user_id: str, limit: int = 10) -> List[Job]:
+    """ユーザーのジョブを新しい順に返す（このプロセスのジョブと、ストアに記録された他のプロセスのジョブ）"""
+    with _active_lock:
+        jobs = {job.id: job for job in [*_recent, *_active.values()] if job.user_id == user_id}
+    try:
+        for job in STORE.list_jobs(user_id, limit):
+            jobs.setdefault(job.id, job)
+    except sqlite3.Error as e:
+        logging.warning(f"ジョブの一覧を取得できませんでした: {e}")
+    return sorted(jobs.values(), key=lambda job: job.created_at, reverse=True)[:limit]
+
+
+def snapshot() -> List[Dict[str, Any]]:
+    """このプロセスで実行中・実行待ちのジョブの進捗（運用向け）"""
+    now = time.time()
+    return [job.summary(now) for job in active_jobs()]
+
+
+def cancel_event() -> Optional[threading.Event]:
+    """処理中のジョブの取り消しイベント（/cancel で取り消せるユーザーのジョブでない場合は None）"""
+    job = _current_job.get()
+    return job.cancel_event if job is not None and job.user_id else None
+
+
+def cancel(user_id: str, job_id: Optional[str] = None) -> Optional[str]:
+    """ユーザーのジョブを取り消し、取り消したジョブのIDを返す（見つからなければ None）
+
+    job_id（先頭一致）を省略した場合は最後に受け付けたジョブを取り消す。
+    このプロセスに該当するジョブがない場合は、キュー（TASK_QUEUE=sqlite）で待っているジョブを探す。
+    """
+    jobs = [job for job in active_jobs(user_id) if not job.cancelled]
+    if job_id:
+        jobs = [job for job in jobs if job.id.startswith(job_id)]
+    if jobs:
+        jobs[-1].cancel()
+        return jobs[-1].id
+    if isinstance(STORE, SQLiteJobStore):
+        try:
+            return STORE.cancel_queued(job_id or "", user_id)
+        except sqlite3.Error as e:
+            logging.warning(f"キューのジョブを取り消せませんでした ({job_id}): {e}")
+    return None
+
+
+def start(kind: str, payload: Dict[str, Any], persist: bool = True) -> Job:
+    """ジョブを開始してレジストリに登録する（ストアに書けない場合も処理は続行できるよう、永続化しないジョブを返す）
+
+    再開できない種類のジョブは persist=False で登録する（このプロセスの /status・/cancel の対象にだけなる）。
+    """
+    if not persist:
+        return register(NullJobStore().create(kind, payload))
+    try:
+        return register(STORE.create(kind, payload))
+    except sqlite3.Error as e:
+        logging.warning(f"ジョブを記録できませんでした: {e}")
+        return register(NullJobStore().create(kind, payload))
+
+
+def resume_stale(handlers: Dict[str, Callable[[Job], Any]], lease_seconds: Optional[float] = None) -> List[Job]:
+    """中断したジョブを引き取り、種類ごとのハンドラーに渡す"""
+    if lease_seconds is None:
+        lease_seconds = _env_float("JOB_LEASE_SECONDS", 600.0)
+    try:
+        jobs = STORE.claim_stale(WORKER_ID, lease_seconds)
+    except sqlite3.Error as e:
+        logging.warning(f"中断したジョブの取得に失敗しました: {e}")
+        return []
+    for job in jobs:
+        handler = handlers.get(job.kind)
+        if handler is None:
+            logging.warning(f"再開できない種類のジョブです: {job.kind} ({job.id})")
+            job.fail(f"再開に未対応のジョブ種別: {job.kind}")
+            continue
+        logging.info(f"中断したジョブを再開します: {job.kind} ({job.id}) 完了済み: {list(job.checkpoints)}")
+        handler(job)
+    return jobs
+
+
+def start_resume_loop(handlers: Dict[str, Callable[[Job], Any]]) -> threading.Thread:
+    """起動時と JOB_RESUME_INTERVAL ごとに中断したジョブを再開し、古いジョブを削除する"""
+    interval = _env_float("JOB_RESUME_INTERVAL", 60.0)
+    retention = _env_float("JOB_RETENTION_SECONDS", 7 * 24 * 3600)
+
+    def loop():
+        while True:
+            resume_stale(handlers)
+            if isinstance(STORE, SQLiteJobStore):
+                try:
+                    STORE.purge(retention)
+                except sqlite3.Error as e:
+                    logging.warning(f"古いジョブの削除に失敗しました: {e}")
+            if interval <= 0:
+                return
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="job-resume", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+遅延インポート層
+
+重量級の依存（anthropic, PyGithub, atlassian, bs4, markdown, google.cloud 等）を
+最初に使われた時点で読み込み、各コマンドが必要なものだけをロードするようにする。
+Cloud Runのコールドスタート時間と常駐メモリを削減するのが目的。
+"""
+
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class LazyModule:
+    """属性アクセス時に初めて実モジュールをインポートするプロキシ"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    logging.debug(f"遅延インポート: {self._name} ({(time.perf_counter() - start) * 1000:.1f}ms)")
+                    self._module = module
+        return self._module
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+
+class LazyObject:
+    """属性アクセス時に初めてファクトリを呼び出してインスタンスを生成するプロキシ
+
+    APIクライアントの生成を最初の利用時まで遅らせるために使う。
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: str = ""):
+        self._factory = factory
+        self._name = name or getattr(factory, "__name__", "object")
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._get(), attr)
+
+    def __repr__(self) -> str:
+        state = "initialized" if self.is_loaded else "not initialized"
+        return f"<LazyObject {self._name!r} ({state})>"
+
+
+_registry: Dict[str, LazyModule] = {}
+_registry_lock = threading.Lock()
+
+
+def lazy_import(name: str) -> LazyModule:
+    """モジュールの遅延インポートプロキシを返す（同名は同一インスタンス）"""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = LazyModule(name)
+        return _registry[name]
+
+
+def preload(names: Optional[List[str]] = None) -> Dict[str, float]:
+    """遅延モジュールを事前に読み込む（ウォームアップ用）
+
+    Args:
+        names: 読み込むモジュール名（省略時は登録済みの全モジュール）
+
+    Returns:
+        dict: モジュール名ごとの読み込み時間（秒）。失敗したモジュールは含まない
+    """
+    with _registry_lock:
+        targets = [_registry[name] for name in names or list(_registry) if name in _registry]
+
+    timings = {}
+    for module in targets:
+        start = time.perf_counter()
+        try:
+            module._load()
+            timings[module._name] = time.perf_counter() - start
+        except ImportError as e:
+            logging.warning(f"事前インポートに失敗しました: {module._name}: {e}")
+    return timings
+
+
+def loaded_modules() -> Dict[str, bool]:
+    """登録済み遅延モジュールの読み込み状況"""
+    with _registry_lock:
+        return {name: module.is_loaded for name, module in _registry.items()}
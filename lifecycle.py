@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+プロセスの終了処理
+
+Cloud Run や gunicorn は再デプロイ時に SIGTERM を送り、猶予（Cloud Run は10秒）の後に強制終了する。
+タスクのスレッドは追跡されていなかったため、実行中の /develop が PR 作成の途中で止まり、
+作成済みのブランチだけが残ることがあった。
+
+SIGTERM を受けたら次の順に処理する。
+1. 受付を止める（on_stop に登録した処理。Socket Mode の切断、キューのポーリング停止など）
+2. 実行中のタスク（track() で登録したスレッドと共有イベントループのタスク）の完了を SHUTDOWN_TIMEOUT まで待つ
+3. 終わらなかったジョブを中断扱いにし、他のワーカーが最後のチェックポイントからすぐに再開できるようにする
+4. プール済みのクライアントを閉じる（on_close に登録した処理）と共有イベントループの停止
+
+環境変数:
+    SHUTDOWN_TIMEOUT: 実行中のタスクを待つ秒数（デフォルト: 8。Cloud Run の猶予10秒に収める）
+"""
+
+import atexit
+import logging
+import signal
+import threading
+import time
+from collections import Counter as _Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import async_runtime
+import job_store
+import metrics
+
+_stopping = threading.Event()
+_done = threading.Event()
+_lock = threading.Lock()
+_tasks: Dict[threading.Thread, str] = {}
+_stop_hooks: List[Callable[[], None]] = []
+_close_hooks: List[Callable[[], None]] = []
+
+
+def stopping() -> bool:
+    """終了処理が始まっているか（タスクはステージの区切りで確認し、重い処理に進まずに引き継ぐ）"""
+    return _stopping.is_set()
+
+
+def wait_stopping(timeout: float) -> bool:
+    """終了処理が始まるか timeout 秒経つまで待つ（終了処理が始まっていれば True）"""
+    return _stopping.wait(timeout)
+
+
+def on_stop(func: Callable[[], None]) -> None:
+    """終了処理の最初（受付の停止）に呼ぶ処理を登録する"""
+    _stop_hooks.append(func)
+
+
+def on_close(func: Callable[[], None]) -> None:
+    """実行中のタスクを待った後（クライアントのクローズ）に呼ぶ処理を登録する（登録と逆順に呼ぶ）"""
+    _close_hooks.append(func)
+
+
+@contextmanager
+def track(kind: str):
+    """with ブロックを実行中のタスクとして登録する（終了処理で完了を待つ）"""
+    thread = threading.current_thread()
+    with _lock:
+        _tasks[thread] = kind
+    try:
+        yield
+    finally:
+        with _lock:
+            _tasks.pop(thread, None)
+
+
+def in_flight() -> Dict[str, int]:
+    """実行中のタスク数（種類別）"""
+    with _lock:
+        return dict(_Counter(_tasks.values()))
+
+
+def _run_hooks(hooks: List[Callable[[], None]]) -> None:
+    for hook in hooks:
+        try:
+            hook()
+        except Exception as e:
+            logging.warning(f"終了処理でエラーが発生しました ({getattr(hook, '__name__', hook)}): {e}")
+
+
+def _wait_for_tasks(deadline: float, clock: Callable[[], float]) -> Dict[threading.Thread, str]:
+    """期限まで実行中のタスクを待ち、終わらなかったスレッドを返す"""
+    while True:
+        with _lock:
+            remaining = dict(_tasks)
+        if not remaining and async_runtime.pending_tasks() == 0:
+            return remaining
+        timeout = deadline - clock()
+        if timeout <= 0:
+            return remaining
+        if remaining:
+            next(iter(remaining)).join(min(timeout, 0.5))
+        else:
+            time.sleep(min(timeout, 0.05))
+
+
+def shutdown(timeout: Optional[float] = None, clock: Callable[[], float] = time.monotonic) -> bool:
+    """終了処理を行い、すべてのタスクが期限内に終わったかを返す（2回目以降は何もしない）"""
+    with _lock:
+        if _stopping.is_set():
+            first = False
+        else:
+            _stopping.set()
+            first = True
+    if not first:
+        _done.wait(timeout)
+        return True
+    if timeout is None:
+        timeout = job_store._env_float("SHUTDOWN_TIMEOUT", 8.0)
+    deadline = clock() + timeout
+    logging.info(f"🛑 終了処理を開始します（実行中: {in_flight()}、最大 {timeout:.0f} 秒待機）")
+    try:
+        _run_hooks(_stop_hooks)
+        abandoned = _wait_for_tasks(deadline, clock)
+        for kind in abandoned.values():
+            metrics.SHUTDOWN_ABANDONED.inc(kind=kind)
+        try:
+            released = job_store.STORE.release(owner=job_store.WORKER_ID)
+        except Exception as e:
+            logging.warning(f"実行中のジョブを引き継げませんでした: {e}")
+            released = 0
+        if abandoned or released:
+            logging.warning(f"完了しなかったタスク: {dict(_Counter(abandoned.values()))}、他のワーカーに引き継いだジョブ: {released}件")
+        _run_hooks(list(reversed(_close_hooks)))
+        async_runtime.shutdown(timeout=max(0.0, min(1.0, deadline - clock())))
+        logging.info("✅ 終了処理が完了しました")
+        return not abandoned
+    finally:
+        _done.set()
+
+
+def install_signal_handlers() -> bool:
+    """SIGTERM で終了処理を行ってから元のハンドラー（gunicorn のワーカー終了など）を呼ぶようにする
+
+    シグナルハンドラーはメインスレッドでしか登録できないため、それ以外から呼んだ場合は False を返す。
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return False
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        shutdown()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    # SIGTERM 以外の通常終了でも実行中のタスクを待つ
+    atexit.register(shutdown)
+    return True
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+ロギング設定
+
+- LOG_FORMAT=json で構造化ログ（Cloud Loggingの severity 形式、trace_id付き）を出力
+- LOG_LEVELS でロガーごとのレベルを指定（例: "anthropic=WARNING,httpx=INFO"）
+- LOG_SAMPLE_RATE で LOG_SAMPLE_LEVEL 以下の冗長なログを間引く
+- QueueHandler / QueueListener により、ログのフォーマットと出力をリクエスト処理スレッドから切り離す
+
+環境変数:
+    LOG_LEVEL: ルートロガーのレベル（デフォルト: INFO）
+    LOG_FORMAT: text（デフォルト） / json
+    LOG_LEVELS: ロガー別レベル（カンマ区切りの name=LEVEL）
+    LOG_SAMPLE_RATE: サンプリング対象ログを残す割合 0.0〜1.0（デフォルト: 1.0）
+    LOG_SAMPLE_LEVEL: サンプリング対象とする上限レベル（デフォルト: DEBUG）
+    LOG_ASYNC: false でキュー経由の非同期出力を無効化（デフォルト: true）
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 外部ライブラリはリクエストごとに大量のログを出すためデフォルトで抑制する
+DEFAULT_LOGGER_LEVELS = {
+    "anthropic": "WARNING",
+    "httpx": "WARNING",
+    "httpcore": "WARNING",
+    "urllib3": "WARNING",
+}
+
+_configure_lock = threading.Lock()
+_configured = False
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1件のJSONとして出力するフォーマッタ（Cloud Logging互換）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key in ("trace_id", "span_id"):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """指定レベル以下のログを一定割合だけ通すフィルタ"""
+
+    def __init__(self, rate: float, max_level: int = logging.DEBUG):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+        self.max_level = max_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class TraceContextFilter(logging.Filter):
+    """現在のトレースIDとスパンIDをログレコードに付与する"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # ログ出力はキュー経由で別スレッドになるため、発生元スレッドで取得しておく
+        tracing = sys.modules.get("tracing")
+        span = tracing.current_span() if tracing else None
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
+
+
+def parse_logger_levels(spec: str) -> Dict[str, str]:
+    """"name=LEVEL,name2=LEVEL" 形式をdictに変換"""
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        name, level = name.strip(), level.strip().upper()
+        if name and level:
+            levels[name] = level
+    return levels
+
+
+def _apply_logger_levels() -> None:
+    levels = dict(DEFAULT_LOGGER_LEVELS)
+    levels.update(parse_logger_levels(os.environ.get("LOG_LEVELS", "")))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+def _build_formatter() -> logging.Formatter:
+    if os.environ.get("LOG_FORMAT", "text").strip().lower() == "json":
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT)
+
+
+def configure_logging(force: bool = False) -> None:
+    """ロギングを設定する（複数モジュールから呼ばれても一度だけ適用）
+
+    既にルートロガーにハンドラーがある場合（テストランナー等）は、
+    force=True でない限りロガー別レベルの適用のみ行う。
+    """
+    global _configured, _listener
+
+    with _configure_lock:
+        if _configured and not force:
+            return
+        _configured = True
+
+        root = logging.getLogger()
+        root.setLevel(os.environ.get("LOG_LEVEL", "INFO").strip().upper() or "INFO")
+        _apply_logger_levels()
+
+        if root.handlers and not force:
+            return
+
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        output = logging.StreamHandler()
+        output.setFormatter(_build_formatter())
+
+        filters = [TraceContextFilter()]
+        sample_rate = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+        if sample_rate < 1.0:
+            sample_level = logging.getLevelName(os.environ.get("LOG_SAMPLE_LEVEL", "DEBUG").strip().upper())
+            filters.append(SamplingFilter(sample_rate, sample_level if isinstance(sample_level, int) else logging.DEBUG))
+
+        if os.environ.get("LOG_ASYNC", "true").strip().lower() in ("0", "false", "no"):
+            handler: logging.Handler = output
+        else:
+            log_queue: queue.Queue = queue.Queue(-1)
+            handler = logging.handlers.QueueHandler(log_queue)
+            _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+            _listener.start()
+            atexit.register(shutdown_logging)
+
+        for log_filter in filters:
+            handler.addFilter(log_filter)
+        root.addHandler(handler)
+
+
+def shutdown_logging() -> None:
+    """キューに残っているログを出力してリスナーを停止する"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -4,18 +4,24 @@ Google Cloud Run エントリーポイント
 Slack Bot機能統合版
 """
 
+import hmac
 import os
+import sys
 import logging
 import threading
-import time
-from flask import Flask, jsonify
+from typing import Optional
+from flask import Flask, Response, jsonify, request
+from slack_bolt.adapter.flask import SlackRequestHandler
 from slack_bolt.adapter.socket_mode import SocketModeHandler
+import job_store
+import lifecycle
+import metrics
+import task_queue
+import tracing
+from logging_config import configure_logging
 
-# ロギング設定
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# ロギング設定（LOG_FORMAT / LOG_LEVELS / LOG_SAMPLE_RATE 等は logging_config.py 参照）
+configure_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +31,10 @@ flask_app = Flask(__name__)
 # Gunicorn用のappオブジェクト（Flask用）
 application = flask_app
 
+# Slackからの受信方式: socket（Socket Mode、デフォルト）/ http（Request URL）
+# http ではSlackが /slack/events にPOSTするため、Cloud Runの複数インスタンスに負荷分散される
+SLACK_MODE = os.environ.get("SLACK_MODE", "socket").strip().lower()
+
 @flask_app.route("/", methods=["GET"])
 def root():
     return jsonify({
@@ -40,6 +50,82 @@ def health():
         "service": "slack-ai-bot"
     }), 200
 
+@flask_app.route("/ready", methods=["GET"])
+def ready():
+    """レディネスプローブ: Slackの受信準備（Socket Mode接続またはHTTPハンドラー）とクライアントのウォームアップ完了を確認"""
+    slack_connected = is_slack_connected()
+    aibot_module = sys.modules.get("aibot")
+    clients_warm = bool(aibot_module and aibot_module.CLIENTS_WARM)
+    is_ready = slack_connected and clients_warm and not lifecycle.stopping()
+    
+    return jsonify({
+        "status": "ready" if is_ready else ("stopping" if lifecycle.stopping() else "not_ready"),
+        "slack": {
+            "mode": SLACK_MODE,
+            "status": slack_status,
+            "connected": slack_connected
+        },
+        "clients_warm": clients_warm
+    }), 200 if is_ready else 503
+
+def warmup_authorized(header: Optional[str]) -> bool:
+    """/warmup の Authorization ヘッダーを確認する（外部APIを呼び出すため、WARMUP_TOKEN 未設定なら受け付けない）"""
+    token = os.environ.get("WARMUP_TOKEN", "")
+    return bool(token) and hmac.compare_digest(header or "", f"Bearer {token}")
+
+@flask_app.route("/warmup", methods=["POST"])
+def warmup():
+    """Anthropic・GitHub・Confluenceへの接続を事前に確立する（Authorization: Bearer <WARMUP_TOKEN>）"""
+    if not warmup_authorized(request.headers.get("Authorization")):
+        return jsonify({"error": "unauthorized"}), 401
+    try:
+        import aibot
+        results = aibot.warm_up_clients()
+        return jsonify({
+            "status": "warm" if aibot.CLIENTS_WARM else "degraded",
+            "components": results
+        }), 200 if aibot.CLIENTS_WARM else 503
+    except Exception as e:
+        logger.error(f"❌ ウォームアップエラー: {e}")
+        return jsonify({"status": "error", "error": str(e)}), 503
+
+@flask_app.route("/slack/events", methods=["POST"])
+def slack_events():
+    """HTTPモードのSlackリクエスト（スラッシュコマンド・イベント）を Bolt に渡す（署名検証は Bolt が行う）"""
+    if SLACK_MODE != "http":
+        return jsonify({"error": "SLACK_MODE=http ではないため受け付けていません"}), 404
+    try:
+        handler = get_slack_request_handler()
+    except Exception as e:
+        logger.error(f"❌ Slackリクエストハンドラーの初期化エラー: {e}")
+        return jsonify({"error": "Slack Botを初期化できませんでした"}), 503
+    return handler.handle(request)
+
+@flask_app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus形式のメトリクス"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@flask_app.route("/debug/traces", methods=["GET"])
+def debug_traces():
+    """直近のリクエストを処理時間の長い順に、スパンごとの内訳付きで返す"""
+    limit = request.args.get("limit", default=10, type=int)
+    traces = tracing.recent_traces().slowest(limit)
+    return jsonify({
+        "count": len(traces),
+        "traces": [tracing.summarize(trace) for trace in traces]
+    }), 200
+
+@flask_app.route("/debug/jobs", methods=["GET"])
+def debug_jobs():
+    """実行中・実行待ちのジョブの進捗（ステージ別の所要時間・実行待ちの時間）とスケジューラの状態"""
+    aibot_module = sys.modules.get("aibot")
+    scheduler = aibot_module.SCHEDULER if aibot_module else None
+    return jsonify({
+        "jobs": job_store.snapshot(),
+        "scheduler": {"pending": scheduler.pending(), "running": scheduler.running()} if scheduler else None,
+    }), 200
+
 @flask_app.route("/debug", methods=["GET"])
 def debug():
     """デバッグ情報エンドポイント"""
@@ -54,36 +140,82 @@ def debug():
     return jsonify({
         "message": "Debug information",
         "environment": env_info,
-        "slack_ready": slack_handler_ready if 'slack_handler_ready' in globals() else False
+        "slack_ready": slack_handler_ready if 'slack_handler_ready' in globals() else False,
+        "slack_status": slack_status if 'slack_status' in globals() else "unknown"
     }), 200
 
 # Slack Bot機能の統合
 slack_handler_ready = False
+slack_handler = None
+slack_request_handler = None
+_slack_request_handler_lock = threading.Lock()
+# not_started / starting / connected / http / error / skipped
+slack_status = "not_started"
+
+def is_slack_connected() -> bool:
+    """Slackの受信準備ができているか（Socket Modeは自動再接続中はFalse、HTTPモードはハンドラー作成済みならTrue）"""
+    if SLACK_MODE == "http":
+        return slack_request_handler is not None
+    return slack_handler is not None and slack_handler.client.is_connected()
+
+def get_slack_request_handler() -> SlackRequestHandler:
+    """HTTPモード用のハンドラー（起動処理より先にリクエストが来た場合はここで aibot を読み込む）"""
+    global slack_request_handler
+    with _slack_request_handler_lock:
+        if slack_request_handler is None:
+            import aibot
+            slack_request_handler = SlackRequestHandler(aibot.app)
+        return slack_request_handler
 
 def start_slack_bot():
     """Slack Botをバックグラウンドで起動"""
-    global slack_handler_ready
+    global slack_handler_ready, slack_handler, slack_status
     try:
         logger.info("🤖 Slack Bot初期化中...")
+        slack_status = "starting"
         
         # aibot.pyからSlack Appをインポート
+        import aibot
         from aibot import app as slack_app, SLACK_APP_TOKEN
         
-        # Socket Modeハンドラーの開始
-        if not os.environ.get("GITHUB_ACTIONS"):  # ビルド時はスキップ
-            handler = SocketModeHandler(slack_app, SLACK_APP_TOKEN)
-            logger.info("🚀 Slack Bot（Socket Mode）を開始します...")
-            slack_handler_ready = True
-            handler.start()  # ブロッキング呼び出し
-        else:
+        if os.environ.get("GITHUB_ACTIONS"):  # ビルド時はスキップ
             logger.info("⚠️ GitHub Actions環境のためSlack Bot起動をスキップします")
             slack_handler_ready = False
+            slack_status = "skipped"
+        elif SLACK_MODE == "http":
+            # HTTPモード: 接続は持たず、/slack/events で受け付ける
+            get_slack_request_handler()
+            slack_handler_ready = True
+            slack_status = "http"
+            logger.info("🚀 Slack Bot（HTTPモード: /slack/events）の準備が完了しました")
+            if os.environ.get("WARMUP_ON_START", "true").lower() not in ("0", "false", "no"):
+                aibot.start_warm_up()
+            if task_queue.QUEUE is None:  # キューを使う構成では worker.py が再開する
+                aibot.start_job_resume()
+        else:
+            # Socket Modeハンドラーの開始
+            handler = SocketModeHandler(slack_app, SLACK_APP_TOKEN)
+            logger.info("🚀 Slack Bot（Socket Mode）を開始します...")
+            handler.connect()  # 接続完了まで待機（以降は自動再接続）
+            slack_handler = handler
+            lifecycle.on_stop(handler.close)  # 終了処理では最初に切断し、新しいコマンドを他のインスタンスに回す
+            slack_handler_ready = handler.client.is_connected()
+            slack_status = "connected" if slack_handler_ready else "error"
+            
+            # 接続確立後にAPIクライアントをウォームアップ
+            if os.environ.get("WARMUP_ON_START", "true").lower() not in ("0", "false", "no"):
+                aibot.start_warm_up()
+            if task_queue.QUEUE is None:  # キューを使う構成では worker.py が再開する
+                aibot.start_job_resume()
+            
+            threading.Event().wait()  # ブロッキング（handler.start() と同等）
             
     except Exception as e:
         logger.error(f"❌ Slack Bot起動エラー: {e}")
         import traceback
         logger.error(f"トレースバック: {traceback.format_exc()}")
         slack_handler_ready = False
+        slack_status = "error"
 
 # メイン実行時の処理
 if __name__ == "__main__":
@@ -92,9 +224,10 @@ if __name__ == "__main__":
     
     # Slack Botをバックグラウンドで起動
     if not os.environ.get("GITHUB_ACTIONS"):
+        lifecycle.install_signal_handlers()
         slack_thread = threading.Thread(target=start_slack_bot, daemon=True)
         slack_thread.start()
-        time.sleep(2)  # Slack Bot初期化の時間を確保
+        # 接続完了を待たずにHTTPサーバーを起動し、準備状況は /ready で公開する
     
     try:
         flask_app.run(
@@ -115,9 +248,11 @@ else:
     
     # Slack Botをバックグラウンドで起動
     if not os.environ.get("GITHUB_ACTIONS"):
+        # SIGTERM で実行中のタスクを待ってから gunicorn のワーカー終了に進む
+        lifecycle.install_signal_handlers()
         slack_thread = threading.Thread(target=start_slack_bot, daemon=True)
         slack_thread.start()
-        logger.info("🤖 Slack Bot（Socket Mode）をバックグラウンドで開始しました")
+        logger.info(f"🤖 Slack Bot（{'HTTPモード' if SLACK_MODE == 'http' else 'Socket Mode'}）をバックグラウンドで開始しました")
 
 # Gunicorn用のapp参照
 app = flask_app
\ No newline at end of file
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Prometheus形式のメトリクス
+
+外部依存なしで Counter / Gauge / Histogram を提供し、main.py の /metrics で
+テキスト形式（exposition format 0.0.4）として公開する。
+aibot.py と atlassian_mcp_integration.py の各処理は `timed` / `stage_timer` で計測する。
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# パイプライン処理時間用のバケット（秒）: LLM呼び出しは数十秒かかるため上限を広めに取る
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ラベルが一致しません {sorted(labels)} != {sorted(self.labelnames)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """単調増加するカウンタ"""
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Counterは減少できません")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """増減する値"""
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """累積バケット付きのヒストグラム"""
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def get_count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return int(state[-1]) if state else 0
+
+    def get_sum(self, **labels) -> float:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[-2] if state else 0.0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            for index, bound in enumerate(self.buckets):
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(state[index])}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class Registry:
+    """メトリクスの登録と出力"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"メトリクス名が重複しています: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- ボットのパイプライン用メトリクス ---
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "aibot_stage_duration_seconds",
+    "Duration of each pipeline stage (parse, github_fetch, retrieval, llm_call, llm_summary, pr_create, confluence_create, confluence_get, mcp_tool_call)",
+    ["stage"],
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "aibot_stage_errors_total",
+    "Pipeline stages that raised an exception",
+    ["stage"],
+))
+MCP_FALLBACKS = REGISTRY.register(Counter(
+    "aibot_mcp_fallback_total",
+    "MCP tool calls that fell back to the direct Confluence API",
+    ["tool", "reason"],
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "aibot_cache_requests_total",
+    "Cache lookups by result (hit/miss)",
+    ["cache", "result"],
+))
+CACHE_HIT_RATIO = REGISTRY.register(Gauge(
+    "aibot_cache_hit_ratio",
+    "Cache hit ratio since process start",
+    ["cache"],
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "aibot_queue_depth",
+    "Background tasks accepted but not yet finished",
+    ["kind"],
+))
+ANTHROPIC_TOKENS = REGISTRY.register(Counter(
+    "aibot_anthropic_tokens_total",
+    "Tokens reported by Anthropic usage",
+    ["model", "type"],
+))
+
+TOKEN_BUDGET_DECISIONS = REGISTRY.register(Counter(
+    "aibot_token_budget_decisions_total",
+    "Prompt budgeting decisions by strategy (send/trim/chunk/reject)",
+    ["strategy"],
+))
+RETRIEVAL_INDEX_UPDATES = REGISTRY.register(Counter(
+    "aibot_retrieval_index_updates_total",
+    "Repository index lookups by update mode (cached/incremental/full)",
+    ["mode"],
+))
+LLM_ROUTE_DURATION = REGISTRY.register(Histogram(
+    "aibot_llm_route_duration_seconds",
+    "Anthropic call latency by model route",
+    ["route", "model"],
+))
+LLM_ROUTE_COST = REGISTRY.register(Counter(
+    "aibot_llm_route_cost_usd_total",
+    "Estimated Anthropic cost in USD by model route",
+    ["route", "model"],
+))
+LLM_ROUTE_ERRORS = REGISTRY.register(Counter(
+    "aibot_llm_route_errors_total",
+    "Failed Anthropic calls by model route",
+    ["route", "model"],
+))
+LLM_ROUTE_CANCELLED = REGISTRY.register(Counter(
+    "aibot_llm_route_cancelled_total",
+    "Anthropic calls aborted because the job was cancelled",
+    ["route", "model"],
+))
+ANTHROPIC_INFLIGHT = REGISTRY.register(Gauge(
+    "aibot_anthropic_inflight_requests",
+    "Anthropic requests currently in flight through the gateway",
+    ["model"],
+))
+ANTHROPIC_GATEWAY_WAIT = REGISTRY.register(Histogram(
+    "aibot_anthropic_gateway_wait_seconds",
+    "Time spent waiting in the Anthropic gateway (rate/concurrency)",
+    ["model", "reason"],
+))
+ANTHROPIC_RETRIES = REGISTRY.register(Counter(
+    "aibot_anthropic_retries_total",
+    "Anthropic calls retried by the gateway, by status code or error type",
+    ["model", "reason"],
+))
+ANTHROPIC_GATEWAY_TIMEOUTS = REGISTRY.register(Counter(
+    "aibot_anthropic_gateway_timeouts_total",
+    "Anthropic calls that gave up waiting for a gateway slot",
+    ["model"],
+))
+PREFETCH_WAIT = REGISTRY.register(Histogram(
+    "aibot_prefetch_wait_seconds",
+    "Time the critical path blocked on a prefetched stage (0 when it was already done)",
+    ["pipeline", "stage"],
+))
+PREFETCH_UNUSED = REGISTRY.register(Counter(
+    "aibot_prefetch_unused_total",
+    "Prefetched stages whose result was never used",
+    ["pipeline", "stage"],
+))
+TASKS_ENQUEUED = REGISTRY.register(Counter(
+    "aibot_tasks_enqueued_total",
+    "Commands handed to the task queue for a worker to run",
+    ["kind", "backend"],
+))
+TASKS_ENQUEUE_ERRORS = REGISTRY.register(Counter(
+    "aibot_tasks_enqueue_errors_total",
+    "Commands that could not be enqueued and ran in-process instead",
+    ["kind", "backend"],
+))
+SCHEDULER_PENDING = REGISTRY.register(Gauge(
+    "aibot_scheduler_pending_tasks",
+    "Commands waiting for an execution slot in the fair scheduler",
+))
+SCHEDULER_RATE_LIMITED = REGISTRY.register(Counter(
+    "aibot_scheduler_rate_limited_total",
+    "Commands rejected by the per-user or per-channel rate limit",
+    ["scope"],
+))
+SHUTDOWN_ABANDONED = REGISTRY.register(Counter(
+    "aibot_shutdown_abandoned_tasks_total",
+    "Tasks still running when the shutdown grace period ran out",
+    ["kind"],
+))
+JOB_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "aibot_job_queue_wait_seconds",
+    "Time from accepting a command until its job started running",
+    ["kind"],
+))
+JOB_STAGE_DURATION = REGISTRY.register(Histogram(
+    "aibot_job_stage_duration_seconds",
+    "Time spent reaching each job checkpoint since the previous one",
+    ["kind", "stage"],
+))
+CONFLUENCE_PAGE_WRITES = REGISTRY.register(Counter(
+    "aibot_confluence_page_writes_total",
+    "Confluence page writes by outcome (created, updated, unchanged)",
+    ["action"],
+))
+DESIGN_BATCH_ITEMS = REGISTRY.register(Counter(
+    "aibot_design_batch_items_total",
+    "Features processed by /design-batch by outcome (created, failed)",
+    ["status"],
+))
+JOBS_CANCELLED = REGISTRY.register(Counter(
+    "aibot_jobs_cancelled_total",
+    "Jobs cancelled with /cancel",
+    ["kind"],
+))
+
+
+def observe_stage(stage: str, elapsed: float, error: bool = False) -> None:
+    STAGE_DURATION.observe(elapsed, stage=stage)
+    if error:
+        STAGE_ERRORS.inc(stage=stage)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """with ブロックの処理時間をステージとして記録する"""
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start, error)
+
+
+def timed(stage: str):
+    """関数（同期・非同期どちらも可）の処理時間をステージとして記録するデコレータ"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """キャッシュの参照結果を記録し、ヒット率を更新する"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    hits = CACHE_REQUESTS.get(cache=cache, result="hit")
+    total = hits + CACHE_REQUESTS.get(cache=cache, result="miss")
+    CACHE_HIT_RATIO.set(hits / total, cache=cache)
+
+
+def record_anthropic_usage(response, model: Optional[str] = None) -> None:
+    """Anthropicレスポンスの usage からトークン数を記録する"""
+    usage = getattr(response, "usage", None)
+    model = getattr(response, "model", None) if model is None else model
+    if not isinstance(model, str):
+        model = "unknown"
+    for token_type in ("input_tokens", "output_tokens"):
+        value = getattr(usage, token_type, None)
+        if isinstance(value, int):
+            ANTHROPIC_TOKENS.inc(value, model=model, type=token_type.replace("_tokens", ""))
+
+
+def render() -> str:
+    """全メトリクスをPrometheusテキスト形式で出力"""
+    return REGISTRY.render()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+タスク種別ごとのモデル選択（モデルルーター）
+
+呼び出し箇所ごとに claude-3-5-sonnet をハードコードしていたため、軽い処理も大きなモデルで待っていた。
+タスク種別（ルート）ごとにモデル・max_tokens・タイムアウトを ROUTES で定義し、
+ルート別のレイテンシとコストをメトリクスに記録して調整できるようにする。
+
+ルート:
+    design_doc:      設計ドキュメント生成（/design, /design-mcp）
+    code_generation: コード生成・改修（/develop, /develop-from-design）
+    design_summary:  設計書セクションの要約（design_chunker）
+    command_parsing: 形式どおりでないコマンドの解析（フォールバック）
+    search_summary:  Confluence検索結果の要約
+
+環境変数:
+    MODEL_ROUTES: ルート設定の上書き（JSON）。例: '{"design_doc": {"model": "claude-3-5-sonnet-20241022", "max_tokens": 8192}}'
+    DESIGN_SUMMARY_MODEL: design_summary ルートのモデル（MODEL_ROUTES より優先度は低い）
+
+create_message() に cancel（threading.Event）を渡すとストリーミングで受信し、
+取り消された時点で接続を閉じて job_store.JobCancelled を送出する（残りの出力トークンを消費しない）。
+"""
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
+
+import anthropic_gateway
+import job_store
+import metrics
+import token_budget
+import tracing
+
+
+@dataclass(frozen=True)
+class Route:
+    """1タスク種別分の呼び出し設定"""
+    name: str
+    model: str
+    max_tokens: Optional[int]   # None はモデルの最大出力トークン数
+    timeout: float              # 秒
+
+    def output_tokens(self, requested: Optional[int] = None) -> int:
+        """呼び出し側の要求（適応的な max_tokens など）をルートとモデルの上限で制限する"""
+        limit = self.max_tokens or token_budget.max_output_tokens(self.model)
+        limit = min(limit, token_budget.max_output_tokens(self.model))
+        return min(requested, limit) if requested else limit
+
+
+SONNET = "claude-3-5-sonnet-20240620"
+HAIKU = "claude-3-haiku-20240307"
+
+DEFAULT_ROUTES = {
+    "design_doc": Route("design_doc", SONNET, None, 180.0),
+    "code_generation": Route("code_generation", SONNET, None, 180.0),
+    "design_summary": Route("design_summary", HAIKU, 400, 30.0),
+    "command_parsing": Route("command_parsing", HAIKU, 300, 15.0),
+    "search_summary": Route("search_summary", HAIKU, 800, 30.0),
+}
+
+# 100万トークンあたりの料金（USD）: (入力, 出力)
+MODEL_PRICES = {
+    "claude-3-5-sonnet-20240620": (3.0, 15.0),
+    "claude-3-5-sonnet-20241022": (3.0, 15.0),
+    "claude-3-5-haiku-20241022": (0.8, 4.0),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "claude-3-opus-20240229": (15.0, 75.0),
+}
+DEFAULT_PRICE = (3.0, 15.0)
+
+
+def load_routes() -> Dict[str, Route]:
+    """デフォルトのルート表に環境変数の上書きを適用する"""
+    routes = dict(DEFAULT_ROUTES)
+    summary_model = os.environ.get("DESIGN_SUMMARY_MODEL", "").strip()
+    if summary_model:
+        routes["design_summary"] = replace(routes["design_summary"], model=summary_model)
+
+    raw = os.environ.get("MODEL_ROUTES", "").strip()
+    if raw:
+        try:
+            overrides = json.loads(raw)
+            for name, values in overrides.items():
+                base = routes.get(name, Route(name, SONNET, None, 120.0))
+                routes[name] = replace(base, **{
+                    key: values[key] for key in ("model", "max_tokens", "timeout") if key in values
+                })
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.error(f"MODEL_ROUTES の形式が正しくないため無視します: {e}")
+    return routes
+
+
+ROUTES = load_routes()
+
+
+def route(name: str) -> Route:
+    """タスク種別のルート（未定義の場合は code_generation と同じ設定）"""
+    return ROUTES.get(name) or replace(ROUTES["code_generation"], name=name)
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """トークン数から料金（USD）を計算する"""
+    input_price, output_price = MODEL_PRICES.get(model, DEFAULT_PRICE)
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def record_call(task: str, model: str, response, elapsed: float, error: bool = False) -> float:
+    """ルート別のレイテンシ・コストを記録し、現在のスパンと処理中のジョブにトークン数を付ける（コストを返す）"""
+    metrics.LLM_ROUTE_DURATION.observe(elapsed, route=task, model=model)
+    if error:
+        metrics.LLM_ROUTE_ERRORS.inc(route=task, model=model)
+        return 0.0
+    metrics.record_anthropic_usage(response, model)
+    usage = getattr(response, "usage", None)
+    tokens = {}
+    for token_type in ("input_tokens", "output_tokens"):
+        value = getattr(usage, token_type, None)
+        tokens[token_type] = value if isinstance(value, int) else 0
+        if isinstance(value, int):
+            tracing.set_attribute(token_type, value)
+    cost = estimate_cost(model, tokens["input_tokens"], tokens["output_tokens"])
+    metrics.LLM_ROUTE_COST.inc(cost, route=task, model=model)
+    tracing.set_attribute("cost_usd", round(cost, 6))
+    job = job_store.current()
+    if job is not None:
+        job.add_usage(tokens["input_tokens"], tokens["output_tokens"], cost)
+    return cost
+
+
+def _input_tokens(messages: List[dict]) -> int:
+    return sum(token_budget.estimate_tokens(str(message.get("content", ""))) for message in messages)
+
+
+def _timer(stage: Optional[str]):
+    return metrics.stage_timer(stage) if stage else contextlib.nullcontext()
+
+
+def _stream_message(client, cancel: threading.Event, **params):
+    """ストリーミングで応答を受信し、cancel がセットされたら接続を閉じて JobCancelled を送出する"""
+    if cancel.is_set():
+        raise job_store.JobCancelled("LLM呼び出しの前に取り消されました")
+    with client.messages.stream(**params) as stream:
+        for _ in stream:
+            if cancel.is_set():
+                # with を抜けるとレスポンスが閉じられ、サーバー側の生成も打ち切られる
+                break
+        else:
+            return stream.get_final_message()
+    raise job_store.JobCancelled("LLMの応答の受信中に取り消されました")
+
+
+def create_message(client, task: str, messages: List[dict], max_tokens: Optional[int] = None,
+                   stage: Optional[str] = "llm_call", cancel: Optional[threading.Event] = None, **kwargs):
+    """ルートの設定で Anthropic Messages API を呼び出す（同時実行数・レート・リトライはゲートウェイが管理）
+
+    Args:
+        client: anthropic.Anthropic（または同じインターフェースのクライアント）
+        task: ルート名（ROUTES のキー）
+        messages: メッセージ
+        max_tokens: 呼び出し側が必要とする出力トークン数（ルートの上限で制限される）
+        stage: 処理時間を記録するステージ名（None の場合は呼び出し側のステージに含める）
+        cancel: 取り消しイベント（渡すとストリーミングで受信し、セットされた時点で中断する）
+    """
+    selected = route(task)
+    output_tokens = selected.output_tokens(max_tokens)
+    params = dict(model=selected.model, max_tokens=output_tokens, messages=messages, timeout=selected.timeout, **kwargs)
+    with _timer(stage), tracing.span(
+        "anthropic.messages.create", model=selected.model, route=task, max_tokens=output_tokens
+    ):
+        start = time.perf_counter()
+        try:
+            response = anthropic_gateway.GATEWAY.call(
+                selected.model,
+                (lambda: _stream_message(client, cancel, **params)) if cancel is not None
+                else (lambda: client.messages.create(**params)),
+                input_tokens=_input_tokens(messages),
+            )
+        except job_store.JobCancelled:
+            metrics.LLM_ROUTE_CANCELLED.inc(route=task, model=selected.model)
+            metrics.LLM_ROUTE_DURATION.observe(time.perf_counter() - start, route=task, model=selected.model)
+            raise
+        except Exception:
+            record_call(task, selected.model, None, time.perf_counter() - start, error=True)
+            raise
+        record_call(task, selected.model, response, time.perf_counter() - start)
+    return response
+
+
+async def acreate_message(client, task: str, messages: List[dict], max_tokens: Optional[int] = None,
+                          stage: Optional[str] = "llm_call", **kwargs):
+    """create_message() の非同期版（client は anthropic.AsyncAnthropic）"""
+    selected = route(task)
+    output_tokens = selected.output_tokens(max_tokens)
+    with _timer(stage), tracing.span(
+        "anthropic.messages.create", model=selected.model, route=task, max_tokens=output_tokens
+    ):
+        start = time.perf_counter()
+        try:
+            response = await anthropic_gateway.GATEWAY.acall(
+                selected.model,
+                lambda: client.messages.create(
+                    model=selected.model,
+                    max_tokens=output_tokens,
+                    messages=messages,
+                    timeout=selected.timeout,
+                    **kwargs,
+                ),
+                input_tokens=_input_tokens(messages),
+            )
+        except Exception:
+            record_call(task, selected.model, None, time.perf_counter() - start, error=True)
+            raise
+        record_call(task, selected.model, response, time.perf_counter() - start)
+    return response
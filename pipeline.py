@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+コマンド処理のステージスケジューラ（先行実行）
+
+/develop や /develop-from-design は「設計書の取得 → コード生成 → プレビュー」のように各ステップを順番に実行しており、
+互いに依存しないI/O（Confluenceの取得、GitHubのベースブランチ参照、クライアントの接続確立）の待ち時間が足し合わされていた。
+コマンドを解析した直後にこれらを並行して開始し、結果が必要になった時点で待つことで、
+全体の所要時間を各ステップの合計ではなくクリティカルパスの長さにする。
+
+先行実行した結果は途中でエラーになると使われずに終わるため、副作用のない取得処理だけを登録すること。
+
+環境変数:
+    PREFETCH_ENABLED: false で先行実行を無効化し、結果が必要になった時点で順番に実行する（デフォルト: true）
+    PREFETCH_WORKERS: 先行実行に使うスレッド数（デフォルト: 8）
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Set
+
+import metrics
+import tracing
+
+
+def prefetch_enabled() -> bool:
+    return os.environ.get("PREFETCH_ENABLED", "true").strip().lower() not in ("0", "false", "no")
+
+
+def _worker_count() -> int:
+    try:
+        return max(1, int(os.environ.get("PREFETCH_WORKERS", "8")))
+    except ValueError:
+        return 8
+
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=_worker_count(), thread_name_prefix="prefetch")
+
+
+class Pipeline:
+    """1つのコマンド処理の中で、独立したステージを先行実行して結果を受け渡す
+
+    with Pipeline("develop") as pipeline:
+        pipeline.start("repo_file", get_repo_content, repo_name, file_path)
+        ...
+        current_code = pipeline.result("repo_file")
+
+    同期関数はスレッドプールで、コルーチン関数は実行中のイベントループのタスクとして開始する。
+    with を抜けるときに結果が使われなかったステージはキャンセルし、未使用として記録する。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._stages: Dict[str, Any] = {}
+        self._used: Set[str] = set()
+
+    def start(self, stage: str, func: Callable, *args, **kwargs) -> None:
+        """ステージを開始する（PREFETCH_ENABLED=false の場合は結果を要求されたときに実行する）"""
+        if stage in self._stages:
+            raise ValueError(f"ステージ {stage} は既に開始されています")
+        call = functools.partial(func, *args, **kwargs)
+        if not prefetch_enabled():
+            self._stages[stage] = call
+        elif asyncio.iscoroutinefunction(func):
+            self._stages[stage] = asyncio.ensure_future(self._run_async(stage, call))
+        else:
+            context = contextvars.copy_context()
+            self._stages[stage] = _executor.submit(context.run, self._run, stage, call)
+
+    def _run(self, stage: str, call: Callable) -> Any:
+        with tracing.span(f"prefetch.{stage}", pipeline=self.name):
+            return call()
+
+    async def _run_async(self, stage: str, call: Callable) -> Any:
+        with tracing.span(f"prefetch.{stage}", pipeline=self.name):
+            return await call()
+
+    def __contains__(self, stage: str) -> bool:
+        return stage in self._stages
+
+    def _take(self, stage: str) -> Any:
+        if stage not in self._stages:
+            raise KeyError(f"ステージ {stage} は開始されていません")
+        self._used.add(stage)
+        return self._stages[stage]
+
+    def _record_wait(self, stage: str, started: float) -> None:
+        metrics.PREFETCH_WAIT.observe(time.perf_counter() - started, pipeline=self.name, stage=stage)
+
+    def result(self, stage: str, timeout: Optional[float] = None) -> Any:
+        """ステージの結果を待って返す（ステージで発生した例外はそのまま送出する）"""
+        pending = self._take(stage)
+        started = time.perf_counter()
+        try:
+            if isinstance(pending, concurrent.futures.Future):
+                return pending.result(timeout)
+            if isinstance(pending, asyncio.Future):
+                raise RuntimeError(f"ステージ {stage} はコルーチンのため aresult() で待ってください")
+            return pending()
+        finally:
+            self._record_wait(stage, started)
+
+    async def aresult(self, stage: str) -> Any:
+        """イベントループを止めずにステージの結果を待って返す"""
+        pending = self._take(stage)
+        started = time.perf_counter()
+        try:
+            if isinstance(pending, concurrent.futures.Future):
+                return await asyncio.wrap_future(pending)
+            if isinstance(pending, asyncio.Future):
+                return await pending
+            if asyncio.iscoroutinefunction(pending.func):
+                return await pending()
+            return await asyncio.to_thread(pending)
+        finally:
+            self._record_wait(stage, started)
+
+    def close(self) -> None:
+        """結果が使われなかったステージをキャンセルする（実行中のスレッドは完了まで続く）"""
+        for stage, pending in self._stages.items():
+            if stage in self._used or isinstance(pending, functools.partial):
+                continue
+            if not pending.cancel() and isinstance(pending, asyncio.Future) and not pending.cancelled():
+                # 完了済みタスクの例外が「未取得」として警告されないよう取り出しておく
+                pending.exception()
+            metrics.PREFETCH_UNUSED.inc(pipeline=self.name, stage=stage)
+            logging.debug(f"先行実行の結果を使わずに終了しました: {self.name}.{stage}")
+
+    def __enter__(self) -> "Pipeline":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+リポジトリ単位の関連コード検索インデックス
+
+/develop は対象ファイルしか見ないため、import先や呼び出し元を知らずに改修してレビューで差し戻されやすい。
+リポジトリごとに以下のインデックスをローカルに持ち、関連するコード片を上位K件だけプロンプトに加える。
+
+- シンボル索引: 関数・クラスなどの定義名 -> 定義を含むチャンク
+- BM25: ファイルをトップレベルの定義単位でチャンクに分割した識別子の全文検索
+
+インデックスはコミットSHAごとに更新する。初回（または変更ファイルが多い場合）はtarballを1回取得して全体を作り、
+以降はツリーのblob SHAを比較して変更されたファイルだけを取得する。
+
+環境変数:
+    RETRIEVAL_ENABLED: false で関連コード検索を無効化（デフォルト: true）
+    RETRIEVAL_INDEX_DIR: インデックスの保存先（デフォルト: /tmp/aibot-repo-index）
+    RETRIEVAL_TOP_K: プロンプトに加えるコード片の最大数（デフォルト: 5）
+    RETRIEVAL_TOKEN_BUDGET: 関連コードに使うトークン上限（デフォルト: 4000）
+    RETRIEVAL_TIMEOUT: インデックス更新を待つ秒数。超えた場合は関連コードなしで続行（デフォルト: 20）
+    RETRIEVAL_MAX_BLOB_FETCHES: 差分更新で個別に取得するファイル数の上限（デフォルト: 30）
+"""
+
+import base64
+import concurrent.futures
+import contextvars
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import re
+import tarfile
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+import metrics
+import token_budget
+
+INDEXABLE_EXTENSIONS = {
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".go", ".java", ".kt", ".rb", ".php", ".rs", ".c", ".h",
+    ".cpp", ".hpp", ".cs", ".swift", ".scala", ".sql", ".sh", ".vue", ".svelte",
+}
+SKIP_DIRS = {".git", "node_modules", "vendor", "dist", "build", "__pycache__", ".venv", "venv", "third_party"}
+MAX_FILE_BYTES = 200_000
+CHUNK_MAX_LINES = 80
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 対象ファイルが参照しているシンボルを定義するチャンクへの加点
+SYMBOL_BOOST = 5.0
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_SUBWORD = re.compile(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])")
+_DEFINITION = re.compile(
+    r"^[ \t]*(?:export[ \t]+)?(?:default[ \t]+)?(?:(?:public|private|protected|static|abstract|final|pub)[ \t]+)*"
+    r"(?:async[ \t]+)?(?:def|class|function|func|fn|interface|type|struct|enum|trait|const|let|var)[ \t]+"
+    r"(?:\([^)]*\)[ \t]*)?([A-Za-z_][A-Za-z0-9_]*)",
+    re.MULTILINE,
+)
+_IMPORT_LINE = re.compile(r"^[ \t]*(?:import|from|require|use|#include|const .*require\()[^\n]*", re.MULTILINE)
+_STOPWORDS = {
+    "def", "class", "return", "import", "from", "self", "this", "none", "true", "false", "null", "function",
+    "const", "let", "var", "for", "while", "and", "not", "the", "str", "int", "if", "else", "elif", "try",
+    "except", "async", "await", "with", "pass", "new", "public", "private", "static", "void", "export",
+}
+
+
+def retrieval_enabled() -> bool:
+    return os.environ.get("RETRIEVAL_ENABLED", "true").strip().lower() not in ("0", "false", "no")
+
+
+def index_dir() -> str:
+    return os.environ.get("RETRIEVAL_INDEX_DIR", "/tmp/aibot-repo-index")
+
+
+def top_k() -> int:
+    return int(os.environ.get("RETRIEVAL_TOP_K", "5"))
+
+
+def context_budget() -> int:
+    return int(os.environ.get("RETRIEVAL_TOKEN_BUDGET", "4000"))
+
+
+def update_timeout() -> float:
+    return float(os.environ.get("RETRIEVAL_TIMEOUT", "20"))
+
+
+def max_blob_fetches() -> int:
+    return int(os.environ.get("RETRIEVAL_MAX_BLOB_FETCHES", "30"))
+
+
+def is_indexable(path: str, size: Optional[int] = None) -> bool:
+    """インデックス対象のファイルか（ソースコードの拡張子で、依存・生成物ディレクトリ外、サイズ上限以下）"""
+    parts = path.split("/")
+    if any(part in SKIP_DIRS for part in parts[:-1]):
+        return False
+    if size is not None and size > MAX_FILE_BYTES:
+        return False
+    return os.path.splitext(path)[1].lower() in INDEXABLE_EXTENSIONS
+
+
+def git_blob_sha(data: bytes) -> str:
+    """Gitのblob SHA（ツリーのSHAと比較して変更を検出するため）"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def tokenize(text: str) -> List[str]:
+    """識別子を小文字化し、snake_case/camelCaseの構成語も加えた検索語の列"""
+    terms = []
+    for identifier in _IDENTIFIER.findall(text):
+        lower = identifier.lower()
+        if len(lower) < 3 or lower in _STOPWORDS:
+            continue
+        terms.append(lower)
+        subwords = [word.lower() for part in identifier.split("_") for word in _SUBWORD.findall(part)]
+        if len(subwords) > 1:
+            terms.extend(word for word in subwords if len(word) >= 3 and word not in _STOPWORDS)
+    return terms
+
+
+def definitions(text: str) -> List[str]:
+    """トップレベル・メソッドを含む定義名"""
+    return _DEFINITION.findall(text)
+
+
+@dataclass
+class Chunk:
+    """検索単位のコード片"""
+    path: str
+    start_line: int
+    text: str
+
+    @property
+    def end_line(self) -> int:
+        return self.start_line + self.text.count("\n") - (1 if self.text.endswith("\n") else 0)
+
+
+@dataclass
+class Snippet:
+    """プロンプトに加える関連コード"""
+    path: str
+    start_line: int
+    end_line: int
+    text: str
+    score: float
+
+    def render(self) -> str:
+        return f"--- {self.path} (L{self.start_line}-{self.end_line}) ---\n{self.text.rstrip()}\n"
+
+
+def split_chunks(path: str, text: str) -> List[Chunk]:
+    """token_budget のブロック分割を使い、長いブロックは CHUNK_MAX_LINES 行ごとに分ける"""
+    chunks = []
+    line = 1
+    for block in token_budget.split_blocks(text):
+        lines = block.splitlines(keepends=True)
+        for offset in range(0, len(lines), CHUNK_MAX_LINES):
+            piece = "".join(lines[offset:offset + CHUNK_MAX_LINES])
+            if piece.strip():
+                chunks.append(Chunk(path, line + offset, piece))
+        line += len(lines)
+    return chunks
+
+
+class RepoIndex:
+    """1リポジトリ分のシンボル索引とBM25インデックス"""
+
+    def __init__(self, repo_name: str, commit_sha: str = ""):
+        self.repo_name = repo_name
+        self.commit_sha = commit_sha
+        # path -> {"sha": blob SHA, "chunks": [Chunk]}
+        self.files: Dict[str, dict] = {}
+        self._chunks: List[Chunk] = []
+        self._terms: List[Counter] = []
+        self._document_frequency: Counter = Counter()
+        self._average_length = 0.0
+        self._symbols: Dict[str, List[int]] = {}
+
+    def blob_sha(self, path: str) -> Optional[str]:
+        entry = self.files.get(path)
+        return entry["sha"] if entry else None
+
+    def update_files(self, changed: Dict[str, Tuple[str, str]], removed: Iterable[str] = ()) -> None:
+        """変更されたファイル（path -> (blob SHA, 内容)）を入れ替え、削除されたファイルを除く"""
+        for path in removed:
+            self.files.pop(path, None)
+        for path, (sha, text) in changed.items():
+            self.files[path] = {"sha": sha, "chunks": split_chunks(path, text)}
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._chunks = [chunk for path in sorted(self.files) for chunk in self.files[path]["chunks"]]
+        self._terms = [Counter(tokenize(chunk.text)) for chunk in self._chunks]
+        self._document_frequency = Counter(term for terms in self._terms for term in terms)
+        total = sum(sum(terms.values()) for terms in self._terms)
+        self._average_length = total / len(self._terms) if self._terms else 0.0
+        self._symbols = {}
+        for index, chunk in enumerate(self._chunks):
+            for name in definitions(chunk.text):
+                self._symbols.setdefault(name, []).append(index)
+
+    def bm25(self, query: Counter, index: int) -> float:
+        terms = self._terms[index]
+        length = sum(terms.values())
+        score = 0.0
+        for term in query:
+            frequency = terms.get(term, 0)
+            if not frequency:
+                continue
+            df = self._document_frequency[term]
+            idf = math.log(1 + (len(self._chunks) - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self._average_length or 1))
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return score
+
+    def related_snippets(self, file_path: str, code: str, instruction: str,
+                         limit: Optional[int] = None, budget: Optional[int] = None) -> List[Snippet]:
+        """対象ファイルの import・参照シンボル・指示に関係するコード片を、トークン予算内で関連度順に返す
+
+        Args:
+            file_path: 改修対象のファイル（結果から除く）
+            code: 対象ファイルの現在の内容
+            instruction: 改修の指示
+            limit: 最大件数（省略時は RETRIEVAL_TOP_K）
+            budget: トークン上限（省略時は RETRIEVAL_TOKEN_BUDGET）
+        """
+        limit = limit or top_k()
+        budget = budget or context_budget()
+        if not self._chunks:
+            return []
+
+        # 検索語: 指示・importしているモジュール・対象ファイル名（呼び出し側がimportしている名前）
+        module = os.path.splitext(os.path.basename(file_path))[0]
+        query = Counter(tokenize(instruction))
+        query.update(tokenize("\n".join(_IMPORT_LINE.findall(code))))
+        query.update(tokenize(module))
+
+        # 対象ファイルが参照していて、他のファイルで定義されているシンボル
+        own = set(definitions(code))
+        referenced = {name for name in set(_IDENTIFIER.findall(code)) - own if name in self._symbols}
+        boosted: Counter = Counter()
+        for name in referenced:
+            for index in self._symbols[name]:
+                boosted[index] += SYMBOL_BOOST
+
+        scores = []
+        for index, chunk in enumerate(self._chunks):
+            if chunk.path == file_path:
+                continue
+            score = self.bm25(query, index) + boosted.get(index, 0.0)
+            if score > 0:
+                scores.append((score, index))
+        scores.sort(key=lambda item: (-item[0], item[1]))
+
+        snippets = []
+        used = 0
+        for score, index in scores:
+            chunk = self._chunks[index]
+            tokens = token_budget.estimate_tokens(chunk.text)
+            if used + tokens > budget:
+                continue
+            snippets.append(Snippet(chunk.path, chunk.start_line, chunk.end_line, chunk.text, round(score, 3)))
+            used += tokens
+            if len(snippets) >= limit:
+                break
+        return snippets
+
+    # --- 永続化 ---
+    def to_dict(self) -> dict:
+        return {
+            "repo_name": self.repo_name,
+            "commit_sha": self.commit_sha,
+            "files": {
+                path: {"sha": entry["sha"], "chunks": [[chunk.start_line, chunk.text] for chunk in entry["chunks"]]}
+                for path, entry in self.files.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RepoIndex":
+        index = cls(data["repo_name"], data.get("commit_sha", ""))
+        index.files = {
+            path: {"sha": entry["sha"], "chunks": [Chunk(path, start, text) for start, text in entry["chunks"]]}
+            for path, entry in data.get("files", {}).items()
+        }
+        index._rebuild()
+        return index
+
+    def save(self, directory: Optional[str] = None) -> None:
+        path = _index_path(self.repo_name, directory)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, repo_name: str, directory: Optional[str] = None) -> Optional["RepoIndex"]:
+        path = _index_path(repo_name, directory)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"リポジトリインデックスの読み込みに失敗したため再作成します ({repo_name}): {e}")
+            return None
+
+
+def _index_path(repo_name: str, directory: Optional[str] = None) -> str:
+    return os.path.join(directory or index_dir(), repo_name.replace("/", "__") + ".json")
+
+
+def format_snippets(snippets: List[Snippet]) -> str:
+    return "\n".join(snippet.render() for snippet in snippets)
+
+
+# --- GitHubからの取得 ---
+def _decode(data: bytes) -> Optional[str]:
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def read_tarball(data: bytes) -> Dict[str, Tuple[str, str]]:
+    """GitHubのtarball（先頭に "owner-repo-sha/" が付く）から対象ファイルを読み込む"""
+    files = {}
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as archive:
+        for member in archive.getmembers():
+            if not member.isfile():
+                continue
+            path = member.name.split("/", 1)[1] if "/" in member.name else member.name
+            if not is_indexable(path, member.size):
+                continue
+            content = archive.extractfile(member).read()
+            text = _decode(content)
+            if text is not None:
+                files[path] = (git_blob_sha(content), text)
+    return files
+
+
+def _full_build(repo, repo_name: str, sha: str) -> RepoIndex:
+    url = repo.get_archive_link("tarball", ref=sha)
+    response = requests.get(url, timeout=60)
+    response.raise_for_status()
+    index = RepoIndex(repo_name, sha)
+    index.update_files(read_tarball(response.content))
+    metrics.RETRIEVAL_INDEX_UPDATES.inc(mode="full")
+    return index
+
+
+def _incremental_update(repo, index: RepoIndex, sha: str) -> Optional[RepoIndex]:
+    """ツリーのblob SHAを比較して変更分だけ取得する（変更が多い場合は None を返し全体を作り直す）"""
+    tree = repo.get_git_tree(sha, recursive=True)
+    current = {
+        element.path: element.sha
+        for element in tree.tree
+        if element.type == "blob" and is_indexable(element.path, element.size)
+    }
+    changed_paths = [path for path, blob_sha in current.items() if index.blob_sha(path) != blob_sha]
+    removed = [path for path in index.files if path not in current]
+    if len(changed_paths) > max_blob_fetches():
+        return None
+
+    changed = {}
+    for path in changed_paths:
+        blob = repo.get_git_blob(current[path])
+        text = _decode(base64.b64decode(blob.content)) if blob.encoding == "base64" else blob.content
+        if text is not None:
+            changed[path] = (current[path], text)
+    index.update_files(changed, removed)
+    index.commit_sha = sha
+    metrics.RETRIEVAL_INDEX_UPDATES.inc(mode="incremental")
+    logging.info(f"リポジトリインデックスを差分更新しました ({index.repo_name}): 変更 {len(changed)} / 削除 {len(removed)}")
+    return index
+
+
+_indexes: Dict[str, RepoIndex] = {}
+_repo_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="repo-index")
+
+
+def _repo_lock(repo_name: str) -> threading.Lock:
+    with _locks_guard:
+        return _repo_locks.setdefault(repo_name, threading.Lock())
+
+
+def ensure_index(client, repo_name: str, branch: str = "main") -> RepoIndex:
+    """ブランチの最新コミットに合わせてインデックスを作成・更新する（同じリポジトリは直列に処理）"""
+    with _repo_lock(repo_name):
+        repo = client.get_repo(repo_name)
+        sha = repo.get_branch(branch).commit.sha
+        index = _indexes.get(repo_name) or RepoIndex.load(repo_name)
+        if index is not None and index.commit_sha == sha:
+            metrics.RETRIEVAL_INDEX_UPDATES.inc(mode="cached")
+        else:
+            updated = _incremental_update(repo, index, sha) if index is not None else None
+            index = updated or _full_build(repo, repo_name, sha)
+            index.save()
+        _indexes[repo_name] = index
+        return index
+
+
+def prepare(client, repo_name: str, branch: str = "main") -> concurrent.futures.Future:
+    """インデックス更新をバックグラウンドで開始する（対象ファイルの取得と並行させるため）"""
+    return _executor.submit(contextvars.copy_context().run, ensure_index, client, repo_name, branch)
+
+
+def wait_for_index(future: concurrent.futures.Future, timeout: Optional[float] = None) -> Optional[RepoIndex]:
+    """更新を待つ。時間切れ・失敗の場合は None（時間切れの更新はそのまま続行し、次回以降に使われる）"""
+    try:
+        return future.result(timeout=update_timeout() if timeout is None else timeout)
+    except concurrent.futures.TimeoutError:
+        logging.warning("リポジトリインデックスの更新が間に合わないため、関連コードなしで続行します")
+    except Exception as e:
+        logging.warning(f"リポジトリインデックスの更新に失敗したため、関連コードなしで続行します: {e}")
+    return None
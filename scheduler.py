@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+ユーザー・チャンネル単位の公平なスケジューラとレート制限
+
+コマンドは受け付けた順にすぐスレッドで実行していたため、1人のユーザーが /develop を連続で送ると
+Anthropic の同時実行枠と GitHub のAPI枠を使い切り、他のユーザーのコマンドが後ろで待たされていた。
+
+- レート制限: ユーザーごと・チャンネルごとに1分あたりの受付数を制限し、超えた分は ack で再実行までの秒数を返す
+- 公平な実行順: 同時に実行するタスク数を SCHEDULER_CONCURRENCY に制限し、空いた枠はユーザーごとの待ち行列から
+  重み付きラウンドロビン（smooth weighted round-robin）で割り当てる。1人のユーザーが同時に使える枠は
+  SCHEDULER_USER_CONCURRENCY まで。大量に送ったユーザーがいても、他のユーザーの待ち時間は1タスク分程度に収まる
+
+環境変数:
+    SCHEDULER_CONCURRENCY: 同時に実行するタスク数（デフォルト: 4）
+    SCHEDULER_USER_CONCURRENCY: 1ユーザーが同時に実行できるタスク数（デフォルト: 2）
+    SCHEDULER_USER_WEIGHTS: ユーザーごとの重み（例: U0123=3,U0456=2。デフォルトの重みは 1）
+    USER_RATE_LIMIT: 1ユーザーが1分間に送れるコマンド数（0で無制限。デフォルト: 10）
+    CHANNEL_RATE_LIMIT: 1チャンネルで1分間に受け付けるコマンド数（0で無制限。デフォルト: 30）
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import metrics
+
+WINDOW_SECONDS = 60.0
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """"U0123=3,U0456=2" 形式の重み指定を解析する（不正な値は無視）"""
+    weights = {}
+    for item in spec.split(","):
+        user, _, value = item.partition("=")
+        try:
+            weight = float(value)
+        except ValueError:
+            continue
+        if user.strip() and weight > 0:
+            weights[user.strip()] = weight
+    return weights
+
+
+class RateLimiter:
+    """キーごとに直近1分間の受付数を数える（スライディングウィンドウ）"""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._hits: Dict[str, Deque[float]] = {}
+
+    def wait_time(self, key: str, now: float) -> float:
+        """受け付けられるようになるまでの秒数（受け付けられるなら 0）"""
+        if self.per_minute <= 0:
+            return 0.0
+        hits = self._hits.get(key)
+        if hits is None:
+            return 0.0
+        while hits and hits[0] <= now - WINDOW_SECONDS:
+            hits.popleft()
+        if not hits:
+            del self._hits[key]
+            return 0.0
+        return hits[0] + WINDOW_SECONDS - now if len(hits) >= self.per_minute else 0.0
+
+    def record(self, key: str, now: float) -> None:
+        if self.per_minute > 0:
+            self._hits.setdefault(key, deque()).append(now)
+
+
+@dataclass(eq=False)
+class _Task:
+    kind: str
+    func: Callable
+    args: Tuple[Any, ...]
+    # 受け付けた時点のコンテキスト（トレースとジョブ）。前のタスクの完了時に開始する場合もこちらで開始する
+    context: contextvars.Context = field(default_factory=contextvars.copy_context)
+
+
+@dataclass
+class _UserQueue:
+    weight: float = 1.0
+    current: float = 0.0
+    running: int = 0
+    pending: Deque[_Task] = field(default_factory=deque)
+
+
+class FairScheduler:
+    """ユーザーごとの待ち行列から重み付きラウンドロビンでタスクを実行する
+
+    runner(kind, func, *args) でタスクを開始する（aibot.start_background_task を渡す）。
+    完了時の通知はタスクを包んで行うため、runner はタスクを別スレッドで実行すること。
+    runner は submit() を呼んだ時点のコンテキストで呼び出す（待っていたタスクを前のタスクのスレッドから開始する場合も同じ）。
+    """
+
+    def __init__(self, runner: Callable[..., Any], concurrency: int = 4, user_concurrency: int = 2,
+                 weights: Optional[Dict[str, float]] = None, user_rate_limit: int = 10,
+                 channel_rate_limit: int = 30, clock: Callable[[], float] = time.monotonic):
+        self.runner = runner
+        self.concurrency = max(1, concurrency)
+        self.user_concurrency = max(1, user_concurrency)
+        self.weights = weights or {}
+        self._clock = clock
+        self._user_limit = RateLimiter(user_rate_limit)
+        self._channel_limit = RateLimiter(channel_rate_limit)
+        self._users: Dict[str, _UserQueue] = {}
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def check_rate(self, user: str, channel: str) -> float:
+        """ユーザーとチャンネルのレート制限を確認し、受け付けるなら記録して 0 を、超えていれば待ち秒数を返す"""
+        with self._lock:
+            now = self._clock()
+            user_wait = self._user_limit.wait_time(user, now)
+            channel_wait = self._channel_limit.wait_time(channel, now)
+            if user_wait > 0 or channel_wait > 0:
+                metrics.SCHEDULER_RATE_LIMITED.inc(scope="user" if user_wait >= channel_wait else "channel")
+                return max(user_wait, channel_wait)
+            self._user_limit.record(user, now)
+            self._channel_limit.record(channel, now)
+            return 0.0
+
+    def submit(self, user: str, kind: str, func: Callable, *args) -> int:
+        """タスクを追加し、実行待ちの順番を返す（0 はすぐに開始）"""
+        task = _Task(kind, func, args)
+        with self._lock:
+            queue = self._users.setdefault(user, _UserQueue(weight=self.weights.get(user, 1.0)))
+            queue.pending.append(task)
+            started = self._dispatch()
+            position = 0 if any(item is task for _, item in started) else self._position(user, task)
+        for item in started:
+            self._start(*item)
+        return position
+
+    def take_pending(self) -> List[Tuple[str, Tuple[Any, ...]]]:
+        """まだ開始していないタスクをすべて取り出す（終了処理で他のワーカーに引き継ぐため）"""
+        with self._lock:
+            tasks = [(task.kind, task.args) for queue in self._users.values() for task in queue.pending]
+            for queue in self._users.values():
+                queue.pending.clear()
+            metrics.SCHEDULER_PENDING.set(0)
+            return tasks
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(queue.pending) for queue in self._users.values())
+
+    def running(self) -> int:
+        with self._lock:
+            return self._running
+
+    def _eligible(self) -> List[str]:
+        return [
+            user for user, queue in self._users.items()
+            if queue.pending and queue.running < self.user_concurrency
+        ]
+
+    def _pick(self, users: List[str], state: Dict[str, _UserQueue]) -> str:
+        """smooth weighted round-robin で次のユーザーを選ぶ（同点なら実行中のタスクが少ないユーザー）"""
+        total = sum(state[user].weight for user in users)
+        for user in users:
+            state[user].current += state[user].weight
+        chosen = max(users, key=lambda user: (state[user].current, -state[user].running))
+        state[chosen].current -= total
+        return chosen
+
+    def _dispatch(self) -> List[Tuple[str, _Task]]:
+        """空いている枠にタスクを割り当てる（ロックを持った状態で呼ぶ）"""
+        started = []
+        while self._running < self.concurrency:
+            users = self._eligible()
+            if not users:
+                break
+            user = self._pick(users, self._users)
+            queue = self._users[user]
+            task = queue.pending.popleft()
+            queue.running += 1
+            self._running += 1
+            started.append((user, task))
+        metrics.SCHEDULER_PENDING.set(sum(len(queue.pending) for queue in self._users.values()))
+        return started
+
+    def _position(self, user: str, task: _Task) -> int:
+        """現在の状態から割り当て順を試算し、task が何番目に開始されるかを返す（同時実行数の上限は考慮しない概算）"""
+        state = {
+            name: _UserQueue(queue.weight, queue.current, queue.running, deque(queue.pending))
+            for name, queue in self._users.items() if queue.pending
+        }
+        position = 0
+        while True:
+            users = [name for name, queue in state.items() if queue.pending]
+            chosen = self._pick(users, state)
+            position += 1
+            if chosen == user and state[chosen].pending[0] is task:
+                return position
+            state[chosen].pending.popleft()
+
+    def _start(self, user: str, task: _Task) -> None:
+        def run(*args):
+            try:
+                task.func(*args)
+            finally:
+                self._finished(user)
+
+        try:
+            task.context.run(self.runner, task.kind, run, *task.args)
+        except Exception as e:
+            logging.error(f"タスクを開始できませんでした ({task.kind}): {e}")
+            self._finished(user)
+
+    def _finished(self, user: str) -> None:
+        with self._lock:
+            queue = self._users[user]
+            queue.running -= 1
+            self._running -= 1
+            if not queue.pending and queue.running == 0:
+                # 待ちのないユーザーは状態を残さない（次回は重みの初期状態から）
+                del self._users[user]
+            started = self._dispatch()
+        for item in started:
+            self._start(*item)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def scheduler_from_env(runner: Callable[..., Any]) -> FairScheduler:
+    return FairScheduler(
+        runner,
+        concurrency=_env_int("SCHEDULER_CONCURRENCY", 4),
+        user_concurrency=_env_int("SCHEDULER_USER_CONCURRENCY", 2),
+        weights=parse_weights(os.environ.get("SCHEDULER_USER_WEIGHTS", "")),
+        user_rate_limit=_env_int("USER_RATE_LIMIT", 10),
+        channel_rate_limit=_env_int("CHANNEL_RATE_LIMIT", 30),
+    )
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+コマンドの受け付けと実行を分けるタスクキュー
+
+main.py のプロセス（gunicorn 1ワーカー・8スレッド）はヘルスチェックとSlackの受信も担っており、
+重いコード生成が同じプロセスで動くと他のコマンドやヘルスチェックの応答が遅れていた。
+TASK_QUEUE を指定すると、コマンドのハンドラーは ack してキューに入れるだけになり、
+実行は worker.py のワーカー（別プロセス・別インスタンス）が行う。
+
+- inline: キューを使わず、受け付けたプロセスのバックグラウンドスレッドで実行する（従来どおり）
+- sqlite: job_store.py のSQLiteファイルを共有するワーカーがポーリングで取り出す（同じホスト・共有ボリューム向け）
+- http: ワーカーの受付URLにPOSTする（Cloud Run の別サービスなど、インスタンスをまたいでスケールさせる場合）
+
+環境変数:
+    TASK_QUEUE: inline / sqlite / http（デフォルト: inline）
+    TASK_QUEUE_URL: http の送信先（ワーカーの /tasks のURL）
+    WORKER_TOKEN: http の送信時に付け、ワーカー側で確認する共有トークン（http では必須）
+    TASK_QUEUE_TIMEOUT: http の送信タイムアウト（秒、デフォルト: 10）
+    TASK_QUEUE_RETRIES: ワーカーが混雑している（429/503）場合の再送回数（デフォルト: 3）
+"""
+
+import hmac
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+import requests
+
+import job_store
+import metrics
+
+
+class EnqueueError(Exception):
+    """キューに入れられなかった（呼び出し元はこのプロセスで実行して続行する）"""
+
+
+class TaskQueue:
+    """タスクキューのインターフェース"""
+
+    backend = "inline"
+
+    def put(self, kind: str, payload: Dict[str, Any]) -> str:
+        """ジョブを投入してIDを返す（失敗時は EnqueueError）"""
+        raise NotImplementedError
+
+
+class SQLiteTaskQueue(TaskQueue):
+    """ジョブストアのSQLiteファイルを共有するキュー（ワーカーは get() で取り出す）"""
+
+    backend = "sqlite"
+
+    def __init__(self, store: job_store.SQLiteJobStore):
+        self.store = store
+
+    def put(self, kind: str, payload: Dict[str, Any]) -> str:
+        try:
+            job = self.store.create(kind, payload, owner=None, status=job_store.QUEUED)
+        except sqlite3.Error as e:
+            raise EnqueueError(f"SQLiteキューに追加できませんでした: {e}") from e
+        metrics.TASKS_ENQUEUED.inc(kind=kind, backend=self.backend)
+        return job.id
+
+    def get(self, owner: str = job_store.WORKER_ID) -> Optional[job_store.Job]:
+        """最も古いジョブを取り出して実行中にする（空なら None）"""
+        return self.store.claim_queued(owner)
+
+
+class HttpPushQueue(TaskQueue):
+    """ワーカーの受付URLにジョブをPOSTするキュー（ワーカーは受け付けた時点で 202 を返す）"""
+
+    backend = "http"
+
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = 10.0, retries: int = 3,
+                 sleep=time.sleep):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.retries = retries
+        self._sleep = sleep
+
+    def put(self, kind: str, payload: Dict[str, Any]) -> str:
+        task_id = uuid.uuid4().hex
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        for attempt in range(self.retries + 1):
+            try:
+                response = requests.post(self.url, json={"id": task_id, "kind": kind, "payload": payload},
+                                         headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                raise EnqueueError(f"ワーカーに送信できませんでした: {e}") from e
+            # 混雑しているワーカーは 429/503 を返す（再送すると別のインスタンスに振り分けられる）
+            if response.status_code in (429, 503) and attempt < self.retries:
+                self._sleep(min(2 ** attempt * 0.5, 5.0))
+                continue
+            if response.status_code >= 400:
+                raise EnqueueError(f"ワーカーが受け付けませんでした: HTTP {response.status_code}")
+            metrics.TASKS_ENQUEUED.inc(kind=kind, backend=self.backend)
+            return task_id
+        raise EnqueueError("ワーカーが混雑しています")
+
+
+def authorized(header: Optional[str]) -> bool:
+    """ワーカーの受付で Authorization ヘッダーを確認する（WORKER_TOKEN 未設定なら常に拒否）"""
+    token = os.environ.get("WORKER_TOKEN", "")
+    if not token:
+        # 誰でも任意のリポジトリと response_url でジョブを投入できてしまうため、受付自体を無効にする
+        return False
+    return hmac.compare_digest(header or "", f"Bearer {token}")
+
+
+def queue_from_env() -> Optional[TaskQueue]:
+    """TASK_QUEUE に応じたキュー（inline の場合は None）"""
+    backend = os.environ.get("TASK_QUEUE", "inline").strip().lower()
+    if backend in ("inline", ""):
+        return None
+    if backend == "sqlite":
+        if not isinstance(job_store.STORE, job_store.SQLiteJobStore):
+            logging.error("TASK_QUEUE=sqlite には JOB_STORE=sqlite が必要です（このプロセスで実行します）")
+            return None
+        return SQLiteTaskQueue(job_store.STORE)
+    if backend == "http":
+        url = os.environ.get("TASK_QUEUE_URL", "").strip()
+        if not url:
+            logging.error("TASK_QUEUE=http には TASK_QUEUE_URL が必要です（このプロセスで実行します）")
+            return None
+        token = os.environ.get("WORKER_TOKEN", "")
+        if not token:
+            logging.error("TASK_QUEUE=http には WORKER_TOKEN が必要です（このプロセスで実行します）")
+            return None
+        return HttpPushQueue(
+            url,
+            token=token,
+            timeout=job_store._env_float("TASK_QUEUE_TIMEOUT", 10.0),
+            retries=int(job_store._env_float("TASK_QUEUE_RETRIES", 3)),
+        )
+    logging.warning(f"未対応の TASK_QUEUE です: {backend}（このプロセスで実行します）")
+    return None
+
+
+QUEUE: Optional[TaskQueue] = queue_from_env()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Anthropic gateway tests
+同時実行数の制限・レート制御・リトライのテスト
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+import unittest.mock
+
+import anthropic
+import httpx
+
+import anthropic_gateway
+import metrics
+
+MODEL = "test-model"
+REQUEST = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+
+
+def _status_error(status, headers=None):
+    response = httpx.Response(status, headers=headers or {}, request=REQUEST)
+    if status == 429:
+        return anthropic.RateLimitError("rate limited", response=response, body=None)
+    if status >= 500:
+        return anthropic.InternalServerError("overloaded", response=response, body=None)
+    return anthropic.BadRequestError("bad request", response=response, body=None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    """トークンバケットのテスト"""
+
+    def test_reserve_waits_when_empty(self):
+        """容量を使い切ると補充速度に応じた待ち時間を返すこと"""
+        clock = FakeClock()
+        bucket = anthropic_gateway.TokenBucket(60, clock=clock)
+
+        self.assertEqual(bucket.reserve(60), 0.0)
+        self.assertAlmostEqual(bucket.reserve(1), 1.0)
+        clock.now = 10.0
+        self.assertEqual(bucket.reserve(5), 0.0)
+
+    def test_oversized_reservation_capped(self):
+        """容量を超える予約でも最大1分の待ちで済むこと"""
+        bucket = anthropic_gateway.TokenBucket(60, clock=FakeClock())
+        bucket.reserve(60)
+
+        self.assertAlmostEqual(bucket.reserve(1000), 60.0)
+
+    def test_pause(self):
+        clock = FakeClock()
+        bucket = anthropic_gateway.TokenBucket(60, clock=clock)
+        bucket.pause(5)
+
+        self.assertEqual(bucket.reserve(1), 5.0)
+
+    def test_refund(self):
+        clock = FakeClock()
+        bucket = anthropic_gateway.TokenBucket(60, clock=clock)
+        bucket.reserve(60)
+        bucket.refund(30)
+
+        self.assertEqual(bucket.reserve(30), 0.0)
+
+
+class TestRetry(unittest.TestCase):
+    """リトライのテスト"""
+
+    def setUp(self):
+        self.sleeps = []
+        self.gateway = anthropic_gateway.Gateway(max_retries=3, retry_base=1.0, retry_max=30.0, sleep=self.sleeps.append)
+
+    def test_retry_after_header(self):
+        """retry-after / retry-after-ms を優先すること"""
+        self.assertEqual(self.gateway.backoff(0, _status_error(429, {"retry-after": "7"})), 7.0)
+        self.assertEqual(self.gateway.backoff(0, _status_error(429, {"retry-after-ms": "1500"})), 1.5)
+        self.assertEqual(self.gateway.backoff(0, _status_error(429, {"retry-after": "600"})), 30.0)
+        self.assertLessEqual(self.gateway.backoff(2, _status_error(529)), 4.0)
+
+    def test_retries_then_succeeds(self):
+        """429と529を再試行して成功し、429ではモデルの後続リクエストも待たせること"""
+        errors = [_status_error(429, {"retry-after": "2"}), _status_error(529)]
+        before = metrics.ANTHROPIC_RETRIES.get(model=MODEL, reason="429")
+
+        def request():
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+
+        self.assertEqual(self.gateway.call(MODEL, request), "ok")
+        self.assertEqual(self.sleeps[0], 2.0)
+        self.assertEqual(metrics.ANTHROPIC_RETRIES.get(model=MODEL, reason="429"), before + 1)
+        self.assertGreater(self.gateway._model(MODEL)["requests"].reserve(0), 0)
+
+    def test_non_retryable_raises_immediately(self):
+        calls = []
+
+        def request():
+            calls.append(1)
+            raise _status_error(400)
+
+        with self.assertRaises(anthropic.BadRequestError):
+            self.gateway.call(MODEL, request)
+        self.assertEqual(len(calls), 1)
+
+    def test_gives_up_after_max_retries(self):
+        calls = []
+
+        def request():
+            calls.append(1)
+            raise anthropic.APIConnectionError(request=REQUEST)
+
+        with self.assertRaises(anthropic.APIConnectionError):
+            self.gateway.call(MODEL, request)
+        self.assertEqual(len(calls), 4)
+
+
+class TestConcurrency(unittest.TestCase):
+    """同時実行数の制限テスト"""
+
+    def test_model_concurrency_limited(self):
+        """モデルごとの同時実行数を超えないこと"""
+        gateway = anthropic_gateway.Gateway(max_concurrency=8, model_concurrency=2, requests_per_minute=6000)
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def request():
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.pop()
+            return "ok"
+
+        threads = [threading.Thread(target=gateway.call, args=(MODEL, request)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(max(peak), 2)
+
+    def test_queue_timeout(self):
+        """スロットを待ちきれない場合は APITimeoutError になること"""
+        gateway = anthropic_gateway.Gateway(max_concurrency=1, queue_timeout=0.05)
+        release = threading.Event()
+        thread = threading.Thread(target=gateway.call, args=(MODEL, release.wait))
+        thread.start()
+        time.sleep(0.01)
+
+        with self.assertRaises(anthropic.APITimeoutError):
+            gateway.call(MODEL, lambda: "ok")
+        release.set()
+        thread.join()
+
+    def test_rate_timeout_returns_reservation(self):
+        """レート待ちで断った呼び出しはバケットを借り越しにしないこと"""
+        gateway = anthropic_gateway.Gateway(requests_per_minute=6, queue_timeout=5)
+        results = []
+        for _ in range(30):
+            try:
+                results.append(gateway.call(MODEL, lambda: "ok"))
+            except anthropic.APITimeoutError:
+                results.append("timeout")
+        bucket = gateway._model(MODEL)["requests"]
+
+        self.assertEqual(results.count("ok"), 6)
+        self.assertGreater(bucket.tokens, -1)
+        self.assertLess(bucket.reserve(1), 11)
+
+    def test_retry_budget_separate_from_queue(self):
+        """順番待ちで期限近くまで待った呼び出しでも、リトライは別の時間枠で行うこと"""
+        clock = FakeClock()
+        sleeps = []
+        gateway = anthropic_gateway.Gateway(queue_timeout=120, retry_timeout=120, sleep=sleeps.append)
+        errors = [_status_error(529)]
+
+        def request():
+            if errors:
+                clock.now = 119.0  # 順番待ちでほぼ期限まで使った
+                raise errors.pop(0)
+            return "ok"
+
+        with unittest.mock.patch("time.monotonic", clock):
+            self.assertEqual(gateway.call(MODEL, request), "ok")
+        self.assertEqual(len(sleeps), 1)
+
+
+class TestAsyncCall(unittest.TestCase):
+    """acall（AsyncAnthropic 用）のテスト"""
+
+    def test_retries_and_limits_concurrency(self):
+        """非同期でもリトライし、同時実行数を守ること"""
+        gateway = anthropic_gateway.Gateway(model_concurrency=2, requests_per_minute=6000, retry_base=0.01)
+        active = []
+        peak = []
+        errors = [_status_error(529)]
+
+        async def request():
+            active.append(1)
+            peak.append(len(active))
+            await asyncio.sleep(0.02)
+            active.pop()
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+
+        async def main():
+            return await asyncio.gather(*(gateway.acall(MODEL, request) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(main()), ["ok"] * 5)
+        self.assertEqual(max(peak), 2)
+
+    def test_cancel_releases_slot(self):
+        """キャンセルされた呼び出しがスロットを解放すること"""
+        gateway = anthropic_gateway.Gateway(max_concurrency=1, model_concurrency=1, requests_per_minute=6000)
+
+        async def main():
+            task = asyncio.ensure_future(gateway.acall(MODEL, lambda: asyncio.sleep(10)))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            async def quick():
+                return "ok"
+            return await gateway.acall(MODEL, quick)
+
+        self.assertEqual(asyncio.run(main()), "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Shared event loop tests
+共有イベントループのテスト
+"""
+
+import asyncio
+import contextvars
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import async_runtime
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+class TestAsyncRuntime(unittest.TestCase):
+    """共有イベントループのテスト"""
+
+    def test_tasks_share_one_loop(self):
+        """別スレッドから投入したタスクが同じループで実行されること"""
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        loops = []
+        threads = [
+            threading.Thread(target=lambda: loops.append(async_runtime.run(current_loop())))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(map(id, loops))), 1)
+        self.assertIs(loops[0], async_runtime.get_loop())
+
+    def test_context_propagated(self):
+        """呼び出し元の contextvars がタスクに引き継がれること"""
+        async def read():
+            return request_id.get()
+
+        token = request_id.set("req-1")
+        try:
+            self.assertEqual(async_runtime.run(read()), "req-1")
+        finally:
+            request_id.reset(token)
+
+    def test_cancel_reaches_task(self):
+        """Future のキャンセルが実行中のタスクに伝わること"""
+        started = threading.Event()
+        cancelled = threading.Event()
+
+        async def long_running():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        future = async_runtime.submit(long_running())
+        self.assertTrue(started.wait(1))
+        future.cancel()
+
+        self.assertTrue(cancelled.wait(1))
+
+    def test_run_from_loop_thread_rejected(self):
+        """ループのスレッドから run() を呼ぶとデッドロックせずにエラーになること"""
+        async def nested():
+            async def inner():
+                return 1
+            with self.assertRaises(RuntimeError):
+                async_runtime.run(inner())
+            return "ok"
+
+        self.assertEqual(async_runtime.run(nested()), "ok")
+
+    def test_pending_tasks(self):
+        release = asyncio.Event()
+
+        async def wait():
+            await release.wait()
+
+        future = async_runtime.submit(wait())
+        async_runtime.run(asyncio.sleep(0.01))
+        self.assertGreaterEqual(async_runtime.pending_tasks(), 1)
+        async_runtime.get_loop().call_soon_threadsafe(release.set)
+        future.result(1)
+
+
+
+class TestBlockingCallsOffLoop(unittest.TestCase):
+    """共有ループ上のコマンド処理が同期のSlack・Confluence呼び出しでループを止めないことのテスト"""
+
+    def setUp(self):
+        import aibot
+
+        self.aibot = aibot
+        self.on_loop = []
+
+        def record(name):
+            def call(*args, **kwargs):
+                self.on_loop.append((name, async_runtime.in_loop_thread()))
+                return SimpleNamespace(page_id="42")
+            return call
+
+        for patcher in (
+            patch("aibot.MCP_AVAILABLE", True),
+            patch("aibot.post_slack_message", side_effect=record("slack")),
+            patch("confluence_format.write_page", side_effect=record("confluence")),
+            patch("aibot.atlassian", MagicMock()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_design_mcp_fallback(self):
+        mcp = MagicMock()
+        mcp.generate_design_document_mcp = AsyncMock(return_value="# 設計書")
+        mcp.create_confluence_page_mcp = AsyncMock(return_value={"success": False, "error": "MCP error"})
+        with patch("aibot.mcp", mcp):
+            async_runtime.run(self.aibot.process_design_task_mcp({"text": "app の 認証 について JWT"}, "https://hooks"))
+
+        self.assertIn(("confluence", False), self.on_loop)
+        self.assertGreater(len(self.on_loop), 3)
+        self.assertFalse(any(on_loop for _, on_loop in self.on_loop))
+
+    def test_confluence_search(self):
+        mcp = MagicMock()
+        mcp.search_confluence_pages_mcp = AsyncMock(return_value={"success": True, "results": "1件"})
+        with patch("aibot.mcp", mcp), patch("aibot.run_async_safely", side_effect=lambda coro, kind: async_runtime.run(coro)), \
+             patch("aibot.record_command"):
+            self.aibot.COMMAND_HANDLERS["confluence-search"](MagicMock(), {"text": "認証", "response_url": "https://hooks"}, MagicMock())
+
+        self.assertEqual(len(self.on_loop), 2)
+        self.assertFalse(any(on_loop for _, on_loop in self.on_loop))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Load benchmark tests
+負荷試験の集計ロジックと偽サーバーのテスト
+"""
+
+import asyncio
+import json
+import subprocess
+import sys
+import unittest
+import urllib.request
+from pathlib import Path
+
+import atlassian
+
+import bench_load
+from bench_fakes import FakeConfig, FakeServers
+
+
+def _post_json(url, payload):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=5) as response:
+        body = response.read()
+        return response.status, json.loads(body) if body else None
+
+
+class TestLoadSummary(unittest.TestCase):
+    """レイテンシ集計と成否判定のテスト"""
+
+    def test_percentile(self):
+        """線形補間でパーセンタイルが計算されること"""
+        values = [float(v) for v in range(1, 101)]
+        self.assertAlmostEqual(bench_load.percentile(values, 50), 50.5)
+        self.assertAlmostEqual(bench_load.percentile(values, 99), 99.01)
+        self.assertEqual(bench_load.percentile([3.0], 95), 3.0)
+        self.assertEqual(bench_load.percentile([], 95), 0.0)
+
+    def test_latency_summary(self):
+        """ミリ秒単位で p50/p95/p99 がまとめられること"""
+        summary = bench_load.latency_summary([0.1, 0.2, 0.3, 0.4])
+
+        self.assertEqual(summary["p50_ms"], 250.0)
+        self.assertEqual(summary["max_ms"], 400.0)
+        self.assertEqual(summary["mean_ms"], 250.0)
+
+    def test_is_successful(self):
+        """シナリオの完了報告があり、失敗の報告がない場合のみ成功とみなすこと"""
+        self.assertTrue(bench_load.is_successful([{"text": "開始します"}, {"text": "✅ 完了しました"}], "✅ 完了"))
+        self.assertFalse(bench_load.is_successful([{"text": "開始します"}], "✅ 完了"))
+        self.assertFalse(bench_load.is_successful([{"text": "✅ 完了"}, {"text": "❌ 失敗"}], "✅ 完了"))
+        # 生成したコードに含まれる文字では失敗とみなさない
+        self.assertTrue(bench_load.is_successful([{"text": "```\nraise ValueError('エラー ❌')\n```"}, {"text": "💡 改善提案"}], "💡 改善提案"))
+
+
+class TestFakeServers(unittest.TestCase):
+    """偽サーバーの応答テスト"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fakes = FakeServers(FakeConfig(llm_latency=0, llm_tokens_per_second=100000, llm_output_tokens=50,
+                                           github_latency=0, confluence_latency=0, mcp_latency=0, slack_latency=0))
+        cls.fakes.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fakes.stop()
+
+    def test_environment_points_to_fakes(self):
+        """aibot を偽サーバーに向ける環境変数が生成されること"""
+        env = self.fakes.environment()
+
+        self.assertEqual(env["ANTHROPIC_BASE_URL"], self.fakes.anthropic.url)
+        self.assertTrue(env["CONFLUENCE_URL"].endswith("/wiki"))
+        self.assertTrue(env["ATLASSIAN_MCP_SERVER_URL"].endswith("/v1/sse"))
+
+    def test_anthropic_message(self):
+        """Messages API形式の応答と usage が返ること"""
+        status, body = _post_json(f"{self.fakes.anthropic.url}/v1/messages", {
+            "model": "claude-test",
+            "max_tokens": 4096,
+            "messages": [{"role": "user", "content": "コードを改修してください"}],
+        })
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body["model"], "claude-test")
+        self.assertEqual(body["usage"]["output_tokens"], 50)
+        self.assertTrue(body["content"][0]["text"])
+
+    def test_slack_sink_records_messages(self):
+        """response_url ごとにメッセージが記録されること"""
+        _post_json(self.fakes.slack.response_url("req-1"), {"text": "✅ 完了"})
+
+        messages = self.fakes.slack.messages_for("req-1")
+        self.assertEqual([message["text"] for message in messages], ["✅ 完了"])
+        self.assertEqual(self.fakes.slack.messages_for("unknown"), [])
+
+    def test_github_pull_request(self):
+        """PR作成が記録され html_url が返ること"""
+        status, body = _post_json(f"{self.fakes.github.url}/repos/bench/repo/pulls", {
+            "title": "AI提案", "head": "ai-feature/x", "base": "main",
+        })
+
+        self.assertEqual(status, 201)
+        self.assertIn("/bench/repo/pull/", body["html_url"])
+
+    def test_mcp_sse_with_real_client(self):
+        """MCPクライアントがSSE応答から結果を取り出せること"""
+        from atlassian_mcp_integration import AtlassianMCPClient
+
+        async def call():
+            client = AtlassianMCPClient()
+            client.mcp_server_url = self.fakes.mcp.sse_url
+            try:
+                return await client._run_mcp_tool("confluence_create_page", {"space_key": "BENCH", "title": "t", "content": "c"})
+            finally:
+                await client.http_client.aclose()
+
+        result = asyncio.run(call())
+
+        self.assertTrue(result["success"])
+        self.assertIn("/wiki/spaces/BENCH/pages/", result["result"]["page_url"])
+        self.assertEqual(self.fakes.stats()["mcp"]["POST /v1/sessions"], 1)
+
+
+class TestScenarios(unittest.TestCase):
+    """偽サーバーに対してシナリオを実行するテスト"""
+
+    @unittest.skipUnless(hasattr(atlassian.Confluence, "get_page_by_id"), "atlassian-python-api 3.x が必要")
+    def test_develop_from_design(self):
+        """設計ベース開発のシナリオが成功として数えられること"""
+        # aibot を偽サーバー向けの環境変数でインポートするため、別プロセスで実行する
+        script = (
+            "import json, bench_load\n"
+            "from bench_fakes import FakeConfig\n"
+            "config = FakeConfig(llm_latency=0, llm_tokens_per_second=100000, llm_output_tokens=50,\n"
+            "                    github_latency=0, confluence_latency=0, mcp_latency=0, slack_latency=0)\n"
+            "results = bench_load.run_benchmark(['develop_from_design'], 2, 2, config, False)\n"
+            "print(json.dumps(results['scenarios']['develop_from_design']))\n"
+        )
+        completed = subprocess.run([sys.executable, "-c", script], cwd=Path(bench_load.__file__).parent,
+                                   capture_output=True, text=True, timeout=120)
+
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        summary = json.loads(completed.stdout.strip().splitlines()[-1])
+        self.assertEqual(summary["success_rate"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Replay harness tests
+記録したコマンドの読み込み・再生スケジュール・集計のテスト
+"""
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import bench_replay
+
+
+class TestRecordLoading(unittest.TestCase):
+    """記録ファイルの読み込みテスト"""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def _write(self, lines):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def test_load_records_sorted_and_filtered(self):
+        """コマンド以外の行を読み飛ばし、時刻順に並べること"""
+        self._write([
+            json.dumps({"timestamp": 20, "command": "/design", "text": "b"}),
+            json.dumps({"request_id": "user-001", "title": "バックログの行"}),
+            "not json",
+            "",
+            json.dumps({"timestamp": "1970-01-01T00:00:10Z", "command": "/develop", "text": "a"}),
+        ])
+
+        records = bench_replay.load_records(self.path)
+
+        self.assertEqual([record["command"] for record in records], ["/develop", "/design"])
+        self.assertEqual(records[0]["timestamp"], 10.0)
+
+
+class TestSchedule(unittest.TestCase):
+    """再生スケジュールのテスト"""
+
+    RECORDS = [{"timestamp": 100.0}, {"timestamp": 110.0}, {"timestamp": 170.0}]
+
+    def test_original_intervals(self):
+        self.assertEqual(bench_replay.schedule(self.RECORDS), [0.0, 10.0, 70.0])
+
+    def test_compressed_intervals(self):
+        """speed で間隔が圧縮され、max_gap で上限が設けられること"""
+        self.assertEqual(bench_replay.schedule(self.RECORDS, speed=10), [0.0, 1.0, 7.0])
+        self.assertEqual(bench_replay.schedule(self.RECORDS, speed=1, max_gap=5), [0.0, 5.0, 10.0])
+
+    def test_burst(self):
+        """speed=0 では全件を同時に投入すること"""
+        self.assertEqual(bench_replay.schedule(self.RECORDS, speed=0), [0.0, 0.0, 0.0])
+
+    def test_command_name(self):
+        """環境プレフィックスを除いたコマンド名になること"""
+        self.assertEqual(bench_replay.command_name("/stg-develop"), "develop")
+        self.assertEqual(bench_replay.command_name("/design-mcp"), "design-mcp")
+
+
+class TestReplayCollector(unittest.TestCase):
+    """トレース収集のテスト"""
+
+    def test_wait_for_exported_traces(self):
+        """trigger_id ごとにトレースを待ち合わせ、未完了分は含めないこと"""
+        collector = bench_replay.ReplayCollector()
+        trace = {"attributes": {"trigger_id": "t1"}, "spans": []}
+        threading.Timer(0.05, collector.export, args=(trace,)).start()
+
+        traces = collector.wait_for(["t1", "t2"], timeout=0.3)
+
+        self.assertEqual(list(traces), ["t1"])
+
+    def test_summarize_requests(self):
+        """コマンドごとの完了数とステージ平均が集計されること"""
+        requests = [
+            {"name": "develop", "status": "ok", "ack_ms": 1.0, "duration_ms": 100.0, "stages": {"llm": 60.0}},
+            {"name": "develop", "status": "ok", "ack_ms": 2.0, "duration_ms": 300.0, "stages": {"llm": 100.0}},
+            {"name": "develop", "status": "timeout", "ack_ms": 1.0},
+        ]
+
+        summary = bench_replay.summarize_requests(requests)["develop"]
+
+        self.assertEqual(summary["count"], 3)
+        self.assertEqual(summary["completed"], 2)
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["stage_mean_ms"], {"llm": 80.0})
+        self.assertEqual(summary["latency"]["p50_ms"], 200.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
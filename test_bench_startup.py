@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark tests
+起動時間ベンチマークの集計ロジックのテスト
+"""
+
+import unittest
+
+import bench_startup
+
+
+IMPORTTIME_SAMPLE = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |       1500 | markdown
+import time:        50 |       4000 |     google.cloud.secretmanager
+import time:       900 |       9000 | anthropic
+2024-01-01 00:00:00 - root - INFO - Secrets loaded in 0.00 seconds
+import time:        10 |         10 | anthropic
+"""
+
+
+class TestImportTimeParsing(unittest.TestCase):
+    """-X importtime 出力の解析テスト"""
+
+    def test_parse_importtime(self):
+        """self/cumulativeがモジュールごとに取得できること"""
+        modules = bench_startup.parse_importtime(IMPORTTIME_SAMPLE)
+
+        self.assertEqual(modules["markdown"], {"self_us": 300, "cumulative_us": 1500})
+        self.assertEqual(modules["google.cloud.secretmanager"]["cumulative_us"], 4000)
+        # ヘッダー行とログ行は無視される
+        self.assertNotIn("imported package", modules)
+        # 同名モジュールは最初のインポートを採用
+        self.assertEqual(modules["anthropic"]["cumulative_us"], 9000)
+
+    def test_summarize_importtime(self):
+        """追跡対象パッケージとトップレベル上位が集計されること"""
+        summary = bench_startup.summarize_importtime(bench_startup.parse_importtime(IMPORTTIME_SAMPLE))
+
+        self.assertEqual(summary["tracked_cumulative_us"]["anthropic"], 9000)
+        self.assertEqual(summary["tracked_cumulative_us"]["google.cloud.secretmanager"], 4000)
+        self.assertNotIn("google.cloud.secretmanager", summary["top_level_cumulative_us"])
+        self.assertEqual(list(summary["top_level_cumulative_us"])[0], "anthropic")
+
+
+class TestBaselineComparison(unittest.TestCase):
+    """ベースライン比較のテスト"""
+
+    def _report(self, import_s, rss_kb, healthy_s):
+        return {
+            "results": {
+                "imports": {"aibot": {"import_s": {"median": import_s}, "max_rss_kb": {"median": rss_kb}}},
+                "health": {"time_to_healthy_s": {"median": healthy_s}},
+            }
+        }
+
+    def test_regression_detected(self):
+        """閾値を超えて悪化した指標が検出されること"""
+        baseline = self._report(1.0, 100000, 2.0)
+        current = self._report(1.5, 101000, 1.0)
+
+        regressions = bench_startup.compare_with_baseline(current, baseline, threshold=0.2)
+
+        self.assertEqual(regressions, ["import aibot"])
+
+    def test_stub_environment_disables_network(self):
+        """スタブ環境ではSecret ManagerとSlackのトークン検証が無効になること"""
+        env = bench_startup.stub_environment()
+
+        self.assertEqual(env["DISABLE_SECRET_MANAGER"], "true")
+        self.assertEqual(env["SLACK_TOKEN_VERIFICATION"], "false")
+        self.assertNotIn("GOOGLE_CLOUD_PROJECT", env)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Job cancellation tests
+/cancel によるジョブの取り消し（レジストリ・ステージ間の確認・ストリーミングの中断）のテスト
+"""
+
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, Mock, patch
+
+import job_store
+import metrics
+import model_router
+
+PAYLOAD = {"text": "owner/repo の a.py に 修正", "user_id": "U1", "channel_id": "C1", "response_url": "https://hooks.slack.com/test"}
+
+
+class CancelTestCase(unittest.TestCase):
+    """ストアとレジストリをテストごとに初期化する"""
+
+    def setUp(self):
+        self.store = job_store.SQLiteJobStore(":memory:")
+        for name, value in (("STORE", self.store), ("_active", {})):
+            patcher = patch.object(job_store, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TestRegistry(CancelTestCase):
+    """ジョブのレジストリと取り消しのテスト"""
+
+    def test_cancel_latest_or_by_id(self):
+        """ID省略時は最後のジョブを、ID指定時は先頭一致したジョブを取り消し、他のユーザーのジョブは取り消さないこと"""
+        first = job_store.start("develop", PAYLOAD)
+        second = job_store.start("design", PAYLOAD)
+        other = job_store.start("develop", dict(PAYLOAD, user_id="U2"))
+
+        self.assertEqual(job_store.cancel("U1"), second.id)
+        self.assertEqual(job_store.cancel("U1", first.id[:8]), first.id)
+        self.assertIsNone(job_store.cancel("U1", other.id[:8]))
+        self.assertTrue(first.cancelled and second.cancelled)
+        self.assertFalse(other.cancelled)
+        with self.assertRaises(job_store.JobCancelled):
+            first.raise_if_cancelled()
+
+    def test_finished_jobs_leave_registry(self):
+        job = job_store.start("develop", PAYLOAD)
+        self.assertEqual(job_store.active_jobs("U1"), [job])
+
+        job.finish(job_store.CANCELLED)
+
+        self.assertEqual(job_store.active_jobs(), [])
+        self.assertEqual(self.store.get(job.id).status, job_store.CANCELLED)
+        self.assertIsNone(job_store.cancel("U1"))
+
+    def test_cancel_queued_job(self):
+        """キューで待っているジョブは取り出される前に取り消し、ワーカーに渡さないこと"""
+        job = self.store.create("develop", PAYLOAD, owner=None, status=job_store.QUEUED)
+        self.store.create("develop", dict(PAYLOAD, user_id="U2"), owner=None, status=job_store.QUEUED)
+
+        self.assertIsNone(job_store.cancel("U3"))
+        self.assertEqual(job_store.cancel("U1", job.id[:8]), job.id)
+        self.assertEqual(self.store.get(job.id).status, job_store.CANCELLED)
+        self.assertEqual(self.store.claim_queued("worker").payload["user_id"], "U2")
+
+    def test_cancel_event_only_for_user_jobs(self):
+        """ユーザーのいるジョブの処理中だけ取り消しイベントを返すこと"""
+        job = job_store.start("develop", PAYLOAD)
+        anonymous = job_store.start("develop", {"text": "x"})
+
+        def current_event(target):
+            job_store.activate(target)
+            return job_store.cancel_event()
+
+        import contextvars
+        self.assertIs(contextvars.copy_context().run(current_event, job), job.cancel_event)
+        self.assertIsNone(contextvars.copy_context().run(current_event, anonymous))
+        self.assertIsNone(job_store.cancel_event())
+
+
+class FakeStream:
+    """client.messages.stream() の戻り値（イベントを返すたびに on_event を呼ぶ）"""
+
+    def __init__(self, events, on_event=None):
+        self.events = events
+        self.on_event = on_event or (lambda index: None)
+        self.closed = False
+        self.final = SimpleNamespace(content=[SimpleNamespace(text="done")], usage=None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed = True
+
+    def __iter__(self):
+        for index, event in enumerate(self.events):
+            yield event
+            self.on_event(index)
+
+    def get_final_message(self):
+        return self.final
+
+
+class TestStreamingAbort(unittest.TestCase):
+    """model_router のストリーミング中断のテスト"""
+
+    def test_aborts_stream_when_cancelled(self):
+        """取り消されたら残りのイベントを受信せずに接続を閉じ、JobCancelled を送出すること"""
+        cancel = threading.Event()
+        received = []
+        stream = FakeStream(range(100), on_event=lambda index: (received.append(index), index == 2 and cancel.set()))
+        client = Mock()
+        client.messages.stream.return_value = stream
+        before = metrics.LLM_ROUTE_CANCELLED.get(route="code_generation", model=model_router.route("code_generation").model)
+
+        with self.assertRaises(job_store.JobCancelled):
+            model_router.create_message(client, "code_generation", [{"role": "user", "content": "x"}], cancel=cancel)
+
+        self.assertTrue(stream.closed)
+        self.assertEqual(received, [0, 1, 2])
+        client.messages.create.assert_not_called()
+        self.assertEqual(
+            metrics.LLM_ROUTE_CANCELLED.get(route="code_generation", model=model_router.route("code_generation").model),
+            before + 1,
+        )
+
+    def test_returns_final_message(self):
+        client = Mock()
+        client.messages.stream.return_value = FakeStream(range(3))
+
+        response = model_router.create_message(
+            client, "code_generation", [{"role": "user", "content": "x"}], cancel=threading.Event()
+        )
+
+        self.assertEqual(response.content[0].text, "done")
+
+    def test_cancelled_before_call(self):
+        cancel = threading.Event()
+        cancel.set()
+        client = Mock()
+
+        with self.assertRaises(job_store.JobCancelled):
+            model_router.create_message(client, "code_generation", [{"role": "user", "content": "x"}], cancel=cancel)
+
+        client.messages.stream.assert_not_called()
+
+
+class TestCancelCommand(CancelTestCase):
+    """/cancel コマンドと処理関数のテスト"""
+
+    def test_develop_stops_before_generation(self):
+        """取り消されたジョブはコード生成とPR作成に進まず、取り消したことを通知すること"""
+        import aibot
+
+        job = job_store.start("develop", PAYLOAD)
+        job.checkpoint("parsed", {"repo_name": "owner/repo", "file_path": "a.py", "instruction": "修正"})
+        job.checkpoint("fetched", {"current_code": "old", "related": "", "base_sha": "abc"})
+        job.cancel()
+
+        with patch("aibot.anthropic_client") as client, patch("aibot.create_github_pr") as create_pr, \
+             patch("requests.post") as post:
+            aibot.process_development_task(dict(PAYLOAD), PAYLOAD["response_url"], job)
+
+        client.messages.stream.assert_not_called()
+        client.messages.create.assert_not_called()
+        create_pr.assert_not_called()
+        self.assertEqual(self.store.get(job.id).status, job_store.CANCELLED)
+        self.assertIn("取り消しました", post.call_args.kwargs["json"]["text"])
+        self.assertEqual(job_store.active_jobs(), [])
+
+    def test_cancel_command(self):
+        """自分のジョブを取り消し、見つからない場合はその旨を返すこと"""
+        import aibot
+
+        job = job_store.start("develop", PAYLOAD)
+        ack = Mock()
+        with patch("aibot.record_command"):
+            aibot.COMMAND_HANDLERS["cancel"](ack, {"text": "", "user_id": "U1"}, Mock())
+            aibot.COMMAND_HANDLERS["cancel"](ack, {"text": "", "user_id": "U1"}, Mock())
+
+        self.assertTrue(job.cancelled)
+        messages = [call.args[0] for call in ack.call_args_list]
+        self.assertIn(job.id[:8], messages[0])
+        self.assertIn("見つかりませんでした", messages[1])
+
+    def test_ack_shows_cancel_hint(self):
+        """受け付け時の ack にジョブIDと /cancel の使い方を含めること"""
+        import aibot
+
+        ack = Mock()
+        with patch("aibot.SCHEDULER", MagicMock(**{"check_rate.return_value": 0, "submit.return_value": 0})):
+            aibot.accept_task(ack, "develop", dict(PAYLOAD), "受け付けました")
+
+        job = job_store.active_jobs("U1")[0]
+        self.assertIn(f"/{aibot.COMMAND_PREFIX}cancel {job.id[:8]}", ack.call_args.args[0])
+
+
+class TestMcpCommands(CancelTestCase):
+    """MCP版コマンドのレート制限・ジョブ登録・取り消しのテスト"""
+
+    def test_rate_limited_and_registered(self):
+        """レート制限を確認し、受け付けたコマンドは永続化しないジョブとして登録すること"""
+        import aibot
+
+        ack = Mock()
+        fair = MagicMock(**{"check_rate.side_effect": [0, 30]})
+        with patch("aibot.SCHEDULER", fair), patch("aibot.run_async_safely", return_value=MagicMock()) as run, \
+             patch("aibot.record_command"):
+            aibot.COMMAND_HANDLERS["design-mcp"](ack, dict(PAYLOAD), Mock())
+            aibot.COMMAND_HANDLERS["develop-from-design-mcp"](ack, dict(PAYLOAD), Mock())
+        run.call_args.args[0].close()
+
+        self.assertEqual(run.call_count, 1)
+        [job] = job_store.active_jobs("U1")
+        self.assertEqual(job.kind, "design_mcp")
+        self.assertIsNone(self.store.get(job.id))
+        messages = [call.args[0] for call in ack.call_args_list]
+        self.assertIn(f"cancel {job.id[:8]}", messages[0])
+        self.assertIn("秒後に再度お試しください", messages[1])
+        fair.submit.assert_not_called()
+
+    def test_cancelled_before_generation(self):
+        """取り消したMCP版のジョブは生成を始めずに終了すること"""
+        import aibot
+        import async_runtime
+
+        job = job_store.start("design_mcp", PAYLOAD, persist=False)
+        job.cancel()
+        mcp = MagicMock()
+        with patch("aibot.MCP_AVAILABLE", True), patch("aibot.mcp", mcp), patch("requests.post") as post:
+            async_runtime.run(aibot.process_design_task_mcp({"text": "app の 認証 について JWT"}, PAYLOAD["response_url"], job))
+
+        mcp.generate_design_document_mcp.assert_not_called()
+        self.assertEqual(job.status, job_store.CANCELLED)
+        self.assertIn("取り消しました", post.call_args.kwargs["json"]["text"])
+        self.assertEqual(job_store.active_jobs(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
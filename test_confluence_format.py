@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Confluence storage format tests
+Markdown から Confluence ストレージ形式への変換とベンチマークのテスト
+"""
+
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import atlassian
+
+import bench_confluence_format
+import confluence_format
+import design_chunker
+
+
+class TestToStorage(unittest.TestCase):
+    """to_storage() のテスト"""
+
+    def test_code_block_macro(self):
+        """コードブロックが言語付きの code マクロになり、本文はエスケープせずに CDATA に入ること"""
+        storage = confluence_format.to_storage('```python\nif a < b:\n    print("]]>")\n```\n\n    indented\n')
+
+        self.assertIn('<ac:parameter ac:name="language">python</ac:parameter>', storage)
+        self.assertIn('<![CDATA[if a < b:\n    print("]]]]><![CDATA[>")]]>', storage)
+        self.assertIn("<![CDATA[indented]]>", storage)
+        self.assertNotIn("<pre>", storage)
+
+    def test_table_without_thead(self):
+        storage = confluence_format.to_storage("| 項目 | 値 |\n|---|---|\n| a | 1 |\n")
+
+        self.assertNotIn("<thead>", storage)
+        self.assertRegex(storage, r"<table>\s*<tbody>\s*<tr>\s*<th>項目</th>")
+        self.assertIn("<td>1</td>", storage)
+
+    def test_toc_macro(self):
+        """[TOC] の行と toc=True が目次マクロになること（コードブロック内の [TOC] はそのまま）"""
+        storage = confluence_format.to_storage("# A\n\n[TOC]\n\n## B\n\n```\n[TOC]\n```\n")
+
+        self.assertEqual(storage.count(confluence_format.TOC_MACRO), 1)
+        self.assertNotIn(f"<p>{confluence_format.TOC_MACRO}</p>", storage)
+        self.assertIn("<![CDATA[[TOC]]]>", storage)
+        self.assertTrue(confluence_format.to_storage("# A", toc=True).startswith(confluence_format.TOC_MACRO))
+
+    def test_state_reset_between_documents(self):
+        """前の文書の参照リンク定義が次の文書に残らないこと"""
+        first = confluence_format.to_storage("[設計][ref]\n\n[ref]: https://example.com/design\n")
+        second = confluence_format.to_storage("[設計][ref]\n")
+
+        self.assertIn('href="https://example.com/design"', first)
+        self.assertNotIn("href", second)
+
+    def test_concurrent_conversions(self):
+        """共有のインスタンスを複数スレッドから使っても文書が混ざらないこと"""
+        results = {}
+
+        def convert(index):
+            results[index] = confluence_format.to_storage(f"# 文書{index}\n\n" + "本文\n\n" * 50)
+
+        threads = [threading.Thread(target=convert, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for index, storage in results.items():
+            self.assertIn(f"<h1>文書{index}</h1>", storage)
+            self.assertEqual(storage.count("<h1>"), 1)
+
+    def test_round_trip_to_text(self):
+        """設計書の読み込み（storage_to_text）でマクロのパラメータが本文に混ざらないこと"""
+        text = design_chunker.storage_to_text(confluence_format.to_storage("## API\n\n```python\nx = 1\n```\n"))
+
+        self.assertEqual(text, "## API\nx = 1")
+
+
+class TestCreatePage(unittest.TestCase):
+    """create_confluence_page のテスト"""
+
+    def test_creates_page_with_storage_format(self):
+        import aibot
+
+        client = MagicMock()
+        client.get_page_by_title.return_value = None
+        client.create_page.return_value = {"id": "42"}
+        with patch("aibot.CONFLUENCE_ENABLED", True), patch("aibot.confluence_client", client):
+            url = aibot.create_confluence_page("DEV", "設計書", "# 設計\n\n```js\nx\n```\n", parent_id="7")
+
+        self.assertTrue(url.endswith("pageId=42"))
+        kwargs = client.create_page.call_args.kwargs
+        self.assertEqual((kwargs["space"], kwargs["parent_id"], kwargs["representation"]), ("DEV", "7", "storage"))
+        self.assertIn('ac:name="code"', kwargs["body"])
+
+
+def existing_page(content, version=3):
+    """get_page_by_title(expand="body.storage,version") の戻り値"""
+    return {"id": "42", "version": {"number": version}, "body": {"storage": {"value": confluence_format.to_storage(content)}}}
+
+
+class TestUpsert(unittest.TestCase):
+    """upsert_page() / write_page() のテスト"""
+
+    DOC = "# 設計\n\n## 概要\n\n概要です。\n\n## API\n\n```python\nx = 1\n```\n"
+
+    def test_changed_sections(self):
+        """変更・追加されたセクションの見出しだけを返すこと"""
+        new = self.DOC.replace("x = 1", "x = 2") + "\n## 追加\n\n追記\n"
+
+        self.assertEqual(confluence_format.changed_sections(confluence_format.to_storage(self.DOC),
+                                                            confluence_format.to_storage(self.DOC)), [])
+        self.assertEqual(confluence_format.changed_sections(confluence_format.to_storage(self.DOC),
+                                                            confluence_format.to_storage(new)), ["API", "追加"])
+
+    def test_creates_when_missing(self):
+        client = MagicMock()
+        client.get_page_by_title.return_value = None
+        client.create_page.return_value = {"id": "42"}
+
+        page = confluence_format.write_page(client, "DEV", "設計書", self.DOC, parent_id="7")
+
+        self.assertEqual((page.page_id, page.action), ("42", "created"))
+        client.put.assert_not_called()
+
+    def test_unchanged_page_is_not_written(self):
+        client = MagicMock()
+        client.get_page_by_title.return_value = existing_page(self.DOC)
+
+        page = confluence_format.write_page(client, "DEV", "設計書", self.DOC)
+
+        self.assertEqual((page.action, page.version), ("unchanged", 3))
+        client.create_page.assert_not_called()
+        client.put.assert_not_called()
+
+    def test_updates_with_next_version(self):
+        """変更があれば次のバージョン番号で更新し、変更したセクションを版のメッセージに残すこと"""
+        client = MagicMock()
+        client.get_page_by_title.return_value = existing_page(self.DOC)
+
+        page = confluence_format.write_page(client, "DEV", "設計書", self.DOC.replace("概要です。", "改訂しました。"), "7")
+
+        self.assertEqual((page.action, page.version, page.changed_sections), ("updated", 4, ["概要"]))
+        path, data = client.put.call_args.args[0], client.put.call_args.kwargs["data"]
+        self.assertEqual(path, "rest/api/content/42")
+        self.assertEqual(data["version"]["number"], 4)
+        self.assertIn("概要", data["version"]["message"])
+        self.assertEqual(data["ancestors"], [{"type": "page", "id": "7"}])
+        self.assertIn("改訂しました。", data["body"]["storage"]["value"])
+
+    def test_retries_after_conflict(self):
+        """409 の場合は読み直し、他の人が更新したバージョンの次の番号で書き込むこと"""
+        conflict = Exception("Version must be incremented")
+        conflict.response = SimpleNamespace(status_code=409)
+        client = MagicMock()
+        client.get_page_by_title.side_effect = [existing_page(self.DOC), existing_page(self.DOC + "\n追記\n", version=4)]
+        client.put.side_effect = [conflict, {"id": "42"}]
+
+        page = confluence_format.write_page(client, "DEV", "設計書", self.DOC.replace("x = 1", "x = 2"))
+
+        self.assertEqual((page.action, page.version), ("updated", 5))
+        self.assertEqual(client.put.call_args.kwargs["data"]["version"]["number"], 5)
+
+    def test_upsert_disabled(self):
+        client = MagicMock()
+        client.create_page.return_value = {"id": "43"}
+
+        with patch.dict("os.environ", {"CONFLUENCE_UPSERT": "false"}):
+            page = confluence_format.write_page(client, "DEV", "設計書", self.DOC)
+
+        self.assertEqual((page.page_id, page.action), ("43", "created"))
+        client.get_page_by_title.assert_not_called()
+
+
+class TestUpsertWithClient(unittest.TestCase):
+    """requirements.txt で指定した atlassian-python-api 3.x の Confluence クライアントと偽サーバーでの upsert のテスト"""
+
+    def test_search_results_shape(self):
+        """get_page_by_title が検索結果（{"results": [...]}）を返すクライアントでも既存のページを見つけること"""
+        client = MagicMock()
+        client.get_page_by_title.return_value = {"results": [existing_page(TestUpsert.DOC)], "size": 1}
+
+        page = confluence_format.write_page(client, "DEV", "設計書", TestUpsert.DOC)
+
+        self.assertEqual((page.page_id, page.action), ("42", "unchanged"))
+        client.get_page_by_title.return_value = {"results": [], "size": 0}
+        client.create_page.return_value = {"id": "43"}
+        self.assertEqual(confluence_format.write_page(client, "DEV", "新規", TestUpsert.DOC).action, "created")
+
+    @unittest.skipUnless(hasattr(atlassian.Confluence, "create_page"), "atlassian-python-api 3.x が必要")
+    def test_create_update_unchanged(self):
+        from bench_fakes import FakeConfig, FakeServers
+
+        with FakeServers(FakeConfig(confluence_latency=0)) as fakes:
+            client = atlassian.Confluence(url=f"{fakes.confluence.url}/wiki", username="u", password="p", cloud=True)
+            created = confluence_format.write_page(client, "DEV", "設計書", TestUpsert.DOC)
+            unchanged = confluence_format.write_page(client, "DEV", "設計書", TestUpsert.DOC)
+            updated = confluence_format.write_page(client, "DEV", "設計書", TestUpsert.DOC.replace("x = 1", "x = 2"))
+            stored = fakes.confluence.pages[created.page_id]
+
+        self.assertEqual([created.action, unchanged.action, updated.action], ["created", "unchanged", "updated"])
+        self.assertEqual(updated.page_id, created.page_id)
+        self.assertEqual((updated.version, updated.changed_sections), (2, ["API"]))
+        self.assertEqual(stored["version"]["number"], 2)
+        self.assertIn("x = 2", stored["body"]["storage"]["value"])
+
+
+class TestBenchmark(unittest.TestCase):
+    """ベンチマークの集計のテスト"""
+
+    def test_run_benchmark(self):
+        report = bench_confluence_format.run_benchmark(iterations=2, sections=2)
+
+        self.assertEqual(set(report["results"]), {"per_call", "shared"})
+        self.assertGreater(report["document_bytes"], 500)
+        self.assertGreater(report["speedup"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
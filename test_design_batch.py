@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Design batch tests
+/design-batch による複数機能の設計ドキュメントの並行作成のテスト
+"""
+
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import job_store
+
+TEXT = "my-app の ユーザー認証、通知: メールとSlack、検索 について 共通の要件"
+PAYLOAD = {"text": TEXT, "user_id": "U1", "channel_id": "C1", "response_url": "https://hooks.slack.com/test"}
+
+
+class TestParse(unittest.TestCase):
+    """parse_design_batch() のテスト"""
+
+    def test_features_and_requirements(self):
+        import aibot
+
+        project_name, features, requirements = aibot.parse_design_batch(TEXT)
+
+        self.assertEqual(project_name, "my-app")
+        self.assertEqual([feature["feature_name"] for feature in features], ["ユーザー認証", "通知", "検索"])
+        self.assertEqual(features[1]["requirements"], "メールとSlack")
+        self.assertEqual(requirements, "共通の要件")
+
+    def test_invalid(self):
+        import aibot
+
+        self.assertIsNone(aibot.parse_design_batch("my-app ユーザー認証"))
+        self.assertIsNone(aibot.parse_design_batch("my-app の 、 について 要件"))
+
+    def test_concurrency_within_gateway_limit(self):
+        """同時に生成する件数はゲートウェイのモデルごとの同時実行数を超えないこと"""
+        import aibot
+
+        gateway = SimpleNamespace(model_concurrency=4, max_concurrency=8)
+        with patch("anthropic_gateway.GATEWAY", gateway), patch.dict("os.environ", {"DESIGN_BATCH_CONCURRENCY": "16"}):
+            self.assertEqual(aibot.design_batch_concurrency(10), 4)
+            self.assertEqual(aibot.design_batch_concurrency(2), 2)
+
+
+class TestProcess(unittest.TestCase):
+    """process_design_batch_task() のテスト"""
+
+    def setUp(self):
+        import aibot
+
+        self.aibot = aibot
+        self.store = job_store.SQLiteJobStore(":memory:")
+        self.client = MagicMock()
+        self.client.get_page_by_title.return_value = None
+        self.client.create_page.return_value = {"id": "900"}
+        self.create_page = MagicMock(side_effect=lambda space, title, content, parent_id=None: f"https://wiki/{title}")
+        for patcher in (
+            patch.object(job_store, "STORE", self.store),
+            patch.object(job_store, "_active", {}),
+            patch("aibot.CONFLUENCE_ENABLED", True),
+            patch("aibot.confluence_client", self.client),
+            patch("aibot.create_confluence_page", self.create_page),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_batch(self, generate, job=None):
+        with patch("aibot.generate_design_document", side_effect=generate), patch("requests.post") as post:
+            self.aibot.process_design_batch_task(dict(PAYLOAD), PAYLOAD["response_url"], job)
+        return [call.kwargs["json"]["text"] for call in post.call_args_list]
+
+    def test_generates_concurrently_under_parent(self):
+        """3件を同時に生成し、すべて親ページの下に作成して、結果を1回だけ通知すること"""
+        barrier = threading.Barrier(3, timeout=5)
+
+        def generate(project_name, feature_name, requirements):
+            barrier.wait()  # 3件が同時に生成中でなければタイムアウトする
+            return f"# {feature_name} 設計書\n\n{requirements}"
+
+        messages = self.run_batch(generate)
+
+        self.assertEqual(self.client.create_page.call_args.kwargs["title"], "my-app 設計書一覧")
+        self.assertEqual({call.kwargs["parent_id"] for call in self.create_page.call_args_list}, {"900"})
+        self.assertEqual(len(messages), 2)
+        summary = messages[-1]
+        self.assertTrue(summary.startswith("✅"))
+        self.assertIn("3/3件", summary)
+        self.assertIn("https://wiki/my-app - 通知 設計書", summary)
+        self.assertIn("pageId=900", summary)
+        contents = {call.args[1]: call.args[2] for call in self.create_page.call_args_list}
+        self.assertIn("共通の要件\nメールとSlack", contents["my-app - 通知 設計書"])
+
+    def test_partial_failure(self):
+        """失敗した機能があっても他の設計書は作成し、まとめて通知すること"""
+        def generate(project_name, feature_name, requirements):
+            if feature_name == "検索":
+                raise RuntimeError("boom")
+            return "# 設計書"
+
+        messages = self.run_batch(generate)
+
+        self.assertTrue(messages[-1].startswith("⚠️"))
+        self.assertIn("2/3件", messages[-1])
+        self.assertIn("検索: ❌ boom", messages[-1])
+        self.assertEqual(self.create_page.call_count, 2)
+
+    def test_generation_error_not_published(self):
+        """生成に失敗した機能はエラーの文言をページにせず、失敗として数えること"""
+        import anthropic
+        import metrics
+
+        before = metrics.DESIGN_BATCH_ITEMS.get(status="failed")
+        with patch("model_router.create_message", side_effect=anthropic.AnthropicError("overloaded")), \
+             patch("requests.post") as post:
+            self.aibot.process_design_batch_task(dict(PAYLOAD), PAYLOAD["response_url"])
+
+        self.create_page.assert_not_called()
+        summary = post.call_args.kwargs["json"]["text"]
+        self.assertTrue(summary.startswith("❌"))
+        self.assertIn("作成できませんでした", summary)
+        self.assertIn("0/3件", summary)
+        self.assertIn("通知: ❌ overloaded", summary)
+        self.assertEqual(metrics.DESIGN_BATCH_ITEMS.get(status="failed"), before + 3)
+
+    def test_resume_skips_created_pages(self):
+        """再開時は作成済みの機能と親ページを作り直さないこと"""
+        import aibot
+
+        job = job_store.start("design_batch", PAYLOAD)
+        job.checkpoint("parsed", dict(zip(("project_name", "features", "requirements"), aibot.parse_design_batch(TEXT))))
+        job.checkpoint("parent", {"page_id": "900", "page_url": "https://wiki/parent"})
+        job.checkpoint("page:0", {"page_url": "https://wiki/auth"})
+        generated = []
+
+        messages = self.run_batch(lambda project_name, feature_name, requirements: generated.append(feature_name) or "#", job)
+
+        self.assertEqual(sorted(generated), ["検索", "通知"])
+        self.client.create_page.assert_not_called()
+        self.assertIn("https://wiki/auth", messages[-1])
+        self.assertEqual(self.store.get(job.id).status, job_store.DONE)
+
+    def test_cancelled(self):
+        job = job_store.start("design_batch", PAYLOAD)
+        job.cancel()
+
+        messages = self.run_batch(lambda *args: "#", job)
+
+        self.create_page.assert_not_called()
+        self.assertIn("取り消しました", messages[-1])
+        self.assertEqual(self.store.get(job.id).status, job_store.CANCELLED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Design chunker tests
+設計書のセクション分割とコンテキスト圧縮のテスト
+"""
+
+import unittest
+from unittest.mock import patch
+
+import design_chunker
+
+
+def _design_document(padding=200):
+    filler = "この処理の詳細な説明です。" * padding
+    return (
+        "# 概要\nユーザー管理機能を追加する。\n\n"
+        "## API設計\nPOST /users でユーザーを登録する。\n\n"
+        f"## 画面設計\n{filler}\n\n"
+        f"## 運用手順\n{filler}\n\n"
+        "## 参考資料\n社内Wikiを参照。\n"
+    )
+
+
+class TestSplitSections(unittest.TestCase):
+    """セクション分割のテスト"""
+
+    def test_storage_format_keeps_headings(self):
+        """ストレージ形式の見出しがMarkdown形式で残ること"""
+        text = design_chunker.storage_to_text("<h1>概要</h1><p>本文</p><h2>詳細</h2><ul><li>項目</li></ul>")
+
+        self.assertIn("# 概要", text)
+        self.assertIn("## 詳細", text)
+        self.assertIn("項目", text)
+
+    def test_split_html_and_markdown(self):
+        """HTMLとMarkdownのどちらでも同じセクションに分割されること"""
+        html = "<p>前書き</p><h1>概要</h1><p>本文</p><h2>API設計</h2><p>エンドポイント</p>"
+        markdown = "前書き\n# 概要\n本文\n## API設計\nエンドポイント\n"
+
+        for content in (html, markdown):
+            sections = design_chunker.split_sections(content)
+            self.assertEqual([(s.title, s.level) for s in sections], [("", 0), ("概要", 1), ("API設計", 2)])
+            self.assertEqual(sections[2].text, "エンドポイント")
+
+    def test_target_keywords(self):
+        """ファイルパス・拡張子・追加要件からキーワードが作られること"""
+        keywords = design_chunker.target_keywords("src/user_service.py", "バリデーションを追加")
+
+        self.assertIn("user", keywords)
+        self.assertIn("service", keywords)
+        self.assertIn("api", keywords)
+        self.assertIn("バリデーション", keywords)
+        self.assertNotIn("src", keywords)
+
+
+class TestBuildDesignContext(unittest.TestCase):
+    """コンテキスト圧縮のテスト"""
+
+    def test_small_document_unchanged(self):
+        """予算内の設計書はそのまま使うこと"""
+        content = "# 概要\n小さな設計書\n"
+        context = design_chunker.build_design_context(content, "app.py", budget=1000)
+
+        self.assertEqual(context.text, content)
+        self.assertEqual(context.summarized_sections, [])
+
+    def test_relevant_sections_full_and_others_summarized(self):
+        """関連セクションは全文、それ以外は要約されること"""
+        summarized = []
+
+        def summarize(section):
+            summarized.append(section.title)
+            return f"{section.title}の要約"
+
+        context = design_chunker.build_design_context(
+            _design_document(), "src/api/users.py", summarize=summarize, budget=1000
+        )
+
+        self.assertIn("POST /users", context.text)
+        self.assertIn("（要約）画面設計の要約", context.text)
+        self.assertIn("（要約）運用手順の要約", context.text)
+        self.assertEqual(sorted(summarized), ["画面設計", "運用手順"])
+        self.assertIn("API設計", context.full_sections)
+        self.assertLess(context.context_tokens, context.original_tokens)
+
+    def test_summarize_failure_falls_back_to_excerpt(self):
+        """要約に失敗したセクションは抜粋になること"""
+        def summarize(section):
+            raise RuntimeError("API error")
+
+        context = design_chunker.build_design_context(
+            _design_document(), "src/api/users.py", summarize=summarize, budget=1000
+        )
+
+        self.assertIn("## 画面設計\n（要約）この処理の詳細な説明です。", context.text)
+        self.assertIn("…", context.text)
+        self.assertLessEqual(context.context_tokens, 1000)
+
+
+
+class TestBuildDesignCodePrompt(unittest.TestCase):
+    """aibot.build_design_code_prompt() のテスト"""
+
+    def test_prompt_contains_compressed_context(self):
+        """圧縮した設計書・実装対象ファイル・追加要件をプロンプトに含めること"""
+        import aibot
+
+        with patch.dict("os.environ", {"DESIGN_CONTEXT_BUDGET": "1000"}), \
+             patch("aibot.summarize_design_section", side_effect=lambda section: f"{section.title}の要約"):
+            prompt = aibot.build_design_code_prompt(_design_document(), "src/api/users.py", "バリデーションを追加")
+
+        self.assertIsInstance(prompt, str)
+        self.assertIn("POST /users", prompt)
+        self.assertIn("（要約）画面設計の要約", prompt)
+        self.assertNotIn("この処理の詳細な説明です。" * 10, prompt)
+        self.assertIn("実装対象ファイル: src/api/users.py", prompt)
+        self.assertIn("追加要件: バリデーションを追加", prompt)
+
+
+if __name__ == "__main__":
+    unittest.main()
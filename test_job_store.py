@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Job store tests
+ジョブの永続化・チェックポイント・中断したジョブの再開のテスト
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from collections import deque
+from unittest.mock import MagicMock, Mock, patch
+
+import job_store
+
+OTHER_WORKER = "other-host:1:dead"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSQLiteJobStore(unittest.TestCase):
+    """SQLiteストアのテスト"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = job_store.SQLiteJobStore(":memory:", clock=self.clock)
+
+    def test_checkpoints_persisted(self):
+        """チェックポイントが保存され、読み直したジョブから取得できること"""
+        job = self.store.create("develop", {"text": "repo の a.py に 修正"}, owner=OTHER_WORKER)
+        job.checkpoint("parsed", {"repo_name": "repo", "file_path": "a.py"})
+        job.checkpoint("generated", {"new_code": "print('ok')"})
+
+        loaded = self.store.get(job.id)
+        self.assertEqual(loaded.payload["text"], "repo の a.py に 修正")
+        self.assertEqual(list(loaded.checkpoints), ["parsed", "generated"])
+        self.assertEqual(loaded.get("generated")["new_code"], "print('ok')")
+        self.assertIsNone(loaded.get("pr_created"))
+        self.assertFalse(loaded.resumed)
+
+    def test_claim_after_lease_expired(self):
+        """更新が途絶えたジョブだけが引き取られ、試行回数が増えること"""
+        job = self.store.create("develop", {}, owner=OTHER_WORKER)
+        done = self.store.create("design", {}, owner=OTHER_WORKER)
+        done.finish()
+
+        self.assertEqual(self.store.claim_stale("me", lease_seconds=60), [])
+        self.clock.now += 61
+        claimed = self.store.claim_stale("me", lease_seconds=60)
+
+        self.assertEqual([item.id for item in claimed], [job.id])
+        self.assertTrue(claimed[0].resumed)
+        self.assertEqual(self.store.claim_stale("me", lease_seconds=60), [])
+
+    def test_claim_when_owner_process_gone(self):
+        """同じホストの所有者プロセスが終了していれば期限前でも引き取ること"""
+        host = job_store.WORKER_ID.split(":")[0]
+        alive = self.store.create("develop", {}, owner=f"{host}:{os.getpid()}:x")
+        dead = self.store.create("develop", {}, owner=f"{host}:99999999:x")
+
+        claimed = self.store.claim_stale("me", lease_seconds=600)
+
+        self.assertEqual([item.id for item in claimed], [dead.id])
+        self.assertNotIn(alive.id, [item.id for item in claimed])
+
+    def test_purge_finished_jobs(self):
+        job = self.store.create("develop", {}, owner=OTHER_WORKER)
+        job.checkpoint("parsed", {})
+        job.fail("boom")
+        running = self.store.create("develop", {}, owner=OTHER_WORKER)
+        self.clock.now += 100
+
+        self.assertEqual(self.store.purge(50), 1)
+        self.assertIsNone(self.store.get(job.id))
+        self.assertIsNotNone(self.store.get(running.id))
+
+
+class TestConcurrentClaim(unittest.TestCase):
+    """複数ワーカーからの同時引き取りのテスト"""
+
+    def test_each_job_claimed_once(self):
+        """同じファイルを共有するワーカーが同時に引き取っても重複しないこと"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "jobs.sqlite3")
+            clock = FakeClock()
+            job_ids = {job_store.SQLiteJobStore(path, clock=clock).create("develop", {}, owner=OTHER_WORKER).id
+                       for _ in range(20)}
+            clock.now += 1000
+            workers = [job_store.SQLiteJobStore(path, clock=clock) for _ in range(4)]
+            claimed = []
+            barrier = threading.Barrier(len(workers))
+
+            def claim(index, store):
+                barrier.wait()
+                claimed.extend(job.id for job in store.claim_stale(f"worker-{index}", lease_seconds=60))
+
+            threads = [threading.Thread(target=claim, args=item) for item in enumerate(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sorted(claimed), sorted(job_ids))
+
+
+class TestResume(unittest.TestCase):
+    """再開処理のテスト"""
+
+    def setUp(self):
+        self.store = job_store.SQLiteJobStore(":memory:")
+        patcher = patch.object(job_store, "STORE", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_resume_dispatches_by_kind(self):
+        """種類ごとのハンドラーに渡し、未対応の種類は失敗として終了すること"""
+        develop = self.store.create("develop", {"text": "x"}, owner=OTHER_WORKER)
+        unknown = self.store.create("unknown", {}, owner=OTHER_WORKER)
+        handler = MagicMock()
+
+        jobs = job_store.resume_stale({"develop": handler}, lease_seconds=0)
+
+        self.assertEqual(len(jobs), 2)
+        handler.assert_called_once()
+        self.assertEqual(handler.call_args.args[0].id, develop.id)
+        self.assertEqual(self.store.get(unknown.id).status, job_store.FAILED)
+
+    def test_null_store(self):
+        """永続化しないストアでもジョブとして扱えること"""
+        job = job_store.NullJobStore().create("develop", {})
+        job.checkpoint("parsed", {"a": 1})
+        job.finish()
+
+        self.assertEqual(job.get("parsed"), {"a": 1})
+        self.assertEqual(job.status, job_store.DONE)
+
+    def test_develop_resumes_after_generation(self):
+        """生成済みのジョブはLLMを呼ばずにPR作成から再開すること"""
+        import aibot
+
+        job = self.store.create("develop", aibot.job_payload({"text": "owner/repo の a.py に 修正"}, "https://hooks.slack.com/test"),
+                                owner=OTHER_WORKER)
+        job.checkpoint("parsed", {"repo_name": "owner/repo", "file_path": "a.py", "instruction": "修正"})
+        job.checkpoint("fetched", {"current_code": "old", "related": "", "base_sha": "abc"})
+        job.checkpoint("generated", {"new_code": "new", "branch_name": "ai-dev/a-1"})
+        resumed = self.store.claim_stale("me", lease_seconds=0)[0]
+
+        with patch("aibot.anthropic_client") as client, \
+             patch("aibot.create_github_pr", return_value="https://github.com/owner/repo/pull/1") as create_pr, \
+             patch("requests.post") as post:
+            aibot.process_development_task(resumed.payload, resumed.payload["response_url"], resumed)
+
+        client.messages.create.assert_not_called()
+        self.assertEqual(create_pr.call_args.args[1], "ai-dev/a-1")
+        self.assertEqual(create_pr.call_args.kwargs["base_sha"], "abc")
+        self.assertIn("再開します", post.call_args_list[0].kwargs["json"]["text"])
+        stored = self.store.get(job.id)
+        self.assertEqual(stored.status, job_store.DONE)
+        self.assertEqual(stored.get("pr_created")["pr_url"], "https://github.com/owner/repo/pull/1")
+
+    def test_design_failure_not_checkpointed(self):
+        """設計書の生成に失敗した場合はチェックポイントを保存せず、ページも作成しないこと"""
+        import anthropic
+        import aibot
+
+        job = self.store.create("design", aibot.job_payload({"text": "app の 認証 について JWT"}, "https://hooks.slack.com/test"))
+        job.checkpoint("parsed", {"project_name": "app", "feature_name": "認証", "requirements": "JWT"})
+
+        with patch("aibot.CONFLUENCE_ENABLED", True), \
+             patch("model_router.create_message", side_effect=anthropic.AnthropicError("overloaded")), \
+             patch("aibot.create_confluence_page") as create_page, patch("requests.post") as post:
+            aibot.process_design_task(job.payload, job.payload["response_url"], job)
+
+        create_page.assert_not_called()
+        stored = self.store.get(job.id)
+        self.assertEqual(stored.status, job_store.FAILED)
+        self.assertIsNone(stored.get("design_doc"))
+        self.assertIn("エラーが発生しました", post.call_args.kwargs["json"]["text"])
+
+    def test_code_failure_not_checkpointed(self):
+        """設計ベースのコード生成に失敗した場合はチェックポイントを保存せず、コードとして表示しないこと"""
+        import anthropic
+        import aibot
+
+        job = self.store.create("develop_from_design", aibot.job_payload({"text": "https://wiki/pages/1 の auth.py に実装"}, "https://hooks.slack.com/test"))
+        job.checkpoint("design", {"content": "# 認証 設計書"})
+
+        with patch("aibot.CONFLUENCE_ENABLED", True), patch("aibot.CLIENTS_WARM", True), \
+             patch("model_router.create_message", side_effect=anthropic.AnthropicError("overloaded")), \
+             patch("requests.post") as post:
+            aibot.process_design_based_development_task(job.payload, job.payload["response_url"], job)
+
+        stored = self.store.get(job.id)
+        self.assertEqual(stored.status, job_store.FAILED)
+        self.assertIsNone(stored.get("generated"))
+        texts = [call.kwargs["json"]["text"] for call in post.call_args_list]
+        self.assertFalse(any("コード生成エラー" in text for text in texts))
+        self.assertIn("エラーが発生しました", texts[-1])
+
+
+class TestProgress(unittest.TestCase):
+    """進捗の記録と /status のテスト"""
+
+    def setUp(self):
+        self.store = job_store.SQLiteJobStore(":memory:")
+        for name, value in (("STORE", self.store), ("_active", {}), ("_recent", deque(maxlen=10))):
+            patcher = patch.object(job_store, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_progress_persisted(self):
+        """ステージごとの所要時間・トークン数・リンクが記録され、読み直したジョブから取得できること"""
+        job = job_store.activate(job_store.start("develop", {"text": "x", "user_id": "U1"}))
+        job.checkpoint("parsed", {})
+        job.add_usage(100, 50, 0.01)
+        job.add_usage(10, 5, 0.001)
+        job.checkpoint("pr_created", {"pr_url": "https://github.com/o/r/pull/1"})
+        job.add_link("PR", "https://github.com/o/r/pull/1")
+        job.finish()
+
+        stored = self.store.get(job.id)
+        self.assertEqual(stored.stage, "pr_created")
+        self.assertEqual(list(stored.progress["stages"]), ["parsed", "pr_created"])
+        self.assertEqual(stored.progress["usage"], {"input_tokens": 110, "output_tokens": 55, "cost_usd": 0.011})
+        self.assertEqual(stored.progress["links"], {"PR": "https://github.com/o/r/pull/1"})
+        self.assertIn("finished_at", stored.progress)
+
+    def test_jobs_for_user(self):
+        """このプロセスのジョブとストアのジョブを新しい順にまとめ、他のユーザーのジョブは含めないこと"""
+        done = job_store.start("develop", {"text": "a", "user_id": "U1"})
+        done.finish()
+        queued = self.store.create("design", {"text": "b", "user_id": "U1"}, owner=None, status=job_store.QUEUED)
+        running = job_store.start("develop", {"text": "c", "user_id": "U1"})
+        job_store.start("develop", {"text": "d", "user_id": "U2"})
+
+        jobs = job_store.jobs_for("U1")
+
+        self.assertEqual({job.id for job in jobs}, {done.id, queued.id, running.id})
+        self.assertIs(next(job for job in jobs if job.id == running.id), running)
+        self.assertEqual(jobs, sorted(jobs, key=lambda job: job.created_at, reverse=True))
+        self.assertEqual([item["status"] for item in job_store.snapshot()], ["waiting", "waiting"])
+
+    def test_old_schema_migrated(self):
+        """進捗の列がない以前のファイルも開けること"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "jobs.sqlite3")
+            conn = sqlite3.connect(path)
+            conn.executescript(job_store.SQLiteJobStore.SCHEMA.replace("progress TEXT,", ""))
+            conn.close()
+
+            store = job_store.SQLiteJobStore(path)
+            job = store.create("develop", {"text": "x"})
+            store.save_progress(job.id, {"stage": "parsed"})
+
+            self.assertEqual(store.get(job.id).stage, "parsed")
+
+    def test_status_command(self):
+        """/status が自分のジョブの状態・完了済みステージ・リンクを返すこと"""
+        import aibot
+
+        running = job_store.activate(job_store.start("develop", {"text": "owner/repo の a.py に 修正", "user_id": "U1"}))
+        running.checkpoint("fetched", {})
+        done = job_store.start("design", {"text": "app の 認証 について", "user_id": "U1"})
+        done.add_link("設計書", "https://example.atlassian.net/wiki/1")
+        done.finish()
+        ack = Mock()
+
+        with patch("aibot.record_command"):
+            aibot.COMMAND_HANDLERS["status"](ack, {"text": "", "user_id": "U1"}, Mock())
+            aibot.COMMAND_HANDLERS["status"](ack, {"text": "", "user_id": "U9"}, Mock())
+
+        text = ack.call_args_list[0].args[0]
+        self.assertIn(f"`{running.id[:8]}` 🔄 実行中", text)
+        self.assertIn("`fetched` まで完了", text)
+        self.assertIn("✅ 完了", text)
+        self.assertIn("<https://example.atlassian.net/wiki/1|設計書>", text)
+        self.assertEqual(ack.call_args_list[1].args[0], "最近のジョブはありません")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Lazy import layer tests
+遅延インポート層のテスト
+"""
+
+import sys
+import unittest
+from unittest.mock import Mock
+
+import lazy_imports
+from lazy_imports import LazyModule, LazyObject, lazy_import
+
+
+class TestLazyModule(unittest.TestCase):
+    """LazyModuleのテスト"""
+
+    def test_module_not_imported_until_attribute_access(self):
+        """属性アクセスまでインポートされないこと"""
+        sys.modules.pop("colorsys", None)
+        module = LazyModule("colorsys")
+
+        self.assertFalse(module.is_loaded)
+        self.assertNotIn("colorsys", sys.modules)
+
+        self.assertEqual(module.rgb_to_hsv(0, 0, 0), (0.0, 0.0, 0.0))
+        self.assertTrue(module.is_loaded)
+        self.assertIn("colorsys", sys.modules)
+
+    def test_lazy_import_returns_shared_proxy(self):
+        """同じモジュール名には同じプロキシが返ること"""
+        self.assertIs(lazy_import("json"), lazy_import("json"))
+
+    def test_exception_classes_usable_in_except(self):
+        """例外クラスをexcept節で参照できること"""
+        json_module = lazy_import("json")
+        with self.assertRaises(json_module.JSONDecodeError):
+            json_module.loads("{invalid")
+
+    def test_preload(self):
+        """preloadで登録済みモジュールが読み込まれること"""
+        module = lazy_import("textwrap")
+        timings = lazy_imports.preload(["textwrap", "not-registered"])
+
+        self.assertTrue(module.is_loaded)
+        self.assertIn("textwrap", timings)
+        self.assertNotIn("not-registered", timings)
+        self.assertTrue(lazy_imports.loaded_modules()["textwrap"])
+
+    def test_preload_skips_missing_modules(self):
+        """存在しないモジュールは警告のみでスキップされること"""
+        lazy_import("module_that_does_not_exist_xyz")
+        timings = lazy_imports.preload(["module_that_does_not_exist_xyz"])
+
+        self.assertEqual(timings, {})
+
+
+class TestLazyObject(unittest.TestCase):
+    """LazyObjectのテスト"""
+
+    def test_factory_called_once_on_first_use(self):
+        """最初の属性アクセスで一度だけファクトリが呼ばれること"""
+        client = Mock()
+        client.get_repo.return_value = "repo"
+        factory = Mock(return_value=client)
+
+        proxy = LazyObject(factory, "client")
+        factory.assert_not_called()
+        self.assertFalse(proxy.is_loaded)
+
+        self.assertEqual(proxy.get_repo("a/b"), "repo")
+        self.assertEqual(proxy.get_repo("a/b"), "repo")
+        factory.assert_called_once()
+        self.assertTrue(proxy.is_loaded)
+
+    def test_proxy_is_truthy_before_initialization(self):
+        """未初期化でも真偽値判定がTrueになること"""
+        factory = Mock()
+        self.assertTrue(LazyObject(factory))
+        factory.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Graceful shutdown tests
+終了処理（受付停止・実行中タスクの待機・ジョブの引き継ぎ・クライアントのクローズ）のテスト
+"""
+
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, Mock, patch
+
+import github
+
+import job_store
+import lifecycle
+import metrics
+
+
+class LifecycleTestCase(unittest.TestCase):
+    """終了処理の状態をテストごとに初期化する"""
+
+    def setUp(self):
+        self.store = job_store.SQLiteJobStore(":memory:")
+        for name, value in (
+            ("_stopping", threading.Event()),
+            ("_done", threading.Event()),
+            ("_stop_hooks", []),
+            ("_close_hooks", []),
+        ):
+            patcher = patch.object(lifecycle, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(job_store, "STORE", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestShutdown(LifecycleTestCase):
+    """shutdown() のテスト"""
+
+    def test_drains_tasks_in_order(self):
+        """受付停止 → 実行中タスクの完了待ち → クローズの順に処理すること"""
+        events = []
+        release = threading.Event()
+
+        def task():
+            with lifecycle.track("develop"):
+                release.wait(1)
+                events.append("task done")
+
+        thread = threading.Thread(target=task)
+        thread.start()
+        time.sleep(0.01)
+        self.assertEqual(lifecycle.in_flight(), {"develop": 1})
+        lifecycle.on_stop(lambda: (events.append("stop"), release.set()))
+        lifecycle.on_close(lambda: events.append("close"))
+
+        self.assertTrue(lifecycle.shutdown(timeout=2))
+        thread.join()
+
+        self.assertEqual(events, ["stop", "task done", "close"])
+        self.assertTrue(lifecycle.stopping())
+        self.assertEqual(lifecycle.in_flight(), {})
+
+    def test_unfinished_jobs_released(self):
+        """期限内に終わらなかったタスクを記録し、実行中のジョブを他のワーカーに引き継ぐこと"""
+        job = self.store.create("develop", {"text": "x"})
+        release = threading.Event()
+        before = metrics.SHUTDOWN_ABANDONED.get(kind="develop")
+
+        def task():
+            with lifecycle.track("develop"):
+                release.wait(2)
+
+        thread = threading.Thread(target=task)
+        thread.start()
+        time.sleep(0.01)
+        try:
+            self.assertFalse(lifecycle.shutdown(timeout=0.1))
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(metrics.SHUTDOWN_ABANDONED.get(kind="develop"), before + 1)
+        self.assertEqual([item.id for item in self.store.claim_stale("next-worker", lease_seconds=600)], [job.id])
+
+    def test_second_call_is_noop(self):
+        hook = Mock()
+        lifecycle.on_close(hook)
+
+        lifecycle.shutdown(timeout=0)
+        lifecycle.shutdown(timeout=0)
+
+        hook.assert_called_once()
+
+    def test_hook_errors_do_not_stop_shutdown(self):
+        lifecycle.on_close(Mock(side_effect=RuntimeError("boom")))
+        later = Mock()
+        lifecycle.on_close(later)
+
+        lifecycle.shutdown(timeout=0)
+
+        later.assert_called_once()
+
+
+class TestSignalHandler(LifecycleTestCase):
+    """SIGTERM ハンドラーのテスト"""
+
+    def test_chains_previous_handler(self):
+        """終了処理の後に元のハンドラー（gunicorn のワーカー終了）を呼ぶこと"""
+        previous = Mock()
+        with patch("signal.getsignal", return_value=previous), \
+             patch("signal.signal") as register, \
+             patch("atexit.register"), \
+             patch.object(lifecycle, "shutdown") as shutdown:
+            self.assertTrue(lifecycle.install_signal_handlers())
+            handler = register.call_args.args[1]
+            handler(15, None)
+
+        shutdown.assert_called_once()
+        previous.assert_called_once_with(15, None)
+
+    def test_not_main_thread(self):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(lifecycle.install_signal_handlers()))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(results, [False])
+
+
+class TestTaskHandOver(LifecycleTestCase):
+    """タスク側の協調的な中断とブランチの後始末のテスト"""
+
+    def test_develop_hands_over_before_generation(self):
+        """終了処理中はコード生成に進まず、ジョブを引き継ぐこと"""
+        import aibot
+
+        job = self.store.create("develop", aibot.job_payload({"text": "owner/repo の a.py に 修正"}, "https://hooks.slack.com/test"))
+        job.checkpoint("parsed", {"repo_name": "owner/repo", "file_path": "a.py", "instruction": "修正"})
+        job.checkpoint("fetched", {"current_code": "old", "related": "", "base_sha": "abc"})
+        lifecycle._stopping.set()
+
+        with patch("aibot.anthropic_client") as client, patch("requests.post") as post:
+            aibot.process_development_task(job.payload, job.payload["response_url"], job)
+
+        client.messages.create.assert_not_called()
+        self.assertEqual(job.status, job_store.RELEASED)
+        self.assertIn("再起動", post.call_args.kwargs["json"]["text"])
+        self.assertEqual(len(self.store.claim_stale("next-worker", lease_seconds=600)), 1)
+
+    def test_failed_pr_deletes_created_branch(self):
+        """PR作成に失敗した場合、作成したブランチを削除すること"""
+        import aibot
+
+        repo = MagicMock()
+        repo.get_contents.side_effect = github.GithubException(404, "not found", None)
+        repo.create_file.side_effect = github.GithubException(500, "error", None)
+        with patch("aibot.github_client") as client:
+            client.get_repo.return_value = repo
+            result = aibot.create_github_pr("owner/repo", "ai-dev/x", "a.py", "code", "msg", "title", base_sha="abc")
+
+        self.assertIsNone(result)
+        repo.get_git_ref.assert_called_once_with("heads/ai-dev/x")
+        repo.get_git_ref.return_value.delete.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Logging configuration tests
+ロギング設定のテスト
+"""
+
+import io
+import json
+import logging
+import logging.handlers
+import os
+import unittest
+from unittest.mock import patch
+
+import logging_config
+import tracing
+
+
+def _record(level=logging.INFO, msg="テスト", name="aibot"):
+    return logging.LogRecord(name, level, __file__, 1, msg, None, None)
+
+
+class TestFormatters(unittest.TestCase):
+    """JSONフォーマッタとフィルタのテスト"""
+
+    def test_json_formatter(self):
+        """Cloud Logging互換のJSONが出力されること"""
+        record = _record(logging.WARNING, "警告メッセージ")
+        record.trace_id = "abc"
+
+        entry = json.loads(logging_config.JsonFormatter().format(record))
+
+        self.assertEqual(entry["severity"], "WARNING")
+        self.assertEqual(entry["message"], "警告メッセージ")
+        self.assertEqual(entry["logger"], "aibot")
+        self.assertEqual(entry["trace_id"], "abc")
+
+    def test_sampling_filter(self):
+        """指定レベル以下のみ間引かれること"""
+        log_filter = logging_config.SamplingFilter(0.0, logging.DEBUG)
+
+        self.assertFalse(log_filter.filter(_record(logging.DEBUG)))
+        self.assertTrue(log_filter.filter(_record(logging.INFO)))
+
+    def test_sampling_filter_rate(self):
+        """サンプリング率に応じて通過すること"""
+        log_filter = logging_config.SamplingFilter(0.5)
+        with patch("logging_config.random.random", side_effect=[0.4, 0.6]):
+            self.assertTrue(log_filter.filter(_record(logging.DEBUG)))
+            self.assertFalse(log_filter.filter(_record(logging.DEBUG)))
+
+    def test_trace_context_filter(self):
+        """現在のトレースIDがレコードに付与されること"""
+        tracing.set_exporters([])
+        record = _record()
+        with tracing.start_trace("/develop") as root:
+            logging_config.TraceContextFilter().filter(record)
+
+        self.assertEqual(record.trace_id, root.trace_id)
+
+    def test_parse_logger_levels(self):
+        """ロガー別レベル指定の解析"""
+        levels = logging_config.parse_logger_levels("anthropic=info, httpx=ERROR,invalid,=DEBUG")
+
+        self.assertEqual(levels, {"anthropic": "INFO", "httpx": "ERROR"})
+
+
+class TestConfigureLogging(unittest.TestCase):
+    """configure_logging のテスト"""
+
+    def setUp(self):
+        self.root = logging.getLogger()
+        self.saved_handlers = list(self.root.handlers)
+        self.saved_level = self.root.level
+
+    def tearDown(self):
+        logging_config.shutdown_logging()
+        for handler in list(self.root.handlers):
+            self.root.removeHandler(handler)
+        for handler in self.saved_handlers:
+            self.root.addHandler(handler)
+        self.root.setLevel(self.saved_level)
+
+    def test_queue_handler_installed(self):
+        """デフォルトでQueueHandler経由の非同期出力になること"""
+        with patch.dict(os.environ, {"LOG_LEVELS": "httpx=ERROR"}, clear=False):
+            logging_config.configure_logging(force=True)
+
+        self.assertEqual(len(self.root.handlers), 1)
+        self.assertIsInstance(self.root.handlers[0], logging.handlers.QueueHandler)
+        self.assertEqual(logging.getLogger("anthropic").level, logging.WARNING)
+        self.assertEqual(logging.getLogger("httpx").level, logging.ERROR)
+
+    def test_json_output_through_queue(self):
+        """キュー経由でJSONログが出力されること"""
+        stream = io.StringIO()
+        env = {"LOG_FORMAT": "json", "LOG_LEVEL": "INFO"}
+        with patch.dict(os.environ, env, clear=False), patch("sys.stderr", stream):
+            logging_config.configure_logging(force=True)
+            logging.getLogger("aibot").info("構造化ログ")
+            logging_config.shutdown_logging()
+
+        entry = json.loads(stream.getvalue().strip().splitlines()[-1])
+        self.assertEqual(entry["message"], "構造化ログ")
+        self.assertEqual(entry["severity"], "INFO")
+
+    def test_existing_handlers_kept(self):
+        """既にハンドラーがある場合はレベルのみ適用されること"""
+        existing = logging.NullHandler()
+        for handler in list(self.root.handlers):
+            self.root.removeHandler(handler)
+        self.root.addHandler(existing)
+
+        with patch.object(logging_config, "_configured", False):
+            logging_config.configure_logging()
+
+        self.assertEqual(self.root.handlers, [existing])
+
+
+if __name__ == '__main__':
+    unittest.main()
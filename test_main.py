@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Cloud Run entrypoint tests
+main.py のHTTPエンドポイントのテスト
+"""
+
+import os
+import sys
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from slack_bolt import App
+from slack_bolt.adapter.flask import SlackRequestHandler
+from slack_bolt.authorization import AuthorizeResult
+from slack_sdk.signature import SignatureVerifier
+
+# ビルド時と同様にSlack Botのバックグラウンド起動を抑止してインポート
+with patch.dict(os.environ, {"GITHUB_ACTIONS": "true"}):
+    import main
+
+
+class TestReadiness(unittest.TestCase):
+    """/ready と /warmup のテスト"""
+
+    def setUp(self):
+        self.client = main.flask_app.test_client()
+        patcher = patch.dict(os.environ, {"WARMUP_TOKEN": "secret"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _connected_handler(self, connected=True):
+        handler = Mock()
+        handler.client.is_connected.return_value = connected
+        return handler
+
+    def test_health_always_ok(self):
+        """/health はプロセスが起動していれば200を返すこと"""
+        response = self.client.get("/health")
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_ready_before_slack_connection(self):
+        """Socket Mode未接続の間は503を返すこと"""
+        with patch.object(main, "slack_handler", None):
+            response = self.client.get("/ready")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.get_json()["slack"]["connected"])
+
+    def test_not_ready_until_clients_warm(self):
+        """接続済みでもクライアントが未ウォームアップなら503を返すこと"""
+        fake_aibot = Mock(CLIENTS_WARM=False)
+        with patch.object(main, "slack_handler", self._connected_handler()), \
+             patch.dict(sys.modules, {"aibot": fake_aibot}):
+            response = self.client.get("/ready")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response.get_json()["slack"]["connected"])
+        self.assertFalse(response.get_json()["clients_warm"])
+
+    def test_ready_when_connected_and_warm(self):
+        """接続済みかつウォームアップ済みなら200を返すこと"""
+        fake_aibot = Mock(CLIENTS_WARM=True)
+        with patch.object(main, "slack_handler", self._connected_handler()), \
+             patch.dict(sys.modules, {"aibot": fake_aibot}):
+            response = self.client.get("/ready")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["status"], "ready")
+
+    def test_not_ready_while_reconnecting(self):
+        """自動再接続中（切断中）は503を返すこと"""
+        fake_aibot = Mock(CLIENTS_WARM=True)
+        with patch.object(main, "slack_handler", self._connected_handler(False)), \
+             patch.dict(sys.modules, {"aibot": fake_aibot}):
+            response = self.client.get("/ready")
+
+        self.assertEqual(response.status_code, 503)
+
+    def test_warmup_runs_client_warmup(self):
+        """/warmup がクライアントのウォームアップ結果を返すこと"""
+        fake_aibot = Mock(CLIENTS_WARM=True)
+        fake_aibot.warm_up_clients.return_value = {"anthropic": {"ok": True}, "github": {"ok": True}}
+        with patch.dict(sys.modules, {"aibot": fake_aibot}):
+            response = self.client.post("/warmup", headers={"Authorization": "Bearer secret"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["status"], "warm")
+        fake_aibot.warm_up_clients.assert_called_once()
+
+    def test_warmup_degraded(self):
+        """ウォームアップに失敗したコンポーネントがあれば503を返すこと"""
+        fake_aibot = Mock(CLIENTS_WARM=False)
+        fake_aibot.warm_up_clients.return_value = {"anthropic": {"ok": False, "error": "timeout"}}
+        with patch.dict(sys.modules, {"aibot": fake_aibot}):
+            response = self.client.post("/warmup", headers={"Authorization": "Bearer secret"})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()["status"], "degraded")
+
+    def test_warmup_requires_token(self):
+        """トークンが一致しない・未設定の場合と GET は、ウォームアップを実行せずに拒否すること"""
+        fake_aibot = Mock(CLIENTS_WARM=True)
+        with patch.dict(sys.modules, {"aibot": fake_aibot}):
+            self.assertEqual(self.client.post("/warmup").status_code, 401)
+            self.assertEqual(self.client.post("/warmup", headers={"Authorization": "Bearer wrong"}).status_code, 401)
+            self.assertEqual(self.client.get("/warmup", headers={"Authorization": "Bearer secret"}).status_code, 405)
+            with patch.dict(os.environ, {"WARMUP_TOKEN": ""}):
+                self.assertEqual(self.client.post("/warmup", headers={"Authorization": "Bearer "}).status_code, 401)
+
+        fake_aibot.warm_up_clients.assert_not_called()
+
+
+class TestWarmUpRetry(unittest.TestCase):
+    """起動時のウォームアップの再試行のテスト"""
+
+    def setUp(self):
+        import aibot
+
+        self.aibot = aibot
+        for patcher in (
+            patch.object(aibot, "CLIENTS_WARM", False),
+            patch.object(aibot, "WARMUP_RETRY_BASE", 0.01),
+            patch.object(aibot, "WARMUP_RETRY_MAX", 0.02),
+            patch.dict(os.environ, {"GITHUB_ACTIONS": ""}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_retries_until_warm(self):
+        """初回に失敗しても、成功するまでバックグラウンドで再試行すること"""
+        attempts = []
+
+        def warm_up():
+            attempts.append(time.monotonic())
+            self.aibot.CLIENTS_WARM = len(attempts) >= 3
+
+        with patch.object(self.aibot, "warm_up_clients", side_effect=warm_up):
+            thread = self.aibot.start_warm_up()
+            thread.join(2)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(attempts), 3)
+        self.assertTrue(self.aibot.CLIENTS_WARM)
+
+    def test_no_retry_when_warm(self):
+        def warm_up():
+            self.aibot.CLIENTS_WARM = True
+
+        with patch.object(self.aibot, "warm_up_clients", side_effect=warm_up) as warm_up_clients:
+            self.assertIsNone(self.aibot.start_warm_up())
+
+        warm_up_clients.assert_called_once()
+
+    def test_stops_on_shutdown(self):
+        with patch.object(self.aibot, "warm_up_clients") as warm_up_clients, \
+             patch("lifecycle.wait_stopping", return_value=True):
+            thread = self.aibot.start_warm_up()
+            thread.join(2)
+
+        self.assertFalse(thread.is_alive())
+        warm_up_clients.assert_called_once()
+
+
+class TestHttpMode(unittest.TestCase):
+    """HTTPモード（/slack/events）のテスト"""
+
+    SIGNING_SECRET = "test-signing-secret"
+
+    def setUp(self):
+        self.client = main.flask_app.test_client()
+        # auth.test を呼ばないよう固定の認可結果を返す
+        slack_app = App(signing_secret=self.SIGNING_SECRET, authorize=lambda **_: AuthorizeResult(
+            enterprise_id=None, team_id="T1", bot_token="xoxb-test", bot_user_id="U1", bot_id="B1"
+        ))
+
+        @slack_app.command("/develop")
+        def develop(ack, body):
+            ack(f"受け付けました: {body['text']}")
+
+        self.handler = SlackRequestHandler(slack_app)
+
+    def _post(self, body, signature=None):
+        timestamp = str(int(time.time()))
+        if signature is None:
+            signature = SignatureVerifier(self.SIGNING_SECRET).generate_signature(timestamp=timestamp, body=body)
+        with patch.object(main, "SLACK_MODE", "http"), patch.object(main, "slack_request_handler", self.handler):
+            return self.client.post("/slack/events", data=body, headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+                "X-Slack-Request-Timestamp": timestamp,
+                "X-Slack-Signature": signature,
+            })
+
+    def test_signed_command_dispatched(self):
+        """署名が正しいスラッシュコマンドは Bolt のハンドラーで ack されること"""
+        response = self._post("command=%2Fdevelop&text=owner%2Frepo&response_url=https%3A%2F%2Fexample.com")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("受け付けました: owner/repo", response.get_data(as_text=True))
+
+    def test_invalid_signature_rejected(self):
+        """署名が一致しないリクエストは401で拒否されること"""
+        response = self._post("command=%2Fdevelop&text=x", signature="v0=invalid")
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_disabled_in_socket_mode(self):
+        with patch.object(main, "SLACK_MODE", "socket"):
+            response = self.client.post("/slack/events", data="command=%2Fdevelop")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_ready_without_socket_connection(self):
+        """HTTPモードではハンドラーの準備とウォームアップが済めば200を返すこと"""
+        fake_aibot = Mock(CLIENTS_WARM=True)
+        with patch.object(main, "SLACK_MODE", "http"), \
+             patch.object(main, "slack_request_handler", self.handler), \
+             patch.object(main, "slack_handler", None), \
+             patch.dict(sys.modules, {"aibot": fake_aibot}):
+            response = self.client.get("/ready")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["slack"]["mode"], "http")
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """/metrics のテスト"""
+
+    def test_metrics_exposition_format(self):
+        """Prometheusテキスト形式でパイプラインのメトリクスを返すこと"""
+        client = main.flask_app.test_client()
+        response = client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        body = response.get_data(as_text=True)
+        self.assertIn("# TYPE aibot_stage_duration_seconds histogram", body)
+        self.assertIn("# TYPE aibot_mcp_fallback_total counter", body)
+        self.assertIn("# TYPE aibot_queue_depth gauge", body)
+
+
+class TestDebugTraces(unittest.TestCase):
+    """/debug/traces のテスト"""
+
+    def test_slowest_traces_with_breakdown(self):
+        """遅い順にスパン内訳付きで返すこと"""
+        import tracing
+        tracing.set_exporters([])
+        tracing.recent_traces().clear()
+        with tracing.start_trace("/develop", user_id="U1"):
+            with tracing.span("anthropic.messages.create"):
+                pass
+
+        client = main.flask_app.test_client()
+        response = client.get("/debug/traces?limit=5")
+
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data["count"], 1)
+        self.assertIn("anthropic.messages.create", data["traces"][0]["breakdown"])
+
+
+class TestDebugJobs(unittest.TestCase):
+    """/debug/jobs のテスト"""
+
+    def test_active_jobs(self):
+        """実行中のジョブの進捗をコマンドの本文なしで返すこと"""
+        import job_store
+
+        with patch.object(job_store, "_active", {}):
+            job = job_store.NullJobStore().create("develop", {"text": "secret", "user_id": "U1"})
+            job_store.activate(job)
+            job.checkpoint("parsed", {})
+            response = main.flask_app.test_client().get("/debug/jobs")
+
+        self.assertEqual(response.status_code, 200)
+        jobs = response.get_json()["jobs"]
+        self.assertEqual([(item["id"], item["stage"], item["status"]) for item in jobs], [(job.id, "parsed", "running")])
+        self.assertNotIn("secret", response.get_data(as_text=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Metrics tests
+Prometheus形式メトリクスのテスト
+"""
+
+import asyncio
+import unittest
+from unittest.mock import Mock
+
+import metrics
+
+
+class TestMetricTypes(unittest.TestCase):
+    """Counter / Gauge / Histogram のテスト"""
+
+    def test_counter_render(self):
+        """ラベル付きカウンタがテキスト形式で出力されること"""
+        counter = metrics.Counter("test_requests_total", "Test counter", ["tool"])
+        counter.inc(tool="confluence_search")
+        counter.inc(2, tool="confluence_search")
+
+        text = counter.render()
+        self.assertIn("# TYPE test_requests_total counter", text)
+        self.assertIn('test_requests_total{tool="confluence_search"} 3', text)
+
+    def test_counter_rejects_negative(self):
+        """カウンタは減少できないこと"""
+        counter = metrics.Counter("test_negative_total", "Test counter")
+        with self.assertRaises(ValueError):
+            counter.inc(-1)
+
+    def test_label_mismatch(self):
+        """定義と異なるラベルはエラーになること"""
+        counter = metrics.Counter("test_labels_total", "Test counter", ["stage"])
+        with self.assertRaises(ValueError):
+            counter.inc(tool="x")
+
+    def test_gauge_inc_dec(self):
+        """ゲージの増減"""
+        gauge = metrics.Gauge("test_queue_depth", "Test gauge", ["kind"])
+        gauge.inc(kind="develop")
+        gauge.inc(kind="develop")
+        gauge.dec(kind="develop")
+
+        self.assertEqual(gauge.get(kind="develop"), 1)
+
+    def test_histogram_buckets(self):
+        """ヒストグラムが累積バケット・合計・件数を出力すること"""
+        histogram = metrics.Histogram("test_duration_seconds", "Test histogram", ["stage"], buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage="parse")
+        histogram.observe(0.5, stage="parse")
+        histogram.observe(5.0, stage="parse")
+
+        text = histogram.render()
+        self.assertIn('test_duration_seconds_bucket{stage="parse",le="0.1"} 1', text)
+        self.assertIn('test_duration_seconds_bucket{stage="parse",le="1"} 2', text)
+        self.assertIn('test_duration_seconds_bucket{stage="parse",le="+Inf"} 3', text)
+        self.assertIn('test_duration_seconds_count{stage="parse"} 3', text)
+        self.assertEqual(histogram.get_count(stage="parse"), 3)
+        self.assertAlmostEqual(histogram.get_sum(stage="parse"), 5.55)
+
+    def test_registry_rejects_duplicates(self):
+        """同名メトリクスの二重登録はエラーになること"""
+        registry = metrics.Registry()
+        registry.register(metrics.Counter("dup_total", "dup"))
+        with self.assertRaises(ValueError):
+            registry.register(metrics.Counter("dup_total", "dup"))
+
+
+class TestInstrumentation(unittest.TestCase):
+    """計測フックのテスト"""
+
+    def test_timed_sync_function(self):
+        """同期関数の処理時間が記録されること"""
+        @metrics.timed("test_sync_stage")
+        def work():
+            return "done"
+
+        before = metrics.STAGE_DURATION.get_count(stage="test_sync_stage")
+        self.assertEqual(work(), "done")
+        self.assertEqual(metrics.STAGE_DURATION.get_count(stage="test_sync_stage"), before + 1)
+
+    def test_timed_async_function(self):
+        """非同期関数の処理時間が記録されること"""
+        @metrics.timed("test_async_stage")
+        async def work():
+            return "done"
+
+        before = metrics.STAGE_DURATION.get_count(stage="test_async_stage")
+        self.assertEqual(asyncio.run(work()), "done")
+        self.assertEqual(metrics.STAGE_DURATION.get_count(stage="test_async_stage"), before + 1)
+
+    def test_stage_timer_counts_errors(self):
+        """例外発生時はエラーカウンタも増えること"""
+        before = metrics.STAGE_ERRORS.get(stage="test_error_stage")
+        with self.assertRaises(RuntimeError):
+            with metrics.stage_timer("test_error_stage"):
+                raise RuntimeError("boom")
+
+        self.assertEqual(metrics.STAGE_ERRORS.get(stage="test_error_stage"), before + 1)
+        self.assertEqual(metrics.STAGE_DURATION.get_count(stage="test_error_stage"), 1)
+
+    def test_record_cache_hit_ratio(self):
+        """キャッシュのヒット率が計算されること"""
+        metrics.record_cache("test_cache", hit=False)
+        metrics.record_cache("test_cache", hit=True)
+        metrics.record_cache("test_cache", hit=True)
+        metrics.record_cache("test_cache", hit=True)
+
+        self.assertEqual(metrics.CACHE_HIT_RATIO.get(cache="test_cache"), 0.75)
+
+    def test_record_anthropic_usage(self):
+        """usage のトークン数がモデル別に記録されること"""
+        response = Mock()
+        response.model = "test-model"
+        response.usage.input_tokens = 120
+        response.usage.output_tokens = 30
+
+        metrics.record_anthropic_usage(response)
+
+        self.assertEqual(metrics.ANTHROPIC_TOKENS.get(model="test-model", type="input"), 120)
+        self.assertEqual(metrics.ANTHROPIC_TOKENS.get(model="test-model", type="output"), 30)
+
+    def test_record_anthropic_usage_ignores_missing_usage(self):
+        """usage が数値でない場合（モック等）は何も記録しないこと"""
+        response = Mock()
+        response.model = "mock-model"
+
+        metrics.record_anthropic_usage(response)
+
+        self.assertEqual(metrics.ANTHROPIC_TOKENS.get(model="mock-model", type="input"), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
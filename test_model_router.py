@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Model router tests
+タスク種別ごとのモデル選択とルート別メトリクスのテスト
+"""
+
+import asyncio
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import metrics
+import model_router
+
+
+def _response(input_tokens=1000, output_tokens=200, text="ok"):
+    return SimpleNamespace(
+        content=[SimpleNamespace(text=text)],
+        usage=SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens),
+        model="ignored",
+    )
+
+
+class TestRoutes(unittest.TestCase):
+    """ルート表のテスト"""
+
+    def test_default_routes(self):
+        """生成系は大きなモデル、解析・要約系は軽量モデルを使うこと"""
+        routes = model_router.load_routes()
+
+        self.assertEqual(routes["code_generation"].model, model_router.SONNET)
+        self.assertEqual(routes["command_parsing"].model, model_router.HAIKU)
+        self.assertEqual(routes["design_summary"].max_tokens, 400)
+
+    @patch.dict(os.environ, {
+        "MODEL_ROUTES": '{"design_doc": {"model": "claude-3-5-sonnet-20241022", "max_tokens": 8192}, "custom": {"timeout": 5}}',
+        "DESIGN_SUMMARY_MODEL": "claude-3-5-haiku-20241022",
+    })
+    def test_environment_overrides(self):
+        routes = model_router.load_routes()
+
+        self.assertEqual(routes["design_doc"].model, "claude-3-5-sonnet-20241022")
+        self.assertEqual(routes["design_doc"].output_tokens(), 8192)
+        self.assertEqual(routes["design_doc"].timeout, model_router.DEFAULT_ROUTES["design_doc"].timeout)
+        self.assertEqual(routes["custom"].timeout, 5)
+        self.assertEqual(routes["design_summary"].model, "claude-3-5-haiku-20241022")
+
+    @patch.dict(os.environ, {"MODEL_ROUTES": "not json"})
+    def test_invalid_overrides_ignored(self):
+        self.assertEqual(model_router.load_routes(), model_router.DEFAULT_ROUTES)
+
+    def test_output_tokens_capped(self):
+        """要求された max_tokens がルートとモデルの上限で制限されること"""
+        route = model_router.Route("test", model_router.HAIKU, 300, 10.0)
+
+        self.assertEqual(route.output_tokens(), 300)
+        self.assertEqual(route.output_tokens(100), 100)
+        self.assertEqual(route.output_tokens(5000), 300)
+        self.assertEqual(model_router.Route("test", model_router.SONNET, 100000, 10.0).output_tokens(), 4096)
+
+
+class TestCreateMessage(unittest.TestCase):
+    """呼び出しと記録のテスト"""
+
+    def test_calls_with_route_settings_and_records_cost(self):
+        client = MagicMock()
+        client.messages.create.return_value = _response()
+        before = metrics.LLM_ROUTE_COST.get(route="command_parsing", model=model_router.HAIKU)
+        count = metrics.LLM_ROUTE_DURATION.get_count(route="command_parsing", model=model_router.HAIKU)
+
+        response = model_router.create_message(client, "command_parsing", [{"role": "user", "content": "x"}])
+
+        self.assertEqual(response.content[0].text, "ok")
+        kwargs = client.messages.create.call_args.kwargs
+        self.assertEqual(kwargs["model"], model_router.HAIKU)
+        self.assertEqual(kwargs["max_tokens"], 300)
+        self.assertEqual(kwargs["timeout"], 15.0)
+        self.assertAlmostEqual(
+            metrics.LLM_ROUTE_COST.get(route="command_parsing", model=model_router.HAIKU) - before,
+            (1000 * 0.25 + 200 * 1.25) / 1_000_000,
+        )
+        self.assertEqual(metrics.LLM_ROUTE_DURATION.get_count(route="command_parsing", model=model_router.HAIKU), count + 1)
+
+    def test_error_recorded_and_raised(self):
+        client = MagicMock()
+        client.messages.create.side_effect = RuntimeError("timeout")
+        before = metrics.LLM_ROUTE_ERRORS.get(route="search_summary", model=model_router.HAIKU)
+
+        with self.assertRaises(RuntimeError):
+            model_router.create_message(client, "search_summary", [{"role": "user", "content": "x"}])
+
+        self.assertEqual(metrics.LLM_ROUTE_ERRORS.get(route="search_summary", model=model_router.HAIKU), before + 1)
+
+    def test_async_create_message(self):
+        """AsyncAnthropic のクライアントでも同じルート設定で呼び出されること"""
+        client = MagicMock()
+        client.messages.create = AsyncMock(return_value=_response(text="async"))
+
+        response = asyncio.run(model_router.acreate_message(client, "design_doc", [{"role": "user", "content": "x"}]))
+
+        self.assertEqual(response.content[0].text, "async")
+        self.assertEqual(client.messages.create.await_args.kwargs["model"], model_router.SONNET)
+
+    def test_estimate_cost(self):
+        self.assertAlmostEqual(model_router.estimate_cost(model_router.SONNET, 1_000_000, 1_000_000), 18.0)
+        self.assertAlmostEqual(model_router.estimate_cost("unknown-model", 1_000_000, 0), 3.0)
+
+
+class TestCommandParsingFallback(unittest.TestCase):
+    """形式どおりでないコマンドの解析のテスト"""
+
+    @unittest.skipIf("COMMAND_PARSING_FALLBACK" in os.environ, "COMMAND_PARSING_FALLBACK が設定されている")
+    def test_disabled_by_default(self):
+        """明示的に有効にしない限り、LLMでコマンドを推測しないこと"""
+        import aibot
+
+        with patch("model_router.create_message") as create_message:
+            self.assertIsNone(aibot.parse_command_with_llm("repo a.py ログ追加", aibot.DEVELOP_COMMAND_FIELDS))
+        create_message.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Pipeline stage scheduler tests
+ステージの先行実行のテスト
+"""
+
+import asyncio
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import metrics
+import pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    """同期ステージのテスト"""
+
+    def test_independent_stages_overlap(self):
+        """独立したステージが並行して実行され、所要時間が合計にならないこと"""
+        def slow(value):
+            time.sleep(0.1)
+            return value
+
+        started = time.perf_counter()
+        with pipeline.Pipeline("test") as stages:
+            stages.start("a", slow, 1)
+            stages.start("b", slow, 2)
+            stages.start("c", slow, 3)
+            results = [stages.result(name) for name in ("a", "b", "c")]
+
+        self.assertEqual(results, [1, 2, 3])
+        self.assertLess(time.perf_counter() - started, 0.25)
+
+    def test_exception_raised_on_result(self):
+        """ステージの例外は結果を要求した時点で送出されること"""
+        def fail():
+            raise ValueError("boom")
+
+        with pipeline.Pipeline("test") as stages:
+            stages.start("fail", fail)
+            with self.assertRaises(ValueError):
+                stages.result("fail")
+
+    def test_duplicate_and_unknown_stage(self):
+        with pipeline.Pipeline("test") as stages:
+            stages.start("a", lambda: 1)
+            with self.assertRaises(ValueError):
+                stages.start("a", lambda: 2)
+            with self.assertRaises(KeyError):
+                stages.result("missing")
+            self.assertIn("a", stages)
+            stages.result("a")
+
+    def test_unused_stage_recorded(self):
+        """結果が使われなかったステージが未使用として記録されること"""
+        release = threading.Event()
+        before = metrics.PREFETCH_UNUSED.get(pipeline="unused", stage="skipped")
+
+        with pipeline.Pipeline("unused") as stages:
+            stages.start("skipped", release.wait, 1)
+        release.set()
+
+        self.assertEqual(metrics.PREFETCH_UNUSED.get(pipeline="unused", stage="skipped"), before + 1)
+
+    @patch.dict(os.environ, {"PREFETCH_ENABLED": "false"})
+    def test_disabled_runs_on_demand(self):
+        """無効化した場合は結果を要求した時点で実行されること"""
+        calls = []
+
+        with pipeline.Pipeline("test") as stages:
+            stages.start("a", calls.append, "a")
+            stages.start("b", calls.append, "b")
+            self.assertEqual(calls, [])
+            stages.result("b")
+
+        self.assertEqual(calls, ["b"])
+
+
+class TestAsyncPipeline(unittest.TestCase):
+    """コルーチンのステージのテスト"""
+
+    def test_coroutine_and_thread_stages(self):
+        """コルーチンはイベントループ上で、同期関数はスレッドで並行して実行されること"""
+        async def fetch(value):
+            await asyncio.sleep(0.1)
+            return value
+
+        def blocking(value):
+            time.sleep(0.1)
+            return value
+
+        async def main():
+            with pipeline.Pipeline("test") as stages:
+                stages.start("page", fetch, "page")
+                stages.start("branch", blocking, "branch")
+                await asyncio.sleep(0.1)
+                return await stages.aresult("page"), await stages.aresult("branch")
+
+        started = time.perf_counter()
+        self.assertEqual(asyncio.run(main()), ("page", "branch"))
+        self.assertLess(time.perf_counter() - started, 0.18)
+
+    def test_unused_task_cancelled(self):
+        """使われなかったコルーチンのステージはキャンセルされること"""
+        cancelled = []
+
+        async def long_running():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def main():
+            with pipeline.Pipeline("test") as stages:
+                stages.start("slow", long_running)
+                await asyncio.sleep(0)
+            await asyncio.sleep(0)
+
+        asyncio.run(main())
+        self.assertEqual(cancelled, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
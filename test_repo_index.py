@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Repository index tests
+関連コード検索インデックスのテスト
+"""
+
+import base64
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import github
+
+import bench_fakes
+import repo_index
+
+FILES = {
+    "app/service.py": "from app.models import UserRepository\n\n\ndef register(name):\n    return UserRepository().save(name)\n",
+    "app/models.py": "class UserRepository:\n    def save(self, name):\n        return name\n\n\nclass OrderRepository:\n    pass\n",
+    "app/views.py": "from app.service import register\n\n\ndef signup_view(request):\n    return register(request.name)\n",
+    "docs/readme.md": "UserRepository の説明\n",
+}
+
+
+def _index(files=FILES):
+    index = repo_index.RepoIndex("owner/repo", "sha1")
+    index.update_files({
+        path: (repo_index.git_blob_sha(text.encode()), text)
+        for path, text in files.items() if repo_index.is_indexable(path)
+    })
+    return index
+
+
+class StubRepo:
+    """get_git_tree / get_git_blob のみを持つリポジトリ"""
+
+    def __init__(self, files):
+        self.files = files
+        self.blob_requests = []
+
+    def get_git_tree(self, sha, recursive=False):
+        return SimpleNamespace(tree=[
+            SimpleNamespace(path=path, sha=repo_index.git_blob_sha(text.encode()), type="blob", size=len(text))
+            for path, text in self.files.items()
+        ])
+
+    def get_git_blob(self, sha):
+        self.blob_requests.append(sha)
+        for text in self.files.values():
+            if repo_index.git_blob_sha(text.encode()) == sha:
+                return SimpleNamespace(encoding="base64", content=base64.b64encode(text.encode()).decode())
+
+
+class TestTokenize(unittest.TestCase):
+    """検索語の抽出テスト"""
+
+    def test_identifiers_and_subwords(self):
+        """snake_case/camelCase の構成語を含み、予約語を除くこと"""
+        terms = repo_index.tokenize("def get_user(self): return UserRepository()")
+
+        self.assertIn("get_user", terms)
+        self.assertIn("user", terms)
+        self.assertIn("userrepository", terms)
+        self.assertIn("repository", terms)
+        self.assertNotIn("def", terms)
+        self.assertNotIn("self", terms)
+
+    def test_git_blob_sha(self):
+        """Gitと同じblob SHAになること"""
+        self.assertEqual(repo_index.git_blob_sha(b""), "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391")
+
+    def test_is_indexable(self):
+        self.assertTrue(repo_index.is_indexable("src/app.ts"))
+        self.assertFalse(repo_index.is_indexable("node_modules/lib/index.js"))
+        self.assertFalse(repo_index.is_indexable("README.md"))
+        self.assertFalse(repo_index.is_indexable("big.py", size=repo_index.MAX_FILE_BYTES + 1))
+
+
+class TestRelatedSnippets(unittest.TestCase):
+    """関連コード片の選択テスト"""
+
+    def test_imported_symbol_and_callers(self):
+        """参照しているシンボルの定義と呼び出し元が選ばれ、対象ファイル自身は除かれること"""
+        snippets = _index().related_snippets("app/service.py", FILES["app/service.py"], "登録時に名前を検証する")
+        paths = [snippet.path for snippet in snippets]
+
+        self.assertEqual(snippets[0].path, "app/models.py")
+        self.assertIn("class UserRepository", snippets[0].text)
+        self.assertIn("app/views.py", paths)
+        self.assertNotIn("app/service.py", paths)
+
+    def test_token_budget_and_limit(self):
+        """件数とトークン予算の上限を守ること"""
+        index = _index()
+
+        self.assertEqual(len(index.related_snippets("app/service.py", FILES["app/service.py"], "", limit=1)), 1)
+        self.assertEqual(index.related_snippets("app/service.py", FILES["app/service.py"], "", budget=5), [])
+
+    def test_render(self):
+        snippet = _index().related_snippets("app/service.py", FILES["app/service.py"], "")[0]
+
+        self.assertTrue(snippet.render().startswith("--- app/models.py (L1-"))
+
+
+class TestIndexUpdates(unittest.TestCase):
+    """インデックスの保存と差分更新のテスト"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_save_and_load(self):
+        index = _index()
+        index.save(self.directory)
+
+        loaded = repo_index.RepoIndex.load("owner/repo", self.directory)
+
+        self.assertEqual(loaded.commit_sha, "sha1")
+        self.assertEqual(set(loaded.files), set(index.files))
+        self.assertEqual(
+            loaded.related_snippets("app/service.py", FILES["app/service.py"], "")[0].path, "app/models.py"
+        )
+
+    def test_incremental_update_fetches_changed_files_only(self):
+        """blob SHAが変わったファイルだけ取得し、削除されたファイルを除くこと"""
+        index = _index()
+        files = dict(FILES)
+        files["app/models.py"] = "class UserRepository:\n    def save(self, name):\n        return name.strip()\n"
+        del files["app/views.py"]
+        repo = StubRepo(files)
+
+        updated = repo_index._incremental_update(repo, index, "sha2")
+
+        self.assertEqual(len(repo.blob_requests), 1)
+        self.assertEqual(updated.commit_sha, "sha2")
+        self.assertNotIn("app/views.py", updated.files)
+        self.assertIn("name.strip()", updated.files["app/models.py"]["chunks"][0].text)
+
+    @patch.dict(os.environ, {"RETRIEVAL_MAX_BLOB_FETCHES": "0"})
+    def test_incremental_update_gives_up_on_many_changes(self):
+        """変更ファイルが上限を超える場合は None（全体の再作成）を返すこと"""
+        files = dict(FILES, **{"app/new.py": "def added():\n    pass\n"})
+
+        self.assertIsNone(repo_index._incremental_update(StubRepo(files), _index(), "sha2"))
+
+    def test_read_tarball(self):
+        """tarballの先頭ディレクトリを除き、対象外のファイルを読み飛ばすこと"""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            for name, data in [("owner-repo-abc/app/a.py", b"x = 1\n"), ("owner-repo-abc/node_modules/b.js", b"y")]:
+                member = tarfile.TarInfo(name)
+                member.size = len(data)
+                archive.addfile(member, io.BytesIO(data))
+
+        files = repo_index.read_tarball(buffer.getvalue())
+
+        self.assertEqual(files, {"app/a.py": (repo_index.git_blob_sha(b"x = 1\n"), "x = 1\n")})
+
+    def test_ensure_index_against_fake_github(self):
+        """初回はtarballから作成し、2回目は同じコミットのためキャッシュを使うこと"""
+        with patch.dict(os.environ, {"RETRIEVAL_INDEX_DIR": self.directory}), \
+                bench_fakes.FakeServers(bench_fakes.FakeConfig(github_latency=0)) as fakes:
+            client = github.Github(auth=github.Auth.Token("x"), base_url=fakes.environment()["GITHUB_API_URL"])
+            repo_index._indexes.pop("owner/fake", None)
+
+            index = repo_index.ensure_index(client, "owner/fake")
+            tarball_requests = fakes.github.requests["GET /archive/"]
+            repo_index.ensure_index(client, "owner/fake")
+
+        self.assertEqual(set(index.files), set(bench_fakes.FakeGitHub.REPOSITORY_FILES))
+        self.assertEqual(tarball_requests, 1)
+        self.assertEqual(fakes.github.requests["GET /archive/"], 1)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "owner__fake.json")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Fair scheduler tests
+ユーザーごとの公平な実行順とレート制限のテスト
+"""
+
+import contextvars
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+import scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ManualRunner:
+    """タスクを記録だけして、テストから順に完了させるランナー"""
+
+    def __init__(self):
+        self.started = []
+
+    def __call__(self, kind, func, *args):
+        self.started.append((kind, func, args))
+
+    def labels(self):
+        return [args[0] for _, _, args in self.started]
+
+    def finish(self, index=0):
+        kind, func, args = self.started.pop(index)
+        func(*args)
+
+
+class TestFairScheduler(unittest.TestCase):
+    """実行順のテスト"""
+
+    def test_burst_does_not_starve_others(self):
+        """1人が大量に送っても、他のユーザーのタスクが次の空き枠で開始されること"""
+        runner = ManualRunner()
+        fair = scheduler.FairScheduler(runner, concurrency=2, user_concurrency=2)
+
+        positions = [fair.submit("heavy", "develop", Mock(), f"heavy-{i}") for i in range(6)]
+        light = fair.submit("light", "develop", Mock(), "light-0")
+
+        self.assertEqual(positions[:2], [0, 0])
+        self.assertEqual(positions[2:], [1, 2, 3, 4])
+        self.assertEqual(light, 1)
+        runner.finish()
+        self.assertEqual(runner.labels(), ["heavy-1", "light-0"])
+
+    def test_user_concurrency_cap(self):
+        """1ユーザーの同時実行数が上限を超えないこと"""
+        runner = ManualRunner()
+        fair = scheduler.FairScheduler(runner, concurrency=4, user_concurrency=1)
+
+        for i in range(3):
+            fair.submit("U1", "develop", Mock(), f"u1-{i}")
+        fair.submit("U2", "design", Mock(), "u2-0")
+
+        self.assertEqual(runner.labels(), ["u1-0", "u2-0"])
+        self.assertEqual(fair.pending(), 2)
+        runner.finish(0)
+        self.assertEqual(runner.labels(), ["u2-0", "u1-1"])
+
+    def test_weighted_round_robin(self):
+        """重みに比例して枠が割り当てられること"""
+        runner = ManualRunner()
+        fair = scheduler.FairScheduler(runner, concurrency=1, user_concurrency=1, weights={"vip": 2})
+        blocker = fair.submit("blocker", "develop", Mock(), "blocker")
+        for i in range(4):
+            fair.submit("vip", "develop", Mock(), f"vip-{i}")
+            fair.submit("user", "develop", Mock(), f"user-{i}")
+
+        order = []
+        for _ in range(6):
+            runner.finish()
+            order.append(runner.labels()[0])
+
+        self.assertEqual(blocker, 0)
+        self.assertEqual(sum(1 for label in order if label.startswith("vip")), 4)
+        self.assertEqual(sum(1 for label in order if label.startswith("user")), 2)
+
+    def test_task_runs_and_releases_slot(self):
+        """実際に実行されたタスクの完了で枠が解放されること"""
+        calls = []
+        fair = scheduler.FairScheduler(lambda kind, func, *args: func(*args), concurrency=1)
+
+        fair.submit("U1", "develop", calls.append, "a")
+        fair.submit("U1", "develop", calls.append, "b")
+
+        self.assertEqual(calls, ["a", "b"])
+        self.assertEqual(fair.running(), 0)
+
+    def test_runner_error_releases_slot(self):
+        fair = scheduler.FairScheduler(Mock(side_effect=RuntimeError("no threads")), concurrency=1)
+
+        fair.submit("U1", "develop", Mock())
+
+        self.assertEqual(fair.running(), 0)
+
+    def test_take_pending(self):
+        runner = ManualRunner()
+        fair = scheduler.FairScheduler(runner, concurrency=1)
+        fair.submit("U1", "develop", Mock(), "a")
+        fair.submit("U2", "design", Mock(), "b", "url")
+
+        self.assertEqual(fair.take_pending(), [("design", ("b", "url"))])
+        self.assertEqual(fair.pending(), 0)
+
+
+REQUEST = contextvars.ContextVar("request", default=None)
+
+
+class TestTaskContext(unittest.TestCase):
+    """タスクを実行するコンテキストのテスト"""
+
+    def test_queued_tasks_keep_submitter_context(self):
+        """前のタスクの完了時に開始されるタスクも、submit() した時点のコンテキストで実行されること"""
+        seen = {}
+        done = threading.Event()
+
+        def runner(kind, func, *args):
+            # aibot.start_background_task と同じく呼び出し元のコンテキストをスレッドへ引き継ぐ
+            threading.Thread(target=contextvars.copy_context().run, args=(func, *args)).start()
+
+        def work(label):
+            seen[label] = REQUEST.get()
+            if len(seen) == 4:
+                done.set()
+
+        fair = scheduler.FairScheduler(runner, concurrency=1, user_concurrency=1)
+        gate = threading.Event()
+        fair.submit("blocker", "develop", gate.wait, 5)
+
+        def submit(label):
+            REQUEST.set(label)
+            fair.submit(label, "develop", work, label)
+
+        for label in ("a", "b", "c", "d"):
+            contextvars.copy_context().run(submit, label)
+        gate.set()
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(seen, {label: label for label in ("a", "b", "c", "d")})
+        self.assertIsNone(REQUEST.get())
+
+
+class TestRateLimit(unittest.TestCase):
+    """レート制限のテスト"""
+
+    def test_user_and_channel_limits(self):
+        """ユーザーとチャンネルそれぞれの上限を超えると待ち秒数を返し、1分経てば受け付けること"""
+        clock = FakeClock()
+        fair = scheduler.FairScheduler(Mock(), user_rate_limit=2, channel_rate_limit=3, clock=clock)
+
+        self.assertEqual(fair.check_rate("U1", "C1"), 0)
+        clock.now += 10
+        self.assertEqual(fair.check_rate("U1", "C1"), 0)
+        self.assertAlmostEqual(fair.check_rate("U1", "C1"), 50.0)
+        self.assertEqual(fair.check_rate("U2", "C1"), 0)
+        self.assertGreater(fair.check_rate("U3", "C1"), 0)
+        clock.now += 51
+        self.assertEqual(fair.check_rate("U1", "C1"), 0)
+
+    def test_unlimited(self):
+        fair = scheduler.FairScheduler(Mock(), user_rate_limit=0, channel_rate_limit=0)
+
+        self.assertTrue(all(fair.check_rate("U1", "C1") == 0 for _ in range(100)))
+
+    def test_parse_weights(self):
+        self.assertEqual(scheduler.parse_weights("U1=3, U2=0.5,bad,U3=-1,U4=x"), {"U1": 3.0, "U2": 0.5})
+
+
+class TestAck(unittest.TestCase):
+    """受付時の ack のテスト"""
+
+    def test_rate_limited_and_queue_position(self):
+        """レート制限を超えたら実行せずに待ち秒数を、実行待ちなら順番を ack に含めること"""
+        import aibot
+
+        body = {"text": "x", "user_id": "U1", "channel_id": "C1", "response_url": "https://hooks.slack.com/test"}
+        fair = scheduler.FairScheduler(ManualRunner(), concurrency=1, user_rate_limit=2)
+        ack = Mock()
+        with patch.object(aibot, "SCHEDULER", fair):
+            aibot.accept_task(ack, "develop", body, "受け付けました")
+            aibot.accept_task(ack, "develop", body, "受け付けました")
+            aibot.accept_task(ack, "develop", body, "受け付けました")
+
+        messages = [call.args[0] for call in ack.call_args_list]
+        self.assertTrue(messages[0].startswith("受け付けました\n🆔"))
+        self.assertNotIn("番目に開始します", messages[0])
+        self.assertIn("1番目に開始します", messages[1])
+        self.assertIn("秒後に再度お試しください", messages[2])
+        self.assertEqual(fair.pending(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
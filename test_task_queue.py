@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Task queue and worker tests
+タスクキュー（SQLite / HTTP）とワーカーのテスト
+"""
+
+import os
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import requests
+
+import job_store
+import task_queue
+
+# ビルド時と同様にワーカーのバックグラウンド起動を抑止してインポート
+with patch.dict(os.environ, {"GITHUB_ACTIONS": "true"}):
+    import worker
+
+PAYLOAD = {"text": "owner/repo の a.py に 修正", "user_id": "U1", "channel_id": "C1", "response_url": "https://hooks.slack.com/test"}
+
+
+class TestSQLiteTaskQueue(unittest.TestCase):
+    """SQLiteキューのテスト"""
+
+    def setUp(self):
+        self.queue = task_queue.SQLiteTaskQueue(job_store.SQLiteJobStore(":memory:"))
+
+    def test_fifo_and_claimed_once(self):
+        """投入順に取り出され、取り出したジョブは実行中になること"""
+        first = self.queue.put("develop", PAYLOAD)
+        second = self.queue.put("design", PAYLOAD)
+
+        job = self.queue.get("worker-1")
+        self.assertEqual((job.id, job.kind, job.status), (first, "develop", job_store.RUNNING))
+        self.assertFalse(job.resumed)
+        self.assertEqual(self.queue.get("worker-2").id, second)
+        self.assertIsNone(self.queue.get("worker-3"))
+
+    def test_queued_jobs_not_treated_as_stale(self):
+        """キューで待っているジョブが中断したジョブとして引き取られないこと"""
+        self.queue.put("develop", PAYLOAD)
+
+        self.assertEqual(self.queue.store.claim_stale("me", lease_seconds=0), [])
+
+
+class TestHttpPushQueue(unittest.TestCase):
+    """HTTP送信のテスト"""
+
+    def _response(self, status):
+        return SimpleNamespace(status_code=status)
+
+    def test_posts_with_token(self):
+        queue = task_queue.HttpPushQueue("https://worker/tasks", token="secret")
+
+        with patch("requests.post", return_value=self._response(202)) as post:
+            task_id = queue.put("develop", PAYLOAD)
+
+        kwargs = post.call_args.kwargs
+        self.assertEqual(kwargs["json"], {"id": task_id, "kind": "develop", "payload": PAYLOAD})
+        self.assertEqual(kwargs["headers"]["Authorization"], "Bearer secret")
+
+    def test_retries_when_busy(self):
+        """503 は再送し、再送しきれない・拒否された場合は EnqueueError になること"""
+        sleeps = []
+        queue = task_queue.HttpPushQueue("https://worker/tasks", retries=2, sleep=sleeps.append)
+
+        with patch("requests.post", side_effect=[self._response(503), self._response(202)]):
+            queue.put("develop", PAYLOAD)
+        self.assertEqual(len(sleeps), 1)
+
+        with patch("requests.post", return_value=self._response(503)) as post, self.assertRaises(task_queue.EnqueueError):
+            queue.put("develop", PAYLOAD)
+        self.assertEqual(post.call_count, 3)
+
+        with patch("requests.post", side_effect=requests.ConnectionError("down")), self.assertRaises(task_queue.EnqueueError):
+            queue.put("develop", PAYLOAD)
+
+    @patch.dict(os.environ, {"TASK_QUEUE": "http", "TASK_QUEUE_URL": ""})
+    def test_misconfigured_falls_back_inline(self):
+        self.assertIsNone(task_queue.queue_from_env())
+
+    @patch.dict(os.environ, {"TASK_QUEUE": "http", "TASK_QUEUE_URL": "https://worker/tasks", "WORKER_TOKEN": ""})
+    def test_http_requires_token(self):
+        """WORKER_TOKEN が未設定なら http キューを使わないこと"""
+        self.assertIsNone(task_queue.queue_from_env())
+        with patch.dict(os.environ, {"WORKER_TOKEN": "secret"}):
+            self.assertEqual(task_queue.queue_from_env().token, "secret")
+
+
+class TestWorker(unittest.TestCase):
+    """ワーカーの受付とポーリングのテスト"""
+
+    def setUp(self):
+        self.client = worker.worker_app.test_client()
+        self.headers = {"Authorization": "Bearer secret"}
+        patcher = patch.dict(os.environ, {"WORKER_TOKEN": "secret"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rejects_without_token(self):
+        response = self.client.post("/tasks", json={"kind": "develop", "payload": PAYLOAD})
+        self.assertEqual(response.status_code, 401)
+
+    def test_rejects_when_token_unset(self):
+        """WORKER_TOKEN が未設定なら受け付けないこと"""
+        with patch.dict(os.environ, {"WORKER_TOKEN": ""}):
+            response = self.client.post("/tasks", json={"kind": "develop", "payload": PAYLOAD}, headers={"Authorization": "Bearer "})
+        self.assertEqual(response.status_code, 401)
+
+    def test_accepts_and_runs_in_background(self):
+        """受け付けたタスクを 202 で返してから実行すること"""
+        done = threading.Event()
+        with patch.object(worker, "run_task", side_effect=lambda *args: done.set()) as run_task:
+            response = self.client.post("/tasks", json={"id": "t1", "kind": "develop", "payload": PAYLOAD}, headers=self.headers)
+            self.assertTrue(done.wait(1))
+
+        self.assertEqual(response.status_code, 202)
+        run_task.assert_called_once_with("develop", PAYLOAD)
+
+    def test_busy_and_invalid(self):
+        """同時実行数を超えると 503、形式が不正なら 400 を返すこと"""
+        self.assertEqual(self.client.post("/tasks", json={"kind": "develop"}, headers=self.headers).status_code, 400)
+        with patch.object(worker, "_slots", threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            self.assertEqual(self.client.post("/tasks", json={"kind": "develop", "payload": PAYLOAD}, headers=self.headers).status_code, 503)
+
+    def test_poll_runs_queued_jobs(self):
+        """ポーリングでキューのジョブを取り出して実行すること"""
+        queue = task_queue.SQLiteTaskQueue(job_store.SQLiteJobStore(":memory:"))
+        job_id = queue.put("develop", PAYLOAD)
+        ran = []
+
+        def run_task(kind, payload, job):
+            ran.append((kind, job.id))
+            worker.stop_event.set()
+
+        with patch.object(worker, "run_task", side_effect=run_task), patch.object(worker, "stop_event", threading.Event()):
+            worker.poll_queue(queue)
+
+        self.assertEqual(ran, [("develop", job_id)])
+
+
+class TestDispatch(unittest.TestCase):
+    """受付側（aibot.dispatch_task）のテスト"""
+
+    def test_enqueue_or_fall_back(self):
+        """キューに入れた場合はこのプロセスで実行せず、失敗した場合はこのプロセスで実行すること"""
+        import aibot
+
+        queue = Mock(backend="http")
+        body = dict(PAYLOAD)
+        with patch.object(task_queue, "QUEUE", queue), patch("aibot.SCHEDULER") as scheduler:
+            aibot.dispatch_task("develop", body)
+            scheduler.submit.assert_not_called()
+            self.assertEqual(queue.put.call_args.args, ("develop", PAYLOAD))
+
+            queue.put.side_effect = task_queue.EnqueueError("down")
+            aibot.dispatch_task("develop", body)
+            job = scheduler.submit.call_args.args[-1]
+            scheduler.submit.assert_called_once_with("U1", "develop", aibot.process_development_task, body, PAYLOAD["response_url"], job)
+            self.assertEqual((job.kind, job.payload), ("develop", PAYLOAD))
+
+    def test_accept_returns_before_enqueue(self):
+        """キューへの送信が終わるのを待たずにリスナーから戻ること（Slackへの応答は戻った後に送られるため）"""
+        import aibot
+
+        release = threading.Event()
+        sent = threading.Event()
+
+        def put(kind, payload):
+            release.wait(1)
+            sent.set()
+            return "t1"
+
+        queue = Mock(backend="http")
+        queue.put.side_effect = put
+        ack = Mock()
+        with patch.object(task_queue, "QUEUE", queue), patch("aibot.SCHEDULER") as scheduler:
+            scheduler.check_rate.return_value = 0
+            aibot.accept_task(ack, "develop", dict(PAYLOAD), "受け付けました")
+            self.assertFalse(sent.is_set())
+            release.set()
+            self.assertTrue(sent.wait(1))
+        ack.assert_called_once_with("受け付けました")
+
+
+if __name__ == "__main__":
+    unittest.main()
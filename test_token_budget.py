@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Token budget tests
+プロンプトのトークン予算管理のテスト
+"""
+
+import os
+import unittest
+from unittest.mock import patch
+
+import metrics
+import token_budget
+
+MODEL = "claude-3-5-sonnet-20240620"
+
+
+def _sample_code(functions=10, padding=40):
+    blocks = ["import os\n\n"]
+    for index in range(functions):
+        blocks.append(f"def func_{index}(x):\n    return x + {index}\n" + "    # padding\n" * padding + "\n\n")
+    return "".join(blocks)
+
+
+class TestEstimation(unittest.TestCase):
+    """トークン数の概算と max_tokens のテスト"""
+
+    def test_estimate_tokens(self):
+        """日本語はASCIIより1文字あたりのトークン数が多く見積もられること"""
+        self.assertEqual(token_budget.estimate_tokens(""), 0)
+        self.assertGreater(token_budget.estimate_tokens("あ" * 100), token_budget.estimate_tokens("a" * 100))
+
+    def test_adaptive_max_tokens(self):
+        """必要量に応じて下限とモデル上限の間で決まること"""
+        self.assertEqual(token_budget.adaptive_max_tokens(10, MODEL), token_budget.MIN_OUTPUT_TOKENS)
+        self.assertEqual(token_budget.adaptive_max_tokens(100000, MODEL), 4096)
+        self.assertEqual(token_budget.adaptive_max_tokens(2000, MODEL), 2756)
+
+    def test_measure_tokens_uses_counter_only_near_limit(self):
+        """上限から遠い場合は count_tokens を呼ばないこと"""
+        calls = []
+
+        def counter(text):
+            calls.append(text)
+            return 999
+
+        self.assertEqual(token_budget.measure_tokens("short", 0, 10000, counter), token_budget.estimate_tokens("short"))
+        self.assertEqual(calls, [])
+        self.assertEqual(token_budget.measure_tokens("x" * 1000, 5, 100, counter), 1004)
+
+    def test_measure_tokens_falls_back_on_counter_error(self):
+        """count_tokens が失敗した場合は概算値を使うこと"""
+        def counter(text):
+            raise RuntimeError("API error")
+
+        self.assertEqual(token_budget.measure_tokens("x" * 1000, 0, 100, counter), token_budget.estimate_tokens("x" * 1000))
+
+
+class TestSplitBlocks(unittest.TestCase):
+    """ブロック分割のテスト"""
+
+    def test_blocks_rejoin_to_original(self):
+        code = _sample_code(3, 1)
+        blocks = token_budget.split_blocks(code)
+
+        self.assertEqual("".join(blocks), code)
+        self.assertEqual(len(blocks), 4)
+
+    def test_decorator_stays_with_definition(self):
+        """デコレータと直後の定義が同じブロックになること"""
+        code = "import x\n\n@app.route('/')\ndef index():\n    pass\n"
+        blocks = token_budget.split_blocks(code)
+
+        self.assertEqual(len(blocks), 2)
+        self.assertTrue(blocks[1].startswith("@app.route"))
+
+
+class TestPlanCodeEdit(unittest.TestCase):
+    """送信方針の決定テスト"""
+
+    def test_send_small_file(self):
+        plan = token_budget.plan_code_edit("print('hello')\n", "挨拶を変更", MODEL)
+
+        self.assertEqual(plan.strategy, "send")
+        self.assertEqual(plan.parts, ["print('hello')\n"])
+        self.assertEqual(plan.max_tokens, [token_budget.MIN_OUTPUT_TOKENS])
+
+    @patch.dict(os.environ, {"PROMPT_TOKEN_BUDGET": "800"})
+    def test_trim_keeps_relevant_blocks_and_restores(self):
+        """指示に関係するブロックだけを送り、出力に省略部分を戻せること"""
+        code = _sample_code()
+        plan = token_budget.plan_code_edit(code, "func_3 の戻り値を修正", MODEL, overhead_tokens=100)
+
+        self.assertEqual(plan.strategy, "trim")
+        self.assertIn("def func_3", plan.parts[0])
+        self.assertNotIn("def func_4", plan.parts[0])
+        edited = plan.parts[0].replace("return x + 3", "return x * 3")
+        restored = plan.restore(edited)
+        self.assertEqual(restored, code.replace("return x + 3", "return x * 3"))
+
+    @patch.dict(os.environ, {"PROMPT_TOKEN_BUDGET": "800"})
+    def test_restore_fails_when_marker_dropped(self):
+        """省略マーカーが消えた出力は復元しないこと"""
+        plan = token_budget.plan_code_edit(_sample_code(), "func_3 を修正", MODEL, overhead_tokens=100)
+
+        self.assertIsNone(plan.restore("def func_3(x):\n    return x\n"))
+
+    @patch.dict(os.environ, {"PROMPT_TOKEN_BUDGET": "800"})
+    def test_chunk_without_relevant_blocks(self):
+        """関連ブロックがない場合は分割し、連結すると元に戻ること"""
+        code = _sample_code()
+        plan = token_budget.plan_code_edit(code, "全体的にリファクタリング", MODEL, overhead_tokens=100)
+
+        self.assertEqual(plan.strategy, "chunk")
+        self.assertEqual("".join(plan.parts), code)
+        self.assertEqual(len(plan.max_tokens), len(plan.parts))
+
+    @patch.dict(os.environ, {"PROMPT_TOKEN_BUDGET": "800", "MAX_EDIT_CHUNKS": "1"})
+    def test_reject_when_too_many_chunks(self):
+        before = metrics.TOKEN_BUDGET_DECISIONS.get(strategy="reject")
+        plan = token_budget.plan_code_edit(_sample_code(), "全体的にリファクタリング", MODEL, overhead_tokens=100)
+
+        self.assertEqual(plan.strategy, "reject")
+        self.assertIn("大きすぎます", plan.reason)
+        self.assertEqual(metrics.TOKEN_BUDGET_DECISIONS.get(strategy="reject"), before + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
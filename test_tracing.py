@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Tracing tests
+トレーシングのテスト
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import tracing
+
+
+class TestSpans(unittest.TestCase):
+    """スパンの親子関係とエクスポートのテスト"""
+
+    def setUp(self):
+        tracing.set_exporters([])
+        tracing.recent_traces().clear()
+
+    def test_span_outside_trace_is_noop(self):
+        """トレース外のスパンは記録されないこと"""
+        with tracing.span("github.get_repo_content") as span:
+            self.assertIsNone(span)
+        self.assertEqual(tracing.recent_traces().traces(), [])
+
+    def test_nested_spans_exported_with_trace(self):
+        """子スパンが親IDを持ち、ルート終了時に1件のトレースとして出力されること"""
+        with tracing.start_trace("/develop", user_id="U1") as root:
+            with tracing.span("anthropic.messages.create") as child:
+                tracing.set_attribute("output_tokens", 42)
+
+        traces = tracing.recent_traces().traces()
+        self.assertEqual(len(traces), 1)
+        trace = traces[0]
+        self.assertEqual(trace["name"], "/develop")
+        self.assertEqual(trace["attributes"], {"user_id": "U1"})
+        spans = {span["name"]: span for span in trace["spans"]}
+        self.assertIsNone(spans["/develop"]["parent_id"])
+        self.assertEqual(spans["anthropic.messages.create"]["parent_id"], root.span_id)
+        self.assertEqual(spans["anthropic.messages.create"]["attributes"]["output_tokens"], 42)
+        self.assertEqual(child.trace_id, root.trace_id)
+
+    def test_error_recorded(self):
+        """例外はスパンとトレースのステータスに反映されること"""
+        with self.assertRaises(ValueError):
+            with tracing.start_trace("/design"):
+                with tracing.span("confluence.create_page"):
+                    raise ValueError("boom")
+
+        trace = tracing.recent_traces().traces()[0]
+        self.assertEqual(trace["status"], "error")
+        self.assertIn("ValueError: boom", trace["spans"][1]["error"])
+
+    def test_trace_stays_open_for_background_task(self):
+        """ハンドラー終了後もバックグラウンドのスパンが終わるまでトレースが出力されないこと"""
+        started = threading.Event()
+        release = threading.Event()
+
+        with tracing.start_trace("/develop"):
+            task_span = tracing.start_span("task.develop")
+            context = contextvars.copy_context()
+
+            def run():
+                with tracing.use_span(task_span):
+                    started.set()
+                    release.wait(5)
+                    with tracing.span("github.create_pr"):
+                        pass
+
+            thread = threading.Thread(target=context.run, args=(run,))
+            thread.start()
+
+        started.wait(5)
+        self.assertEqual(tracing.recent_traces().traces(), [])
+
+        release.set()
+        thread.join(5)
+        trace = tracing.recent_traces().traces()[0]
+        self.assertEqual([span["name"] for span in trace["spans"]], ["/develop", "task.develop", "github.create_pr"])
+
+    def test_async_task_cancelled_before_start(self):
+        """共有ループで開始する前にキャンセルされた非同期タスクもスパンを終了し、トレースを出力すること"""
+        import concurrent.futures
+        from unittest.mock import patch
+
+        import aibot
+
+        future = concurrent.futures.Future()
+
+        async def never_started():
+            raise AssertionError("開始されないこと")
+
+        def submit(coroutine):
+            coroutine.close()
+            return future
+
+        with patch("async_runtime.submit", side_effect=submit):
+            with tracing.start_trace("/design-mcp"):
+                aibot.run_async_safely(never_started(), kind="design_mcp")
+            self.assertEqual(tracing.recent_traces().traces(), [])
+            future.cancel()
+
+        trace = tracing.recent_traces().traces()[0]
+        self.assertEqual([span["name"] for span in trace["spans"]], ["/design-mcp", "task.design_mcp"])
+
+    def test_traced_async(self):
+        """非同期関数のデコレータでもスパンが記録されること"""
+        @tracing.traced("mcp.tool_call")
+        async def call_tool():
+            return "ok"
+
+        async def main():
+            with tracing.start_trace("/confluence-search"):
+                return await call_tool()
+
+        self.assertEqual(asyncio.run(main()), "ok")
+        names = [span["name"] for span in tracing.recent_traces().traces()[0]["spans"]]
+        self.assertIn("mcp.tool_call", names)
+
+    def test_slowest_and_summary(self):
+        """遅い順の取得とスパン名ごとの集計"""
+        for name in ("/fast", "/slow"):
+            with tracing.start_trace(name):
+                with tracing.span("slack.response_url"):
+                    pass
+                with tracing.span("slack.response_url"):
+                    if name == "/slow":
+                        threading.Event().wait(0.02)
+
+        slowest = tracing.recent_traces().slowest(1)
+        self.assertEqual(slowest[0]["name"], "/slow")
+        summary = tracing.summarize(slowest[0])
+        self.assertEqual(summary["breakdown"]["slack.response_url"]["count"], 2)
+
+
+class TestExporters(unittest.TestCase):
+    """エクスポーターのテスト"""
+
+    def tearDown(self):
+        tracing.set_exporters([])
+
+    def test_json_lines_exporter(self):
+        """JSON Lines形式でファイルに追記されること"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "traces.jsonl")
+            tracing.set_exporters([tracing.JsonLinesExporter(path)])
+
+            with tracing.start_trace("/develop"):
+                pass
+            with tracing.start_trace("/design"):
+                pass
+
+            with open(path, encoding="utf-8") as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual([line["name"] for line in lines], ["/develop", "/design"])
+
+    def test_json_lines_rotation(self):
+        """上限を超えたら退避ファイルに回し、合計のサイズが上限の (backups + 1) 倍を超えないこと"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "traces.jsonl")
+            exporter = tracing.JsonLinesExporter(path, max_bytes=300, backups=1)
+            for index in range(20):
+                exporter.export({"name": f"/develop-{index}", "duration_ms": 1.0})
+
+            files = sorted(os.listdir(tmpdir))
+            self.assertEqual(files, ["traces.jsonl", "traces.jsonl.1"])
+            self.assertTrue(all(os.path.getsize(os.path.join(tmpdir, name)) <= 300 for name in files))
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(json.loads(f.readlines()[-1])["name"], "/develop-19")
+
+    def test_custom_exporter(self):
+        """任意のエクスポーターに差し替えられること"""
+        exported = []
+
+        class ListExporter(tracing.SpanExporter):
+            def export(self, trace):
+                exported.append(trace)
+
+        tracing.set_exporters([ListExporter()])
+        with tracing.start_trace("/develop"):
+            pass
+
+        self.assertEqual(len(exported), 1)
+
+    def test_failing_exporter_does_not_break_request(self):
+        """エクスポーターの失敗が処理に影響しないこと"""
+        class BrokenExporter(tracing.SpanExporter):
+            def export(self, trace):
+                raise OSError("disk full")
+
+        tracing.set_exporters([BrokenExporter()])
+        with tracing.start_trace("/develop"):
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
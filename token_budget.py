@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+プロンプトのトークン予算管理
+
+/develop は現在のファイル全体をプロンプトに埋め込み、改修後のファイル全体を出力させる。
+巨大なファイルはAPIエラーになるか、出力が max_tokens で打ち切られて壊れたコードになるため、
+送信前にトークン数を見積もり、以下のいずれかの方針を選ぶ。
+
+- send:   そのまま送信
+- trim:   指示と関係の薄いブロックをマーカーに置き換えて送信し、出力に元のブロックを戻す
+- chunk:  ブロック単位で分割して複数回に分けて改修する
+- reject: 予算内に収まらないため、Slackに理由を返して処理しない
+
+max_tokens は出力に必要な量から決める（固定の4096ではなく、小さなファイルでは小さくする）。
+
+環境変数:
+    PROMPT_TOKEN_BUDGET: 1回の呼び出しで送る入力トークンの上限（デフォルト: 50000）
+    MAX_EDIT_CHUNKS: chunk 方針での最大分割数（デフォルト: 4）
+    TOKEN_COUNT_API: false で Anthropic の count_tokens による事前計測を無効化（デフォルト: true）
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import metrics
+
+# モデルごとの (コンテキスト長, 最大出力トークン数)
+MODEL_LIMITS = {
+    "claude-3-5-sonnet-20240620": (200000, 4096),
+    "claude-3-5-sonnet-20241022": (200000, 8192),
+    "claude-3-5-haiku-20241022": (200000, 8192),
+    "claude-3-haiku-20240307": (200000, 4096),
+}
+DEFAULT_MODEL_LIMITS = (200000, 4096)
+
+MIN_OUTPUT_TOKENS = 1024
+# 改修で増えるコード量と、説明文が混ざった場合の余裕
+OUTPUT_GROWTH = 1.25
+OUTPUT_MARGIN = 256
+# 見積もりが上限のこの割合を超えたら count_tokens で正確に数える
+EXACT_COUNT_THRESHOLD = 0.8
+
+OMITTED_MARKER = "<<<AIBOT_OMITTED_{index}>>>"
+_MARKER_PATTERN = re.compile(r"^[ \t]*<<<AIBOT_OMITTED_(\d+)>>>[ \t]*$", re.MULTILINE)
+
+# トップレベルの定義の開始とみなす行（Python / JS / TS / Go / Java など）
+_BLOCK_START = re.compile(
+    r"^(?:@|def |async def |class |function |async function |export |const |let |var |func |type |interface |"
+    r"public |private |protected |static |fn |impl |struct |enum |module |package )"
+)
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+
+
+def prompt_token_budget() -> int:
+    return int(os.environ.get("PROMPT_TOKEN_BUDGET", "50000"))
+
+
+def max_edit_chunks() -> int:
+    return int(os.environ.get("MAX_EDIT_CHUNKS", "4"))
+
+
+def exact_count_enabled() -> bool:
+    return os.environ.get("TOKEN_COUNT_API", "true").strip().lower() not in ("0", "false", "no")
+
+
+def model_limits(model: str):
+    return MODEL_LIMITS.get(model, DEFAULT_MODEL_LIMITS)
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（ASCIIは約3.5文字/トークン、日本語などは約1文字/トークン）"""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return int(ascii_chars / 3.5 + (len(text) - ascii_chars)) + 1
+
+
+def adaptive_max_tokens(expected_output_tokens: int, model: str) -> int:
+    """出力に必要なトークン数から max_tokens を決める"""
+    needed = int(expected_output_tokens * OUTPUT_GROWTH) + OUTPUT_MARGIN
+    return max(MIN_OUTPUT_TOKENS, min(needed, model_limits(model)[1]))
+
+
+def max_output_tokens(model: str) -> int:
+    """出力量を事前に見積もれない生成（設計書など）に使う max_tokens"""
+    return model_limits(model)[1]
+
+
+def output_capacity(model: str) -> int:
+    """1回の呼び出しで改修対象として渡せるコードのトークン数（全体を出力させるため出力上限で決まる）"""
+    return int((model_limits(model)[1] - OUTPUT_MARGIN) / OUTPUT_GROWTH)
+
+
+def split_blocks(code: str) -> List[str]:
+    """コードをトップレベルの定義単位のブロックに分割する（連結すると元に戻る）"""
+    lines = code.splitlines(keepends=True)
+    blocks: List[List[str]] = [[]]
+    for line in lines:
+        if _BLOCK_START.match(line) and blocks[-1] and not _is_decorated(blocks[-1]):
+            blocks.append([])
+        blocks[-1].append(line)
+    return ["".join(block) for block in blocks if block]
+
+
+def _is_decorated(block: List[str]) -> bool:
+    # デコレータの直後の def/class は同じブロックに含める
+    stripped = [line for line in block if line.strip()]
+    return bool(stripped) and stripped[-1].startswith("@")
+
+
+def _relevance(block: str, keywords: set) -> int:
+    if not keywords:
+        return 0
+    return len(keywords & {word.lower() for word in _IDENTIFIER.findall(block)})
+
+
+@dataclass
+class EditPlan:
+    """トークン予算に基づく送信方針"""
+    strategy: str                  # send / trim / chunk / reject
+    parts: List[str]               # LLMに渡すコード（chunk の場合は複数）
+    max_tokens: List[int]          # parts ごとの max_tokens
+    input_tokens: int              # 元のファイルの推定トークン数
+    reason: str = ""
+    omitted: Dict[int, str] = field(default_factory=dict)
+
+    def restore(self, output: str) -> Optional[str]:
+        """trim で省略したブロックを出力に戻す（マーカーが欠けていたら None）"""
+        if not self.omitted:
+            return output
+        found = {int(index) for index in _MARKER_PATTERN.findall(output)}
+        if found != set(self.omitted):
+            logging.warning(f"省略マーカーが出力に残っていません: 期待 {sorted(self.omitted)}, 実際 {sorted(found)}")
+            return None
+        # マーカー行の改行は出力側に残るため、ブロック末尾の改行を1つだけ除いて戻す
+        return _MARKER_PATTERN.sub(lambda match: _strip_one_newline(self.omitted[int(match.group(1))]), output)
+
+
+def _strip_one_newline(block: str) -> str:
+    return block[:-1] if block.endswith("\n") else block
+
+
+def measure_tokens(text: str, overhead_tokens: int, limit: int, counter: Optional[Callable[[str], int]] = None) -> int:
+    """トークン数を見積もり、上限に近い場合のみ counter（count_tokens API）で正確に数える"""
+    estimated = estimate_tokens(text) + overhead_tokens
+    if counter is None or not exact_count_enabled() or estimated < limit * EXACT_COUNT_THRESHOLD:
+        return estimated
+    try:
+        return counter(text) + overhead_tokens
+    except Exception as e:
+        logging.warning(f"count_tokens に失敗したため概算値を使用します: {e}")
+        return estimated
+
+
+def plan_code_edit(code: str, instruction: str, model: str, overhead_tokens: int = 0,
+                   counter: Optional[Callable[[str], int]] = None) -> EditPlan:
+    """ファイル全体を改修させるプロンプトの送信方針を決める
+
+    Args:
+        code: 現在のファイル内容
+        instruction: 改修の指示（関連ブロックの選択に使う）
+        model: 使用するモデル
+        overhead_tokens: コード以外のプロンプト部分のトークン数
+        counter: コードの正確なトークン数を返す関数（Anthropic count_tokens）
+    """
+    input_budget = min(prompt_token_budget(), model_limits(model)[0] - model_limits(model)[1])
+    output_budget = output_capacity(model)
+    code_tokens = measure_tokens(code, 0, min(input_budget - overhead_tokens, output_budget), counter)
+
+    if code_tokens + overhead_tokens <= input_budget and code_tokens <= output_budget:
+        return _record(EditPlan("send", [code], [adaptive_max_tokens(code_tokens, model)], code_tokens))
+
+    blocks = split_blocks(code)
+    block_tokens = [estimate_tokens(block) for block in blocks]
+    capacity = min(input_budget - overhead_tokens, output_budget)
+
+    # trim: 先頭（import等）と指示に関係するブロックだけを残す
+    keywords = {word.lower() for word in _IDENTIFIER.findall(instruction)}
+    ranked = sorted(range(1, len(blocks)), key=lambda index: _relevance(blocks[index], keywords), reverse=True)
+    keep = {0}
+    used = block_tokens[0] if blocks else 0
+    for index in ranked:
+        if _relevance(blocks[index], keywords) == 0:
+            break
+        if used + block_tokens[index] <= capacity:
+            keep.add(index)
+            used += block_tokens[index]
+    if len(keep) > 1 and used <= capacity:
+        omitted = {}
+        trimmed = []
+        for index, block in enumerate(blocks):
+            if index in keep:
+                trimmed.append(block)
+            else:
+                omitted[index] = block
+                trimmed.append(OMITTED_MARKER.format(index=index) + "\n")
+        return _record(EditPlan(
+            "trim", ["".join(trimmed)], [adaptive_max_tokens(used + len(omitted) * 10, model)], code_tokens,
+            reason=f"{len(omitted)}個のブロックを省略", omitted=omitted,
+        ))
+
+    # chunk: ブロックを出力上限に収まる単位にまとめる
+    chunks: List[List[int]] = [[]]
+    chunk_tokens = [0]
+    for index, tokens in enumerate(block_tokens):
+        if tokens > capacity:
+            return _record(EditPlan("reject", [], [], code_tokens,
+                                    reason=f"1つの定義が大きすぎます（推定 {tokens} トークン、上限 {capacity} トークン）"))
+        if chunk_tokens[-1] + tokens > capacity and chunks[-1]:
+            chunks.append([])
+            chunk_tokens.append(0)
+        chunks[-1].append(index)
+        chunk_tokens[-1] += tokens
+    if len(chunks) <= max_edit_chunks():
+        parts = ["".join(blocks[index] for index in chunk) for chunk in chunks]
+        return _record(EditPlan(
+            "chunk", parts, [adaptive_max_tokens(tokens, model) for tokens in chunk_tokens], code_tokens,
+            reason=f"{len(parts)}分割",
+        ))
+
+    return _record(EditPlan("reject", [], [], code_tokens,
+                            reason=f"ファイルが大きすぎます（推定 {code_tokens} トークン、{len(chunks)}分割が必要で上限は {max_edit_chunks()}）"))
+
+
+def _record(plan: EditPlan) -> EditPlan:
+    metrics.TOKEN_BUDGET_DECISIONS.inc(strategy=plan.strategy)
+    return plan
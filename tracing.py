@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+軽量トレーシング
+
+Slackコマンド1件ごとにトレースを作成し、バックグラウンドの process_*_task から
+GitHub・Anthropic・Confluence・Slack への外部呼び出しまでスパンを伝搬させる。
+スパンの親子関係は contextvars で管理するため、スレッドやイベントループに渡す際は
+`contextvars.copy_context()` で呼び出し元のコンテキストを引き継ぐこと。
+
+エクスポーターは差し替え可能で、デフォルトはJSON Lines形式のファイル出力
+（Cloud Run の /tmp はメモリを消費するため、サイズの上限に達したらローテーションする）。
+直近のトレースはメモリにも保持し、main.py の /debug/traces で遅い順に参照できる。
+
+環境変数:
+    TRACE_EXPORTER: jsonl（デフォルト） / none / "module:ClassName"
+    TRACE_FILE: JSON Linesの出力先（デフォルト: /tmp/aibot-traces.jsonl）
+    TRACE_FILE_MAX_BYTES: 1ファイルの上限バイト数（超えたら .1 に退避する。0 で無制限。デフォルト: 10MB）
+    TRACE_FILE_BACKUPS: 残す退避ファイルの数（デフォルト: 1）
+    TRACE_BUFFER_SIZE: メモリに保持するトレース数（デフォルト: 200）
+"""
+
+import asyncio
+import collections
+import contextvars
+import functools
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+DEFAULT_TRACE_FILE = "/tmp/aibot-traces.jsonl"
+DEFAULT_TRACE_FILE_MAX_BYTES = 10 * 1024 * 1024
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("aibot_current_span", default=None)
+
+
+class Span:
+    """処理区間1つ分の記録"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_time = time.time()
+        self._start_perf = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = (time.perf_counter() - self._start_perf) * 1000
+        _collector.span_ended(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+# --- エクスポーター ---
+class SpanExporter:
+    """完了したトレースの出力先（差し替え用の基底クラス）"""
+
+    def export(self, trace: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class JsonLinesExporter(SpanExporter):
+    """トレースを1行1件のJSONとしてファイルに追記する（max_bytes を超える場合は backups 世代までローテーションする）"""
+
+    def __init__(self, path: str = DEFAULT_TRACE_FILE, max_bytes: int = DEFAULT_TRACE_FILE_MAX_BYTES, backups: int = 1):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+
+    def export(self, trace: Dict[str, Any]) -> None:
+        data = (json.dumps(trace, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            if self.max_bytes > 0 and self._size() + len(data) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "ab") as f:
+                f.write(data)
+
+    def _size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _rotate(self) -> None:
+        # path.{backups} を捨て、path → path.1 → path.2 … と1世代ずつずらす
+        for index in range(self.backups, 0, -1):
+            source = f"{self.path}.{index - 1}" if index > 1 else self.path
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index}")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class InMemoryExporter(SpanExporter):
+    """直近のトレースをメモリに保持する（/debug/traces 用）"""
+
+    def __init__(self, maxlen: int = 200):
+        self._traces = collections.deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def export(self, trace: Dict[str, Any]) -> None:
+        with self._lock:
+            self._traces.append(trace)
+
+    def traces(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._traces)
+
+    def slowest(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return sorted(self.traces(), key=lambda trace: trace["duration_ms"], reverse=True)[:limit]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._traces.clear()
+
+
+def _exporter_from_env() -> Optional[SpanExporter]:
+    exporter_name = os.environ.get("TRACE_EXPORTER", "jsonl").strip()
+    if exporter_name in ("", "none"):
+        return None
+    if exporter_name == "jsonl":
+        return JsonLinesExporter(
+            os.environ.get("TRACE_FILE", DEFAULT_TRACE_FILE),
+            max_bytes=int(os.environ.get("TRACE_FILE_MAX_BYTES", str(DEFAULT_TRACE_FILE_MAX_BYTES))),
+            backups=int(os.environ.get("TRACE_FILE_BACKUPS", "1")),
+        )
+    try:
+        module_name, class_name = exporter_name.split(":", 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    except Exception as e:
+        logging.error(f"トレースエクスポーターの読み込みに失敗しました ({exporter_name}): {e}")
+        return None
+
+
+# --- 収集 ---
+class _TraceCollector:
+    """トレースごとにスパンを集め、全スパンが終了した時点でエクスポートする"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open: Dict[str, int] = {}
+        self._spans: Dict[str, List[Span]] = {}
+        self.recent = InMemoryExporter(int(os.environ.get("TRACE_BUFFER_SIZE", "200")))
+        self.exporters: List[SpanExporter] = []
+        default_exporter = _exporter_from_env()
+        if default_exporter:
+            self.exporters.append(default_exporter)
+
+    def span_started(self, span: Span) -> None:
+        with self._lock:
+            self._open[span.trace_id] = self._open.get(span.trace_id, 0) + 1
+            self._spans.setdefault(span.trace_id, [])
+
+    def span_ended(self, span: Span) -> None:
+        with self._lock:
+            self._spans.setdefault(span.trace_id, []).append(span)
+            self._open[span.trace_id] = self._open.get(span.trace_id, 1) - 1
+            if self._open[span.trace_id] > 0:
+                return
+            spans = self._spans.pop(span.trace_id)
+            del self._open[span.trace_id]
+        self._export(_build_trace(span.trace_id, spans))
+
+    def _export(self, trace: Dict[str, Any]) -> None:
+        for exporter in [self.recent] + self.exporters:
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                logging.warning(f"トレースのエクスポートに失敗しました ({type(exporter).__name__}): {e}")
+
+
+def _build_trace(trace_id: str, spans: List[Span]) -> Dict[str, Any]:
+    spans = sorted(spans, key=lambda span: span.start_time)
+    root = next((span for span in spans if span.parent_id is None), spans[0])
+    trace_start = spans[0].start_time
+    trace_end = max(span.start_time + (span.duration_ms or 0) / 1000 for span in spans)
+    span_dicts = []
+    for span in spans:
+        data = span.to_dict()
+        data["offset_ms"] = round((span.start_time - trace_start) * 1000, 3)
+        span_dicts.append(data)
+    return {
+        "trace_id": trace_id,
+        "name": root.name,
+        "attributes": root.attributes,
+        "start_time": trace_start,
+        "duration_ms": round((trace_end - trace_start) * 1000, 3),
+        "status": "error" if any(span.status == "error" for span in spans) else "ok",
+        "spans": span_dicts,
+    }
+
+
+_collector = _TraceCollector()
+
+
+def set_exporters(exporters: List[SpanExporter]) -> None:
+    """エクスポーターを差し替える（メモリ上の直近トレースは常に保持される）"""
+    _collector.exporters = list(exporters)
+
+
+def add_exporter(exporter: SpanExporter) -> None:
+    _collector.exporters.append(exporter)
+
+
+def recent_traces() -> InMemoryExporter:
+    return _collector.recent
+
+
+# --- スパンAPI ---
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, new_trace: bool = False, **attributes) -> Optional[Span]:
+    """スパンを開始する（現在のスパンの子になる）
+
+    現在のトレースがなく new_trace=False の場合は None を返し、計測しない。
+    """
+    parent = _current_span.get()
+    if parent is None and not new_trace:
+        return None
+    if new_trace or parent is None:
+        span = Span(name, uuid.uuid4().hex, None, attributes)
+    else:
+        span = Span(name, parent.trace_id, parent.span_id, attributes)
+    _collector.span_started(span)
+    return span
+
+
+@contextmanager
+def use_span(span: Optional[Span], end_on_exit: bool = True):
+    """スパンを現在のコンテキストに設定する"""
+    if span is None:
+        yield None
+        return
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        if end_on_exit:
+            span.end()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """現在のトレースに子スパンを追加する（トレース外では何もしない）"""
+    with use_span(start_span(name, **attributes)) as current:
+        yield current
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """新しいトレースのルートスパンを開始する"""
+    with use_span(start_span(name, new_trace=True, **attributes)) as root:
+        yield root
+
+
+def traced(name: str):
+    """関数（同期・非同期どちらも可）の実行をスパンとして記録するデコレータ"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """現在のスパンに属性を追加する"""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute(key, value)
+
+
+def summarize(trace: Dict[str, Any]) -> Dict[str, Any]:
+    """トレースをスパン名ごとの合計時間に集約する（/debug/traces 用）"""
+    breakdown: Dict[str, Dict[str, float]] = {}
+    for item in trace["spans"]:
+        entry = breakdown.setdefault(item["name"], {"count": 0, "total_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] = round(entry["total_ms"] + (item["duration_ms"] or 0), 3)
+    return {
+        "trace_id": trace["trace_id"],
+        "name": trace["name"],
+        "attributes": trace["attributes"],
+        "duration_ms": trace["duration_ms"],
+        "status": trace["status"],
+        "breakdown": dict(sorted(breakdown.items(), key=lambda item: item[1]["total_ms"], reverse=True)),
+        "spans": trace["spans"],
+    }
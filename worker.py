@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+ワーカーモードのエントリーポイント
+
+main.py（受付）がタスクキュー（task_queue.py）に入れたコマンドを実行する。
+受付とは別のプロセス・別のCloud Runサービスとして動かすことで、重いコード生成が
+ヘルスチェックやSlackの受信と同じプロセスのスレッドを奪い合わなくなり、実行側だけを独立してスケールできる。
+
+    TASK_QUEUE=sqlite python worker.py      # 共有のSQLiteキューをポーリングして実行
+    gunicorn --bind :$PORT worker:app        # TASK_QUEUE=http の送信先（POST /tasks）として待ち受ける
+
+どちらの場合も中断したジョブの再開（job_store.py）はワーカーが行う。
+
+環境変数:
+    WORKER_CONCURRENCY: 同時に実行するジョブ数（デフォルト: 4）
+    WORKER_POLL_INTERVAL: キューが空のときに次の取り出しまで待つ秒数（デフォルト: 1）
+    WORKER_TOKEN: POST /tasks で確認する共有トークン（受付側と同じ値を設定する。未設定なら受け付けない）
+"""
+
+import logging
+import os
+import sqlite3
+import sys
+import threading
+
+from flask import Flask, Response, jsonify, request
+
+import job_store
+import lifecycle
+import metrics
+import task_queue
+from logging_config import configure_logging
+
+configure_logging()
+
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = max(1, int(job_store._env_float("WORKER_CONCURRENCY", 4)))
+WORKER_POLL_INTERVAL = job_store._env_float("WORKER_POLL_INTERVAL", 1.0)
+
+worker_app = Flask(__name__)
+
+# POST /tasks で同時に受け付けるジョブ数（超えた分は 503 を返し、送信側が別のインスタンスに再送する）
+_slots = threading.BoundedSemaphore(WORKER_CONCURRENCY)
+# ポーリングを止めるためのイベント
+stop_event = threading.Event()
+# not_started / starting / running / error
+worker_status = "not_started"
+
+
+def run_task(kind: str, payload: dict, job=None):
+    """ジョブを実行する（処理関数内で扱えなかった例外もここで記録し、ワーカーは止めない）"""
+    import aibot
+
+    if kind not in aibot.JOB_PROCESSORS:
+        logger.error(f"実行できない種類のタスクです: {kind}")
+        if job is not None:
+            job.fail(f"未対応のタスク種別: {kind}")
+        return
+    try:
+        aibot.run_job(kind, payload, job)
+    except Exception as e:
+        logger.error(f"タスク実行エラー ({kind}): {e}")
+        if job is not None:
+            job.fail(e)
+
+
+def poll_queue(queue: task_queue.SQLiteTaskQueue):
+    """キューが空になるまで取り出して実行し、空なら WORKER_POLL_INTERVAL 待つ"""
+    while not stop_event.is_set():
+        try:
+            job = queue.get()
+        except sqlite3.Error as e:
+            logger.warning(f"キューからの取り出しに失敗しました: {e}")
+            job = None
+        if job is None:
+            stop_event.wait(WORKER_POLL_INTERVAL)
+            continue
+        logger.info(f"キューのタスクを実行します: {job.kind} ({job.id})")
+        run_task(job.kind, job.payload, job)
+
+
+def start_worker():
+    """クライアントを準備し、中断したジョブの再開とキューのポーリングを開始する"""
+    global worker_status
+    try:
+        worker_status = "starting"
+        import aibot
+
+        if os.environ.get("WARMUP_ON_START", "true").lower() not in ("0", "false", "no"):
+            aibot.start_warm_up()
+        aibot.start_job_resume()
+        if isinstance(task_queue.QUEUE, task_queue.SQLiteTaskQueue):
+            for index in range(WORKER_CONCURRENCY):
+                threading.Thread(target=poll_queue, args=(task_queue.QUEUE,), name=f"worker-{index}", daemon=True).start()
+            logger.info(f"🚀 SQLiteキューのポーリングを開始しました（{WORKER_CONCURRENCY}並列）")
+        else:
+            logger.info(f"🚀 POST /tasks でタスクを受け付けます（{WORKER_CONCURRENCY}並列）")
+        worker_status = "running"
+    except Exception as e:
+        logger.error(f"❌ ワーカー起動エラー: {e}")
+        worker_status = "error"
+
+
+@worker_app.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "healthy", "service": "slack-ai-bot-worker"}), 200
+
+
+@worker_app.route("/ready", methods=["GET"])
+def ready():
+    aibot_module = sys.modules.get("aibot")
+    is_ready = worker_status == "running" and bool(aibot_module and aibot_module.CLIENTS_WARM) and not lifecycle.stopping()
+    return jsonify({
+        "status": "ready" if is_ready else "not_ready",
+        "worker": worker_status,
+        "concurrency": WORKER_CONCURRENCY,
+    }), 200 if is_ready else 503
+
+
+@worker_app.route("/tasks", methods=["POST"])
+def accept_task():
+    """受付（TASK_QUEUE=http）から送られたタスクを受け付け、バックグラウンドで実行する"""
+    if not task_queue.authorized(request.headers.get("Authorization")):
+        return jsonify({"error": "unauthorized"}), 401
+    task = request.get_json(silent=True) or {}
+    kind, payload = task.get("kind"), task.get("payload")
+    if not isinstance(kind, str) or not isinstance(payload, dict) or "response_url" not in payload:
+        return jsonify({"error": "kind と payload（response_url を含む）が必要です"}), 400
+    if lifecycle.stopping() or not _slots.acquire(blocking=False):
+        return jsonify({"error": "busy"}), 503
+
+    def run():
+        try:
+            run_task(kind, payload)
+        finally:
+            _slots.release()
+
+    threading.Thread(target=run, name=f"task-{kind}", daemon=True).start()
+    return jsonify({"status": "accepted", "id": task.get("id")}), 202
+
+
+@worker_app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@worker_app.route("/debug/jobs", methods=["GET"])
+def debug_jobs():
+    """このワーカーで実行中のジョブの進捗"""
+    return jsonify({"jobs": job_store.snapshot(), "concurrency": WORKER_CONCURRENCY}), 200
+
+
+# 終了処理ではまずポーリングを止める（取り出し済みのジョブは完了を待つ）
+lifecycle.on_stop(stop_event.set)
+
+if __name__ == "__main__":
+    lifecycle.install_signal_handlers()
+    start_worker()
+    if isinstance(task_queue.QUEUE, task_queue.SQLiteTaskQueue):
+        # ポーリングのみの場合はHTTPサーバーを起動しない
+        try:
+            stop_event.wait()
+        except KeyboardInterrupt:
+            stop_event.set()
+    else:
+        worker_app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 8080)), debug=False, threaded=True)
+elif not os.environ.get("GITHUB_ACTIONS"):
+    # Gunicorn実行時
+    lifecycle.install_signal_handlers()
+    threading.Thread(target=start_worker, daemon=True).start()
+
+# Gunicorn用のapp参照
+app = worker_app